@@ -0,0 +1,123 @@
+"""Prefetch the state of the applications a job is expected to publish, while its input artifacts are fetched.
+
+The applications of a job are predicted from the ApplicationNames of its UserParameters, and from the applications
+published by this container from the same pipeline artifact before. Their state is fetched with GetApplication and
+cached in applicationstate, where publisher finds that they exist: CreateApplication, which would fail with a
+conflict, and GetApplication are then skipped on the critical path of the job. Wrong predictions only cost a
+GetApplication call that overlaps with the fetch.
+"""
+
+import applicationstate
+import callpolicy
+import clientfactory
+import lambdalogging
+import metrics
+import userparameters
+
+import collections
+import threading
+
+LOG = lambdalogging.getLogger(__name__)
+
+# pipeline artifacts whose applications are remembered, least recently published first
+MAX_REMEMBERED_ARTIFACTS = 100
+
+# application ids last published from a pipeline artifact, by (bucket, key prefix, region)
+_PUBLISHED = collections.OrderedDict()
+_LOCK = threading.Lock()
+
+
+def predict(job, regions, function_arn=None):
+    """Predict the applications a job publishes.
+
+    Arguments:
+        job {CodePipelineJob} -- The CodePipeline job
+        regions {list} -- The regions to publish to, [None] for the function's region only
+
+    Keyword Arguments:
+        function_arn {str} -- The ARN of the function, which gives the account and region of the applications named
+        in the UserParameters. They are not predicted if None (default: {None})
+
+    Returns:
+        list -- The region, None for the function's region, and the application id of each application
+
+    Raises:
+        RuntimeError -- When the ApplicationNames of the UserParameters are not a list of names
+
+    """
+    names = job.user_parameters.get(userparameters.APPLICATION_NAMES, [])
+    if not isinstance(names, list) or not all(isinstance(name, str) and name for name in names):
+        raise RuntimeError('{} must be a list of application names.'.format(userparameters.APPLICATION_NAMES))
+
+    targets = []
+    with _LOCK:
+        for input_artifact in job.input_artifacts:
+            for region in regions:
+                targets.extend((region, application_id)
+                               for application_id in _PUBLISHED.get(_get_key(input_artifact, region), ()))
+    if function_arn:
+        # arn:<partition>:lambda:<region>:<account>:function:<name>
+        _, partition, _, function_region, account_id = function_arn.split(':')[:5]
+        targets.extend(
+            (region, 'arn:{}:serverlessrepo:{}:{}:applications/{}'.format(
+                partition, region or function_region, account_id, name))
+            for region in regions for name in names)
+    return list(collections.OrderedDict.fromkeys(targets))
+
+
+def prefetch(targets, deadline):
+    """Fetch and cache the state of the predicted applications, never raising.
+
+    Arguments:
+        targets {list} -- The region and application id of each application, see predict()
+        deadline {Deadline} -- The deadline of the invocation
+
+    """
+    with metrics.span('SarPrefetch'):
+        for region, application_id in targets:
+            try:
+                _prefetch_state(region, application_id, deadline)
+            except Exception as e:
+                # e.g. the application doesn't exist yet, it is created as usual
+                LOG.info('Unable to prefetch the state of %s: %s', application_id, e)
+
+
+def remember(input_artifact, region, application_ids):
+    """Remember the applications published from a pipeline artifact by a job, for the predictions of the next jobs.
+
+    Arguments:
+        input_artifact {InputArtifact} -- The input artifact of the templates
+        region {str} -- The region of the applications, None for the function's region
+        application_ids {list} -- The application ARNs
+
+    """
+    key = _get_key(input_artifact, region)
+    with _LOCK:
+        _PUBLISHED.pop(key, None)
+        if application_ids:
+            _PUBLISHED[key] = tuple(application_ids)
+        while len(_PUBLISHED) > MAX_REMEMBERED_ARTIFACTS:
+            _PUBLISHED.popitem(last=False)
+
+
+def clear_cache():
+    """Forget all the applications published."""
+    with _LOCK:
+        _PUBLISHED.clear()
+
+
+def _get_key(input_artifact, region):
+    # the artifacts of a pipeline action are stored under <pipeline>/<artifact>/ with a new name for each run
+    return input_artifact.bucket_name, input_artifact.object_key.rpartition('/')[0], region
+
+
+def _prefetch_state(region, application_id, deadline):
+    sar_client = clientfactory.get_serverlessrepo_client(region, timeout=deadline.call_timeout())
+    region_name = sar_client.meta.region_name
+    if applicationstate.find(region_name, application_id) is not None:
+        return
+    response = callpolicy.get_policy('serverlessrepo', region_name).call(
+        'get_application', sar_client.get_application, deadline, ApplicationId=application_id)
+    applicationstate.put(region_name, application_id, applicationstate.from_get_application_response(response))
+    metrics.count('PrefetchedApplications')
+    LOG.debug('Prefetched the state of %s', application_id)
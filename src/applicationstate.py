@@ -0,0 +1,140 @@
+"""Current state of published applications, cached per warm container to diff the metadata to publish against it.
+
+The state of an application is fetched with GetApplication and kept for config.APPLICATION_STATE_TTL_SECONDS,
+so that a change made outside of this function is only missed for that long. Publishing updates the cached
+state with the fields it sent.
+
+GetApplication returns a link to the copy of the readme kept by AWS Serverless Application Repository, which
+can't be compared with the ReadmeUrl of a template. The readme fields are compared with the ones last sent by
+this container instead, and are considered changed when unknown. Packaged ReadmeUrls point to objects named after
+their content, so an unchanged readme keeps the same URL.
+"""
+
+import config
+import lambdalogging
+
+import threading
+import time
+
+LOG = lambdalogging.getLogger(__name__)
+
+# metadata fields set by UpdateApplication
+UPDATABLE_FIELDS = ('Author', 'Description', 'HomePageUrl', 'Labels', 'ReadmeBody', 'ReadmeUrl')
+# fields only known from what was sent
+README_FIELDS = ('ReadmeBody', 'ReadmeUrl')
+# latest version of the application
+SEMANTIC_VERSION = 'SemanticVersion'
+
+# (expiry time, state) by (region name, application id)
+_STATES = {}
+_LOCK = threading.Lock()
+
+
+def find(region_name, application_id):
+    """Find the cached state of an application.
+
+    Arguments:
+        region_name {str} -- The region of the application
+        application_id {str} -- The application ARN
+
+    Returns:
+        dict -- The metadata fields and SEMANTIC_VERSION of the application, None if not cached or expired
+
+    """
+    with _LOCK:
+        expires_at, state = _STATES.get((region_name, application_id), (0, None))
+        return dict(state) if state is not None and expires_at > time.monotonic() else None
+
+
+def find_application_id(region_name, application_name):
+    """Find the id of an application of the function's account with a cached state.
+
+    Arguments:
+        region_name {str} -- The region of the application
+        application_name {str} -- The name of the application
+
+    Returns:
+        str -- The application ARN, None if no state of the application is cached or it expired
+
+    """
+    suffix = ':applications/{}'.format(application_name)
+    now = time.monotonic()
+    with _LOCK:
+        for (state_region_name, application_id), (expires_at, _) in _STATES.items():
+            if state_region_name == region_name and application_id.endswith(suffix) and expires_at > now:
+                return application_id
+    return None
+
+
+def put(region_name, application_id, state):
+    """Cache the state of an application, keeping the readme fields last sent from this container if not in it.
+
+    Arguments:
+        region_name {str} -- The region of the application
+        application_id {str} -- The application ARN
+        state {dict} -- The metadata fields and SEMANTIC_VERSION of the application
+
+    Returns:
+        dict -- The cached state
+
+    """
+    with _LOCK:
+        _, previous_state = _STATES.get((region_name, application_id), (0, None))
+        state = dict(state)
+        for field in README_FIELDS:
+            state.setdefault(field, (previous_state or {}).get(field))
+        _STATES[(region_name, application_id)] = (time.monotonic() + config.APPLICATION_STATE_TTL_SECONDS, state)
+        return dict(state)
+
+
+def update(region_name, application_id, fields):
+    """Update the cached state of an application with the fields just published, if it is cached.
+
+    Arguments:
+        region_name {str} -- The region of the application
+        application_id {str} -- The application ARN
+        fields {dict} -- The fields published
+
+    """
+    with _LOCK:
+        if (region_name, application_id) in _STATES:
+            _STATES[(region_name, application_id)][1].update(fields)
+
+
+def from_get_application_response(response):
+    """Get the state of an application from a GetApplication response, without the unknown readme fields."""
+    state = {field: response.get(field) for field in UPDATABLE_FIELDS if field not in README_FIELDS}
+    state[SEMANTIC_VERSION] = response.get('Version', {}).get('SemanticVersion')
+    return state
+
+
+def get_changed_fields(request, state):
+    """Compare the fields of a request with the state of the application.
+
+    Only the fields set in the request are compared. serverlessrepo leaves the empty metadata fields out of the
+    UpdateApplication request, so a field removed from the metadata, e.g. HomePageUrl, is never changed: SAR keeps its
+    previous value, and the update is skipped if nothing else changed.
+
+    Arguments:
+        request {dict} -- The UpdateApplication request
+        state {dict} -- The state of the application, None if unknown
+
+    Returns:
+        list -- The names of the fields of the request that differ, in UPDATABLE_FIELDS order
+
+    """
+    return [field for field in UPDATABLE_FIELDS if field in request and (
+        state is None or _normalize(request[field]) != _normalize(state.get(field)))]
+
+
+def clear_cache():
+    """Drop the cached states."""
+    with _LOCK:
+        _STATES.clear()
+
+
+def _normalize(value):
+    # labels are a set, and unset fields are None or empty
+    if isinstance(value, list):
+        return sorted(value)
+    return value or None
@@ -0,0 +1,212 @@
+"""Templates extracted from input artifacts, cached per warm container to skip fetching and unzipping them again.
+
+Re-runs of a pipeline execution, and the actions of a pipeline consuming the same build artifact, read the same
+S3 object. The templates extracted from an object are kept with its ETag, in memory up to
+config.ARTIFACT_CACHE_MEMORY_BYTES and in config.ARTIFACT_CACHE_DIR up to config.ARTIFACT_CACHE_DISK_BYTES, the
+least recently used first evicted. A cached entry is only used after a GET of the object conditioned on its ETag
+is answered with 304 Not Modified, see s3helper, so a changed object is never served from the cache. The hit
+rate of the container is logged on each lookup.
+"""
+
+import config
+import lambdalogging
+import metrics
+
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+LOG = lambdalogging.getLogger(__name__)
+
+# names of the files of the disk cache, so that no other file of the directory is read or evicted
+FILE_NAME_PATTERN = re.compile(r'^[0-9a-f]{64}\.json$')
+
+# Entry by (bucket, key, selection), least recently used first
+_ENTRIES = collections.OrderedDict()
+_LOCK = threading.Lock()
+_STATS = {'hits': 0, 'lookups': 0, 'memory_bytes': 0}
+
+
+class Entry(object):
+    """Templates extracted from a version of an S3 object."""
+
+    __slots__ = ('etag', 'value', 'size')
+
+    def __init__(self, etag, value):
+        """Initialize the entry.
+
+        Arguments:
+            etag {str} -- The ETag of the object
+            value {object} -- The templates extracted from the object, JSON serializable
+
+        """
+        self.etag = etag
+        self.value = value
+        self.size = len(json.dumps(value))
+
+
+def is_enabled():
+    """Return whether templates are cached in memory or on disk."""
+    return config.ARTIFACT_CACHE_MEMORY_BYTES > 0 or _is_disk_enabled()
+
+
+def find(bucket, key, selection):
+    """Find the templates extracted from an object, in memory or else on disk.
+
+    Arguments:
+        bucket {str} -- The S3 bucket of the object
+        key {str} -- The S3 key of the object
+        selection {tuple} -- What was extracted from the object, e.g. the template path
+
+    Returns:
+        Entry -- The cached entry, to validate with its ETag before use, None if not cached
+
+    """
+    cache_key = (bucket, key, selection)
+    with _LOCK:
+        entry = _ENTRIES.get(cache_key)
+        if entry is not None:
+            _ENTRIES.move_to_end(cache_key)
+            return entry
+
+    entry = _read_file(cache_key)
+    if entry is not None:
+        _put_in_memory(cache_key, entry)
+    return entry
+
+
+def put(bucket, key, selection, etag, value):
+    """Cache the templates extracted from an object, replacing those of its previous versions.
+
+    Arguments:
+        bucket {str} -- The S3 bucket of the object
+        key {str} -- The S3 key of the object
+        selection {tuple} -- What was extracted from the object, e.g. the template path
+        etag {str} -- The ETag of the object
+        value {object} -- The templates extracted from the object, JSON serializable
+
+    """
+    if not etag or not is_enabled():
+        return
+    cache_key = (bucket, key, selection)
+    entry = Entry(etag, value)
+    _put_in_memory(cache_key, entry)
+    try:
+        _write_file(cache_key, entry)
+    except Exception as e:
+        # e.g. /tmp is full, the entry is still cached in memory
+        LOG.warning('Unable to write the artifact cache: %s', e)
+
+
+def record_lookup(hit):
+    """Count a lookup of the cache, and log the hit rate of the container.
+
+    Arguments:
+        hit {bool} -- Whether the templates were served from the cache
+
+    """
+    with _LOCK:
+        _STATS['lookups'] += 1
+        _STATS['hits'] += int(hit)
+        hits, lookups = _STATS['hits'], _STATS['lookups']
+    metrics.count('ArtifactCacheHits' if hit else 'ArtifactCacheMisses')
+    LOG.info('Artifact cache %s, hit rate %.1f%% (%s of %s lookups)', 'hit' if hit else 'miss',
+             100.0 * hits / lookups, hits, lookups)
+
+
+def clear_cache():
+    """Drop the cached templates, in memory and on disk, and the hit rate."""
+    with _LOCK:
+        _ENTRIES.clear()
+        _STATS.update(hits=0, lookups=0, memory_bytes=0)
+    for path, _, _ in _list_files():
+        _remove(path)
+
+
+def _put_in_memory(cache_key, entry):
+    with _LOCK:
+        previous = _ENTRIES.pop(cache_key, None)
+        if previous is not None:
+            _STATS['memory_bytes'] -= previous.size
+        if entry.size > config.ARTIFACT_CACHE_MEMORY_BYTES:
+            return
+        _ENTRIES[cache_key] = entry
+        _STATS['memory_bytes'] += entry.size
+        while _STATS['memory_bytes'] > config.ARTIFACT_CACHE_MEMORY_BYTES:
+            _, evicted = _ENTRIES.popitem(last=False)
+            _STATS['memory_bytes'] -= evicted.size
+
+
+def _is_disk_enabled():
+    return bool(config.ARTIFACT_CACHE_DIR) and config.ARTIFACT_CACHE_DISK_BYTES > 0
+
+
+def _get_path(cache_key):
+    file_name = hashlib.sha256(json.dumps(cache_key).encode('utf-8')).hexdigest() + '.json'
+    return os.path.join(config.ARTIFACT_CACHE_DIR, file_name)
+
+
+def _read_file(cache_key):
+    if not _is_disk_enabled():
+        return None
+    path = _get_path(cache_key)
+    try:
+        with open(path) as f:
+            record = json.load(f)
+        # the modification time orders the files for eviction
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        LOG.warning('Unable to read the artifact cache: %s', e)
+        _remove(path)
+        return None
+    return Entry(record['etag'], record['value'])
+
+
+def _write_file(cache_key, entry):
+    if not _is_disk_enabled() or entry.size > config.ARTIFACT_CACHE_DISK_BYTES:
+        return
+    os.makedirs(config.ARTIFACT_CACHE_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=config.ARTIFACT_CACHE_DIR, suffix='.tmp', delete=False) as f:
+        json.dump({'etag': entry.etag, 'value': entry.value}, f)
+    os.replace(f.name, _get_path(cache_key))
+
+    files = sorted(_list_files(), key=lambda file: file[2])
+    disk_bytes = sum(size for _, size, _ in files)
+    for path, size, _ in files:
+        if disk_bytes <= config.ARTIFACT_CACHE_DISK_BYTES:
+            break
+        _remove(path)
+        disk_bytes -= size
+
+
+def _list_files():
+    """List the path, size and modification time of the files of the disk cache."""
+    if not config.ARTIFACT_CACHE_DIR:
+        return []
+    try:
+        names = os.listdir(config.ARTIFACT_CACHE_DIR)
+    except FileNotFoundError:
+        return []
+    files = []
+    for name in names:
+        if FILE_NAME_PATTERN.match(name):
+            path = os.path.join(config.ARTIFACT_CACHE_DIR, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+    return files
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
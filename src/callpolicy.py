@@ -0,0 +1,311 @@
+"""Retries, client-side rate limiting and circuit breaking of the calls to AWS APIs.
+
+Each endpoint, a service in a region, has a CallPolicy shared by the threads and warm invocations of the container.
+Errors are classified as throttling, retryable or fatal, and fatal errors are raised at once. The others are
+retried with exponential backoff and full jitter, up to config.CALL_MAX_ATTEMPTS attempts and within the deadline
+of the invocation. A token bucket limits the rate of calls: the rate is halved when a call is throttled and grows
+back with each successful call, so that concurrent jobs settle on the rate the endpoint accepts. A circuit breaker
+suspends the calls to an endpoint after config.CIRCUIT_BREAKER_FAILURES consecutive retryable errors, and lets one
+call through after config.CIRCUIT_BREAKER_RESET_SECONDS to probe it.
+
+The clients of these endpoints are created without botocore retries, see clientfactory.
+"""
+
+import config
+import lambdalogging
+import lazyimport
+import metrics
+
+import random
+import threading
+import time
+
+LOG = lambdalogging.getLogger(__name__)
+
+botocore_exceptions = lazyimport.LazyModule('botocore.exceptions')
+
+ERROR_THROTTLING = 'throttling'
+ERROR_RETRYABLE = 'retryable'
+ERROR_FATAL = 'fatal'
+
+THROTTLING_ERROR_CODES = ('TooManyRequestsException', 'ThrottlingException', 'Throttling', 'RequestLimitExceeded')
+RETRYABLE_ERROR_CODES = ('InternalFailure', 'InternalServerErrorException', 'ServiceUnavailable',
+                         'ServiceUnavailableException', 'RequestTimeout', 'RequestTimeoutException')
+
+# prefix of the metrics counting the throttled and retried calls of each service
+METRIC_PREFIXES = {'serverlessrepo': 'Sar', 'codepipeline': 'CodePipeline'}
+
+# the rate of calls is multiplied by this when a call is throttled
+RATE_DECREASE_FACTOR = 0.5
+# share of the maximum rate added back with each successful call
+RATE_INCREASE_RATIO = 0.05
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+# policies by (service name, region name)
+_POLICIES = {}
+_LOCK = threading.Lock()
+
+
+class CallSuspendedError(RuntimeError):
+    """A call was not attempted, because the circuit of the endpoint is open or no call is allowed in time."""
+
+
+class TokenBucket(object):
+    """Client-side rate limit with an adaptive rate, increased additively and decreased multiplicatively."""
+
+    def __init__(self, max_rate, min_rate):
+        """Initialize a full bucket at the maximum rate.
+
+        Arguments:
+            max_rate {float} -- The rate of calls per second when no call is throttled
+            min_rate {float} -- The rate is never decreased below this
+
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = max_rate
+        self._tokens = max(max_rate, 1)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting for one if needed.
+
+        Keyword Arguments:
+            timeout {float} -- The longest time to wait in seconds, no limit if None (default: {None})
+
+        Returns:
+            bool -- True when a token was taken, False when none is available in time
+
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # bursts are limited to one second of calls at the current rate
+                self._tokens = min(max(self.rate, 1), self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                return False
+            time.sleep(wait)
+            if timeout is not None:
+                timeout -= wait
+
+    def on_throttle(self):
+        """Decrease the rate after a throttled call."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE_FACTOR)
+
+    def on_success(self):
+        """Increase the rate after a successful call."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_INCREASE_RATIO)
+
+
+class CircuitBreaker(object):
+    """Suspend the calls to an endpoint after consecutive failures."""
+
+    def __init__(self, failure_threshold, reset_seconds):
+        """Initialize a closed circuit.
+
+        Arguments:
+            failure_threshold {int} -- Consecutive failures opening the circuit
+            reset_seconds {float} -- Time the circuit stays open before a call probes the endpoint
+
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return whether a call is allowed, letting a single probe through once the circuit is half open."""
+        with self._lock:
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = CIRCUIT_HALF_OPEN
+                self._probing = False
+            if self.state == CIRCUIT_OPEN or (self.state == CIRCUIT_HALF_OPEN and self._probing):
+                return False
+            if self.state == CIRCUIT_HALF_OPEN:
+                self._probing = True
+            return True
+
+    def release(self):
+        """Let another call probe the half open circuit when the allowed call was not made."""
+        with self._lock:
+            self._probing = False
+
+    def retry_after_seconds(self):
+        """Return the time left before the open circuit lets a probe through."""
+        with self._lock:
+            if self.state != CIRCUIT_OPEN:
+                return 0
+            return max(self.reset_seconds - (time.monotonic() - self._opened_at), 0)
+
+    def record_success(self):
+        """Close the circuit after the endpoint answered."""
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """Count a failure, opening the circuit after too many or when the probe failed."""
+        with self._lock:
+            self._failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    LOG.warning('Opening circuit after %s consecutive failures', self._failures)
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class CallPolicy(object):
+    """Retries, rate limit and circuit breaker of the calls to an endpoint."""
+
+    def __init__(self, service_name, region_name=None):
+        """Initialize the policy of an endpoint with the settings in config.
+
+        Arguments:
+            service_name {str} -- The name of the service, e.g. serverlessrepo
+
+        Keyword Arguments:
+            region_name {str} -- The region of the endpoint, the function's region if None (default: {None})
+
+        """
+        self.endpoint = service_name if region_name is None else '{} in {}'.format(service_name, region_name)
+        self.metric_prefix = METRIC_PREFIXES.get(service_name, service_name)
+        self.token_bucket = TokenBucket(config.CALL_MAX_RATE_PER_SECOND, config.CALL_MIN_RATE_PER_SECOND)
+        self.circuit_breaker = CircuitBreaker(config.CIRCUIT_BREAKER_FAILURES, config.CIRCUIT_BREAKER_RESET_SECONDS)
+
+    def call(self, operation_name, function, deadline=None, **kwargs):
+        """Call an API operation, retrying throttling and retryable errors.
+
+        Arguments:
+            operation_name {str} -- The name of the operation, for logs
+            function {callable} -- The client method of the operation
+
+        Keyword Arguments:
+            deadline {Deadline} -- The deadline of the invocation, retries are only bounded by
+            config.CALL_MAX_ATTEMPTS if None (default: {None})
+            kwargs {dict} -- The request
+
+        Returns:
+            dict -- The response
+
+        Raises:
+            CallSuspendedError -- When the circuit is open, or no call is allowed by the rate limit before the deadline
+
+        """
+        attempt = 1
+        while True:
+            self._acquire(operation_name, deadline)
+            try:
+                response = function(**kwargs)
+            except Exception as e:
+                error_class = classify(e)
+                self._record_error(error_class)
+                backoff_seconds = random.uniform(
+                    0, min(config.CALL_BACKOFF_MAX_SECONDS, config.CALL_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+                if error_class == ERROR_FATAL or attempt >= config.CALL_MAX_ATTEMPTS or \
+                        not _allows_call_after(deadline, backoff_seconds):
+                    raise
+                LOG.info('Retrying %s on %s in %.2f seconds after %s error, attempt %s: %s',
+                         operation_name, self.endpoint, backoff_seconds, error_class, attempt, e)
+                metrics.count(self.metric_prefix + 'Retries')
+                time.sleep(backoff_seconds)
+                attempt += 1
+                continue
+
+            self.token_bucket.on_success()
+            self.circuit_breaker.record_success()
+            return response
+
+    def _acquire(self, operation_name, deadline):
+        # the circuit is checked first so that suspended calls leave the token bucket alone
+        if not self.circuit_breaker.allow():
+            metrics.count(self.metric_prefix + 'CallsSuspended')
+            raise CallSuspendedError('Calls to {} are suspended after repeated failures, retrying in {:.0f} '
+                                     'seconds.'.format(self.endpoint, self.circuit_breaker.retry_after_seconds()))
+
+        remaining_seconds = deadline.remaining_seconds() if deadline else None
+        timeout = None if remaining_seconds is None else max(remaining_seconds - config.MIN_CALL_TIMEOUT_SECONDS, 0)
+        if not self.token_bucket.acquire(timeout):
+            self.circuit_breaker.release()
+            metrics.count(self.metric_prefix + 'CallsSuspended')
+            raise CallSuspendedError('Not enough time left to call {} on {} within the rate limit of {:.1f} calls '
+                                     'per second.'.format(operation_name, self.endpoint, self.token_bucket.rate))
+
+    def _record_error(self, error_class):
+        if error_class == ERROR_RETRYABLE:
+            self.circuit_breaker.record_failure()
+            return
+        # the endpoint answered
+        self.circuit_breaker.record_success()
+        if error_class == ERROR_THROTTLING:
+            self.token_bucket.on_throttle()
+            metrics.count(self.metric_prefix + 'Throttles')
+
+
+def get_policy(service_name, region_name=None):
+    """Get the call policy of an endpoint, shared across threads and warm invocations.
+
+    Arguments:
+        service_name {str} -- The name of the service, e.g. serverlessrepo
+
+    Keyword Arguments:
+        region_name {str} -- The region of the endpoint, the function's region if None (default: {None})
+
+    Returns:
+        CallPolicy -- The call policy
+
+    """
+    with _LOCK:
+        if (service_name, region_name) not in _POLICIES:
+            _POLICIES[(service_name, region_name)] = CallPolicy(service_name, region_name)
+        return _POLICIES[(service_name, region_name)]
+
+
+def clear_cache():
+    """Drop the call policies, and with them the rates and circuits of the endpoints."""
+    with _LOCK:
+        _POLICIES.clear()
+
+
+def classify(e):
+    """Classify the error of a call.
+
+    Arguments:
+        e {Exception} -- The error
+
+    Returns:
+        str -- ERROR_THROTTLING, ERROR_RETRYABLE or ERROR_FATAL
+
+    """
+    if isinstance(e, botocore_exceptions.ClientError):
+        error = e.response.get('Error', {})
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        if error.get('Code') in THROTTLING_ERROR_CODES or status == 429:
+            return ERROR_THROTTLING
+        if error.get('Code') in RETRYABLE_ERROR_CODES or status >= 500:
+            return ERROR_RETRYABLE
+        return ERROR_FATAL
+    if isinstance(e, (botocore_exceptions.ConnectionError, botocore_exceptions.HTTPClientError)):
+        # timeouts, connections refused or closed
+        return ERROR_RETRYABLE
+    return ERROR_FATAL
+
+
+def _allows_call_after(deadline, backoff_seconds):
+    remaining_seconds = deadline.remaining_seconds() if deadline else None
+    return remaining_seconds is None or remaining_seconds - backoff_seconds >= config.MIN_CALL_TIMEOUT_SECONDS
@@ -0,0 +1,198 @@
+"""Factory for boto3 clients that are cached and reused across warm invocations."""
+
+import config
+import lambdalogging
+import lazyimport
+
+import collections
+import functools
+import os
+import threading
+import time
+
+LOG = lambdalogging.getLogger(__name__)
+
+# boto3 and botocore are only imported when the first client is created
+boto3 = lazyimport.LazyModule('boto3')
+botocore_config = lazyimport.LazyModule('botocore.config')
+
+# calls of these services are retried by callpolicy, their clients don't retry
+RETRIED_BY_CALL_POLICY = ('serverlessrepo', 'codepipeline')
+# timeouts of deadline-bound clients are rounded down to one of these, so that few clients are created
+CALL_TIMEOUT_BUCKETS_SECONDS = (1, 2, 3, 5, 10, 15, 20, 30, 45, 60)
+
+# S3 clients by artifact credentials, least recently used first, with the time they expire at
+_S3_CLIENTS = collections.OrderedDict()
+# other clients by (service name, region name, call timeout, endpoint URL)
+_CLIENTS = {}
+# boto3 client creation is not thread safe
+_LOCK = threading.Lock()
+# whether the libraries were patched for X-Ray tracing, see patch_xray()
+_xray_patched = False
+
+
+def get_s3_client(artifact_credentials):
+    """Get an S3 client for the artifact credentials of a CodePipeline job.
+
+    Clients are cached by credentials for config.S3_CLIENT_CACHE_TTL_SECONDS, since the artifact
+    credentials are short lived, and at most config.S3_CLIENT_CACHE_SIZE clients are kept.
+
+    Arguments:
+        artifact_credentials {dict} -- The artifactCredentials of the CodePipeline job
+
+    Returns:
+        S3.Client -- The S3 client
+
+    """
+    cache_key = (
+        artifact_credentials['accessKeyId'],
+        artifact_credentials['secretAccessKey'],
+        artifact_credentials['sessionToken']
+    )
+    now = time.monotonic()
+
+    with _LOCK:
+        _evict_expired_s3_clients(now)
+        if cache_key in _S3_CLIENTS:
+            _S3_CLIENTS.move_to_end(cache_key)
+            return _S3_CLIENTS[cache_key][0]
+
+        LOG.debug('Creating S3 client for access key id %s', artifact_credentials['accessKeyId'])
+        _patch_xray()
+        client = boto3.client(
+            's3',
+            aws_access_key_id=artifact_credentials['accessKeyId'],
+            aws_secret_access_key=artifact_credentials['secretAccessKey'],
+            aws_session_token=artifact_credentials['sessionToken'],
+            config=get_botocore_config()
+        )
+        _S3_CLIENTS[cache_key] = (client, now + config.S3_CLIENT_CACHE_TTL_SECONDS)
+        while len(_S3_CLIENTS) > config.S3_CLIENT_CACHE_SIZE:
+            _S3_CLIENTS.popitem(last=False)
+        return client
+
+
+def get_function_s3_client():
+    """Get an S3 client with the function's own credentials.
+
+    Returns:
+        S3.Client -- The S3 client
+
+    """
+    return _get_client('s3')
+
+
+def get_function_dynamodb_client():
+    """Get a DynamoDB client with the function's own credentials, for config.DYNAMODB_ENDPOINT_URL if set.
+
+    Returns:
+        DynamoDB.Client -- The DynamoDB client
+
+    """
+    return _get_client('dynamodb', endpoint_url=config.DYNAMODB_ENDPOINT_URL or None)
+
+
+def get_codepipeline_client():
+    """Get the CodePipeline client of the function's region.
+
+    Returns:
+        CodePipeline.Client -- The CodePipeline client
+
+    """
+    return _get_client('codepipeline')
+
+
+def get_serverlessrepo_client(region_name=None, timeout=None):
+    """Get an AWS Serverless Application Repository client.
+
+    Keyword Arguments:
+        region_name {str} -- The region of the client, the function's region if None (default: {None})
+        timeout {float} -- When set, the client's calls don't retry and time out within this many seconds,
+        rounded down to one of CALL_TIMEOUT_BUCKETS_SECONDS (default: {None})
+
+    Returns:
+        ServerlessApplicationRepository.Client -- The serverlessrepo client
+
+    """
+    return _get_client('serverlessrepo', region_name, timeout)
+
+
+@functools.lru_cache(maxsize=None)
+def get_botocore_config():
+    """Get the botocore config shared by all clients.
+
+    Returns:
+        Config -- The botocore config
+
+    """
+    options = {
+        'max_pool_connections': config.CLIENT_MAX_POOL_CONNECTIONS,
+        'connect_timeout': config.CLIENT_CONNECT_TIMEOUT_SECONDS,
+        'read_timeout': config.CLIENT_READ_TIMEOUT_SECONDS
+    }
+    # TCP keep-alive on pooled connections needs a recent botocore
+    if 'tcp_keepalive' in botocore_config.Config.OPTION_DEFAULTS:
+        options['tcp_keepalive'] = True
+    return botocore_config.Config(**options)
+
+
+def patch_xray():
+    """Patch the libraries of config.XRAY_PATCH_MODULES for X-Ray tracing, once, when running in Lambda.
+
+    The X-Ray SDK costs most of the import time of the function, so it is imported here rather than on import, by the
+    first client created or by warmup. Patching only the libraries the function calls, rather than with patch_all(),
+    avoids importing every library the SDK supports. Outside of Lambda, e.g. in the worker or republish, there is no
+    segment to add the calls to, and the patched calls would fail, so nothing is patched.
+    """
+    with _LOCK:
+        _patch_xray()
+
+
+def is_xray_patched():
+    """Return whether the libraries were patched for X-Ray tracing, see patch_xray()."""
+    return _xray_patched
+
+
+def clear_cache():
+    """Drop all the cached clients."""
+    with _LOCK:
+        _S3_CLIENTS.clear()
+        _CLIENTS.clear()
+
+
+def _get_client(service_name, region_name=None, timeout=None, endpoint_url=None):
+    if timeout is not None:
+        timeout = max([t for t in CALL_TIMEOUT_BUCKETS_SECONDS if t <= timeout] or CALL_TIMEOUT_BUCKETS_SECONDS[:1])
+    cache_key = (service_name, region_name, timeout, endpoint_url)
+
+    with _LOCK:
+        if cache_key not in _CLIENTS:
+            LOG.debug('Creating %s client for region %s, timeout %s', service_name, region_name, timeout)
+            _patch_xray()
+            client_config = get_botocore_config()
+            if service_name in RETRIED_BY_CALL_POLICY:
+                client_config = client_config.merge(botocore_config.Config(retries={'max_attempts': 0}))
+            if timeout is not None:
+                client_config = client_config.merge(botocore_config.Config(
+                    connect_timeout=min(config.CLIENT_CONNECT_TIMEOUT_SECONDS, timeout),
+                    read_timeout=timeout,
+                    retries={'max_attempts': 0}
+                ))
+            _CLIENTS[cache_key] = boto3.client(service_name, region_name=region_name, endpoint_url=endpoint_url,
+                                               config=client_config)
+        return _CLIENTS[cache_key]
+
+
+def _patch_xray():
+    global _xray_patched
+    if _xray_patched or not config.XRAY_PATCH_MODULES or 'LAMBDA_TASK_ROOT' not in os.environ:
+        return
+    from aws_xray_sdk.core import patch
+    patch(config.XRAY_PATCH_MODULES)
+    _xray_patched = True
+
+
+def _evict_expired_s3_clients(now):
+    expired_keys = [cache_key for cache_key, (_, expires_at) in _S3_CLIENTS.items() if expires_at <= now]
+    for cache_key in expired_keys:
+        del _S3_CLIENTS[cache_key]
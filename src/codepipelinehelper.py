@@ -1,12 +1,20 @@
-"""CodePipeline helper for putting job execution result."""
+"""CodePipeline helper for putting job execution result, and polling the jobs of a custom action."""
 
+import callpolicy
+import clientfactory
 import lambdalogging
-
-import boto3
+import metrics
 
 LOG = lambdalogging.getLogger(__name__)
 
-CODEPIPELINE = boto3.client('codepipeline')
+# limits of CodePipeline on the job result
+MAX_SUMMARY_LENGTH = 2048
+MAX_FAILURE_MESSAGE_LENGTH = 5000
+TRUNCATED_SUFFIX = '...'
+# most jobs returned by one PollForJobs call
+MAX_POLL_BATCH_SIZE = 100
+# status of a job acknowledged by the worker that polled it
+JOB_STATUS_IN_PROGRESS = 'InProgress'
 
 
 def put_job_success(job_id, sar_response):
@@ -17,15 +25,68 @@ def put_job_success(job_id, sar_response):
         sar_response {dict} -- The result from invoking serverlessrepo.publish_application()
     """
     LOG.info('Putting job success result=%s', sar_response)
-    CODEPIPELINE.put_job_success_result(
+    _put_result(
+        'put_job_success_result',
+        jobId=job_id,
+        executionDetails={
+            'summary': _summarize(str(sar_response)),
+            'percentComplete': 100
+        }
+    )
+
+
+def put_job_successes(job_id, results, latencies=None):
+    """Notify AWS CodePipeline of a successful job that published several applications or regions.
+
+    Arguments:
+        job_id {str} -- The unique ID for the job generated by AWS CodePipeline
+        results {dict} -- The result from invoking serverlessrepo.publish_application(), or the exception of a
+        tolerated failure, by input artifact name or template key
+
+    Keyword Arguments:
+        latencies {dict} -- The seconds spent publishing, by the same keys (default: {None})
+    """
+    LOG.info('Putting job success results=%s latencies=%s', results, latencies)
+    latencies = latencies or {}
+    failed_count = sum(isinstance(result, Exception) for result in results.values())
+    summary = 'Published {}{} applications: {}'.format(
+        '{} of '.format(len(results) - failed_count) if failed_count else '',
+        len(results),
+        '; '.join(_describe_result(key, result, latencies.get(key)) for key, result in results.items())
+    )
+    _put_result(
+        'put_job_success_result',
         jobId=job_id,
         executionDetails={
-            'summary': str(sar_response),
+            'summary': _summarize(summary),
             'percentComplete': 100
         }
     )
 
 
+def put_job_continuation(job_id, continuation_token, summary, percent_complete):
+    """Notify AWS CodePipeline that the job continues in a new invocation.
+
+    AWS CodePipeline invokes the function again with the continuation token in the job data.
+
+    Arguments:
+        job_id {str} -- The unique ID for the job generated by AWS CodePipeline
+        continuation_token {str} -- The state of the job to pass to the next invocation
+        summary {str} -- The progress shown in the pipeline
+        percent_complete {int} -- The percentage of the work done so far
+    """
+    LOG.info('Putting job continuation token=%s', continuation_token)
+    _put_result(
+        'put_job_success_result',
+        jobId=job_id,
+        continuationToken=continuation_token,
+        executionDetails={
+            'summary': _summarize(summary),
+            'percentComplete': percent_complete
+        }
+    )
+
+
 def put_job_failure(job_id, e):
     """Notify AWS CodePipeline of a failed job.
 
@@ -34,10 +95,106 @@ def put_job_failure(job_id, e):
         e {Exception} -- The exception from invoking serverlessrepo.publish_application()
     """
     LOG.info('Putting job failure result=%s', e)
-    CODEPIPELINE.put_job_failure_result(
+    _put_result(
+        'put_job_failure_result',
         jobId=job_id,
         failureDetails={
             'type': 'JobFailed',
-            'message': str(e)
+            'message': _truncate(str(e), MAX_FAILURE_MESSAGE_LENGTH)
         }
     )
+
+
+def put_job_failures(job_id, errors, target_count):
+    """Notify AWS CodePipeline of a job that failed to publish some of its applications.
+
+    Arguments:
+        job_id {str} -- The unique ID for the job generated by AWS CodePipeline
+        errors {dict} -- The exception from publishing each failed target, a template in a region, by input artifact
+        name or template key, suffixed with @<region> when publishing to several regions
+        target_count {int} -- The number of targets of the job, each template in each region
+    """
+    message = '{} of {} applications failed to publish. {}'.format(len(errors), target_count, '; '.join(
+        '{}: {}'.format(name, e) for name, e in errors.items()
+    ))
+    put_job_failure(job_id, RuntimeError(message))
+
+
+def poll_for_jobs(action_type_id, max_batch_size):
+    """Poll for the jobs of a custom action.
+
+    Arguments:
+        action_type_id {dict} -- The category, owner, provider and version of the custom action type
+        max_batch_size {int} -- The most jobs to return, capped at MAX_POLL_BATCH_SIZE
+
+    Returns:
+        list -- The jobs, each with the id, data and nonce of the job
+
+    """
+    codepipeline_client = clientfactory.get_codepipeline_client()
+    response = callpolicy.get_policy('codepipeline').call(
+        'poll_for_jobs', codepipeline_client.poll_for_jobs,
+        actionTypeId=action_type_id,
+        maxBatchSize=min(max_batch_size, MAX_POLL_BATCH_SIZE)
+    )
+    return response.get('jobs', [])
+
+
+def acknowledge_job(job_id, nonce):
+    """Acknowledge a polled job, so that no other worker processes it.
+
+    Arguments:
+        job_id {str} -- The unique ID for the job generated by AWS CodePipeline
+        nonce {str} -- The nonce of the job from PollForJobs
+
+    Returns:
+        bool -- True when the job is for this worker to process
+
+    """
+    codepipeline_client = clientfactory.get_codepipeline_client()
+    response = callpolicy.get_policy('codepipeline').call(
+        'acknowledge_job', codepipeline_client.acknowledge_job, jobId=job_id, nonce=nonce)
+    if response.get('status') != JOB_STATUS_IN_PROGRESS:
+        LOG.warning('Not processing job %s with status %s', job_id, response.get('status'))
+        return False
+    return True
+
+
+def _put_result(operation_name, **request):
+    codepipeline_client = clientfactory.get_codepipeline_client()
+    with metrics.span('CodePipelineResult'):
+        try:
+            callpolicy.get_policy('codepipeline').call(
+                operation_name, getattr(codepipeline_client, operation_name), **request)
+        except Exception as e:
+            # without a result, the job only fails when it times out in CodePipeline
+            LOG.error('Unable to put the result of job %s: %s, request=%s', request['jobId'], e, request)
+            raise
+
+
+def _summarize(summary):
+    # the throttled and retried calls are kept when the summary is truncated
+    throttles = metrics.get_total('SarThrottles') + metrics.get_total('CodePipelineThrottles')
+    retries = metrics.get_total('SarRetries') + metrics.get_total('CodePipelineRetries')
+    if not throttles and not retries:
+        return _truncate(summary, MAX_SUMMARY_LENGTH)
+    calls = ' ({} throttled, {} retried AWS calls)'.format(throttles, retries)
+    return _truncate(summary, MAX_SUMMARY_LENGTH - len(calls)) + calls
+
+
+def _describe_result(key, result, latency):
+    if isinstance(result, Exception):
+        description = '{}: failed, {}'.format(key, result)
+    else:
+        description = '{}: {} {}'.format(key, result['application_id'], result['actions'] or 'no-op')
+        if result.get('changed_fields'):
+            description += ' changed {}'.format(', '.join(result['changed_fields']))
+    if latency is not None:
+        description += ' in {:.1f}s'.format(latency)
+    return description
+
+
+def _truncate(text, max_length):
+    if len(text) <= max_length:
+        return text
+    return text[:max_length - len(TRUNCATED_SUFFIX)] + TRUNCATED_SUFFIX
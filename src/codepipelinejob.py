@@ -0,0 +1,147 @@
+"""Model of the CodePipeline job in the event sent to the lambda, parsed once per invocation.
+
+The job is logged with its artifact credentials hidden. Use it as a logging argument, e.g.
+LOG.info('job=%s', job), so that it is only rendered when the log level is enabled.
+"""
+
+import userparameters
+
+HIDDEN_VALUE = '__HIDDEN__'
+# path of the job data in the event, for errors
+DATA_PATH = 'CodePipeline.job.data'
+# keys of the artifactCredentials of the job, needed to read the input artifacts
+ARTIFACT_CREDENTIALS_KEYS = ('accessKeyId', 'secretAccessKey', 'sessionToken')
+
+
+class InputArtifact(object):
+    """Input artifact of the job, a zip file in the artifact store of the pipeline."""
+
+    __slots__ = ('name', 'bucket_name', 'object_key')
+
+    def __init__(self, name, bucket_name, object_key):
+        """Initialize the input artifact.
+
+        Arguments:
+            name {str} -- The name of the artifact in the pipeline
+            bucket_name {str} -- The S3 bucket of the artifact
+            object_key {str} -- The S3 key of the artifact
+
+        """
+        self.name = name
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+
+    def __eq__(self, other):
+        """Return whether two InputArtifact objects are equal."""
+        return isinstance(other, type(self)) and _values(self) == _values(other)
+
+    def __repr__(self):
+        """Return the representation of the input artifact."""
+        return 'InputArtifact({} at s3://{}/{})'.format(self.name, self.bucket_name, self.object_key)
+
+
+class CodePipelineJob(object):
+    """CodePipeline job of an invocation."""
+
+    __slots__ = ('job_id', 'artifact_credentials', 'input_artifacts', 'user_parameters', 'continuation_token')
+
+    def __init__(self, job_id, artifact_credentials, input_artifacts, user_parameters=None, continuation_token=None):
+        """Initialize the job.
+
+        Arguments:
+            job_id {str} -- The unique ID for the job generated by AWS CodePipeline
+            artifact_credentials {dict} -- The artifactCredentials of the job, see clientfactory.get_s3_client()
+            input_artifacts {tuple} -- The InputArtifact of the action
+
+        Keyword Arguments:
+            user_parameters {dict} -- The parsed UserParameters of the action (default: {None})
+            continuation_token {str} -- The continuation token, None on the first invocation of the job
+            (default: {None})
+
+        """
+        self.job_id = job_id
+        self.artifact_credentials = artifact_credentials
+        self.input_artifacts = input_artifacts
+        self.user_parameters = user_parameters or {}
+        self.continuation_token = continuation_token
+
+    def __eq__(self, other):
+        """Return whether two CodePipelineJob objects are equal."""
+        return isinstance(other, type(self)) and _values(self) == _values(other)
+
+    def __repr__(self):
+        """Return the representation of the job, without the artifact credentials."""
+        return 'CodePipelineJob(job_id={!r}, input_artifacts={!r}, user_parameters={!r}, continuation_token={!r}, ' \
+            'artifact_credentials={!r})'.format(
+                self.job_id, list(self.input_artifacts), self.user_parameters, self.continuation_token,
+                {key: HIDDEN_VALUE for key in self.artifact_credentials})
+
+    @classmethod
+    def from_event(cls, event):
+        """Parse the job of an event.
+
+        Arguments:
+            event {dict} -- The JSON event sent to AWS Lambda by AWS CodePipeline
+
+        Returns:
+            CodePipelineJob -- The job
+
+        Raises:
+            RuntimeError -- When the event is missing a field, the action has no input artifact or invalid
+            UserParameters
+
+        """
+        data = _get(event, 'CodePipeline.job', 'data')
+        artifact_credentials = _get(data, 'artifactCredentials', parent=DATA_PATH)
+        for key in ARTIFACT_CREDENTIALS_KEYS:
+            _get(artifact_credentials, key, parent=DATA_PATH + '.artifactCredentials')
+
+        input_artifacts = tuple(
+            _parse_input_artifact(input_artifact, '{}.inputArtifacts[{}]'.format(DATA_PATH, i))
+            for i, input_artifact in enumerate(_get(data, 'inputArtifacts', parent=DATA_PATH)))
+        if not input_artifacts:
+            raise RuntimeError('You should have at least one input artifact. Please check the setting for the action.')
+
+        configuration = _get(data, 'actionConfiguration', 'configuration', parent=DATA_PATH)
+        return cls(
+            get_job_id(event),
+            artifact_credentials,
+            input_artifacts,
+            userparameters.parse_user_parameters(configuration.get('UserParameters', '')),
+            data.get('continuationToken')
+        )
+
+
+def get_job_id(event):
+    """Get the id of the job of an event, as soon as possible to report errors to it.
+
+    Arguments:
+        event {dict} -- The JSON event sent to AWS Lambda by AWS CodePipeline
+
+    Returns:
+        str -- The unique ID for the job generated by AWS CodePipeline
+
+    """
+    return _get(event, 'CodePipeline.job', 'id')
+
+
+def _parse_input_artifact(input_artifact, path):
+    return InputArtifact(
+        _get(input_artifact, 'name', parent=path),
+        _get(input_artifact, 'location', 's3Location', 'bucketName', parent=path),
+        _get(input_artifact, 'location', 's3Location', 'objectKey', parent=path)
+    )
+
+
+def _get(value, *keys, parent=None):
+    for i, key in enumerate(keys):
+        try:
+            value = value[key]
+        except (KeyError, TypeError):
+            path = '.'.join(((parent,) if parent else ()) + keys[:i + 1])
+            raise RuntimeError('Malformed CodePipeline event, {} is missing.'.format(path))
+    return value
+
+
+def _values(instance):
+    return tuple(getattr(instance, name) for name in instance.__slots__)
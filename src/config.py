@@ -3,3 +3,95 @@
 import os
 
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+# input artifacts up to this size are spooled in memory, bigger ones are spooled to ARTIFACT_SPOOL_DIR
+ARTIFACT_SPOOL_MEMORY_BYTES = int(os.getenv('ARTIFACT_SPOOL_MEMORY_BYTES', str(8 * 1024 * 1024)))
+ARTIFACT_SPOOL_DIR = os.getenv('ARTIFACT_SPOOL_DIR', '/tmp')
+# size caps for the zipped input artifact and the unzipped packaged template
+MAX_ARTIFACT_BYTES = int(os.getenv('MAX_ARTIFACT_BYTES', str(400 * 1024 * 1024)))
+MAX_TEMPLATE_BYTES = int(os.getenv('MAX_TEMPLATE_BYTES', str(10 * 1024 * 1024)))
+# read input artifacts with ranged GETs, fetching only the zip central directory and the template
+RANGED_ARTIFACT_FETCH = os.getenv('RANGED_ARTIFACT_FETCH', 'true').lower() == 'true'
+# size of the first ranged GET at the end of the artifact, which should cover the zip central directory
+RANGED_FETCH_TAIL_BYTES = int(os.getenv('RANGED_FETCH_TAIL_BYTES', str(128 * 1024)))
+# minimum size of subsequent ranged GETs
+RANGED_FETCH_BLOCK_BYTES = int(os.getenv('RANGED_FETCH_BLOCK_BYTES', str(1024 * 1024)))
+# artifacts smaller than this are downloaded in full, ranged GETs would not save anything
+RANGED_FETCH_MIN_OBJECT_BYTES = int(os.getenv('RANGED_FETCH_MIN_OBJECT_BYTES', str(1024 * 1024)))
+# bytes of templates extracted from input artifacts kept in memory by a warm container, 0 to disable, see artifactcache
+ARTIFACT_CACHE_MEMORY_BYTES = int(os.getenv('ARTIFACT_CACHE_MEMORY_BYTES', str(32 * 1024 * 1024)))
+# directory and most bytes of the extracted templates kept on disk, an empty directory or 0 to disable
+ARTIFACT_CACHE_DIR = os.getenv('ARTIFACT_CACHE_DIR', '/tmp/artifact-cache')
+ARTIFACT_CACHE_DISK_BYTES = int(os.getenv('ARTIFACT_CACHE_DISK_BYTES', str(64 * 1024 * 1024)))
+# path or glob pattern of the packaged template in the input artifact, overridden by UserParameters
+TEMPLATE_PATH = os.getenv('TEMPLATE_PATH', '')
+# publish every template with application metadata in the input artifacts, overridden by UserParameters
+MONOREPO = os.getenv('MONOREPO', 'false').lower() == 'true'
+# settings of the boto3 clients, which are reused across warm invocations
+CLIENT_MAX_POOL_CONNECTIONS = int(os.getenv('CLIENT_MAX_POOL_CONNECTIONS', '10'))
+CLIENT_CONNECT_TIMEOUT_SECONDS = int(os.getenv('CLIENT_CONNECT_TIMEOUT_SECONDS', '5'))
+CLIENT_READ_TIMEOUT_SECONDS = int(os.getenv('CLIENT_READ_TIMEOUT_SECONDS', '60'))
+# S3 clients are cached by artifact credentials, which are short lived
+S3_CLIENT_CACHE_SIZE = int(os.getenv('S3_CLIENT_CACHE_SIZE', '8'))
+S3_CLIENT_CACHE_TTL_SECONDS = int(os.getenv('S3_CLIENT_CACHE_TTL_SECONDS', '900'))
+# comma separated libraries patched for X-Ray tracing, an empty value disables the X-Ray SDK
+XRAY_PATCH_MODULES = tuple(m.strip() for m in os.getenv('XRAY_PATCH_MODULES', 'botocore').split(',') if m.strip())
+# time kept at the end of an invocation to report the job result to CodePipeline
+DEADLINE_RESERVE_SECONDS = int(os.getenv('DEADLINE_RESERVE_SECONDS', '5'))
+# when less time is left for an API call, the job continues in a new invocation with a continuation token
+MIN_CALL_TIMEOUT_SECONDS = int(os.getenv('MIN_CALL_TIMEOUT_SECONDS', '3'))
+# attempts of each SAR and CodePipeline call, retried with exponential backoff and jitter, see callpolicy
+CALL_MAX_ATTEMPTS = int(os.getenv('CALL_MAX_ATTEMPTS', '4'))
+CALL_BACKOFF_BASE_SECONDS = float(os.getenv('CALL_BACKOFF_BASE_SECONDS', '0.2'))
+CALL_BACKOFF_MAX_SECONDS = float(os.getenv('CALL_BACKOFF_MAX_SECONDS', '5'))
+# client-side rate limit of the calls to each endpoint, halved when throttled and growing back on success
+CALL_MAX_RATE_PER_SECOND = float(os.getenv('CALL_MAX_RATE_PER_SECOND', '10'))
+CALL_MIN_RATE_PER_SECOND = float(os.getenv('CALL_MIN_RATE_PER_SECOND', '0.5'))
+# calls to an endpoint are suspended after this many consecutive retryable errors, for this many seconds
+CIRCUIT_BREAKER_FAILURES = int(os.getenv('CIRCUIT_BREAKER_FAILURES', '5'))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv('CIRCUIT_BREAKER_RESET_SECONDS', '30'))
+# a publishing phase interrupted by timeouts or throttling more often than this fails the job
+MAX_PHASE_ATTEMPTS = int(os.getenv('MAX_PHASE_ATTEMPTS', '5'))
+# seconds the state of an application from GetApplication is reused by a warm container to skip unchanged updates
+APPLICATION_STATE_TTL_SECONDS = float(os.getenv('APPLICATION_STATE_TTL_SECONDS', '60'))
+# fetch the state of the applications a job is expected to publish while fetching its artifacts, see applicationprefetch
+PREFETCH_APPLICATION_STATE = os.getenv('PREFETCH_APPLICATION_STATE', 'true').lower() == 'true'
+# URL of the store of published template digests (memory://, file://<path> or s3://<bucket>/<prefix>),
+# publishing a template identical to the last published one is skipped. Empty to always publish.
+PUBLISH_DIGEST_STORE = os.getenv('PUBLISH_DIGEST_STORE', '')
+# URL of the store of job and publish leases and results (memory://, file://<path> or dynamodb://<table>), duplicate
+# jobs get the result of the first one, see idempotency. Empty to disable.
+IDEMPOTENCY_STORE = os.getenv('IDEMPOTENCY_STORE', '')
+# seconds a lease is held when there is no deadline, e.g. in the worker, before another execution can take over
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '900'))
+# endpoint of the DynamoDB stores, e.g. a DynamoDB-compatible service, empty for the endpoint of the region. Read by
+# the function since the locked botocore ignores the AWS_ENDPOINT_URL_<SERVICE> variables
+DYNAMODB_ENDPOINT_URL = os.getenv('AWS_ENDPOINT_URL_DYNAMODB', '')
+# seconds the result of a job or publish is returned to its duplicates
+IDEMPOTENCY_RESULT_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_RESULT_TTL_SECONDS', '3600'))
+# number of input artifacts, templates and regions published concurrently
+PUBLISH_CONCURRENCY = int(os.getenv('PUBLISH_CONCURRENCY', '4'))
+# comma separated regions the applications are published to, overridden by UserParameters, empty for the function's
+REGIONS = tuple(r.strip() for r in os.getenv('REGIONS', '').split(',') if r.strip())
+# all-or-nothing fails the job when any region fails, best-effort when an application fails in all its regions
+REGION_FAILURE_POLICY = os.getenv('REGION_FAILURE_POLICY', 'all-or-nothing')
+# CloudWatch namespace of the metrics logged at the end of each invocation, an empty value disables them
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'ServerlessRepoPublish')
+# profile the memory of each invocation with tracemalloc and log a recommended memory setting, see memprofile
+MEMORY_PROFILING = os.getenv('MEMORY_PROFILING', 'false').lower() == 'true'
+# frames kept per traced allocation, more frames find allocation sites deeper in the call stack
+MEMORY_PROFILING_FRAMES = int(os.getenv('MEMORY_PROFILING_FRAMES', '16'))
+# number of allocation sites in the memory profile
+MEMORY_PROFILING_TOP_SITES = int(os.getenv('MEMORY_PROFILING_TOP_SITES', '10'))
+# custom action type whose jobs are polled by the worker entry point, see worker. The provider must be set.
+WORKER_ACTION_CATEGORY = os.getenv('WORKER_ACTION_CATEGORY', 'Deploy')
+WORKER_ACTION_PROVIDER = os.getenv('WORKER_ACTION_PROVIDER', '')
+WORKER_ACTION_VERSION = os.getenv('WORKER_ACTION_VERSION', '1')
+# number of jobs the worker processes concurrently
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '4'))
+# seconds the worker waits before polling again when no job was found
+WORKER_POLL_INTERVAL_SECONDS = float(os.getenv('WORKER_POLL_INTERVAL_SECONDS', '5'))
+# warm the function up in the init phase of provisioned concurrency, see warmup
+WARMUP_ON_INIT = os.getenv('WARMUP_ON_INIT', 'true').lower() == 'true'
+# also open connections to the SAR endpoints when warming up, unless the warm-up event says otherwise
+WARMUP_CONNECT = os.getenv('WARMUP_CONNECT', 'false').lower() == 'true'
@@ -0,0 +1,39 @@
+"""Deadline of a Lambda invocation, used to bound the time spent in API calls."""
+
+import config
+
+
+class Deadline(object):
+    """Time left in the current invocation, minus a reserve for reporting the job result."""
+
+    def __init__(self, context):
+        """Initialize the deadline.
+
+        Arguments:
+            context {LambdaContext} -- The context passed by AWS Lambda, None when there is no deadline
+
+        """
+        self._context = context
+
+    def remaining_seconds(self):
+        """Return the seconds left for work before the result must be reported, None without deadline."""
+        if self._context is None:
+            return None
+        return self._context.get_remaining_time_in_millis() / 1000.0 - config.DEADLINE_RESERVE_SECONDS
+
+    def call_timeout(self):
+        """Return the timeout in seconds for the next API call, None without deadline.
+
+        Returns:
+            float -- The time left, capped at config.CLIENT_READ_TIMEOUT_SECONDS
+
+        """
+        remaining_seconds = self.remaining_seconds()
+        if remaining_seconds is None:
+            return None
+        return min(remaining_seconds, config.CLIENT_READ_TIMEOUT_SECONDS)
+
+    def allows_call(self):
+        """Return whether there is enough time left for another API call."""
+        call_timeout = self.call_timeout()
+        return call_timeout is None or call_timeout >= config.MIN_CALL_TIMEOUT_SECONDS
@@ -2,16 +2,32 @@
 
 # must be the first import in files with lambda function handlers
 import lambdainit  # noqa: F401
+import applicationprefetch
+import codepipelinejob
+import config
+import deadline
+import idempotency
 import lambdalogging
+import memprofile
+import metrics
+import publishcache
+import publisher
 import s3helper
 import codepipelinehelper
+import userparameters
+import warmup
 
-import serverlessrepo
-import copy
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import time
 
 LOG = lambdalogging.getLogger(__name__)
 
-HIDDEN_VALUE = '__HIDDEN__'
+# the job fails when publishing fails in any region
+REGION_FAILURE_ALL_OR_NOTHING = 'all-or-nothing'
+# the job fails when publishing an application fails in all the regions
+REGION_FAILURE_BEST_EFFORT = 'best-effort'
+REGION_FAILURE_POLICIES = (REGION_FAILURE_ALL_OR_NOTHING, REGION_FAILURE_BEST_EFFORT)
 
 
 def publish(event, context):
@@ -21,42 +37,451 @@ def publish(event, context):
     to AWS Serverless Application Repository. If the application
     already exists, it will update the application metadata. Besides,
     it will create an application version if SemanticVersion is specified
-    in the Metadata section of the packaged template.
+    in the Metadata section of the packaged template. Publishing is skipped
+    when the template is identical to the last one published, see publishcache.
+    A retried invocation of a job in progress or done is not processed, and a
+    template published by several jobs at once is published once, see idempotency.
+
+    When the action has several input artifacts, the application of each one is published concurrently,
+    and the job succeeds only when all of them are published. In monorepo mode, every template with
+    application metadata in the input artifacts is published, see s3helper.get_input_artifact_templates().
+    With Regions, each application is published to every region concurrently, and the region failure policy
+    decides whether the job fails when some of the regions fail.
+
+    The state of the applications the job is expected to publish is fetched from SAR while the input artifacts
+    are fetched, see applicationprefetch.
+
+    When the invocation runs out of time between API calls, the job continues in a new invocation
+    with a continuation token carrying the progress.
+
+    A warm-up event prepares the function for the next jobs without touching CodePipeline, see warmup.
 
     Arguments:
         event {dict} -- The JSON event sent to AWS Lambda by AWS CodePipeline
         (https://docs.aws.amazon.com/codepipeline/latest/userguide/actions-invoke-lambda-function.html#actions-invoke-lambda-function-json-event-example)
         context {LambdaContext} -- The context passed by AWS Lambda
+
+    Returns:
+        dict -- The report of warmup.warm_up() for a warm-up event, None otherwise
     """
-    job_id = event['CodePipeline.job']['id']
+    if warmup.is_warmup_event(event):
+        return warmup.handle_event(event)
+
+    metrics.reset()
+    outcome = metrics.OUTCOME_FAILURE
+    try:
+        with metrics.span('Invocation'):
+            outcome = _publish(event, context)
+    finally:
+        metrics.emit(outcome)
 
-    redacted_event = _remove_sensitive_items_from_event(event)
-    LOG.info('CodePipeline publish to SAR request={}'.format(redacted_event))
+
+if config.MEMORY_PROFILING:
+    # the handler is only wrapped when profiling is enabled, so that it costs nothing otherwise
+    publish = memprofile.profile(publish)
+
+# the init phase of provisioned concurrency runs ahead of the first job, which then finds everything set up
+warmup.on_init()
+
+
+def _publish(event, context):
+    """Publish to AWS Serverless Application Repository and report the job result, see publish().
+
+    Returns:
+        str -- The outcome of the job, one of the metrics.OUTCOME_* constants
+
+    """
+    job_id = codepipelinejob.get_job_id(event)
 
     try:
-        packaged_template_str = s3helper.get_input_artifact(event)
-        LOG.info('Making API calls to AWS Serverless Application Repository...')
-        sar_response = serverlessrepo.publish_application(packaged_template_str)
-        codepipelinehelper.put_job_success(job_id, sar_response)
+        job = codepipelinejob.CodePipelineJob.from_event(event)
     except Exception as e:
         LOG.error(str(e))
         codepipelinehelper.put_job_failure(job_id, e)
+        return metrics.OUTCOME_FAILURE
+
+    job_deadline = deadline.Deadline(context)
+    lease, duplicate = idempotency.acquire(idempotency.get_job_key(job), _get_lease_seconds(job_deadline))
+    if duplicate:
+        # the result of the job is put by the other invocation, or was put already
+        LOG.info('Not processing duplicate invocation of job %s, %s by another invocation', job_id,
+                 duplicate['status'])
+        metrics.count('DuplicateJobs')
+        return metrics.OUTCOME_DUPLICATE
+
+    outcome = None
+    try:
+        outcome = _publish_job(job, job_deadline, getattr(context, 'invoked_function_arn', None))
+        return outcome
+    finally:
+        if outcome is None:
+            idempotency.release(lease)
+        else:
+            idempotency.complete(lease, {'outcome': outcome})
 
 
-def _remove_sensitive_items_from_event(event):
-    """Remove sensitive items from the CodePipeline event.
+def _publish_job(job, job_deadline, function_arn=None):
+    """Publish the applications of a parsed job and report the job result, see publish().
 
     Arguments:
-        event {dict} -- The JSON event sent to AWS Lambda by AWS CodePipeline
+        job {CodePipelineJob} -- The CodePipeline job
+        job_deadline {Deadline} -- The deadline of the invocation
+
+    Keyword Arguments:
+        function_arn {str} -- The ARN of the invoked function, None outside of Lambda (default: {None})
+
+    Returns:
+        str -- The outcome of the job, one of the metrics.OUTCOME_* constants
+
+    """
+    job_id = job.job_id
+    try:
+        LOG.info('CodePipeline publish to SAR request=%s', job)
+        regions = _get_regions(job.user_parameters)
+        region_failure_policy = _get_region_failure_policy(job.user_parameters)
+        monorepo = job.user_parameters.get(userparameters.MONOREPO, config.MONOREPO)
+        packaged_templates = _get_packaged_templates_and_prefetch(job, monorepo, regions, job_deadline, function_arn)
+        publications = publisher.from_continuation_token(job.continuation_token)
+        publications = {
+            _get_target_key(key, region): publications.get(_get_target_key(key, region), publisher.Publication())
+            for key in packaged_templates for region in regions
+        }
+        results, latencies = publish_templates(packaged_templates, regions, publications, job_deadline)
+        if config.PREFETCH_APPLICATION_STATE:
+            _remember_applications(job, packaged_templates, regions, results)
+    except Exception as e:
+        LOG.error(str(e))
+        codepipelinehelper.put_job_failure(job_id, e)
+        return metrics.OUTCOME_FAILURE
+
+    errors = {key: result for key, result in results.items() if isinstance(result, Exception)}
+    pending = [key for key, result in results.items() if result is None]
+    try:
+        if errors and not _is_failure_tolerated(results, packaged_templates, regions, region_failure_policy):
+            if len(results) == 1:
+                codepipelinehelper.put_job_failure(job_id, next(iter(errors.values())))
+            else:
+                codepipelinehelper.put_job_failures(job_id, errors, len(results))
+            return metrics.OUTCOME_FAILURE
+        elif pending:
+            codepipelinehelper.put_job_continuation(
+                job_id,
+                publisher.to_continuation_token(publications),
+                _continuation_summary(publications, pending),
+                sum(p.percent_complete() for p in publications.values()) // len(publications)
+            )
+            return metrics.OUTCOME_CONTINUATION
+        elif len(results) == 1:
+            codepipelinehelper.put_job_success(job_id, next(iter(results.values())))
+        else:
+            codepipelinehelper.put_job_successes(job_id, results, latencies)
+        return metrics.OUTCOME_SUCCESS
+    except Exception as e:
+        LOG.error(str(e))
+        codepipelinehelper.put_job_failure(job_id, e)
+        return metrics.OUTCOME_FAILURE
+
+
+def _get_regions(user_parameters):
+    """Get the regions to publish to.
+
+    Arguments:
+        user_parameters {dict} -- The UserParameters of the action
+
+    Returns:
+        list -- The region names, [None] to publish to the function's region only
+
+    """
+    regions = user_parameters.get(userparameters.REGIONS, config.REGIONS)
+    if not isinstance(regions, (list, tuple)) or not all(isinstance(r, str) and r for r in regions):
+        raise RuntimeError('{} must be a list of region names.'.format(userparameters.REGIONS))
+    if len(set(regions)) != len(regions):
+        raise RuntimeError('{} must not contain the same region twice.'.format(userparameters.REGIONS))
+    return list(regions) or [None]
+
+
+def _get_region_failure_policy(user_parameters):
+    region_failure_policy = user_parameters.get(userparameters.REGION_FAILURE_POLICY, config.REGION_FAILURE_POLICY)
+    if region_failure_policy not in REGION_FAILURE_POLICIES:
+        raise RuntimeError('{} must be one of {}.'.format(
+            userparameters.REGION_FAILURE_POLICY, ', '.join(REGION_FAILURE_POLICIES)))
+    return region_failure_policy
+
+
+def _get_target_key(key, region):
+    """Get the key of publishing a template to a region, the template key itself for the function's region."""
+    if region is None:
+        return key
+    return '{}@{}'.format(key, region)
+
+
+def _is_failure_tolerated(results, packaged_templates, regions, region_failure_policy):
+    """Return whether the job can succeed despite the failed targets.
+
+    With the best-effort policy, failures are tolerated as long as each template is published to a region.
+    """
+    if region_failure_policy != REGION_FAILURE_BEST_EFFORT:
+        return False
+    return all(
+        any(not isinstance(results[_get_target_key(key, region)], Exception) for region in regions)
+        for key in packaged_templates
+    )
+
+
+def _get_packaged_templates(job, monorepo):
+    """Get the packaged templates of the input artifacts, concurrently when there are several.
+
+    Arguments:
+        job {CodePipelineJob} -- The CodePipeline job
+        monorepo {bool} -- Whether to get every template with application metadata, instead of one per input artifact
+
+    Returns:
+        dict -- The content of each template, or the exception that made getting it fail, by key: the input
+        artifact name, or in monorepo mode the input artifact name and the template file name joined by '/'
+
+    """
+    def get_packaged_templates(input_artifact):
+        name = input_artifact.name
+        try:
+            if monorepo:
+                packaged_templates = s3helper.get_input_artifact_templates(job, input_artifact)
+                return [('{}/{}'.format(name, file_name), packaged_template)
+                        for file_name, packaged_template in packaged_templates]
+            return [(name, s3helper.get_input_artifact(job, input_artifact))]
+        except Exception as e:
+            LOG.error('Failed to get input artifact %s: %s', name, e)
+            return [(name, e)]
+
+    return {key: packaged_template
+            for packaged_templates in _map_concurrently(get_packaged_templates, job.input_artifacts)
+            for key, packaged_template in packaged_templates}
+
+
+def _get_packaged_templates_and_prefetch(job, monorepo, regions, job_deadline, function_arn):
+    """Get the packaged templates of the input artifacts, see _get_packaged_templates().
+
+    Meanwhile, the state of the applications the job is expected to publish is fetched from SAR on another thread.
+
+    Arguments:
+        job {CodePipelineJob} -- The CodePipeline job
+        monorepo {bool} -- Whether to get every template with application metadata
+        regions {list} -- The regions to publish to, [None] for the function's region only
+        job_deadline {Deadline} -- The deadline of the invocation
+        function_arn {str} -- The ARN of the invoked function, None outside of Lambda
 
     Returns:
-        dict -- The redacted CodePipeline event
+        dict -- The content of each template, or the exception that made getting it fail, by key
 
     """
-    event_to_log = copy.deepcopy(event)
-    artifact_credentials = event_to_log['CodePipeline.job']['data']['artifactCredentials']
-    artifact_credentials['accessKeyId'] = HIDDEN_VALUE
-    artifact_credentials['secretAccessKey'] = HIDDEN_VALUE
-    artifact_credentials['sessionToken'] = HIDDEN_VALUE
+    targets = applicationprefetch.predict(job, regions, function_arn) if config.PREFETCH_APPLICATION_STATE else []
+    if not targets:
+        return _get_packaged_templates(job, monorepo)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # in a copy of the caller's context, so that the metrics of a job are recorded together, see metrics
+        future = executor.submit(contextvars.copy_context().run, applicationprefetch.prefetch, targets, job_deadline)
+        packaged_templates = _get_packaged_templates(job, monorepo)
+        fetched = time.monotonic()
+        with metrics.span('PrefetchWait'):
+            future.result()
+    LOG.info('Fetched the input artifacts in %.3f seconds, then waited %.3f seconds for the state of %d applications',
+             fetched - start, time.monotonic() - fetched, len(targets))
+    return packaged_templates
+
+
+def _remember_applications(job, packaged_templates, regions, results):
+    """Remember the applications published from each input artifact to each region, see applicationprefetch.
+
+    The applications of an input artifact are not remembered when some of its templates were not published.
+    """
+    for input_artifact in job.input_artifacts:
+        keys = [key for key in packaged_templates if key.partition('/')[0] == input_artifact.name]
+        for region in regions:
+            artifact_results = [results[_get_target_key(key, region)] for key in keys]
+            if artifact_results and all(isinstance(result, dict) for result in artifact_results):
+                applicationprefetch.remember(
+                    input_artifact, region, [result['application_id'] for result in artifact_results])
+
+
+def prepare_templates(packaged_templates):
+    """Parse each distinct template once, and fail templates with different digests publishing the same application.
+
+    Arguments:
+        packaged_templates {dict} -- The content of each template, its PreparedTemplate if it was prepared already,
+        or the exception that made getting it fail, by key
+
+    Returns:
+        tuple -- The PreparedTemplate of each template by key, then the exception that made each other template
+        fail by key
+
+    """
+    errors = {}
+    templates = {}
+    prepared_templates = {}
+    for key, packaged_template in packaged_templates.items():
+        if isinstance(packaged_template, Exception):
+            errors[key] = packaged_template
+            continue
+        if isinstance(packaged_template, publisher.PreparedTemplate):
+            templates[key] = packaged_template
+        else:
+            if packaged_template not in prepared_templates:
+                prepared_templates[packaged_template] = _prepare(packaged_template)
+            if isinstance(prepared_templates[packaged_template], Exception):
+                errors[key] = prepared_templates[packaged_template]
+                continue
+            templates[key] = prepared_templates[packaged_template]
+        metrics.add_application(templates[key].app_metadata.name)
+
+    keys_by_application = {}
+    for keys in _get_keys_by_digest(templates).values():
+        keys_by_application.setdefault(templates[keys[0]].app_metadata.name, []).append(keys)
+    for name, digest_keys in keys_by_application.items():
+        if len(digest_keys) > 1:
+            e = RuntimeError('More than one template publishes application {}: {}'.format(
+                name, ', '.join(keys[0] for keys in digest_keys)))
+            # the templates with the same digest as a conflicting one fail with it
+            errors.update((key, e) for keys in digest_keys for key in keys)
+    return {key: template for key, template in templates.items() if key not in errors}, errors
+
+
+def publish_templates(packaged_templates, regions, publications, job_deadline):
+    """Publish the application of each template to each region concurrently, for a job or for republish.
+
+    Each distinct template is parsed once. Templates with the same digest are published once, and templates
+    with different digests that publish the same application fail, see prepare_templates().
+
+    Arguments:
+        packaged_templates {dict} -- The content of each template, its PreparedTemplate if it was prepared already,
+        or the exception that made getting it fail, by key
+        regions {list} -- The regions to publish to, [None] for the function's region only
+        publications {dict} -- The Publication of each template and region by target key, updated in place
+        job_deadline {Deadline} -- The deadline of the invocation
+
+    Returns:
+        tuple -- The result of each template and region by target key, ordered by template then region: the
+        response of serverlessrepo.publish_application(), None when publishing continues in a new invocation, or the
+        exception that made publishing fail. Then the seconds spent publishing each target that was published.
+
+    """
+    templates, errors = prepare_templates(packaged_templates)
+    # the first of the templates with the same digest is published for all of them
+    keys_by_digest = _get_keys_by_digest(templates)
+
+    latencies = {}
+
+    def publish_target(target):
+        key, region = target
+        target_key = _get_target_key(key, region)
+        start = time.monotonic()
+        try:
+            return _publish_template(target_key, templates[key], publications[target_key], job_deadline, region)
+        except Exception as e:
+            LOG.error('Failed to publish %s: %s', target_key, e)
+            return e
+        finally:
+            latencies[target_key] = time.monotonic() - start
+            LOG.info('Spent %.3f seconds publishing %s', latencies[target_key], target_key)
+
+    targets = [(keys[0], region) for keys in keys_by_digest.values() for region in regions]
+    results = {_get_target_key(key, region): result
+               for (key, region), result in zip(targets, _map_concurrently(publish_target, targets))}
+    for key, e in errors.items():
+        for region in regions:
+            results[_get_target_key(key, region)] = e
+    for keys in keys_by_digest.values():
+        for key in keys[1:]:
+            for region in regions:
+                results[_get_target_key(key, region)] = results[_get_target_key(keys[0], region)]
+                if _get_target_key(keys[0], region) in latencies:
+                    latencies[_get_target_key(key, region)] = latencies[_get_target_key(keys[0], region)]
+
+    target_keys = [_get_target_key(key, region) for key in packaged_templates for region in regions]
+    return {target_key: results[target_key] for target_key in target_keys}, latencies
+
+
+def _get_keys_by_digest(templates):
+    keys_by_digest = {}
+    for key, template in templates.items():
+        keys_by_digest.setdefault(template.digest, []).append(key)
+    return keys_by_digest
+
+
+def _prepare(packaged_template):
+    try:
+        return publisher.prepare(packaged_template)
+    except Exception as e:
+        return e
+
+
+def _publish_template(target_key, template, publication, job_deadline, region):
+    no_op_result = publishcache.find_published(template, region) if publication == publisher.Publication() else None
+    if no_op_result:
+        # nothing left to do for this target if the job continues in a new invocation
+        publication.phase = publisher.PHASE_DONE
+        publication.application_id = no_op_result['application_id']
+        return no_op_result
+
+    lease, duplicate = idempotency.acquire(idempotency.get_publish_key(template, region),
+                                           _get_lease_seconds(job_deadline))
+    if duplicate and duplicate['status'] == idempotency.STATUS_COMPLETED:
+        LOG.info('%s was published by another job, reusing its result', target_key)
+        metrics.count('DuplicatePublishes')
+        publication.phase = publisher.PHASE_DONE
+        publication.application_id = duplicate['result']['application_id']
+        return duplicate['result']
+    if duplicate:
+        # the job continues in a new invocation, which reuses the result once the other job is done
+        LOG.info('%s is being published by another job, continuing in a new invocation', target_key)
+        metrics.count('DuplicatePublishes')
+        return None
+
+    sar_response = None
+    try:
+        LOG.info('Making API calls to AWS Serverless Application Repository for %s...', target_key)
+        if not publisher.run(template, publication, job_deadline, region):
+            return None
+        sar_response = publisher.get_result(template, publication)
+    finally:
+        if sar_response is None:
+            idempotency.release(lease)
+        else:
+            idempotency.complete(lease, sar_response)
+
+    publishcache.record_published(template, sar_response['application_id'], region)
+    return sar_response
+
+
+def _get_lease_seconds(job_deadline):
+    """Get how long a lease is held, until the lambda times out, or the default lease without deadline."""
+    remaining_seconds = job_deadline.remaining_seconds()
+    if remaining_seconds is None:
+        return None
+    return remaining_seconds + config.DEADLINE_RESERVE_SECONDS
+
+
+def _map_concurrently(function, items):
+    """Call a function on each item, on a thread pool of at most config.PUBLISH_CONCURRENCY threads.
+
+    Arguments:
+        function {callable} -- The function to call, which must not raise
+        items {list} -- The items to call it on
+
+    Returns:
+        list -- The results, in the order of the items
+
+    """
+    if len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(config.PUBLISH_CONCURRENCY, len(items))) as executor:
+        # in a copy of the caller's context, so that the metrics of a job are recorded together, see metrics
+        futures = [executor.submit(contextvars.copy_context().run, function, item) for item in items]
+        return [future.result() for future in futures]
+
 
-    return event_to_log
+def _continuation_summary(publications, pending):
+    if len(publications) == 1:
+        return 'Publishing continues with phase {}'.format(publications[pending[0]].phase)
+    return 'Publishing continues for {}'.format(
+        ', '.join('{} with phase {}'.format(key, publications[key].phase) for key in pending))
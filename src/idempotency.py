@@ -0,0 +1,173 @@
+"""Deduplicate jobs and publishes that run more than once, e.g. when CodePipeline or a user retries them.
+
+An execution acquires a lease on the key of its work before doing it, and completes the lease with its result.
+Until the result expires after config.IDEMPOTENCY_RESULT_TTL_SECONDS, duplicates get the result back instead of
+doing the work again. Duplicates of an execution in progress are told so until its lease expires, e.g. when the
+lambda running it timed out, and another execution can then take over. Records are kept in the store configured with
+config.IDEMPOTENCY_STORE, see kvstore. Failures of the store are logged and don't fail the job, the work is then done
+without deduplication. Failures to acquire a lease are logged as errors and counted as IdempotencyStoreErrors, since
+deduplication is then off.
+"""
+
+import config
+import kvstore
+import lambdalogging
+import metrics
+
+import functools
+import hashlib
+import time
+import uuid
+
+LOG = lambdalogging.getLogger(__name__)
+
+STATUS_IN_PROGRESS = 'InProgress'
+STATUS_COMPLETED = 'Completed'
+STATUS_RELEASED = 'Released'
+# conditional writes lost to other executions before giving up on deduplication
+MAX_ACQUIRE_ATTEMPTS = 3
+
+
+class Lease(object):
+    """Lease on the key of some work, held by the current execution."""
+
+    __slots__ = ('key', 'record')
+
+    def __init__(self, key, record):
+        """Initialize the lease.
+
+        Arguments:
+            key {str} -- The key of the work
+            record {dict} -- The in-progress record written to the store
+
+        """
+        self.key = key
+        self.record = record
+
+    def __repr__(self):
+        """Return the representation of the lease."""
+        return 'Lease({}, expiresAt={})'.format(self.key, self.record['expiresAt'])
+
+
+@functools.lru_cache(maxsize=None)
+def get_store():
+    """Get the store of leases and results, None if config.IDEMPOTENCY_STORE is not set."""
+    if not config.IDEMPOTENCY_STORE:
+        return None
+    return kvstore.from_url(config.IDEMPOTENCY_STORE)
+
+
+def get_job_key(job):
+    """Get the key of an invocation of a job, which is the same for a retried invocation.
+
+    Arguments:
+        job {CodePipelineJob} -- The CodePipeline job
+
+    Returns:
+        str -- The key
+
+    """
+    # continuation tokens can be long, the invocations of a job are told apart by their digest
+    if job.continuation_token is None:
+        return 'job/{}/start'.format(job.job_id)
+    return 'job/{}/{}'.format(job.job_id, hashlib.sha256(job.continuation_token.encode()).hexdigest())
+
+
+def get_publish_key(template, region_name=None):
+    """Get the key of publishing a template, which is the same for all the jobs publishing it.
+
+    Arguments:
+        template {PreparedTemplate} -- The template to publish
+
+    Keyword Arguments:
+        region_name {str} -- The region the application is published to, None for the function's region
+        (default: {None})
+
+    Returns:
+        str -- The key
+
+    """
+    return 'publish/{}/{}/{}'.format(region_name or 'default', template.app_metadata.name, template.digest)
+
+
+def acquire(key, lease_seconds=None):
+    """Acquire the lease on a key, unless another execution holds it or has completed it.
+
+    Arguments:
+        key {str} -- The key of the work, see get_job_key() and get_publish_key()
+
+    Keyword Arguments:
+        lease_seconds {float} -- How long the lease is held unless completed or released,
+        config.IDEMPOTENCY_LEASE_SECONDS if None (default: {None})
+
+    Returns:
+        tuple -- The Lease if it was acquired, None otherwise. Then the record of the other execution if it holds
+        the lease or has completed it, with its status, and its result when completed. Both are None when
+        deduplication is disabled or the store failed.
+
+    """
+    store = get_store()
+    if store is None:
+        return None, None
+
+    record = {
+        'status': STATUS_IN_PROGRESS,
+        'owner': uuid.uuid4().hex,
+        'expiresAt': time.time() + (lease_seconds or config.IDEMPOTENCY_LEASE_SECONDS)
+    }
+    try:
+        current = store.get(key)
+        for _ in range(MAX_ACQUIRE_ATTEMPTS):
+            if current is not None and _is_live(current):
+                LOG.info('%s is %s by another execution', key, current['status'])
+                return None, current
+            acquired = store.add(key, record) if current is None else store.replace(key, record, current)
+            if acquired:
+                LOG.debug('Acquired lease on %s until %s', key, record['expiresAt'])
+                return Lease(key, record), None
+            # another execution wrote the key in between
+            current = store.get(key)
+        raise RuntimeError('lost the lease to other executions {} times'.format(MAX_ACQUIRE_ATTEMPTS))
+    except Exception as e:
+        LOG.error('Unable to acquire the lease on %s, deduplication is off: %s', key, e)
+        metrics.count('IdempotencyStoreErrors')
+        return None, None
+
+
+def complete(lease, result):
+    """Complete a lease with the result of the work, returned to the duplicates.
+
+    Arguments:
+        lease {Lease} -- The lease from acquire(), nothing is done if None
+        result {object} -- The JSON serializable result
+
+    """
+    if lease is not None:
+        _finish(lease, {
+            'status': STATUS_COMPLETED,
+            'result': result,
+            'expiresAt': time.time() + config.IDEMPOTENCY_RESULT_TTL_SECONDS
+        })
+
+
+def release(lease):
+    """Release a lease without result, so that another execution can do the work.
+
+    Arguments:
+        lease {Lease} -- The lease from acquire(), nothing is done if None
+
+    """
+    if lease is not None:
+        _finish(lease, {'status': STATUS_RELEASED})
+
+
+def _is_live(record):
+    return record.get('status') in (STATUS_IN_PROGRESS, STATUS_COMPLETED) and record['expiresAt'] > time.time()
+
+
+def _finish(lease, record):
+    try:
+        if not get_store().replace(lease.key, record, lease.record):
+            LOG.warning('Lease on %s expired and was taken over by another execution', lease.key)
+    except Exception as e:
+        LOG.warning('Unable to mark %s as %s: %s', lease.key, record['status'], e)
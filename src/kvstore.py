@@ -0,0 +1,303 @@
+"""Small key-value stores for state that outlives an invocation.
+
+Values are JSON serializable. A store is selected with a URL:
+
+- memory:// -- kept in the warm container only
+- file:///path/to/file.json -- a local file, e.g. in /tmp or on an EFS mount
+- s3://bucket/prefix/ -- one S3 object per key, read and written with the function's credentials
+- dynamodb://table -- one item per key in a DynamoDB table, or a DynamoDB-compatible endpoint set with the
+  AWS_ENDPOINT_URL_DYNAMODB environment variable, see config.DYNAMODB_ENDPOINT_URL. The table has a string partition
+  key named `key`.
+
+Besides get() and put(), the stores have conditional writes, add() and replace(), that are atomic across the
+threads of a process for the memory store, across processes of a host for the file store, and across hosts for
+the S3 and DynamoDB stores. The conditional writes of the S3 store need a botocore release with the IfNoneMatch
+and IfMatch parameters of PutObject, newer than the one locked in Pipfile.lock; with an older one they raise
+RuntimeError, so use the DynamoDB store for leases.
+"""
+
+import clientfactory
+import lambdalogging
+import lazyimport
+
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+LOG = lambdalogging.getLogger(__name__)
+
+botocore = lazyimport.LazyModule('botocore')
+botocore_exceptions = lazyimport.LazyModule('botocore.exceptions')
+
+# error codes of an S3 conditional write whose condition doesn't hold
+S3_CONDITION_FAILED_CODES = ('PreconditionFailed', 'ConditionalRequestConflict')
+
+
+class MemoryStore(object):
+    """Store kept in memory, shared by the invocations of a warm container."""
+
+    def __init__(self):
+        """Initialize an empty store."""
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value of a key, None if it is not set."""
+        with self._lock:
+            return self._items.get(key)
+
+    def put(self, key, value):
+        """Set the value of a key."""
+        with self._lock:
+            self._items[key] = value
+
+    def add(self, key, value):
+        """Set the value of a key only if it is not set, returning whether it was set."""
+        with self._lock:
+            if key in self._items:
+                return False
+            self._items[key] = value
+            return True
+
+    def replace(self, key, value, expected):
+        """Set the value of a key only if it has the expected value, returning whether it was set."""
+        with self._lock:
+            if self._items.get(key) != expected:
+                return False
+            self._items[key] = value
+            return True
+
+
+class FileStore(object):
+    """Store kept in a local JSON file, written atomically."""
+
+    def __init__(self, path):
+        """Initialize the store.
+
+        Arguments:
+            path {str} -- The path of the file, created on first put
+
+        """
+        self._path = path
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value of a key, None if it is not set."""
+        with self._lock:
+            return self._read().get(key)
+
+    def put(self, key, value):
+        """Set the value of a key."""
+        with self._locked():
+            items = self._read()
+            items[key] = value
+            self._write(items)
+
+    def add(self, key, value):
+        """Set the value of a key only if it is not set, returning whether it was set."""
+        with self._locked():
+            items = self._read()
+            if key in items:
+                return False
+            items[key] = value
+            self._write(items)
+            return True
+
+    def replace(self, key, value, expected):
+        """Set the value of a key only if it has the expected value, returning whether it was set."""
+        with self._locked():
+            items = self._read()
+            if items.get(key) != expected:
+                return False
+            items[key] = value
+            self._write(items)
+            return True
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # the lock file keeps the read and the write of other processes apart, e.g. other workers on the host
+        with self._lock, open(self._path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _read(self):
+        try:
+            with open(self._path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, items):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+            json.dump(items, f)
+        os.replace(f.name, self._path)
+
+
+class S3Store(object):
+    """Store kept in S3, with one object per key."""
+
+    def __init__(self, bucket, prefix='', s3_client=None):
+        """Initialize the store.
+
+        Arguments:
+            bucket {str} -- The bucket of the objects
+
+        Keyword Arguments:
+            prefix {str} -- The prefix of the object keys (default: {''})
+            s3_client {S3.Client} -- The client used, the function's S3 client if None (default: {None})
+
+        """
+        self._bucket = bucket
+        self._prefix = prefix
+        self._s3_client = s3_client
+
+    def get(self, key):
+        """Return the value of a key, None if it is not set."""
+        return self._get(key)[0]
+
+    def put(self, key, value):
+        """Set the value of a key."""
+        self._put(key, value)
+
+    def add(self, key, value):
+        """Set the value of a key only if it is not set, returning whether it was set."""
+        return self._put(key, value, IfNoneMatch='*')
+
+    def replace(self, key, value, expected):
+        """Set the value of a key only if it has the expected value, returning whether it was set."""
+        current, etag = self._get(key)
+        if etag is None or current != expected:
+            return False
+        return self._put(key, value, IfMatch=etag)
+
+    def _get(self, key):
+        try:
+            response = self._get_s3_client().get_object(Bucket=self._bucket, Key=self._prefix + key)
+        except botocore_exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None, None
+            raise
+        return json.loads(response['Body'].read().decode()), response['ETag']
+
+    def _put(self, key, value, **conditions):
+        s3_client = self._get_s3_client()
+        if conditions:
+            _check_conditional_put(s3_client, conditions)
+        try:
+            s3_client.put_object(
+                Bucket=self._bucket,
+                Key=self._prefix + key,
+                Body=json.dumps(value).encode(),
+                ContentType='application/json',
+                **conditions
+            )
+        except botocore_exceptions.ClientError as e:
+            # a concurrent conditional write of the same key fails with ConditionalRequestConflict
+            if conditions and e.response['Error']['Code'] in S3_CONDITION_FAILED_CODES:
+                return False
+            raise
+        return True
+
+    def _get_s3_client(self):
+        return self._s3_client or clientfactory.get_function_s3_client()
+
+
+def _check_conditional_put(s3_client, conditions):
+    # botocore rejects unknown parameters with ParamValidationError, which doesn't say why
+    parameters = s3_client.meta.service_model.operation_model('PutObject').input_shape.members
+    unsupported = sorted(condition for condition in conditions if condition not in parameters)
+    if unsupported:
+        raise RuntimeError('botocore {} does not support conditional writes to S3 ({}), upgrade it or use a '
+                           'dynamodb:// store.'.format(botocore.__version__, ', '.join(unsupported)))
+
+
+class DynamoDBStore(object):
+    """Store kept in a DynamoDB table, with one item per key holding the JSON value."""
+
+    def __init__(self, table_name, dynamodb_client=None):
+        """Initialize the store.
+
+        Arguments:
+            table_name {str} -- The table of the items, with a string partition key named `key`
+
+        Keyword Arguments:
+            dynamodb_client {DynamoDB.Client} -- The client used, the function's DynamoDB client if None
+            (default: {None})
+
+        """
+        self._table_name = table_name
+        self._dynamodb_client = dynamodb_client
+
+    def get(self, key):
+        """Return the value of a key, None if it is not set."""
+        response = self._get_dynamodb_client().get_item(
+            TableName=self._table_name,
+            Key={'key': {'S': key}},
+            ConsistentRead=True
+        )
+        if 'Item' not in response:
+            return None
+        return json.loads(response['Item']['value']['S'])
+
+    def put(self, key, value):
+        """Set the value of a key."""
+        self._put(key, value)
+
+    def add(self, key, value):
+        """Set the value of a key only if it is not set, returning whether it was set."""
+        return self._put(key, value, ConditionExpression='attribute_not_exists(#key)',
+                         ExpressionAttributeNames={'#key': 'key'})
+
+    def replace(self, key, value, expected):
+        """Set the value of a key only if it has the expected value, returning whether it was set."""
+        return self._put(key, value, ConditionExpression='#value = :expected',
+                         ExpressionAttributeNames={'#value': 'value'},
+                         ExpressionAttributeValues={':expected': {'S': _dump(expected)}})
+
+    def _put(self, key, value, **conditions):
+        try:
+            self._get_dynamodb_client().put_item(
+                TableName=self._table_name,
+                Item={'key': {'S': key}, 'value': {'S': _dump(value)}},
+                **conditions
+            )
+        except botocore_exceptions.ClientError as e:
+            if conditions and e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def _get_dynamodb_client(self):
+        return self._dynamodb_client or clientfactory.get_function_dynamodb_client()
+
+
+def from_url(url):
+    """Create a store from its URL, see the module documentation.
+
+    Arguments:
+        url {str} -- The URL of the store
+
+    Returns:
+        object -- The store
+
+    """
+    parsed_url = urlparse(url)
+    if parsed_url.scheme == 'memory':
+        return MemoryStore()
+    if parsed_url.scheme == 'file' and parsed_url.path:
+        return FileStore(parsed_url.path)
+    if parsed_url.scheme == 's3' and parsed_url.netloc:
+        return S3Store(parsed_url.netloc, parsed_url.path.lstrip('/'))
+    if parsed_url.scheme == 'dynamodb' and parsed_url.netloc:
+        return DynamoDBStore(parsed_url.netloc)
+    raise ValueError('Unsupported store URL: {}'.format(url))
+
+
+def _dump(value):
+    # values are compared as strings by the conditional writes of DynamoDB
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
@@ -8,8 +8,5 @@ import sys
 # add packaged dependencies to search path
 sys.path.append('lib')
 
-# imports of library dependencies must come after setting up the dependency search path
-from aws_xray_sdk.core import patch_all  # noqa: E402
-
-# patch all supported libraries for X-Ray tracing
-patch_all()
+# imports of library dependencies must come after setting up the dependency search path. The X-Ray SDK, which
+# costs most of the import time of the function, is imported when the first client is created, see clientfactory
@@ -0,0 +1,39 @@
+"""Lazy module proxy, deferring the cost of importing a module until it is first used."""
+
+import importlib
+import threading
+
+
+class LazyModule(object):
+    """Proxy for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        """Initialize the proxy without importing the module.
+
+        Arguments:
+            name {str} -- The absolute name of the module, e.g. "botocore.config"
+
+        """
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute):
+        """Return an attribute of the module, importing it if needed."""
+        return getattr(self.load(), attribute)
+
+    def __repr__(self):
+        """Return the representation of the proxy."""
+        return '<LazyModule {} ({})>'.format(self._name, 'loaded' if self.is_loaded() else 'not loaded')
+
+    def is_loaded(self):
+        """Return whether the module has been imported through this proxy."""
+        return self._module is not None
+
+    def load(self):
+        """Import the module if needed and return it."""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
@@ -0,0 +1,201 @@
+"""Opt-in memory profiling of invocations, to right-size the memory setting of the function.
+
+With config.MEMORY_PROFILING, the handler is wrapped with profile(), which traces allocations with tracemalloc
+and samples the resident set size (RSS) at the beginning and end of every metrics span. At the end of the
+invocation, one log line reports the peak and steady (still allocated at the end) memory of each span, the top
+allocation sites in PROFILED_FILE_PATTERNS and a recommended memory setting. When profiling is disabled, the
+handler is not wrapped and no span listener is registered.
+"""
+
+import config
+import lambdalogging
+import metrics
+
+import fnmatch
+import functools
+import json
+import math
+import os
+import resource
+import threading
+import tracemalloc
+
+LOG = lambdalogging.getLogger(__name__)
+
+# allocation sites are reported for the innermost frame in these files
+PROFILED_FILE_PATTERNS = ('*/s3helper.py', '*/s3rangedfile.py', '*/serverlessrepo/*')
+# the recommended memory setting leaves this much room above the peak RSS
+MEMORY_HEADROOM_RATIO = 1.5
+# the recommended memory setting is a multiple of this, and at least the minimum of AWS Lambda
+MEMORY_STEP_MB = 64
+MIN_MEMORY_MB = 128
+MAX_MEMORY_MB = 10240
+
+MIB = 1024 * 1024
+
+
+class Profiler(object):
+    """Memory of each span of an invocation, registered as a metrics span listener."""
+
+    def __init__(self, top_sites=10):
+        """Initialize the profiler.
+
+        Keyword Arguments:
+            top_sites {int} -- The number of allocation sites in the report (default: {10})
+
+        """
+        self.top_sites = top_sites
+        self.phases = {}
+        self.sites = {}
+        self.peak_traced_bytes = 0
+        self.peak_rss_bytes = 0
+        self._open_spans = {}
+        self._started_tracing = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start tracing allocations and listening to spans."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(config.MEMORY_PROFILING_FRAMES)
+            self._started_tracing = True
+        metrics.SPAN_LISTENERS.append(self)
+
+    def stop(self):
+        """Stop tracing allocations and listening to spans.
+
+        Returns:
+            dict -- The memory profile of the invocation
+
+        """
+        metrics.SPAN_LISTENERS.remove(self)
+        with self._lock:
+            self._sample()
+        if self._started_tracing:
+            tracemalloc.stop()
+        return self.report()
+
+    def begin_span(self, name):
+        """Sample memory at the beginning of a span.
+
+        Arguments:
+            name {str} -- The name of the span
+
+        Returns:
+            object -- The state passed to end_span()
+
+        """
+        state = object()
+        with self._lock:
+            self._sample()
+            self._open_spans[state] = (name, 0)
+        return state
+
+    def end_span(self, state):
+        """Sample memory at the end of a span, and record the allocation sites then alive.
+
+        Arguments:
+            state {object} -- The state returned by begin_span()
+
+        """
+        with self._lock:
+            self._sample()
+            name, peak_bytes = self._open_spans.pop(state)
+            current_bytes = tracemalloc.get_traced_memory()[0]
+            phase = self.phases.setdefault(name, {'calls': 0, 'peakBytes': 0, 'steadyBytes': 0, 'rssBytes': 0})
+            phase['calls'] += 1
+            phase['peakBytes'] = max(phase['peakBytes'], peak_bytes)
+            phase['steadyBytes'] = max(phase['steadyBytes'], current_bytes)
+            phase['rssBytes'] = max(phase['rssBytes'], get_rss_bytes() or 0)
+            self._record_sites()
+
+    def report(self):
+        """Return the memory profile of the invocation."""
+        sites = sorted(self.sites.items(), key=lambda site: site[1], reverse=True)[:self.top_sites]
+        return {
+            'peakTracedBytes': self.peak_traced_bytes,
+            'peakRssBytes': self.peak_rss_bytes,
+            'recommendedMemoryMB': recommend_memory_mb(self.peak_rss_bytes),
+            'phases': self.phases,
+            'topSites': [{'site': site, 'bytes': size} for site, size in sites]
+        }
+
+    def _sample(self):
+        # the traced peak since the previous sample is attributed to all the spans open in between
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self.peak_traced_bytes = max(self.peak_traced_bytes, peak_bytes)
+        self.peak_rss_bytes = max(self.peak_rss_bytes, get_peak_rss_bytes())
+        for state, (name, span_peak_bytes) in self._open_spans.items():
+            self._open_spans[state] = (name, max(span_peak_bytes, peak_bytes))
+
+    def _record_sites(self):
+        snapshot = tracemalloc.take_snapshot()
+        sizes = {}
+        for statistic in snapshot.statistics('traceback'):
+            site = _find_site(statistic.traceback)
+            if site:
+                sizes[site] = sizes.get(site, 0) + statistic.size
+        for site, size in sizes.items():
+            self.sites[site] = max(self.sites.get(site, 0), size)
+
+
+def profile(handler):
+    """Wrap a Lambda function handler to log the memory profile of each invocation.
+
+    Arguments:
+        handler {callable} -- The handler, called with the event and context
+
+    Returns:
+        callable -- The profiled handler
+
+    """
+    @functools.wraps(handler)
+    def profiled_handler(event, context):
+        profiler = Profiler(config.MEMORY_PROFILING_TOP_SITES)
+        profiler.start()
+        try:
+            return handler(event, context)
+        finally:
+            LOG.info('Memory profile: %s', json.dumps(profiler.stop()))
+
+    return profiled_handler
+
+
+def recommend_memory_mb(peak_rss_bytes):
+    """Recommend a memory setting for the function from the peak RSS observed.
+
+    Arguments:
+        peak_rss_bytes {int} -- The peak resident set size of the process
+
+    Returns:
+        int -- The memory setting in MB, with MEMORY_HEADROOM_RATIO room and rounded up to MEMORY_STEP_MB
+
+    """
+    memory_mb = math.ceil(peak_rss_bytes * MEMORY_HEADROOM_RATIO / MIB / MEMORY_STEP_MB) * MEMORY_STEP_MB
+    return min(max(memory_mb, MIN_MEMORY_MB), MAX_MEMORY_MB)
+
+
+def get_peak_rss_bytes():
+    """Return the peak resident set size of the process since it started."""
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_rss_bytes():
+    """Return the current resident set size of the process, None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _find_site(traceback):
+    # tracemalloc tracebacks are ordered from the oldest frame, the site is the most recent profiled one
+    for frame in reversed(traceback):
+        if any(fnmatch.fnmatch(frame.filename, pattern) for pattern in PROFILED_FILE_PATTERNS):
+            # the file and its directory, e.g. serverlessrepo/parser.py, wherever the package is installed
+            directory, filename = os.path.split(frame.filename)
+            return '{}/{}:{}'.format(os.path.basename(directory), filename, frame.lineno)
+    return None
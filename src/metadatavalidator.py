@@ -0,0 +1,113 @@
+"""Validate the application metadata of a packaged template offline, before any call to SAR.
+
+The rules follow the constraints of the AWS Serverless Application Repository API, so that a template SAR would
+reject fails the job right away with every problem listed, instead of after the first failed API call. Patterns
+are compiled once, when the module is imported.
+"""
+
+import collections
+import re
+
+# fields of AWS::ServerlessRepo::Application, see serverlessrepo.application_metadata.ApplicationMetadata
+NAME = 'Name'
+DESCRIPTION = 'Description'
+AUTHOR = 'Author'
+SPDX_LICENSE_ID = 'SpdxLicenseId'
+LICENSE_BODY = 'LicenseBody'
+LICENSE_URL = 'LicenseUrl'
+README_BODY = 'ReadmeBody'
+README_URL = 'ReadmeUrl'
+LABELS = 'Labels'
+HOME_PAGE_URL = 'HomePageUrl'
+SEMANTIC_VERSION = 'SemanticVersion'
+SOURCE_CODE_URL = 'SourceCodeUrl'
+
+# a string field of the metadata, pattern and max_length are not checked when None
+Rule = collections.namedtuple('Rule', ['field', 'required', 'max_length', 'pattern', 'expected'])
+
+# sam package uploads local license and readme files, and sets their S3 URL
+S3_URL_PATTERN = re.compile(
+    r'^(s3://[^/]+/.+|https://([a-z0-9.-]+\.)?s3([.-][a-z0-9-]+)*\.amazonaws\.com(\.cn)?/.+)$')
+HTTP_URL_PATTERN = re.compile(r'^https?://[^\s/?#]+[^\s]*$')
+# https://semver.org
+SEMANTIC_VERSION_PATTERN = re.compile(
+    r'^(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)'
+    r'(-((0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(\.(0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?'
+    r'(\+([0-9a-zA-Z-]+(\.[0-9a-zA-Z-]+)*))?$')
+
+RULES = (
+    Rule(NAME, True, 140, re.compile(r'^[a-zA-Z0-9-]+$'), 'letters, digits and hyphens'),
+    Rule(DESCRIPTION, True, 256, None, None),
+    Rule(AUTHOR, True, 127, re.compile(r'^[a-z0-9](([a-z0-9]|-(?!-))*[a-z0-9])?$'),
+         'lowercase letters, digits and single hyphens, not at the start or the end'),
+    Rule(SPDX_LICENSE_ID, False, 100, re.compile(r'^[A-Za-z0-9][A-Za-z0-9.+-]*$'),
+         'an SPDX license identifier, e.g. MIT or Apache-2.0'),
+    Rule(LICENSE_BODY, False, None, None, None),
+    Rule(LICENSE_URL, False, None, S3_URL_PATTERN, 'an S3 URL set by sam package, e.g. s3://bucket/key'),
+    Rule(README_BODY, False, None, None, None),
+    Rule(README_URL, False, None, S3_URL_PATTERN, 'an S3 URL set by sam package, e.g. s3://bucket/key'),
+    Rule(HOME_PAGE_URL, False, None, HTTP_URL_PATTERN, 'an http or https URL'),
+    Rule(SEMANTIC_VERSION, False, 255, SEMANTIC_VERSION_PATTERN, 'a semantic version, e.g. 1.0.0'),
+    Rule(SOURCE_CODE_URL, False, None, HTTP_URL_PATTERN, 'an http or https URL')
+)
+LABEL_RULE = Rule(LABELS, False, 127, re.compile(r'^[a-zA-Z0-9+\-_:/@]+$'), 'letters, digits and +-_:/@')
+MAX_LABELS = 10
+# fields that can't be set together
+EXCLUSIVE_FIELDS = ((LICENSE_BODY, LICENSE_URL), (README_BODY, README_URL))
+
+
+def get_errors(metadata):
+    """Check application metadata against all the rules.
+
+    Arguments:
+        metadata {dict} -- The AWS::ServerlessRepo::Application metadata of the template
+
+    Returns:
+        list -- The description of every problem found, empty if the metadata is valid
+
+    """
+    errors = []
+    for rule in RULES:
+        _check(rule, metadata.get(rule.field), rule.field, errors)
+
+    labels = metadata.get(LABELS)
+    if labels is not None and not isinstance(labels, list):
+        errors.append('{} must be a list'.format(LABELS))
+    elif labels is not None:
+        if len(labels) > MAX_LABELS:
+            errors.append('{} has {} labels, at most {} are allowed'.format(LABELS, len(labels), MAX_LABELS))
+        for i, label in enumerate(labels):
+            _check(LABEL_RULE, label, '{}[{}]'.format(LABELS, i), errors)
+
+    for fields in EXCLUSIVE_FIELDS:
+        if all(metadata.get(field) for field in fields):
+            errors.append('Only one of {} can be set'.format(' and '.join(fields)))
+    return errors
+
+
+def validate(metadata):
+    """Check application metadata against all the rules.
+
+    Arguments:
+        metadata {dict} -- The AWS::ServerlessRepo::Application metadata of the template
+
+    Raises:
+        RuntimeError -- When the metadata is invalid, listing every problem found
+
+    """
+    errors = get_errors(metadata)
+    if errors:
+        raise RuntimeError('Invalid application metadata in the packaged template: {}.'.format('; '.join(errors)))
+
+
+def _check(rule, value, name, errors):
+    if value is None or value == '':
+        if rule.required:
+            errors.append('{} is required'.format(name))
+    elif not isinstance(value, str):
+        # e.g. SemanticVersion: 1.0 is a number in YAML
+        errors.append('{} must be a string, {!r} is not'.format(name, value))
+    elif rule.max_length is not None and len(value) > rule.max_length:
+        errors.append('{} must be at most {} characters long'.format(name, rule.max_length))
+    elif rule.pattern is not None and not rule.pattern.match(value):
+        errors.append('{} must be {}, {!r} is not'.format(name, rule.expected, value))
@@ -0,0 +1,247 @@
+"""Timings and counters of an invocation, logged as one CloudWatch Embedded Metric Format line.
+
+Spans time the steps of publishing, e.g. the S3 fetch or a SAR call, and are also recorded as X-Ray
+subsegments once clientfactory has patched the libraries for X-Ray, see clientfactory.patch_xray(). Counters add
+up values such as the bytes fetched from S3. At the end of the invocation, emit() logs all of them with the
+application name and the outcome of the job as dimensions, see
+https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+"""
+
+import clientfactory
+import config
+import lambdalogging
+import lazyimport
+
+import contextlib
+import contextvars
+import json
+import sys
+import threading
+import time
+
+LOG = lambdalogging.getLogger(__name__)
+
+xray_core = lazyimport.LazyModule('aws_xray_sdk.core')
+
+OUTCOME_SUCCESS = 'Success'
+OUTCOME_FAILURE = 'Failure'
+OUTCOME_CONTINUATION = 'Continuation'
+OUTCOME_DUPLICATE = 'Duplicate'
+
+# dimension value when no application, or several, were published
+UNKNOWN_APPLICATION = 'unknown'
+MULTIPLE_APPLICATIONS = 'multiple'
+# most values of a metric in one EMF line
+MAX_VALUES_PER_METRIC = 100
+
+UNIT_MILLISECONDS = 'Milliseconds'
+UNIT_BYTES = 'Bytes'
+UNIT_COUNT = 'Count'
+
+
+class Invocation(object):
+    """Metrics recorded during an invocation, from any thread."""
+
+    def __init__(self):
+        """Initialize the metrics with no values."""
+        self.values = {}
+        self.units = {}
+        self.applications = set()
+        self._lock = threading.Lock()
+
+    def add_value(self, name, value, unit):
+        """Add a value to a metric, e.g. the duration of one more span."""
+        with self._lock:
+            self.values.setdefault(name, []).append(value)
+            self.units[name] = unit
+
+    def add_to_total(self, name, value, unit):
+        """Add a value to the single total of a metric."""
+        with self._lock:
+            self.values[name] = [self.values.get(name, [0])[0] + value]
+            self.units[name] = unit
+
+    def get_total(self, name):
+        """Return the total of a metric, 0 if no value was added."""
+        with self._lock:
+            return self.values.get(name, [0])[0]
+
+    def add_application(self, name):
+        """Add the name of an application published in the invocation."""
+        with self._lock:
+            self.applications.add(name)
+
+    def to_emf(self, outcome, timestamp):
+        """Return the metrics as an EMF log entry.
+
+        Arguments:
+            outcome {str} -- The outcome of the job, one of the OUTCOME_* constants
+            timestamp {float} -- The time of the entry in seconds since the epoch
+
+        Returns:
+            dict -- The EMF log entry
+
+        """
+        with self._lock:
+            if len(self.applications) == 1:
+                application_name = next(iter(self.applications))
+            else:
+                application_name = MULTIPLE_APPLICATIONS if self.applications else UNKNOWN_APPLICATION
+            entry = {
+                '_aws': {
+                    'Timestamp': int(timestamp * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': config.METRICS_NAMESPACE,
+                        'Dimensions': [['ApplicationName', 'Outcome'], ['Outcome']],
+                        'Metrics': [{'Name': name, 'Unit': self.units[name]} for name in sorted(self.values)]
+                    }]
+                },
+                'ApplicationName': application_name,
+                'Outcome': outcome,
+                'ApplicationNames': sorted(self.applications)
+            }
+            for name, values in self.values.items():
+                entry[name] = values[0] if len(values) == 1 else values[:MAX_VALUES_PER_METRIC]
+        return entry
+
+
+_invocation = Invocation()
+# metrics of the job run in the current context, when a worker runs several jobs concurrently, see run_isolated()
+_context_invocation = contextvars.ContextVar('invocation', default=None)
+
+# objects notified of spans, with begin_span(name) returning a state that is passed to end_span(state),
+# see memprofile. Empty unless profiling is enabled.
+SPAN_LISTENERS = []
+
+
+def reset():
+    """Drop the metrics recorded so far, at the start of an invocation."""
+    global _invocation
+    if _context_invocation.get() is not None:
+        _context_invocation.set(Invocation())
+    else:
+        _invocation = Invocation()
+
+
+def run_isolated(function, *args):
+    """Call a function in a copy of the current context, recording metrics apart from the other contexts.
+
+    Threads started by the function only record into the same metrics when they run in a copy of its context,
+    e.g. executor.submit(contextvars.copy_context().run, function).
+
+    Arguments:
+        function {callable} -- The function, e.g. the handler processing a job
+        args {list} -- The arguments of the function
+
+    Returns:
+        object -- The return value of the function
+
+    """
+    def run():
+        _context_invocation.set(Invocation())
+        return function(*args)
+    return contextvars.copy_context().run(run)
+
+
+def _current_invocation():
+    return _context_invocation.get() or _invocation
+
+
+@contextlib.contextmanager
+def span(name, **annotations):
+    """Time a block of code as a value of the <name>Duration metric, and as an X-Ray subsegment.
+
+    Arguments:
+        name {str} -- The name of the step, e.g. "S3Fetch"
+
+    Keyword Arguments:
+        annotations {dict} -- X-Ray annotations of the subsegment, e.g. the application name
+
+    """
+    subsegment = _begin_subsegment(name, annotations)
+    listener_states = [(listener, listener.begin_span(name)) for listener in SPAN_LISTENERS]
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        _current_invocation().add_value(name + 'Duration', (time.monotonic() - start) * 1000, UNIT_MILLISECONDS)
+        for listener, state in listener_states:
+            listener.end_span(state)
+        if subsegment is not None:
+            _end_subsegment()
+
+
+def count(name, value=1, unit=UNIT_COUNT):
+    """Add to the total of a counter, e.g. "ArtifactBytes".
+
+    Arguments:
+        name {str} -- The name of the metric
+
+    Keyword Arguments:
+        value {int} -- The value to add (default: {1})
+        unit {str} -- The unit of the metric (default: {UNIT_COUNT})
+
+    """
+    if value:
+        _current_invocation().add_to_total(name, value, unit)
+
+
+def get_total(name):
+    """Return the total of a counter in the current invocation, 0 if nothing was counted."""
+    return _current_invocation().get_total(name)
+
+
+def add_application(name):
+    """Record the name of an application published in the invocation, used as a dimension."""
+    if name:
+        _current_invocation().add_application(name)
+
+
+def emit(outcome):
+    """Log the metrics of the invocation as one EMF line, unless config.METRICS_NAMESPACE is empty.
+
+    Arguments:
+        outcome {str} -- The outcome of the job, one of the OUTCOME_* constants
+
+    Returns:
+        dict -- The EMF log entry, None if metrics are disabled
+
+    """
+    if not config.METRICS_NAMESPACE:
+        return None
+    entry = _current_invocation().to_emf(outcome, time.time())
+    try:
+        # CloudWatch only extracts metrics from lines that are a JSON object, without the prefix of the logging module
+        sys.stdout.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        sys.stdout.flush()
+    except Exception as e:
+        # metrics must not fail the invocation, the job result has been reported already
+        LOG.warning('Unable to emit metrics: %s', e)
+    return entry
+
+
+def _is_xray_active():
+    # the SDK is only set up in AWS Lambda, where there is a segment to add to, with modules to patch
+    return clientfactory.is_xray_patched()
+
+
+def _begin_subsegment(name, annotations):
+    if not _is_xray_active():
+        return None
+    try:
+        subsegment = xray_core.xray_recorder.begin_subsegment(name)
+        if subsegment is not None:
+            for key, value in annotations.items():
+                if value is not None:
+                    subsegment.put_annotation(key, value)
+        return subsegment
+    except Exception as e:
+        LOG.debug('Unable to begin X-Ray subsegment %s: %s', name, e)
+        return None
+
+
+def _end_subsegment():
+    try:
+        xray_core.xray_recorder.end_subsegment()
+    except Exception as e:
+        LOG.debug('Unable to end X-Ray subsegment: %s', e)
@@ -0,0 +1,92 @@
+"""Skip publishing templates that are identical to the last published one.
+
+The digest of the last template published for each application, and region when one is given, is kept
+in the store configured with config.PUBLISH_DIGEST_STORE, see kvstore for the supported stores. Failures
+of the store are logged and don't fail the job, the application is then published as usual.
+"""
+
+import config
+import kvstore
+import lambdalogging
+
+import functools
+
+LOG = lambdalogging.getLogger(__name__)
+
+NO_OP_STATUS = 'no-op, already published'
+
+
+@functools.lru_cache(maxsize=None)
+def get_store():
+    """Get the store of published digests, None if config.PUBLISH_DIGEST_STORE is not set."""
+    if not config.PUBLISH_DIGEST_STORE:
+        return None
+    return kvstore.from_url(config.PUBLISH_DIGEST_STORE)
+
+
+def find_published(template, region_name=None):
+    """Find whether the template is the last one published for its application.
+
+    Arguments:
+        template {PreparedTemplate} -- The template to publish
+
+    Keyword Arguments:
+        region_name {str} -- The region the application is published to, None for the function's region
+        (default: {None})
+
+    Returns:
+        dict -- The no-op publish result if the template was already published, None otherwise
+
+    """
+    store = get_store()
+    if store is None or not template.app_metadata.name:
+        return None
+
+    try:
+        published = store.get(_get_key(template, region_name))
+    except Exception as e:
+        LOG.warning('Unable to get the published digest of %s: %s', _get_key(template, region_name), e)
+        return None
+
+    if not published or published['digest'] != template.digest:
+        return None
+
+    LOG.info('Template of %s is unchanged since its last publish. digest=%s', _get_key(template, region_name),
+             template.digest)
+    return {
+        'application_id': published['applicationId'],
+        'actions': [],
+        'details': {
+            'Status': NO_OP_STATUS,
+            'TemplateDigest': template.digest
+        }
+    }
+
+
+def record_published(template, application_id, region_name=None):
+    """Record the template as the last one published for its application.
+
+    Arguments:
+        template {PreparedTemplate} -- The published template
+        application_id {str} -- The ARN of the application
+
+    Keyword Arguments:
+        region_name {str} -- The region the application was published to, None for the function's region
+        (default: {None})
+
+    """
+    store = get_store()
+    if store is None or not template.app_metadata.name:
+        return
+
+    try:
+        store.put(_get_key(template, region_name), {'digest': template.digest, 'applicationId': application_id})
+    except Exception as e:
+        LOG.warning('Unable to record the published digest of %s: %s', _get_key(template, region_name), e)
+
+
+def _get_key(template, region_name):
+    # keys of the function's region are kept as they were before regions could be set
+    if region_name is None:
+        return template.app_metadata.name
+    return '{}/{}'.format(region_name, template.app_metadata.name)
@@ -0,0 +1,400 @@
+"""Publish an application to AWS Serverless Application Repository in resumable phases.
+
+The phases mirror serverlessrepo.publish_application(): create the application, or update it if it already exists
+and then create the application version. The progress between phases is small enough to be carried in a CodePipeline
+continuation token, so that a job can continue in a new invocation when the current one runs out of time.
+
+An existing application is only updated with the metadata fields that differ from its current state, see
+applicationstate, and a version that is already the latest one is not created again.
+"""
+
+import applicationstate
+import callpolicy
+import clientfactory
+import config
+import lambdalogging
+import lazyimport
+import metadatavalidator
+import metrics
+import templateloader
+
+import collections
+import hashlib
+import json
+
+LOG = lambdalogging.getLogger(__name__)
+
+# requests and error handling are shared with serverlessrepo.publish_application()
+sarpublish = lazyimport.LazyModule('serverlessrepo.publish')
+sarparser = lazyimport.LazyModule('serverlessrepo.parser')
+botocore_exceptions = lazyimport.LazyModule('botocore.exceptions')
+
+PHASE_CREATE_OR_UPDATE_APPLICATION = 'CREATE_OR_UPDATE_APPLICATION'
+PHASE_CREATE_APPLICATION_VERSION = 'CREATE_APPLICATION_VERSION'
+PHASE_DONE = 'DONE'
+PHASES = (PHASE_CREATE_OR_UPDATE_APPLICATION, PHASE_CREATE_APPLICATION_VERSION, PHASE_DONE)
+
+# bumped when the content of continuation tokens changes
+CONTINUATION_TOKEN_VERSION = 2
+# CodePipeline rejects longer continuation tokens
+MAX_CONTINUATION_TOKEN_LENGTH = 2048
+
+# packaged template ready to be published, parsed once
+PreparedTemplate = collections.namedtuple('PreparedTemplate',
+                                          ['app_metadata', 'stripped_template', 'digest', 'template_dict'])
+
+
+class Publication(object):
+    """Progress of publishing an application."""
+
+    def __init__(self, phase=PHASE_CREATE_OR_UPDATE_APPLICATION, application_id=None, actions=None, attempts=0,
+                 changed_fields=None):
+        """Initialize the progress, by default before the first phase.
+
+        Keyword Arguments:
+            phase {str} -- The next phase to run (default: {PHASE_CREATE_OR_UPDATE_APPLICATION})
+            application_id {str} -- The application ARN, once known (default: {None})
+            actions {list} -- The actions taken so far (default: {None})
+            attempts {int} -- The number of interrupted attempts of the next phase (default: {0})
+            changed_fields {list} -- The metadata fields updated, all of them if None (default: {None})
+
+        """
+        if phase not in PHASES:
+            raise ValueError('Unknown publishing phase: {}'.format(phase))
+        self.phase = phase
+        self.application_id = application_id
+        self.actions = actions or []
+        self.attempts = attempts
+        self.changed_fields = changed_fields
+
+    def __eq__(self, other):
+        """Return whether two Publication objects are equal."""
+        return isinstance(other, type(self)) and self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        """Return the representation of the progress."""
+        return 'Publication({})'.format(self.to_dict())
+
+    def is_done(self):
+        """Return whether all the phases have run."""
+        return self.phase == PHASE_DONE
+
+    def percent_complete(self):
+        """Return the progress as a percentage."""
+        return 100 * PHASES.index(self.phase) // (len(PHASES) - 1)
+
+    def to_dict(self):
+        """Return the progress as a JSON serializable dict."""
+        return {
+            'phase': self.phase,
+            'applicationId': self.application_id,
+            'actions': self.actions,
+            'attempts': self.attempts,
+            'changedFields': self.changed_fields
+        }
+
+    @classmethod
+    def from_dict(cls, publication_dict):
+        """Create the progress from the output of to_dict()."""
+        return cls(
+            phase=publication_dict['phase'],
+            application_id=publication_dict.get('applicationId'),
+            actions=publication_dict.get('actions'),
+            attempts=publication_dict.get('attempts', 0),
+            changed_fields=publication_dict.get('changedFields')
+        )
+
+
+def prepare(template):
+    """Parse the packaged template for publishing.
+
+    The application metadata is validated offline, so that invalid metadata fails before any call to SAR.
+
+    Arguments:
+        template {str} -- Content of a packaged YAML or JSON SAM template
+
+    Returns:
+        PreparedTemplate -- The application metadata, the template stripped of it, the template digest and the
+        parsed template
+
+    """
+    if not template:
+        raise ValueError('Require SAM template to publish the application')
+
+    with metrics.span('TemplateParse', format=templateloader.get_format(template)):
+        template_dict = templateloader.load(template)
+        app_metadata = sarparser.get_app_metadata(template_dict)
+        # before any SAR call, and before serializing the template
+        metadatavalidator.validate(app_metadata.template_dict)
+        stripped_template = templateloader.dump(sarparser.strip_app_metadata(template_dict))
+    return PreparedTemplate(app_metadata, stripped_template, get_digest(template_dict), template_dict)
+
+
+def get_digest(template_dict):
+    """Get the digest of a parsed template.
+
+    The template is serialized with sorted keys first, so formatting, comments and key order don't change it.
+
+    Arguments:
+        template_dict {dict} -- The parsed template
+
+    Returns:
+        str -- The SHA-256 hex digest
+
+    """
+    normalized_template = json.dumps(template_dict, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(normalized_template.encode()).hexdigest()
+
+
+def run(template, publication, deadline, region_name=None):
+    """Run the remaining phases of a publication, as long as the deadline allows.
+
+    Each call is retried within the invocation as set by callpolicy. With a deadline, a phase still interrupted by
+    timeouts, throttling or other retryable errors is left to the next invocation, up to config.MAX_PHASE_ATTEMPTS
+    times.
+
+    Arguments:
+        template {PreparedTemplate} -- The template to publish
+        publication {Publication} -- The progress of the publication, updated in place
+        deadline {Deadline} -- The deadline of the invocation
+
+    Keyword Arguments:
+        region_name {str} -- The region to publish to, the function's region if None (default: {None})
+
+    Returns:
+        bool -- True when all phases have run, False when the job must continue in a new invocation
+
+    """
+    while not publication.is_done():
+        if not deadline.allows_call():
+            LOG.info('Not enough time left for phase %s, continuing in a new invocation.', publication.phase)
+            return False
+
+        sar_client = clientfactory.get_serverlessrepo_client(region_name=region_name, timeout=deadline.call_timeout())
+        try:
+            run_phase(template, publication, sar_client, deadline)
+        except Exception as e:
+            if deadline.remaining_seconds() is None or not _is_interruption(e):
+                raise
+            publication.attempts += 1
+            metrics.count('InterruptedPhases')
+            if publication.attempts >= config.MAX_PHASE_ATTEMPTS:
+                raise
+            LOG.warning('Phase %s interrupted, continuing in a new invocation. attempts=%s error=%s',
+                        publication.phase, publication.attempts, e)
+            return False
+
+    return True
+
+
+def run_phase(template, publication, sar_client, deadline=None):
+    """Run the next phase of a publication.
+
+    Arguments:
+        template {PreparedTemplate} -- The template to publish
+        publication {Publication} -- The progress of the publication, updated in place
+        sar_client {ServerlessApplicationRepository.Client} -- The client used for the phase
+
+    Keyword Arguments:
+        deadline {Deadline} -- The deadline bounding the retries of the calls, none if None (default: {None})
+
+    """
+    LOG.info('Running phase %s', publication.phase)
+    if publication.phase == PHASE_CREATE_OR_UPDATE_APPLICATION:
+        _create_or_update_application(template, publication, sar_client, deadline)
+    elif publication.phase == PHASE_CREATE_APPLICATION_VERSION:
+        _create_application_version(template, publication, sar_client, deadline)
+    publication.attempts = 0
+
+
+def get_result(template, publication):
+    """Get the result of a completed publication.
+
+    Arguments:
+        template {PreparedTemplate} -- The published template
+        publication {Publication} -- The completed publication
+
+    Returns:
+        dict -- Application id, actions taken and updated details, as returned by serverlessrepo.publish_application(),
+        and the changed metadata fields when the application was compared with its current state
+
+    """
+    details = sarpublish._get_publish_details(publication.actions, template.app_metadata.template_dict)
+    if publication.changed_fields is None:
+        return {'application_id': publication.application_id, 'actions': publication.actions, 'details': details}
+
+    # fields that were not changed were not sent, the version fields are only sent with a new version
+    sent_fields = list(publication.changed_fields)
+    if sarpublish.CREATE_APPLICATION_VERSION in publication.actions:
+        sent_fields += ['SemanticVersion', 'SourceCodeUrl']
+    return {
+        'application_id': publication.application_id,
+        'actions': publication.actions,
+        'details': {k: v for k, v in details.items() if k in sent_fields},
+        'changed_fields': publication.changed_fields
+    }
+
+
+def to_continuation_token(publications):
+    """Serialize the progress of publications as a CodePipeline continuation token.
+
+    Publications that have not started are left out, and so are the fields that have their default value, so
+    that the progress of many templates fits in the token.
+
+    Arguments:
+        publications {dict} -- Publication of each template, by input artifact name or template key
+
+    Returns:
+        str -- The continuation token
+
+    """
+    default_publication_dict = Publication().to_dict()
+    continuation_token = json.dumps({
+        'version': CONTINUATION_TOKEN_VERSION,
+        'publications': {
+            name: {k: v for k, v in publication.to_dict().items() if k == 'phase' or v != default_publication_dict[k]}
+            for name, publication in publications.items() if publication != Publication()
+        }
+    }, separators=(',', ':'))
+    if len(continuation_token) > MAX_CONTINUATION_TOKEN_LENGTH:
+        raise RuntimeError('The progress of publishing {} templates does not fit in a continuation token.'.format(
+            len(publications)))
+    return continuation_token
+
+
+def from_continuation_token(continuation_token):
+    """Deserialize the progress of publications from a CodePipeline continuation token.
+
+    Arguments:
+        continuation_token {str} -- The continuation token from the job data, None on the first invocation
+
+    Returns:
+        dict -- Publication of each template that has started, empty if the token is missing or unknown
+
+    """
+    if not continuation_token:
+        return {}
+
+    try:
+        token = json.loads(continuation_token)
+        if token['version'] != CONTINUATION_TOKEN_VERSION:
+            raise ValueError('unsupported version {}'.format(token['version']))
+        publications = {name: Publication.from_dict(p) for name, p in token['publications'].items()}
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        LOG.warning('Ignoring continuation token that was not created by this function: %s', e)
+        return {}
+
+    LOG.info('Continuing publications=%s', publications)
+    return publications
+
+
+def _create_or_update_application(template, publication, sar_client, deadline):
+    app_metadata = template.app_metadata
+    region_name = sar_client.meta.region_name
+    # the application is known to exist when its state was cached, e.g. by applicationprefetch
+    application_id = applicationstate.find_application_id(region_name, app_metadata.name)
+    if application_id is not None:
+        LOG.info('Skipping CreateApplication of %s, the application exists', application_id)
+        metrics.count('SkippedCreates')
+    else:
+        try:
+            request = sarpublish._create_application_request(app_metadata, template.stripped_template)
+            response = _call(sar_client, 'create_application', template, deadline, **request)
+            applicationstate.put(region_name, response['ApplicationId'], _get_state_fields(request))
+            publication.application_id = response['ApplicationId']
+            publication.actions = [sarpublish.CREATE_APPLICATION]
+            publication.phase = PHASE_DONE
+            return
+        except botocore_exceptions.ClientError as e:
+            if not sarpublish._is_conflict_exception(e):
+                raise _wrap_client_error(e)
+            # the application already exists
+            application_id = sarparser.parse_application_id(e.response['Error']['Message'])
+
+    state = _get_application_state(sar_client, template, application_id, deadline)
+    request = sarpublish._update_application_request(app_metadata, application_id)
+    changed_fields = applicationstate.get_changed_fields(request, state)
+    if changed_fields:
+        try:
+            _call(sar_client, 'update_application', template, deadline, ApplicationId=application_id,
+                  **{field: request[field] for field in changed_fields})
+        except botocore_exceptions.ClientError as e:
+            raise _wrap_client_error(e)
+        applicationstate.update(region_name, application_id, _get_state_fields(request))
+    else:
+        LOG.info('Skipping UpdateApplication of %s, the metadata did not change', application_id)
+        metrics.count('SkippedUpdates')
+
+    publication.application_id = application_id
+    publication.actions = [sarpublish.UPDATE_APPLICATION] if changed_fields else []
+    publication.changed_fields = changed_fields if state is not None else None
+    # a new version is only created if SemanticVersion is specified
+    publication.phase = PHASE_CREATE_APPLICATION_VERSION if app_metadata.semantic_version else PHASE_DONE
+
+
+def _create_application_version(template, publication, sar_client, deadline):
+    state = applicationstate.find(sar_client.meta.region_name, publication.application_id)
+    if state and state.get(applicationstate.SEMANTIC_VERSION) == template.app_metadata.semantic_version:
+        LOG.info('Skipping CreateApplicationVersion of %s, version %s is the latest',
+                 publication.application_id, template.app_metadata.semantic_version)
+        publication.phase = PHASE_DONE
+        return
+
+    try:
+        _call(sar_client, 'create_application_version', template, deadline,
+              **sarpublish._create_application_version_request(
+                  template.app_metadata, publication.application_id, template.stripped_template))
+        publication.actions = publication.actions + [sarpublish.CREATE_APPLICATION_VERSION]
+        applicationstate.update(sar_client.meta.region_name, publication.application_id,
+                                {applicationstate.SEMANTIC_VERSION: template.app_metadata.semantic_version})
+    except botocore_exceptions.ClientError as e:
+        # the version already exists
+        if not sarpublish._is_conflict_exception(e):
+            raise _wrap_client_error(e)
+    publication.phase = PHASE_DONE
+
+
+def _get_application_state(sar_client, template, application_id, deadline):
+    # the state cached by this container, or the current one from GetApplication, None if unknown
+    region_name = sar_client.meta.region_name
+    state = applicationstate.find(region_name, application_id)
+    if state is not None:
+        return state
+
+    try:
+        response = _call(sar_client, 'get_application', template, deadline, ApplicationId=application_id)
+    except botocore_exceptions.ClientError as e:
+        if callpolicy.classify(e) != callpolicy.ERROR_FATAL:
+            raise
+        # e.g. the function's role is not allowed to call GetApplication, all the fields are updated
+        LOG.warning('Updating all the metadata of %s, its current state is unknown: %s', application_id, e)
+        return None
+    return applicationstate.put(region_name, application_id, applicationstate.from_get_application_response(response))
+
+
+def _get_state_fields(request):
+    # the fields of a CreateApplication or UpdateApplication request kept in the state of the application
+    state_fields = {field: request.get(field) for field in applicationstate.UPDATABLE_FIELDS}
+    if 'SemanticVersion' in request:
+        state_fields[applicationstate.SEMANTIC_VERSION] = request['SemanticVersion']
+    return state_fields
+
+
+def _call(sar_client, operation_name, template, deadline, **request):
+    # each SAR call is timed as a span named after the operation, e.g. SarCreateApplication, retries included
+    span_name = 'Sar' + ''.join(word.capitalize() for word in operation_name.split('_'))
+    region_name = sar_client.meta.region_name
+    with metrics.span(span_name, application=template.app_metadata.name, region=region_name):
+        return callpolicy.get_policy('serverlessrepo', region_name).call(
+            operation_name, getattr(sar_client, operation_name), deadline, **request)
+
+
+def _wrap_client_error(e):
+    # throttling and retryable errors are kept as is, so that the phase can be attempted again
+    if callpolicy.classify(e) != callpolicy.ERROR_FATAL:
+        return e
+    return sarpublish._wrap_client_error(e)
+
+
+def _is_interruption(e):
+    return isinstance(e, callpolicy.CallSuspendedError) or callpolicy.classify(e) != callpolicy.ERROR_FATAL
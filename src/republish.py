@@ -0,0 +1,303 @@
+"""Republish many applications at once from packaged templates, e.g. after rotating licenses or readmes.
+
+The packaged templates are read from a directory, a local zip file or an S3 prefix, see get_templates(), and each
+one is published to each region with the publish logic of the Lambda function, see handler.publish_templates().
+Templates with different content that publish the same application fail, wherever they are in the source.
+Up to --concurrency templates are published at a time, and the calls to each SAR endpoint stay under the rate
+limit of its call policy, set with --max-rate or CALL_MAX_RATE_PER_SECOND, see callpolicy. The other settings are
+read from the same environment variables as in the Lambda function, e.g. PUBLISH_DIGEST_STORE.
+
+With --checkpoint, every template published to a region is recorded in a store with the digest of its content,
+see kvstore. A run that was interrupted, or that failed for some of the templates, resumes when run again with
+the same checkpoint: the templates already published to a region with the same content are skipped. The run
+ends with a summary report in JSON, and exits with status 1 when some templates were not published.
+
+    python src/republish.py ./packaged-templates --regions us-east-1,eu-west-1 --checkpoint file:///tmp/republish.json
+
+SIGTERM and SIGINT stop the run once the templates in progress are published.
+"""
+
+# must be the first import, for the dependency search path as in the Lambda function. X-Ray patching is skipped
+# outside of Lambda, see clientfactory.patch_xray()
+import lambdainit  # noqa: F401
+import clientfactory
+import config
+import deadline
+import handler
+import kvstore
+import lambdalogging
+import metrics
+import publisher
+import s3helper
+
+import argparse
+import collections
+from concurrent import futures
+import contextvars
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+import zipfile
+
+LOG = lambdalogging.getLogger(__name__)
+
+# status of a template in a region
+STATUS_PUBLISHED = 'published'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+STATUS_PENDING = 'pending'
+STATUS_NOT_STARTED = 'notStarted'
+STATUSES = (STATUS_PUBLISHED, STATUS_SKIPPED, STATUS_FAILED, STATUS_PENDING, STATUS_NOT_STARTED)
+# counters of the calls to SAR added to the report
+REPORTED_COUNTERS = ('SarThrottles', 'SarRetries', 'SarCallsSuspended', 'SkippedCreates', 'SkippedUpdates')
+
+
+def get_templates(source, template_path=None):
+    """Get the packaged templates with application metadata of a source.
+
+    Arguments:
+        source {str} -- A directory, a local zip file, or an S3 prefix as s3://<bucket>/<prefix>. The zip objects
+        under the prefix are read like pipeline artifacts in monorepo mode, and the other objects like the files of
+        a directory
+
+    Keyword Arguments:
+        template_path {str} -- Glob pattern of the templates, relative to the directory, zip file or prefix,
+        s3helper.DISCOVERED_TEMPLATE_PATTERNS if None (default: {None})
+
+    Returns:
+        list -- The key and content of each template, or the exception that made getting it fail, in key order
+
+    """
+    if source.startswith('s3://'):
+        return _get_s3_templates(source, template_path)
+    if os.path.isdir(source):
+        return _get_directory_templates(source, template_path)
+    if zipfile.is_zipfile(source):
+        return s3helper.get_zip_templates(source, template_path)
+    raise RuntimeError('{} is not a directory, a zip file or an s3://<bucket>/<prefix> URL.'.format(source))
+
+
+def republish(templates, regions=None, concurrency=None, checkpoint=None, stopping=None):
+    """Publish the application of each template to each region, skipping those checkpointed.
+
+    Arguments:
+        templates {list} -- The key and content of each template, or the exception that made getting it fail,
+        see get_templates()
+
+    Keyword Arguments:
+        regions {list} -- The regions to publish to, config.REGIONS or the function's region if None
+        (default: {None})
+        concurrency {int} -- The most templates published at once, config.PUBLISH_CONCURRENCY if None
+        (default: {None})
+        checkpoint {object} -- The store of the templates published, see kvstore. Nothing is checkpointed
+        if None (default: {None})
+        stopping {threading.Event} -- Once set, the templates not started yet are not published (default: {None})
+
+    Returns:
+        dict -- The summary report: the number of targets, a template in a region, with each status, the
+        error of each failed target, the pending targets, the SAR call counters and the duration of the run
+
+    """
+    regions = list(regions or config.REGIONS) or [None]
+    concurrency = concurrency or config.PUBLISH_CONCURRENCY
+    stopping = stopping or threading.Event()
+    start = time.monotonic()
+
+    # before any is published, since the templates publishing the same application are published separately
+    prepared_templates, errors = handler.prepare_templates(collections.OrderedDict(templates))
+
+    def republish_template(template):
+        key = template[0]
+        if stopping.is_set():
+            return [(_get_target_name(key, region), STATUS_NOT_STARTED, None) for region in regions]
+        prepared_template = prepared_templates[key] if key in prepared_templates else errors[key]
+        return _republish_template(template, prepared_template, regions, checkpoint)
+
+    outcomes = []
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # in a copy of the caller's context, so that the metrics of the run are recorded together, see metrics
+        pending_futures = [executor.submit(contextvars.copy_context().run, republish_template, template)
+                           for template in templates]
+        for done, future in enumerate(futures.as_completed(pending_futures), 1):
+            outcomes.extend(future.result())
+            LOG.info('Republished %s of %s templates', done, len(templates))
+
+    statuses = collections.Counter(status for _, status, _ in outcomes)
+    report = {'templates': len(templates), 'targets': len(outcomes)}
+    report.update((status, statuses[status]) for status in STATUSES)
+    outcomes.sort(key=lambda outcome: outcome[0])
+    report['failures'] = {name: str(e) for name, status, e in outcomes if status == STATUS_FAILED}
+    report['pendingTargets'] = [name for name, status, _ in outcomes if status == STATUS_PENDING]
+    report.update((counter, metrics.get_total(counter)) for counter in REPORTED_COUNTERS)
+    report['durationSeconds'] = round(time.monotonic() - start, 3)
+    return report
+
+
+def _republish_template(template, prepared_template, regions, checkpoint):
+    key, packaged_template = template
+    digest = None if isinstance(packaged_template, Exception) else \
+        hashlib.sha256(packaged_template.encode('utf-8')).hexdigest()
+    outcomes = []
+    remaining_regions = []
+    for region in regions:
+        if digest is not None and _is_checkpointed(checkpoint, key, region, digest):
+            outcomes.append((_get_target_name(key, region), STATUS_SKIPPED, None))
+        else:
+            remaining_regions.append(region)
+    if not remaining_regions:
+        return outcomes
+
+    # without deadline, the phases of a publication run to the end, or until an API call fails after its retries
+    results, _ = handler.publish_templates({key: prepared_template}, remaining_regions,
+                                           collections.defaultdict(publisher.Publication), deadline.Deadline(None))
+    for region, result in zip(remaining_regions, results.values()):
+        name = _get_target_name(key, region)
+        if isinstance(result, Exception):
+            outcomes.append((name, STATUS_FAILED, result))
+        elif result is None:
+            # the template is being published by another job, see idempotency
+            outcomes.append((name, STATUS_PENDING, None))
+        else:
+            outcomes.append((name, STATUS_PUBLISHED, None))
+            _checkpoint(checkpoint, key, region, digest, result)
+    return outcomes
+
+
+def _get_target_name(key, region):
+    return key if region is None else '{}@{}'.format(key, region)
+
+
+def _get_checkpoint_key(key, region):
+    return 'republish/{}/{}'.format(region or 'default', key)
+
+
+def _is_checkpointed(checkpoint, key, region, digest):
+    if checkpoint is None:
+        return False
+    record = checkpoint.get(_get_checkpoint_key(key, region))
+    return record is not None and record['digest'] == digest
+
+
+def _checkpoint(checkpoint, key, region, digest, result):
+    if checkpoint is None:
+        return
+    try:
+        checkpoint.put(_get_checkpoint_key(key, region),
+                       {'digest': digest, 'application_id': result['application_id'], 'actions': result['actions']})
+    except Exception as e:
+        # the template is published again by the next run
+        LOG.warning('Unable to checkpoint %s: %s', _get_target_name(key, region), e)
+
+
+def _matches(name, template_path):
+    patterns = (template_path,) if template_path else s3helper.DISCOVERED_TEMPLATE_PATTERNS
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def _get_directory_templates(path, template_path):
+    templates = []
+    for directory, directory_names, file_names in os.walk(path):
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(directory, file_name)
+            name = os.path.relpath(file_path, path).replace(os.sep, '/')
+            if not _matches(name, template_path):
+                continue
+            try:
+                if os.path.getsize(file_path) > config.MAX_TEMPLATE_BYTES:
+                    raise _template_too_large_error(name)
+                with open(file_path, encoding='utf-8') as f:
+                    content = f.read()
+            except Exception as e:
+                LOG.error('Failed to read %s: %s', name, e)
+                templates.append((name, e))
+                continue
+            if s3helper.APP_METADATA_KEY in content:
+                templates.append((name, content))
+    return templates
+
+
+def _get_s3_templates(url, template_path):
+    parsed_url = urlparse(url)
+    bucket, prefix = parsed_url.netloc, parsed_url.path.lstrip('/')
+    s3_client = clientfactory.get_function_s3_client()
+    templates = []
+    for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for s3_object in page.get('Contents', []):
+            key = s3_object['Key']
+            name = key[len(prefix):].lstrip('/')
+            try:
+                if key.endswith('.zip'):
+                    templates.extend(('{}/{}'.format(key, file_name), content) for file_name, content
+                                     in s3helper.get_artifact_templates(s3_client, bucket, key, template_path))
+                elif _matches(name, template_path):
+                    if s3_object['Size'] > config.MAX_TEMPLATE_BYTES:
+                        raise _template_too_large_error(key)
+                    content = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+                    if s3helper.APP_METADATA_KEY in content:
+                        templates.append((key, content))
+            except Exception as e:
+                LOG.error('Failed to get s3://%s/%s: %s', bucket, key, e)
+                templates.append((key, e))
+    return templates
+
+
+def _template_too_large_error(name):
+    return RuntimeError('The packaged template {} is larger than {} bytes.'.format(name, config.MAX_TEMPLATE_BYTES))
+
+
+def main(argv=None):
+    """Republish the templates of the source given on the command line, then print the report.
+
+    Keyword Arguments:
+        argv {list} -- The command line arguments, sys.argv[1:] if None (default: {None})
+
+    Returns:
+        int -- The exit status, 1 when some templates were not published
+
+    """
+    parser = argparse.ArgumentParser(description='Republish applications to AWS Serverless Application Repository '
+                                                 'from packaged templates.')
+    parser.add_argument('source', help='directory, zip file or s3://<bucket>/<prefix> of the packaged templates')
+    parser.add_argument('--template-path', default=config.TEMPLATE_PATH or None,
+                        help='glob pattern of the templates, relative to the source')
+    parser.add_argument('--regions', help='comma separated regions to publish to, REGIONS by default')
+    parser.add_argument('--concurrency', type=int, help='most templates published at once, PUBLISH_CONCURRENCY '
+                                                        'by default')
+    parser.add_argument('--max-rate', type=float, help='most calls per second to each SAR endpoint, '
+                                                       'CALL_MAX_RATE_PER_SECOND by default')
+    parser.add_argument('--checkpoint', help='URL of the store of the templates published, to resume an interrupted '
+                                             'run, e.g. file:///tmp/republish.json, see kvstore')
+    args = parser.parse_args(argv)
+
+    # outside of Lambda, no handler is set up for the root logger
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    if args.max_rate:
+        # read by the call policies, which are created by the first call to each endpoint
+        config.CALL_MAX_RATE_PER_SECOND = args.max_rate
+    regions = [region.strip() for region in args.regions.split(',') if region.strip()] if args.regions else None
+    checkpoint = kvstore.from_url(args.checkpoint) if args.checkpoint else None
+
+    stopping = threading.Event()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda *_: stopping.set())
+
+    try:
+        templates = get_templates(args.source, args.template_path)
+    except RuntimeError as e:
+        parser.error(str(e))
+    LOG.info('Republishing %s templates', len(templates))
+    report = republish(templates, regions, args.concurrency, checkpoint, stopping)
+    print(json.dumps(report, indent=2))
+    return 0 if report['templates'] and report[STATUS_PUBLISHED] + report[STATUS_SKIPPED] == report['targets'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,61 +1,460 @@
-"""S3 helper for getting the input artifact."""
+"""S3 helper for getting the input artifacts."""
 
+import artifactcache
+import clientfactory
+import config
 import lambdalogging
+import metrics
+import s3rangedfile
+import userparameters
 
-import boto3
+import codecs
+import fnmatch
+import itertools
+import tempfile
 import zipfile
-import io
 
 LOG = lambdalogging.getLogger(__name__)
 
+# size of the chunks read from the S3 object body and from the unzipped template
+CHUNK_BYTES = 1024 * 1024
+# fixed part of a zip local file header, followed by the file name and extra field
+ZIP_LOCAL_HEADER_BYTES = 30
+# allowance for a local extra field that is longer than the one in the central directory
+ZIP_LOCAL_EXTRA_SLACK_BYTES = 1024
+# file name patterns of the templates discovered in monorepo mode, when no template path is set
+DISCOVERED_TEMPLATE_PATTERNS = ('*.yaml', '*.yml', '*.json', '*.template')
+# discovered templates must contain this metadata key to be published
+APP_METADATA_KEY = 'AWS::ServerlessRepo::Application'
 
-def get_input_artifact(event):
+
+def get_input_artifact(job, input_artifact=None):
     """Get the packaged SAM template from CodePipeline S3 Bucket.
 
     Arguments:
-        event {dict} -- The JSON event sent to AWS Lambda by AWS CodePipeline
+        job {CodePipelineJob} -- The CodePipeline job
+
+    Keyword Arguments:
+        input_artifact {InputArtifact} -- The input artifact to fetch, one of job.input_artifacts. If None, the
+        action must have a single input artifact (default: {None})
 
     Returns:
         str -- The content in the packaged SAM template as string
 
     """
-    artifact_credentials = event['CodePipeline.job']['data']['artifactCredentials']
-    S3 = boto3.client(
-        's3',
-        aws_access_key_id=artifact_credentials['accessKeyId'],
-        aws_secret_access_key=artifact_credentials['secretAccessKey'],
-        aws_session_token=artifact_credentials['sessionToken']
+    if input_artifact is None:
+        if len(job.input_artifacts) != 1:
+            raise RuntimeError('You should only have one input artifact. Please check the setting for the action.')
+        input_artifact = job.input_artifacts[0]
+
+    template_path = job.user_parameters.get(userparameters.TEMPLATE_PATH, config.TEMPLATE_PATH)
+
+    return _get_input_artifact_content(job, input_artifact, ('template', template_path),
+                                       lambda zipped_content: _unzip_as_string(zipped_content, template_path))
+
+
+def get_input_artifact_templates(job, input_artifact):
+    """Get the packaged SAM templates of all the applications in an input artifact, for monorepo mode.
+
+    The files matching the template path, or DISCOVERED_TEMPLATE_PATTERNS without one, are found in the zip
+    central directory, and those containing APP_METADATA_KEY are returned without being parsed.
+
+    Arguments:
+        job {CodePipelineJob} -- The CodePipeline job
+        input_artifact {InputArtifact} -- The input artifact to fetch, one of job.input_artifacts
+
+    Returns:
+        list -- (file name, content) of each template as string, in zip order
+
+    """
+    template_path = job.user_parameters.get(userparameters.TEMPLATE_PATH, config.TEMPLATE_PATH)
+
+    templates = _get_input_artifact_content(job, input_artifact, ('templates', template_path),
+                                            lambda zipped_content: _find_app_templates(zipped_content, template_path))
+    # the tuples of cached templates were read back from JSON as lists
+    return [tuple(template) for template in templates]
+
+
+def get_artifact_templates(s3_client, bucket, key, template_path=None):
+    """Get the packaged SAM templates with application metadata in a zip object, see get_input_artifact_templates().
+
+    Arguments:
+        s3_client {S3.Client} -- The client reading the object
+        bucket {str} -- The S3 bucket of the object
+        key {str} -- The S3 key of the object
+
+    Keyword Arguments:
+        template_path {str} -- Glob pattern of the templates, DISCOVERED_TEMPLATE_PATTERNS if None (default: {None})
+
+    Returns:
+        list -- (file name, content) of each template as string, in zip order
+
+    """
+    templates = _get_artifact_content(s3_client, bucket, key, key, ('templates', template_path),
+                                      lambda zipped_content: _find_app_templates(zipped_content, template_path))
+    return [tuple(template) for template in templates]
+
+
+def get_zip_templates(path, template_path=None):
+    """Get the packaged SAM templates with application metadata in a local zip file, see get_input_artifact_templates().
+
+    Arguments:
+        path {str} -- The path of the zip file
+
+    Keyword Arguments:
+        template_path {str} -- Glob pattern of the templates, DISCOVERED_TEMPLATE_PATTERNS if None (default: {None})
+
+    Returns:
+        list -- (file name, content) of each template as string, in zip order
+
+    """
+    with open(path, 'rb') as zipped_content, metrics.span('Unzip'):
+        return _find_app_templates(zipped_content, template_path)
+
+
+def _get_input_artifact_content(job, input_artifact, selection, extract):
+    S3 = clientfactory.get_s3_client(job.artifact_credentials)
+
+    LOG.info('artifact_to_fetch=%s', input_artifact)
+    return _get_artifact_content(S3, input_artifact.bucket_name, input_artifact.object_key, input_artifact.name,
+                                 selection, extract)
+
+
+def _get_artifact_content(s3_client, bucket, key, name, selection, extract):
+    """Fetch a zipped artifact and extract its content, unless the content extracted before is cached.
+
+    Arguments:
+        s3_client {S3.Client} -- The boto3 client used to get the object
+        bucket {str} -- The bucket of the artifact
+        key {str} -- The key of the artifact
+        name {str} -- The name of the artifact, for the S3Fetch span
+        selection {tuple} -- What is extracted, part of the key of the artifact cache
+        extract {callable} -- The function extracting the content from the zipped artifact, JSON serializable
+
+    Returns:
+        object -- The content extracted, or read from artifactcache when the artifact did not change
+
+    """
+    cached = artifactcache.find(bucket, key, selection) if artifactcache.is_enabled() else None
+    with metrics.span('S3Fetch', artifact=name):
+        zipped_content, etag = _open_artifact(s3_client, bucket, key, cached.etag if cached else None)
+    if zipped_content is None:
+        LOG.info('%s/%s not modified, using the templates extracted before.', bucket, key)
+        artifactcache.record_lookup(hit=True)
+        return cached.value
+
+    with zipped_content:
+        with metrics.span('Unzip'):
+            content = extract(zipped_content)
+        _count_ranged_bytes(zipped_content)
+    if artifactcache.is_enabled():
+        artifactcache.record_lookup(hit=False)
+        artifactcache.put(bucket, key, selection, etag, content)
+    return content
+
+
+def _count_ranged_bytes(zipped_content):
+    # the bytes of spooled artifacts are counted when they are spooled
+    if isinstance(zipped_content, s3rangedfile.S3RangedFile):
+        metrics.count('ArtifactBytes', zipped_content.bytes_fetched, metrics.UNIT_BYTES)
+        metrics.count('ArtifactRangeRequests', zipped_content.range_requests)
+
+
+def _open_artifact(s3_client, bucket, key, etag=None):
+    """Open the zipped artifact in S3 as a seekable file object.
+
+    With config.RANGED_ARTIFACT_FETCH, the end of the object is fetched first with a ranged GET. Large
+    objects are then read through an S3RangedFile, so only the zip central directory and the template
+    member are downloaded. Small objects, and objects served by an endpoint ignoring ranges, are
+    downloaded in full.
+
+    Arguments:
+        s3_client {S3.Client} -- The boto3 client used to get the object
+        bucket {str} -- The bucket of the artifact
+        key {str} -- The key of the artifact
+
+    Keyword Arguments:
+        etag {str} -- The ETag of the version of the object extracted before, the first GET is conditioned on the
+        object having another one (default: {None})
+
+    Returns:
+        tuple -- Seekable binary file object with the zipped artifact, None when the object still has the given
+        ETag. Then the ETag of the object
+
+    """
+    request = {'Bucket': bucket, 'Key': key}
+    if config.RANGED_ARTIFACT_FETCH:
+        request['Range'] = 'bytes=-{}'.format(config.RANGED_FETCH_TAIL_BYTES)
+    if etag:
+        request['IfNoneMatch'] = etag
+    try:
+        response = s3_client.get_object(**request)
+    except Exception as e:
+        if etag and _is_not_modified(e):
+            return None, etag
+        raise
+    _count_retries(response)
+    etag = response.get('ETag')
+
+    if not config.RANGED_ARTIFACT_FETCH:
+        LOG.info('%s/%s fetched. %s bytes.', bucket, key, response['ContentLength'])
+        return _spool_body(response), etag
+
+    if 'ContentRange' not in response:
+        LOG.info('%s/%s fetched in full, ranges are not supported. %s bytes.', bucket, key, response['ContentLength'])
+        return _spool_body(response), etag
+
+    tail_start, _, object_size = s3rangedfile.parse_content_range(response['ContentRange'])
+    if tail_start == 0:
+        LOG.info('%s/%s fetched. %s bytes.', bucket, key, object_size)
+        return _spool_body(response), etag
+
+    tail = response['Body'].read()
+    if object_size < config.RANGED_FETCH_MIN_OBJECT_BYTES:
+        head = s3_client.get_object(
+            Bucket=bucket,
+            Key=key,
+            Range='bytes=0-{}'.format(tail_start - 1),
+            IfMatch=response['ETag']
+        )
+        _count_retries(head)
+        LOG.info('%s/%s fetched. %s bytes.', bucket, key, object_size)
+        return _spool(object_size, itertools.chain(head['Body'].iter_chunks(CHUNK_BYTES), [tail])), etag
+
+    LOG.info('%s/%s is %s bytes, fetching the zip central directory and the template only.',
+             bucket, key, object_size)
+    metrics.count('ArtifactBytes', len(tail), metrics.UNIT_BYTES)
+    return s3rangedfile.S3RangedFile(
+        s3_client,
+        bucket,
+        key,
+        object_size,
+        etag=response['ETag'],
+        block_bytes=config.RANGED_FETCH_BLOCK_BYTES,
+        buffered=(tail_start, tail)
+    ), etag
+
+
+def _is_not_modified(e):
+    # botocore raises a ClientError for the 304 response of a GET with If-None-Match
+    return getattr(e, 'response', {}).get('ResponseMetadata', {}).get('HTTPStatusCode') == 304
+
+
+def _count_retries(response):
+    metrics.count('S3Retries', response.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+
+
+def _spool_body(response):
+    """Copy the body of a GetObject response into a spooled temporary file chunk by chunk.
+
+    Arguments:
+        response {dict} -- The response of S3 GetObject
+
+    Returns:
+        SpooledTemporaryFile -- The object body, positioned at the start
+
+    """
+    return _spool(response['ContentLength'], response['Body'].iter_chunks(CHUNK_BYTES))
+
+
+def _spool(content_length, chunks):
+    """Copy chunks of bytes into a spooled temporary file.
+
+    The content stays in memory up to config.ARTIFACT_SPOOL_MEMORY_BYTES and is rolled over to
+    config.ARTIFACT_SPOOL_DIR beyond that, so memory use does not grow with the artifact size.
+
+    Arguments:
+        content_length {int} -- The expected number of bytes
+        chunks {iterable} -- The content as chunks of bytes
+
+    Returns:
+        SpooledTemporaryFile -- The content, positioned at the start
+
+    """
+    if content_length > config.MAX_ARTIFACT_BYTES:
+        raise _artifact_too_large_error()
+
+    spooled_file = tempfile.SpooledTemporaryFile(
+        max_size=config.ARTIFACT_SPOOL_MEMORY_BYTES,
+        dir=config.ARTIFACT_SPOOL_DIR
     )
+    try:
+        spooled_bytes = 0
+        for chunk in chunks:
+            spooled_bytes += len(chunk)
+            if spooled_bytes > config.MAX_ARTIFACT_BYTES:
+                raise _artifact_too_large_error()
+            spooled_file.write(chunk)
+        spooled_file.seek(0)
+        metrics.count('ArtifactBytes', spooled_bytes, metrics.UNIT_BYTES)
+    except Exception:
+        spooled_file.close()
+        raise
 
-    input_artifacts = event['CodePipeline.job']['data']['inputArtifacts']
+    return spooled_file
 
-    if len(input_artifacts) != 1:
-        raise RuntimeError('You should only have one input artifact. Please check the setting for the action.')
 
-    artifact_to_fetch = input_artifacts[0]
-    LOG.info('artifact_to_fetch=%s', artifact_to_fetch)
+def _unzip_as_string(zipped_content, template_path=None):
+    """Unzip the packaged template from a zip file as string.
 
-    artifact_s3_location = artifact_to_fetch['location']['s3Location']
-    bucket = artifact_s3_location['bucketName']
-    key = artifact_s3_location['objectKey']
+    Only the template member is decompressed, incrementally and within config.MAX_TEMPLATE_BYTES.
 
-    response = S3.get_object(Bucket=bucket, Key=key)
-    LOG.info('%s/%s fetched. %s bytes.', bucket, key, response['ContentLength'])
+    Arguments:
+        zipped_content {file} -- Seekable binary file object with the zipped data
+
+    Keyword Arguments:
+        template_path {str} -- Path or glob pattern of the template, see _select_template_member (default: {None})
+
+    Returns:
+        str -- Unzipped data as string
 
-    zipped_content_as_bytes = response.get('Body').read()
-    return _unzip_as_string(zipped_content_as_bytes)
+    """
+    with zipfile.ZipFile(zipped_content) as z:
+        member = _select_template_member(_build_zip_index(z), template_path)
+        if member.file_size > config.MAX_TEMPLATE_BYTES:
+            raise _template_too_large_error(member.filename)
+        return _read_member(z, zipped_content, member)
 
 
-def _unzip_as_string(data):
-    """Unzip stream of data in bytes as string.
+def _find_app_templates(zipped_content, template_path=None):
+    """Find the packaged templates with application metadata in a zip file.
 
     Arguments:
-        data {bytes} -- Zipped data as bytes
+        zipped_content {file} -- Seekable binary file object with the zipped data
+
+    Keyword Arguments:
+        template_path {str} -- Glob pattern of the templates, DISCOVERED_TEMPLATE_PATTERNS if None (default: {None})
+
+    Returns:
+        list -- (file name, content) of each template as string, in zip order
+
+    """
+    patterns = (template_path,) if template_path else DISCOVERED_TEMPLATE_PATTERNS
+    with zipfile.ZipFile(zipped_content) as z:
+        members = [info for name, info in _build_zip_index(z).items()
+                   if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+        for member in members:
+            if member.file_size > config.MAX_TEMPLATE_BYTES:
+                raise _template_too_large_error(member.filename)
+        if sum(member.file_size for member in members) > config.MAX_ARTIFACT_BYTES:
+            raise _artifact_too_large_error()
+
+        if isinstance(zipped_content, s3rangedfile.S3RangedFile) and members:
+            # fetch all the candidates with a single ranged GET when little else is stored between them
+            start = min(member.header_offset for member in members)
+            end = max(member.header_offset + _local_member_bytes(member) for member in members)
+            gap_bytes = end - start - sum(_local_member_bytes(member) for member in members)
+            if gap_bytes <= config.RANGED_FETCH_BLOCK_BYTES:
+                zipped_content.prefetch(start, end - start)
+
+        templates = []
+        for member in members:
+            content = _read_member(z, zipped_content, member)
+            if APP_METADATA_KEY in content:
+                templates.append((member.filename, content))
+            else:
+                LOG.debug('Skipping %s without application metadata', member.filename)
+
+    if not templates:
+        raise RuntimeError('No template with {} metadata in the input artifact.'.format(APP_METADATA_KEY))
+    LOG.info('Found %s templates with application metadata', len(templates))
+    return templates
+
+
+def _read_member(z, zipped_content, member):
+    """Read a zip member as string, decompressed incrementally and within config.MAX_TEMPLATE_BYTES.
+
+    Arguments:
+        z {ZipFile} -- The opened zip file
+        zipped_content {file} -- The file object the zip file was opened from
+        member {ZipInfo} -- The member to read
 
     Returns:
         str -- Unzipped data as string
 
     """
-    z = zipfile.ZipFile(io.BytesIO(data))
-    unzipped_data = z.read(z.infolist()[0])
-    return unzipped_data.decode()
+    if isinstance(zipped_content, s3rangedfile.S3RangedFile):
+        # fetch the whole member with a single ranged GET
+        if not zipped_content.is_buffered(member.header_offset, _local_member_bytes(member)):
+            zipped_content.prefetch(member.header_offset, _local_member_bytes(member))
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    unzipped_parts = []
+    unzipped_bytes = 0
+    with z.open(member) as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            # the size recorded in the zip is not trusted on its own
+            unzipped_bytes += len(chunk)
+            if unzipped_bytes > config.MAX_TEMPLATE_BYTES:
+                raise _template_too_large_error(member.filename)
+            unzipped_parts.append(decoder.decode(chunk))
+    unzipped_parts.append(decoder.decode(b'', final=True))
+
+    return ''.join(unzipped_parts)
+
+
+def _local_member_bytes(member):
+    # the local header, with room for a longer extra field, and the compressed data
+    local_header_bytes = ZIP_LOCAL_HEADER_BYTES + len(member.orig_filename.encode()) + len(member.extra)
+    return local_header_bytes + ZIP_LOCAL_EXTRA_SLACK_BYTES + member.compress_size
+
+
+def _build_zip_index(z):
+    """Index the files in the zip central directory by name.
+
+    Arguments:
+        z {ZipFile} -- The opened zip file
+
+    Returns:
+        dict -- ZipInfo of each file by name, in central directory order
+
+    """
+    return {info.filename: info for info in z.infolist() if not info.is_dir()}
+
+
+def _select_template_member(zip_index, template_path):
+    """Select the packaged template in the zip.
+
+    An exact name match is looked up first, then template_path is matched as a glob pattern, which must
+    match a single file. Without template_path, the first file is selected.
+
+    Arguments:
+        zip_index {dict} -- ZipInfo of each file by name, see _build_zip_index
+        template_path {str} -- Path or glob pattern of the template in the zip
+
+    Returns:
+        ZipInfo -- The selected member
+
+    """
+    if not zip_index:
+        raise RuntimeError('The input artifact does not contain any file.')
+
+    if not template_path:
+        if len(zip_index) > 1:
+            LOG.warning('The input artifact contains %s files, using the first one. Set %s to select the template.',
+                        len(zip_index), userparameters.TEMPLATE_PATH)
+        return next(iter(zip_index.values()))
+
+    if template_path in zip_index:
+        return zip_index[template_path]
+
+    matches = [name for name in zip_index if fnmatch.fnmatchcase(name, template_path)]
+    if not matches:
+        raise RuntimeError('No file matching {} in the input artifact.'.format(template_path))
+    if len(matches) > 1:
+        raise RuntimeError('More than one file matching {} in the input artifact: {}'.format(
+            template_path, ', '.join(sorted(matches))))
+    return zip_index[matches[0]]
+
+
+def _artifact_too_large_error():
+    return RuntimeError(
+        'The input artifact is larger than {} bytes. Please check the setting for the action.'.format(
+            config.MAX_ARTIFACT_BYTES)
+    )
+
+
+def _template_too_large_error(name):
+    return RuntimeError(
+        'The packaged template {} is larger than {} bytes when unzipped.'.format(name, config.MAX_TEMPLATE_BYTES)
+    )
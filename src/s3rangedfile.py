@@ -0,0 +1,161 @@
+"""Seekable file object reading an S3 object with ranged GETs."""
+
+import lambdalogging
+
+import io
+import re
+
+LOG = lambdalogging.getLogger(__name__)
+
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+def parse_content_range(content_range):
+    """Parse the Content-Range header of a ranged GET response.
+
+    Arguments:
+        content_range {str} -- Value of the header, e.g. "bytes 0-99/1000"
+
+    Returns:
+        tuple -- (first byte, last byte, object size)
+
+    """
+    match = CONTENT_RANGE_PATTERN.match(content_range or '')
+    if not match:
+        raise IOError('Unexpected Content-Range in S3 response: {}'.format(content_range))
+    return tuple(int(group) for group in match.groups())
+
+
+class S3RangedFile(io.RawIOBase):
+    """Read-only, seekable view of an S3 object that only downloads the byte ranges being read.
+
+    Reads are served from a single buffer. A read outside of the buffer replaces it with a ranged GET
+    of at least block_bytes, so consecutive small reads (as done by zipfile) don't turn into one
+    request each.
+    """
+
+    def __init__(self, s3_client, bucket, key, size, etag=None, block_bytes=1024 * 1024, buffered=None):
+        """Initialize the file object.
+
+        Arguments:
+            s3_client {S3.Client} -- The boto3 client used to get the object
+            bucket {str} -- The bucket of the object
+            key {str} -- The key of the object
+            size {int} -- The size of the object in bytes
+
+        Keyword Arguments:
+            etag {str} -- When set, ranged GETs fail if the object no longer has this ETag (default: {None})
+            block_bytes {int} -- The minimum number of bytes fetched by a ranged GET (default: {1 MiB})
+            buffered {tuple} -- (offset, bytes) of object content already fetched (default: {None})
+
+        """
+        super().__init__()
+        self._s3_client = s3_client
+        self._bucket = bucket
+        self._key = key
+        self._size = size
+        self._etag = etag
+        self._block_bytes = block_bytes
+        self._position = 0
+        self._buffer_start, self._buffer = buffered or (0, b'')
+        self.range_requests = 0
+        self.bytes_fetched = 0
+
+    def readable(self):
+        """Return True, the object can be read."""
+        return True
+
+    def seekable(self):
+        """Return True, the object supports random access."""
+        return True
+
+    def tell(self):
+        """Return the current position in the object."""
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Change the current position in the object.
+
+        Arguments:
+            offset {int} -- The offset relative to whence
+
+        Keyword Arguments:
+            whence {int} -- io.SEEK_SET, io.SEEK_CUR or io.SEEK_END (default: {io.SEEK_SET})
+
+        Returns:
+            int -- The new position
+
+        """
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError('Invalid whence: {}'.format(whence))
+
+        if position < 0:
+            raise ValueError('Negative seek position: {}'.format(position))
+        self._position = position
+        return position
+
+    def readinto(self, b):
+        """Read up to len(b) bytes from the current position into b.
+
+        Arguments:
+            b {bytearray} -- The buffer to read into
+
+        Returns:
+            int -- The number of bytes read, 0 at the end of the object
+
+        """
+        length = min(len(b), self._size - self._position)
+        if length <= 0:
+            return 0
+
+        if not self.is_buffered(self._position, length):
+            self.prefetch(self._position, max(length, self._block_bytes))
+
+        offset = self._position - self._buffer_start
+        b[:length] = self._buffer[offset:offset + length]
+        self._position += length
+        return length
+
+    def prefetch(self, start, length):
+        """Replace the buffer with a single ranged GET covering [start, start + length).
+
+        Arguments:
+            start {int} -- The first byte to fetch
+            length {int} -- The number of bytes to fetch, truncated at the end of the object
+
+        """
+        end = min(self._size, start + length) - 1
+        request = {
+            'Bucket': self._bucket,
+            'Key': self._key,
+            'Range': 'bytes={}-{}'.format(start, end)
+        }
+        if self._etag:
+            request['IfMatch'] = self._etag
+
+        response = self._s3_client.get_object(**request)
+        data = response['Body'].read()
+        self.range_requests += 1
+        self.bytes_fetched += len(data)
+
+        if 'ContentRange' not in response:
+            # the range was ignored and the whole object was returned
+            data = data[start:end + 1]
+        if len(data) != end - start + 1:
+            raise IOError('Expected {} bytes from {}/{} at offset {}, got {}'.format(
+                end - start + 1, self._bucket, self._key, start, len(data)))
+
+        LOG.debug('Fetched bytes %s-%s of %s/%s', start, end, self._bucket, self._key)
+        self._buffer_start = start
+        self._buffer = data
+
+    def is_buffered(self, start, length):
+        """Return whether [start, start + length), truncated at the end of the object, is in the buffer."""
+        end = min(self._size, start + length)
+        return self._buffer_start <= start and end <= self._buffer_start + len(self._buffer)
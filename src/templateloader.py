@@ -0,0 +1,107 @@
+"""Load and dump packaged SAM templates, with the libyaml bindings of PyYAML when they are available.
+
+The parsed template is the same as with serverlessrepo.parser.parse_template(): JSON templates are parsed with the
+json module, YAML templates with CloudFormation intrinsic function tags such as !Ref or !GetAtt turned into their
+JSON form, and mappings keep their order. The pure-Python loader and dumper of PyYAML are several times slower on
+large templates, and are only used when PyYAML was built without libyaml.
+"""
+
+import lambdalogging
+import lazyimport
+
+import collections
+import json
+import threading
+
+LOG = lambdalogging.getLogger(__name__)
+
+yaml = lazyimport.LazyModule('yaml')
+sarparser = lazyimport.LazyModule('serverlessrepo.parser')
+
+FORMAT_JSON = 'json'
+FORMAT_YAML = 'yaml'
+
+# loader and dumper classes, created on first use so that importing this module doesn't import yaml
+_yaml_classes = None
+_LOCK = threading.Lock()
+
+
+def get_format(template):
+    """Detect the format of a template from its first character.
+
+    Arguments:
+        template {str} -- Content of a YAML or JSON template
+
+    Returns:
+        str -- FORMAT_JSON or FORMAT_YAML
+
+    """
+    return FORMAT_JSON if template.lstrip()[:1] == '{' else FORMAT_YAML
+
+
+def load(template):
+    """Parse a template.
+
+    Arguments:
+        template {str} -- Content of a YAML or JSON template
+
+    Returns:
+        OrderedDict -- The parsed template
+
+    """
+    if get_format(template) == FORMAT_JSON:
+        try:
+            return json.loads(template, object_pairs_hook=collections.OrderedDict)
+        except ValueError:
+            # a YAML flow mapping
+            LOG.debug('Template is not JSON, parsing it as YAML')
+    loader_class, _ = _get_yaml_classes()
+    # as yaml.load(), which can't be reached through the lazy module that has a load() method of its own
+    loader = loader_class(template)
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
+
+
+def dump(template_dict):
+    """Serialize a parsed template as YAML, as serverlessrepo does before publishing.
+
+    Arguments:
+        template_dict {dict} -- The parsed template
+
+    Returns:
+        str -- The YAML template
+
+    """
+    _, dumper_class = _get_yaml_classes()
+    return yaml.dump(template_dict, Dumper=dumper_class, default_flow_style=False)
+
+
+def is_accelerated():
+    """Return whether YAML templates are loaded and dumped with libyaml."""
+    return yaml.__with_libyaml__
+
+
+def _get_yaml_classes():
+    global _yaml_classes
+    with _LOCK:
+        if _yaml_classes is None:
+            _yaml_classes = _create_yaml_classes()
+        return _yaml_classes
+
+
+def _create_yaml_classes():
+    base_loader_class = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    base_dumper_class = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    LOG.debug('Loading templates with %s', base_loader_class.__name__)
+
+    # subclasses, so that the constructors and representers are not added to the classes shared with other modules
+    loader_class = type('TemplateLoader', (base_loader_class,), {})
+    loader_class.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+                                 lambda loader, node: collections.OrderedDict(loader.construct_pairs(node)))
+    loader_class.add_multi_constructor('!', sarparser.intrinsics_multi_constructor)
+
+    dumper_class = type('TemplateDumper', (base_dumper_class,), {})
+    dumper_class.add_representer(collections.OrderedDict, lambda dumper, data: dumper.represent_dict(data.items()))
+    return loader_class, dumper_class
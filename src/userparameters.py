@@ -0,0 +1,49 @@
+"""Helper for reading the UserParameters of the CodePipeline action."""
+
+import lambdalogging
+
+import json
+
+LOG = lambdalogging.getLogger(__name__)
+
+# path or glob pattern of the packaged template in the input artifact
+TEMPLATE_PATH = 'TemplatePath'
+# whether to publish every template with application metadata in the input artifacts
+MONOREPO = 'Monorepo'
+# list of regions the applications are published to
+REGIONS = 'Regions'
+# what to do when publishing fails in some of the regions
+REGION_FAILURE_POLICY = 'RegionFailurePolicy'
+# names of the applications published by the action, whose state is fetched along with the input artifacts
+APPLICATION_NAMES = 'ApplicationNames'
+
+
+def parse_user_parameters(user_parameters):
+    """Parse the UserParameters of the action as a dictionary.
+
+    UserParameters are expected to be a JSON object. Values that are not JSON are ignored, since earlier
+    versions of this app did not read UserParameters at all.
+
+    Arguments:
+        user_parameters {str} -- The UserParameters in the configuration of the action, empty if it has none
+
+    Returns:
+        dict -- The parsed UserParameters, empty if the action has none
+
+    """
+    user_parameters = user_parameters.strip()
+    if not user_parameters:
+        return {}
+
+    try:
+        parsed_parameters = json.loads(user_parameters)
+    except ValueError as e:
+        if user_parameters.startswith('{'):
+            raise RuntimeError('UserParameters is not a valid JSON object: {}'.format(e))
+        LOG.warning('Ignoring UserParameters that are not a JSON object.')
+        return {}
+
+    if not isinstance(parsed_parameters, dict):
+        LOG.warning('Ignoring UserParameters that are not a JSON object.')
+        return {}
+    return parsed_parameters
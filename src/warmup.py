@@ -0,0 +1,151 @@
+"""Warm the function up ahead of the first job, e.g. in the init phase of provisioned concurrency.
+
+Warming up imports the dependencies that are otherwise imported lazily by the first job, creates and caches the
+clients of CodePipeline, SAR in each publish region and the function's stores, and resolves the addresses of their
+endpoints. It can also open connections to the SAR endpoints with a ListApplications call of one item, an
+AccessDenied response opens the connection as well. CodePipeline is never called. S3 clients for the artifact
+credentials of a job can't be created ahead of the job, but creating the function's S3 client loads the S3 model and
+endpoint rules that they share.
+
+The function is warmed up when invoked with a warm-up event, {"warmup": true} or {"warmup": {"connect": true}},
+and in its init phase with provisioned concurrency, see on_init().
+"""
+
+import callpolicy
+import clientfactory
+import config
+import lambdalogging
+import publisher
+import templateloader
+
+import os
+import socket
+import time
+from urllib.parse import urlparse
+
+LOG = lambdalogging.getLogger(__name__)
+
+WARMUP_EVENT_KEY = 'warmup'
+# value of AWS_LAMBDA_INITIALIZATION_TYPE in the init phase of provisioned concurrency
+PROVISIONED_CONCURRENCY = 'provisioned-concurrency'
+# lazily imported modules of the publish path
+LAZY_MODULES = (
+    clientfactory.boto3,
+    clientfactory.botocore_config,
+    callpolicy.botocore_exceptions,
+    publisher.sarpublish,
+    publisher.sarparser,
+    templateloader.yaml
+)
+
+
+def is_warmup_event(event):
+    """Return whether the function was invoked with a warm-up event rather than a CodePipeline job."""
+    return isinstance(event, dict) and WARMUP_EVENT_KEY in event and 'CodePipeline.job' not in event
+
+
+def handle_event(event):
+    """Warm the function up for a warm-up event.
+
+    Arguments:
+        event {dict} -- The warm-up event, see the module documentation
+
+    Returns:
+        dict -- The report of warm_up()
+
+    """
+    options = event[WARMUP_EVENT_KEY] if isinstance(event[WARMUP_EVENT_KEY], dict) else {}
+    return warm_up(connect=options.get('connect', config.WARMUP_CONNECT))
+
+
+def on_init():
+    """Warm the function up if it is initialized for provisioned concurrency, never raising.
+
+    Returns:
+        dict -- The report of warm_up(), None if the function was not warmed up
+
+    """
+    if not config.WARMUP_ON_INIT or os.getenv('AWS_LAMBDA_INITIALIZATION_TYPE') != PROVISIONED_CONCURRENCY:
+        return None
+    try:
+        return warm_up(connect=config.WARMUP_CONNECT)
+    except Exception as e:
+        # the first job does the work instead, failing the init phase would fail the function
+        LOG.warning('Unable to warm up: %s', e)
+        return None
+
+
+def warm_up(connect=False):
+    """Import the dependencies, create the clients and resolve their endpoints.
+
+    Keyword Arguments:
+        connect {bool} -- Whether to also open connections to the SAR endpoints (default: {False})
+
+    Returns:
+        dict -- The milliseconds spent in each step by step name, in 'steps', and in total, in 'durationMs'
+
+    """
+    start = time.monotonic()
+    steps = {}
+    _run_step(steps, 'ImportDependencies', _import_dependencies)
+    clients = _run_step(steps, 'CreateClients', _create_clients)
+    _run_step(steps, 'ResolveEndpoints', _resolve_endpoints, clients)
+    if connect:
+        _run_step(steps, 'OpenConnections', _open_connections, clients)
+    report = {'steps': steps, 'durationMs': round((time.monotonic() - start) * 1000, 3)}
+    LOG.info('Warmed up report=%s', report)
+    return report
+
+
+def _run_step(steps, name, function, *args):
+    start = time.monotonic()
+    try:
+        return function(*args)
+    finally:
+        steps[name] = round((time.monotonic() - start) * 1000, 3)
+
+
+def _import_dependencies():
+    for module in LAZY_MODULES:
+        module.load()
+    clientfactory.patch_xray()
+    # the YAML loader and dumper classes of the templates are created on first use
+    templateloader.dump({})
+
+
+def _create_clients():
+    # by service name and region
+    clients = {('codepipeline', None): clientfactory.get_codepipeline_client()}
+    clients[('s3', None)] = clientfactory.get_function_s3_client()
+    if any(store.startswith('dynamodb://') for store in (config.PUBLISH_DIGEST_STORE, config.IDEMPOTENCY_STORE)):
+        clients[('dynamodb', None)] = clientfactory.get_function_dynamodb_client()
+    for region in config.REGIONS or (None,):
+        # the client without timeout is used without deadline, e.g. by the worker
+        clientfactory.get_serverlessrepo_client(region)
+        # calls with a deadline use the client of the read timeout unless little time is left
+        clients[('serverlessrepo', region)] = clientfactory.get_serverlessrepo_client(
+            region, timeout=config.CLIENT_READ_TIMEOUT_SECONDS)
+    return clients
+
+
+def _resolve_endpoints(clients):
+    for client in clients.values():
+        host = urlparse(client.meta.endpoint_url).hostname
+        try:
+            socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+        except OSError as e:
+            LOG.warning('Unable to resolve %s: %s', host, e)
+
+
+def _open_connections(clients):
+    for (service_name, _), client in clients.items():
+        if service_name != 'serverlessrepo':
+            continue
+        try:
+            # the pooled connection is reused by the first call of the job
+            client.list_applications(MaxItems=1)
+        except callpolicy.botocore_exceptions.ClientError as e:
+            # an error response, e.g. AccessDenied without serverlessrepo:ListApplications, still opens the connection
+            LOG.debug('Opened a connection to %s: %s', client.meta.endpoint_url, e)
+        except Exception as e:
+            LOG.warning('Unable to open a connection to %s: %s', client.meta.endpoint_url, e)
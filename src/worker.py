@@ -0,0 +1,140 @@
+"""Worker publishing the jobs of a CodePipeline custom action, the long-running alternative to the Lambda function.
+
+The worker polls CodePipeline for the jobs of the custom action type set in config, acknowledges them and
+processes up to config.WORKER_CONCURRENCY of them concurrently with handler.publish(), so that the imports,
+clients, call policies and caches are set up once for all the jobs. Jobs have no deadline, and each job
+records and emits its metrics on its own, see metrics.run_isolated().
+
+Run it in a container or a CodeBuild project with AWS credentials allowed to call codepipeline:PollForJobs,
+codepipeline:AcknowledgeJob and the APIs used by the Lambda function, e.g. `python src/worker.py`. SIGTERM and
+SIGINT stop the polling, and the worker exits once the jobs in progress are done.
+"""
+
+# must be the first import, for the dependency search path as in the Lambda function. X-Ray patching is skipped
+# outside of Lambda, see clientfactory.patch_xray()
+import lambdainit  # noqa: F401
+import codepipelinehelper
+import config
+import handler
+import lambdalogging
+import metrics
+
+from concurrent import futures
+import logging
+import signal
+import threading
+
+LOG = lambdalogging.getLogger(__name__)
+
+# owner of the custom action types
+CUSTOM_ACTION_OWNER = 'Custom'
+
+
+class Worker(object):
+    """Poll for the jobs of a custom action and process them on a bounded pool of threads."""
+
+    def __init__(self, action_type_id, concurrency=None, poll_interval_seconds=None):
+        """Initialize the worker.
+
+        Arguments:
+            action_type_id {dict} -- The category, owner, provider and version of the custom action type
+
+        Keyword Arguments:
+            concurrency {int} -- The most jobs processed at once, config.WORKER_CONCURRENCY if None
+            (default: {None})
+            poll_interval_seconds {float} -- The time waited when no job was found,
+            config.WORKER_POLL_INTERVAL_SECONDS if None (default: {None})
+
+        """
+        self.action_type_id = action_type_id
+        self.concurrency = concurrency or config.WORKER_CONCURRENCY
+        self.poll_interval_seconds = config.WORKER_POLL_INTERVAL_SECONDS if poll_interval_seconds is None \
+            else poll_interval_seconds
+        self._stopping = threading.Event()
+
+    def run(self):
+        """Process jobs until stopped, then wait for the jobs in progress."""
+        LOG.info('Polling for jobs of %s, %s at a time', self.action_type_id, self.concurrency)
+        in_progress = set()
+        with futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not self._stopping.is_set():
+                in_progress = {future for future in in_progress if not future.done()}
+                if len(in_progress) >= self.concurrency:
+                    futures.wait(in_progress, timeout=self.poll_interval_seconds,
+                                 return_when=futures.FIRST_COMPLETED)
+                    continue
+
+                jobs = self._poll(self.concurrency - len(in_progress))
+                for job in jobs:
+                    if self._acknowledge(job):
+                        in_progress.add(executor.submit(metrics.run_isolated, process_job, job))
+                if not jobs:
+                    self._stopping.wait(self.poll_interval_seconds)
+            LOG.info('Stopping, waiting for %s jobs in progress', len(in_progress))
+        LOG.info('Stopped')
+
+    def stop(self):
+        """Stop polling for jobs, from any thread or a signal handler."""
+        self._stopping.set()
+
+    def _poll(self, max_batch_size):
+        try:
+            return codepipelinehelper.poll_for_jobs(self.action_type_id, max_batch_size)
+        except Exception as e:
+            # retried after the poll interval, the call policy has retried already
+            LOG.error('Unable to poll for jobs: %s', e)
+            return []
+
+    def _acknowledge(self, job):
+        try:
+            return codepipelinehelper.acknowledge_job(job['id'], job['nonce'])
+        except Exception as e:
+            # the job is polled again once CodePipeline gives up waiting for the acknowledgement
+            LOG.error('Unable to acknowledge job %s: %s', job['id'], e)
+            return False
+
+
+def process_job(job):
+    """Publish the applications of a job polled from CodePipeline, and put the job result.
+
+    Arguments:
+        job {dict} -- The job from PollForJobs, with the same id and data as a Lambda invocation event
+
+    """
+    LOG.info('Processing job %s', job['id'])
+    try:
+        handler.publish({'CodePipeline.job': job}, None)
+    except Exception as e:
+        # only a job without an id fails before its result is put, one more job must not stop the worker
+        LOG.error('Unable to process job %s: %s', job.get('id'), e)
+
+
+def get_action_type_id():
+    """Get the id of the custom action type of the worker from config.
+
+    Returns:
+        dict -- The category, owner, provider and version of the custom action type
+
+    """
+    if not config.WORKER_ACTION_PROVIDER:
+        raise RuntimeError('WORKER_ACTION_PROVIDER must be set to the provider of the custom action type.')
+    return {
+        'category': config.WORKER_ACTION_CATEGORY,
+        'owner': CUSTOM_ACTION_OWNER,
+        'provider': config.WORKER_ACTION_PROVIDER,
+        'version': config.WORKER_ACTION_VERSION
+    }
+
+
+def main():
+    """Run a worker until SIGTERM or SIGINT."""
+    # outside of Lambda, no handler is set up for the root logger
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    worker = Worker(get_action_type_id())
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda *args: worker.stop())
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Local stand-in for the CodePipeline job result APIs, and PollForJobs/AcknowledgeJob for custom actions."""
+import itertools
+import json
+
+import boto3
+from botocore.config import Config
+from fake_server import ERROR, THROTTLE, FakeServer, RequestHandler
+
+TARGET_PREFIX = 'CodePipeline_20150709.'
+
+
+class FakeCodePipeline(FakeServer):
+    """CodePipeline endpoint keeping the jobs and job results in memory.
+
+    Use as a context manager. Every request is recorded in `requests` as a dict with the operation, the
+    job id and the HTTP status sent back. Jobs of custom actions are queued with queue_job(), and a job
+    succeeding with a continuation token is queued again with it, as CodePipeline does.
+    """
+
+    def __init__(self, faults=None):
+        """Initialize the fake without jobs or job results.
+
+        Keyword Arguments:
+            faults {Faults} -- The faults injected in the responses, none if None (default: {None})
+
+        """
+        super(FakeCodePipeline, self).__init__(faults)
+        # (operation, request) of the results put for each job, by job id
+        self.results = {}
+        # (action type id, job) of the jobs waiting to be polled
+        self.queued_jobs = []
+        # (action type id, job) of the jobs polled, by job id
+        self.polled_jobs = {}
+        # job ids in acknowledgement order
+        self.acknowledged_job_ids = []
+        self._job_numbers = itertools.count(1)
+
+    def queue_job(self, action_type_id, data):
+        """Queue a job of a custom action.
+
+        Arguments:
+            action_type_id {dict} -- The category, owner, provider and version of the custom action type
+            data {dict} -- The job data, as in a Lambda invocation event
+
+        Returns:
+            str -- The job id
+
+        """
+        with self._lock:
+            return self._queue_job(action_type_id, data)
+
+    def last_result(self, job_id):
+        """Return the last (operation, request) put for a job, None if there is none."""
+        with self._lock:
+            results = self.results.get(job_id)
+            return results[-1] if results else None
+
+    def client(self):
+        """Return a boto3 CodePipeline client pointed at the fake."""
+        return boto3.client(
+            'codepipeline',
+            endpoint_url=self.endpoint_url,
+            region_name='us-east-1',
+            aws_access_key_id='fake-access-key-id',
+            aws_secret_access_key='fake-secret-access-key',
+            config=Config(retries={'max_attempts': 0})
+        )
+
+    def _queue_job(self, action_type_id, data):
+        job_number = next(self._job_numbers)
+        job = {'id': 'job-{}'.format(job_number), 'nonce': 'nonce-{}'.format(job_number),
+               'accountId': '123456789012', 'data': data}
+        self.queued_jobs.append((action_type_id, job))
+        return job['id']
+
+    def _handler_class(self):
+        return _handler_class(self)
+
+
+def _handler_class(fake):
+    class Handler(RequestHandler):
+        def do_POST(self):
+            operation = self.headers.get('X-Amz-Target', '')[len(TARGET_PREFIX):]
+            request = json.loads(self.read_body() or b'{}')
+            recorded = {'operation': operation, 'job_id': request.get('jobId'), 'status': None}
+            fake._record(recorded)
+
+            fault = fake.faults.inject()
+            if fault == THROTTLE:
+                status, body = 400, {'__type': 'ThrottlingException', 'message': 'Rate exceeded'}
+            elif fault == ERROR:
+                status, body = 500, {'__type': 'InternalFailure', 'message': 'Internal failure'}
+            elif operation in ('PutJobSuccessResult', 'PutJobFailureResult') and request.get('jobId'):
+                with fake._lock:
+                    status, body = self._put_result(operation, request)
+            elif operation == 'PollForJobs' and request.get('actionTypeId'):
+                with fake._lock:
+                    status, body = self._poll_for_jobs(request)
+            elif operation == 'AcknowledgeJob' and request.get('jobId'):
+                with fake._lock:
+                    status, body = self._acknowledge_job(request)
+            else:
+                status, body = 400, {'__type': 'ValidationException', 'message': 'Invalid request'}
+            recorded['status'] = status
+            self.send(status, json.dumps(body).encode(), {'Content-Type': 'application/x-amz-json-1.1'})
+
+        def _put_result(self, operation, request):
+            fake.results.setdefault(request['jobId'], []).append((operation, request))
+            polled_job = fake.polled_jobs.get(request['jobId'])
+            if polled_job and request.get('continuationToken'):
+                action_type_id, job = polled_job
+                fake._queue_job(action_type_id, dict(job['data'], continuationToken=request['continuationToken']))
+            return 200, {}
+
+        def _poll_for_jobs(self, request):
+            jobs = [(action_type_id, job) for action_type_id, job in fake.queued_jobs
+                    if action_type_id == request['actionTypeId']][:request.get('maxBatchSize', 1)]
+            for action_type_id, job in jobs:
+                fake.queued_jobs.remove((action_type_id, job))
+                fake.polled_jobs[job['id']] = (action_type_id, job)
+            return 200, {'jobs': [job for _, job in jobs]}
+
+        def _acknowledge_job(self, request):
+            polled_job = fake.polled_jobs.get(request['jobId'])
+            if polled_job is None or polled_job[1]['nonce'] != request.get('nonce'):
+                return 400, {'__type': 'InvalidNonceException', 'message': 'Invalid nonce'}
+            fake.acknowledged_job_ids.append(request['jobId'])
+            return 200, {'status': 'InProgress'}
+
+    return Handler
@@ -0,0 +1,97 @@
+"""Local stand-in for the DynamoDB GetItem/PutItem API, with the condition expressions used by kvstore."""
+import json
+
+import boto3
+from botocore.config import Config
+
+from fake_server import ERROR, THROTTLE, FakeServer, RequestHandler
+
+TARGET_PREFIX = 'DynamoDB_20120810.'
+ERROR_PREFIX = 'com.amazonaws.dynamodb.v20120810#'
+
+
+class FakeDynamoDB(FakeServer):
+    """DynamoDB endpoint keeping the items of its tables in memory.
+
+    Use as a context manager. Every request is recorded in `requests` as a dict with the operation, the table
+    and the HTTP status sent back. Only the attribute_not_exists(#name) and #name = :value conditions are supported.
+    """
+
+    def __init__(self, faults=None):
+        """Initialize the fake without items.
+
+        Keyword Arguments:
+            faults {Faults} -- The faults injected in the responses, none if None (default: {None})
+
+        """
+        super(FakeDynamoDB, self).__init__(faults)
+        # items by (table name, partition key value)
+        self.items = {}
+
+    def client(self):
+        """Return a boto3 DynamoDB client pointed at the fake."""
+        return boto3.client(
+            'dynamodb',
+            endpoint_url=self.endpoint_url,
+            region_name='us-east-1',
+            aws_access_key_id='fake-access-key-id',
+            aws_secret_access_key='fake-secret-access-key',
+            config=Config(retries={'max_attempts': 0})
+        )
+
+    def _handler_class(self):
+        return _handler_class(self)
+
+
+def _handler_class(fake):
+    class Handler(RequestHandler):
+        def do_POST(self):
+            operation = self.headers.get('X-Amz-Target', '')[len(TARGET_PREFIX):]
+            request = json.loads(self.read_body() or b'{}')
+            recorded = {'operation': operation, 'table': request.get('TableName'), 'status': None}
+            fake._record(recorded)
+
+            fault = fake.faults.inject()
+            if fault == THROTTLE:
+                status, body = 400, _error('ProvisionedThroughputExceededException', 'Rate exceeded')
+            elif fault == ERROR:
+                status, body = 500, _error('InternalServerError', 'Internal server error')
+            elif operation == 'GetItem':
+                with fake._lock:
+                    item = fake.items.get(_item_key(request, request['Key']))
+                status, body = 200, {'Item': item} if item else {}
+            elif operation == 'PutItem':
+                with fake._lock:
+                    status, body = self._put_item(request)
+            else:
+                status, body = 400, _error('ValidationException', 'Unsupported operation')
+            recorded['status'] = status
+            self.send(status, json.dumps(body).encode(), {'Content-Type': 'application/x-amz-json-1.0'})
+
+        def _put_item(self, request):
+            item_key = _item_key(request, request['Item'])
+            condition = request.get('ConditionExpression')
+            if condition and not _evaluate(condition, fake.items.get(item_key), request):
+                return 400, _error('ConditionalCheckFailedException', 'The conditional request failed')
+            fake.items[item_key] = request['Item']
+            return 200, {}
+
+    return Handler
+
+
+def _item_key(request, item):
+    # the fake tables have the partition key of kvstore.DynamoDBStore
+    return request['TableName'], item['key']['S']
+
+
+def _evaluate(condition, item, request):
+    names = request.get('ExpressionAttributeNames', {})
+    values = request.get('ExpressionAttributeValues', {})
+    if condition.startswith('attribute_not_exists(') and condition.endswith(')'):
+        return item is None or names[condition[len('attribute_not_exists('):-1]] not in item
+    name, _, value = (part.strip() for part in condition.partition('='))
+    return item is not None and item.get(names[name]) == values[value]
+
+
+def _error(code, message):
+    return {'__type': ERROR_PREFIX + code, 'message': message}
@@ -0,0 +1,161 @@
+"""Local stand-in for the S3 GetObject/HeadObject/PutObject/ListObjectsV2 API, honoring Range and If-* headers."""
+import hashlib
+import re
+from urllib.parse import parse_qs, unquote
+from xml.sax.saxutils import escape
+
+import boto3
+from botocore.config import Config
+
+from fake_server import ERROR, THROTTLE, FakeServer, RequestHandler
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FakeS3(FakeServer):
+    """S3 endpoint serving in-memory objects over HTTP on localhost.
+
+    Use as a context manager. Every request is recorded in `requests` as a dict with the method,
+    bucket, key, requested range and the number of body bytes sent back.
+    """
+
+    def __init__(self, honor_ranges=True, faults=None):
+        """Initialize the fake.
+
+        Keyword Arguments:
+            honor_ranges {bool} -- When False, Range headers are ignored like some S3-compatible servers do
+            faults {Faults} -- The faults injected in the responses, none if None (default: {None})
+
+        """
+        super(FakeS3, self).__init__(faults)
+        self.honor_ranges = honor_ranges
+        self.objects = {}
+        self._etags = {}
+
+    def put_object(self, bucket, key, data):
+        """Store an object."""
+        self.objects[(bucket, key)] = data
+        # computed once, hashing large objects on every request would dominate the timings of benchmarks
+        self._etags[(bucket, key)] = '"{}"'.format(hashlib.md5(data).hexdigest())
+
+    @property
+    def bytes_sent(self):
+        """Return the total number of body bytes sent."""
+        return sum(request['bytes_sent'] for request in self.requests)
+
+    def client(self):
+        """Return a boto3 S3 client pointed at the fake."""
+        return boto3.client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            region_name='us-east-1',
+            aws_access_key_id='fake-access-key-id',
+            aws_secret_access_key='fake-secret-access-key',
+            aws_session_token='fake-session-token',
+            config=Config(s3={'addressing_style': 'path'}, retries={'max_attempts': 0})
+        )
+
+    def _handler_class(self):
+        return _handler_class(self)
+
+
+def _handler_class(fake):
+    class Handler(RequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition('?')
+            if '/' not in path.strip('/') and 'list-type=2' in query:
+                return self._list_objects(unquote(path.strip('/')), parse_qs(query))
+            self._serve(send_body=True)
+
+        def do_HEAD(self):
+            self._serve(send_body=False)
+
+        def do_PUT(self):
+            bucket, _, key = unquote(self.path.split('?', 1)[0]).lstrip('/').partition('/')
+            fake._record({'method': 'PUT', 'bucket': bucket, 'key': key, 'range': None, 'bytes_sent': 0})
+            data = self.read_body()
+            if self._inject_fault():
+                return
+            with fake._lock:
+                etag = fake._etags.get((bucket, key))
+                if self.headers.get('If-None-Match') == '*' and etag is not None:
+                    return self._send_error(412, 'PreconditionFailed')
+                if self.headers.get('If-Match') is not None and self.headers.get('If-Match') != etag:
+                    return self._send_error(412, 'PreconditionFailed')
+                fake.put_object(bucket, key, data)
+                etag = fake._etags[(bucket, key)]
+            self.send(200, headers={'ETag': etag})
+
+        def _serve(self, send_body):
+            bucket, _, key = unquote(self.path.split('?', 1)[0]).lstrip('/').partition('/')
+            range_header = self.headers.get('Range')
+            request = {'method': self.command, 'bucket': bucket, 'key': key, 'range': range_header, 'bytes_sent': 0}
+            fake._record(request)
+            if self._inject_fault():
+                return
+
+            data = fake.objects.get((bucket, key))
+            if data is None:
+                return self._send_error(404, 'NoSuchKey')
+
+            etag = fake._etags[(bucket, key)]
+            if self.headers.get('If-Match') not in (None, etag):
+                return self._send_error(412, 'PreconditionFailed')
+            if self.headers.get('If-None-Match') == etag:
+                return self.send(304, headers={'ETag': etag})
+
+            status, body, headers = 200, data, {'ETag': etag, 'Accept-Ranges': 'bytes'}
+            if range_header and fake.honor_ranges:
+                first, last = _parse_range(range_header, len(data))
+                if first is None:
+                    return self._send_error(416, 'InvalidRange')
+                status, body = 206, data[first:last + 1]
+                headers['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, len(data))
+
+            if send_body:
+                # recorded first, the client can be done reading before write() returns
+                request['bytes_sent'] = len(body)
+            self.send(status, body, headers)
+
+        def _list_objects(self, bucket, query):
+            fake._record({'method': 'LIST', 'bucket': bucket, 'key': None, 'range': None, 'bytes_sent': 0})
+            if self._inject_fault():
+                return
+            prefix = query.get('prefix', [''])[0]
+            # all the keys in a single page
+            contents = ''.join(
+                '<Contents><Key>{}</Key><Size>{}</Size><ETag>{}</ETag></Contents>'.format(
+                    escape(key), len(data), escape(fake._etags[(object_bucket, key)]))
+                for (object_bucket, key), data in sorted(fake.objects.items())
+                if object_bucket == bucket and key.startswith(prefix))
+            body = '<ListBucketResult><Name>{}</Name><Prefix>{}</Prefix><IsTruncated>false</IsTruncated>{}' \
+                '</ListBucketResult>'.format(escape(bucket), escape(prefix), contents)
+            self.send(200, body.encode(), {'Content-Type': 'application/xml'})
+
+        def _inject_fault(self):
+            fault = fake.faults.inject()
+            if fault == THROTTLE:
+                self._send_error(503, 'SlowDown')
+            elif fault == ERROR:
+                self._send_error(500, 'InternalError')
+            return fault
+
+        def _send_error(self, status, code):
+            body = '<Error><Code>{}</Code><Message>{}</Message></Error>'.format(code, code).encode()
+            self.send(status, body, {'Content-Type': 'application/xml'})
+
+    return Handler
+
+
+def _parse_range(range_header, size):
+    match = RANGE_PATTERN.match(range_header)
+    if not match or not any(match.groups()) or size == 0:
+        return None, None
+
+    first, last = match.groups()
+    if not first:
+        # suffix range: the last N bytes
+        return max(size - int(last), 0), size - 1
+    if int(first) >= size:
+        return None, None
+    return int(first), min(int(last), size - 1) if last else size - 1
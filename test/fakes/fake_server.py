@@ -0,0 +1,150 @@
+"""Base of the local stand-ins for AWS APIs, with latency, throttling and error injection."""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+THROTTLE = 'throttle'
+ERROR = 'error'
+
+
+class Faults(object):
+    """Faults injected in the responses of a fake.
+
+    Throttling happens at random with throttle_rate, and for the requests above max_requests_per_second in
+    each second. Injected faults are counted in `throttles` and `errors`.
+    """
+
+    def __init__(self, latency_seconds=0, jitter_seconds=0, throttle_rate=0, error_rate=0,
+                 max_requests_per_second=None, seed=None):
+        """Initialize the faults, none by default.
+
+        Keyword Arguments:
+            latency_seconds {float} -- Time spent before each response (default: {0})
+            jitter_seconds {float} -- Random time added to latency_seconds, up to this much (default: {0})
+            throttle_rate {float} -- Share of the requests throttled at random (default: {0})
+            error_rate {float} -- Share of the requests failing with an internal error (default: {0})
+            max_requests_per_second {int} -- Requests served each second before throttling, no limit if None
+            (default: {None})
+            seed {int} -- Seed of the random faults, for reproducible runs (default: {None})
+
+        """
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.max_requests_per_second = max_requests_per_second
+        self.throttles = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._window = None
+        self._window_requests = 0
+        self._lock = threading.Lock()
+
+    def inject(self):
+        """Wait for the latency of a request, and draw its fault.
+
+        Returns:
+            str -- THROTTLE, ERROR or None when the request is served
+
+        """
+        with self._lock:
+            delay = self.latency_seconds + self._random.uniform(0, self.jitter_seconds)
+            draw = self._random.random()
+        time.sleep(delay)
+
+        with self._lock:
+            window = int(time.monotonic())
+            if window != self._window:
+                self._window, self._window_requests = window, 0
+            self._window_requests += 1
+            rate_limited = self.max_requests_per_second is not None and \
+                self._window_requests > self.max_requests_per_second
+            if rate_limited or draw < self.throttle_rate:
+                self.throttles += 1
+                return THROTTLE
+            if draw < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return ERROR
+        return None
+
+
+class FakeServer(object):
+    """HTTP server on localhost, started and stopped as a context manager.
+
+    Every request is recorded in `requests` as a dict, see the subclasses.
+    """
+
+    def __init__(self, faults=None):
+        """Initialize the fake.
+
+        Keyword Arguments:
+            faults {Faults} -- The faults injected in the responses, none if None (default: {None})
+
+        """
+        self.faults = faults or Faults()
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        """Return the URL of the endpoint."""
+        host, port = self._server.server_address
+        return 'http://{}:{}'.format(host, port)
+
+    def __enter__(self):
+        """Start serving on a free port."""
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.01,), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _handler_class(self):
+        raise NotImplementedError()
+
+    def _record(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Request handler of the fakes, speaking HTTP/1.1 quietly."""
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, Nagle's algorithm would delay the body by a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        """Don't log requests."""
+
+    def read_body(self):
+        """Return the body of the request."""
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def send(self, status, body=b'', headers=None):
+        """Send a response.
+
+        Arguments:
+            status {int} -- The HTTP status
+
+        Keyword Arguments:
+            body {bytes} -- The body, not sent for HEAD requests (default: {b''})
+            headers {dict} -- Other headers (default: {None})
+
+        """
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
@@ -0,0 +1,129 @@
+"""Local stand-in for the AWS Serverless Application Repository API used to publish applications."""
+import json
+import re
+from urllib.parse import unquote
+
+import boto3
+from botocore.config import Config
+
+from fake_server import ERROR, THROTTLE, FakeServer, RequestHandler
+
+APPLICATION_ID_FORMAT = 'arn:aws:serverlessrepo:us-east-1:123456789012:applications/{}'
+APPLICATION_PATTERN = re.compile(r'^/applications/(?P<application_id>[^/]+)$')
+VERSION_PATTERN = re.compile(r'^/applications/(?P<application_id>[^/]+)/versions/(?P<semantic_version>[^/]+)$')
+
+
+class FakeServerlessRepo(FakeServer):
+    """Serverless Application Repository endpoint keeping applications in memory.
+
+    Use as a context manager. Every request is recorded in `requests` as a dict with the operation, the
+    application name and the HTTP status sent back.
+    """
+
+    def __init__(self, faults=None):
+        """Initialize the fake without applications.
+
+        Keyword Arguments:
+            faults {Faults} -- The faults injected in the responses, none if None (default: {None})
+
+        """
+        super(FakeServerlessRepo, self).__init__(faults)
+        # semantic versions of each application in creation order, by application id
+        self.applications = {}
+
+    def client(self, region_name='us-east-1'):
+        """Return a boto3 Serverless Application Repository client pointed at the fake."""
+        return boto3.client(
+            'serverlessrepo',
+            endpoint_url=self.endpoint_url,
+            region_name=region_name,
+            aws_access_key_id='fake-access-key-id',
+            aws_secret_access_key='fake-secret-access-key',
+            config=Config(retries={'max_attempts': 0})
+        )
+
+    def _handler_class(self):
+        return _handler_class(self)
+
+
+def _handler_class(fake):
+    class Handler(RequestHandler):
+        def do_POST(self):
+            request = json.loads(self.read_body() or b'{}')
+            self._serve('CreateApplication', request.get('name'), self._create_application, request)
+
+        def do_GET(self):
+            match = APPLICATION_PATTERN.match(self.path.split('?')[0])
+            application_id = match and unquote(match.group('application_id'))
+            self._serve('GetApplication', application_id, self._get_application, application_id)
+
+        def do_PATCH(self):
+            self.read_body()
+            # the application id is an ARN, URL encoded in the path
+            match = APPLICATION_PATTERN.match(self.path)
+            application_id = match and unquote(match.group('application_id'))
+            self._serve('UpdateApplication', application_id, self._update_application, application_id)
+
+        def do_PUT(self):
+            self.read_body()
+            match = VERSION_PATTERN.match(self.path)
+            version = match and {name: unquote(value) for name, value in match.groupdict().items()}
+            self._serve('CreateApplicationVersion', version and version['application_id'],
+                        self._create_application_version, version)
+
+        def _serve(self, operation, application, function, argument):
+            request = {'operation': operation, 'application': application, 'status': None}
+            fake._record(request)
+            fault = fake.faults.inject()
+            if fault == THROTTLE:
+                status, body = 429, _error('TooManyRequestsException', 'Rate exceeded')
+            elif fault == ERROR:
+                status, body = 500, _error('InternalServerErrorException', 'Internal server error')
+            elif application is None:
+                status, body = 400, _error('BadRequestException', 'Invalid request')
+            else:
+                with fake._lock:
+                    status, body = function(argument)
+            request['status'] = status
+            headers = {'Content-Type': 'application/json'}
+            if status >= 400:
+                headers['x-amzn-ErrorType'] = body['__type']
+            self.send(status, json.dumps(body).encode(), headers)
+
+        def _create_application(self, request):
+            application_id = APPLICATION_ID_FORMAT.format(request['name'])
+            if application_id in fake.applications:
+                return 409, _error('ConflictException', 'Application with id {} already exists'.format(application_id))
+            fake.applications[application_id] = []
+            if request.get('semanticVersion'):
+                fake.applications[application_id].append(request['semanticVersion'])
+            return 201, {'applicationId': application_id, 'name': request['name']}
+
+        def _get_application(self, application_id):
+            if application_id not in fake.applications:
+                return 404, _error('NotFoundException', 'Application {} not found'.format(application_id))
+            versions = fake.applications[application_id]
+            response = {'applicationId': application_id}
+            if versions:
+                response['version'] = {'applicationId': application_id, 'semanticVersion': versions[-1]}
+            return 200, response
+
+        def _update_application(self, application_id):
+            if application_id not in fake.applications:
+                return 404, _error('NotFoundException', 'Application {} not found'.format(application_id))
+            return 200, {'applicationId': application_id}
+
+        def _create_application_version(self, version):
+            versions = fake.applications.get(version['application_id'])
+            if versions is None:
+                return 404, _error('NotFoundException', 'Application {} not found'.format(version['application_id']))
+            if version['semantic_version'] in versions:
+                return 409, _error('ConflictException', 'Version {} already exists'.format(version['semantic_version']))
+            versions.append(version['semantic_version'])
+            return 201, {'applicationId': version['application_id'], 'semanticVersion': version['semantic_version']}
+
+    return Handler
+
+
+def _error(code, message):
+    return {'__type': code, 'message': message}
@@ -0,0 +1,371 @@
+"""Benchmark the publish hot path offline, and check the results against regression budgets.
+
+Artifacts are served by the local fake S3 in test/fakes, and the serverlessrepo and CodePipeline clients are
+botocore Stubbers, so no AWS account is needed. Measured:
+
+- get_input_artifact latency and bytes fetched, for artifacts of several sizes and member counts, with and without
+  ranged fetches, and from the artifact cache of a warm container
+- _unzip_as_string latency and throughput, in MiB of template decompressed per second, on in-memory artifacts
+- templateloader.load latency on YAML and JSON templates of several sizes, and its speedup over
+  serverlessrepo.parser.parse_template
+- handler.publish end-to-end latency and peak traced memory
+- import time and peak RSS of a cold start, in a fresh interpreter
+
+The artifact cache is kept in a temporary directory, and disabled except for the cached variant of
+get_input_artifact, so that every other run fetches and unzips the artifact.
+
+Each result is a flat metric name, e.g. get_input_artifact.16MiB-1000.ranged.median_ms, written as JSON to the
+output file. The budgets file maps metric names or glob patterns to {"max": value} or {"min": value}, and the
+script exits with status 1 when a budget is exceeded.
+
+Usage: python test/perf/bench.py [--output bench-results.json] [--budgets test/perf/budgets.json] [--repeat 5]
+"""
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from unittest import mock
+
+PERF_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(PERF_DIR, '..', '..', 'src')
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(PERF_DIR, '..', 'fakes'))
+sys.path.insert(0, PERF_DIR)
+
+# cold starts are measured with the environment as it is, X-Ray patching included
+COLD_START_ENV = dict(os.environ)
+# there is no X-Ray segment to add subsegments to outside of Lambda
+os.environ.setdefault('XRAY_PATCH_MODULES', '')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'fake-access-key-id')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'fake-secret-access-key')
+
+import boto3  # noqa: E402
+from botocore.stub import Stubber  # noqa: E402
+
+import applicationprefetch  # noqa: E402
+import applicationstate  # noqa: E402
+import artifactcache  # noqa: E402
+import clientfactory  # noqa: E402
+from codepipelinejob import CodePipelineJob  # noqa: E402
+import config  # noqa: E402
+import handler  # noqa: E402
+import importtime  # noqa: E402
+import s3helper  # noqa: E402
+import templateloader  # noqa: E402
+from fake_s3 import FakeS3  # noqa: E402
+from serverlessrepo import parser as sarparser  # noqa: E402
+
+MIB = 1024 * 1024
+DEFAULT_BUDGETS = os.path.join(PERF_DIR, 'budgets.json')
+
+ARTIFACT_BUCKET = 'bench-artifact-bucket'
+TEMPLATE_NAME = 'packaged.yml'
+APPLICATION_ID = 'arn:aws:serverlessrepo:us-east-1:123456789012:applications/bench-app'
+
+# (total size of the other members in MiB, number of other members) of the benchmarked artifacts
+ARTIFACT_LAYOUTS = ((1, 10), (16, 10), (16, 1000), (64, 100))
+# number of functions in the templates of the loading benchmark
+TEMPLATE_FUNCTION_COUNTS = (50, 2000)
+
+TEMPLATE = '''AWSTemplateFormatVersion: '2010-09-09'
+Transform: AWS::Serverless-2016-10-31
+Metadata:
+  AWS::ServerlessRepo::Application:
+    Name: bench-app
+    Description: Application published by the benchmark
+    Author: bench
+    SemanticVersion: 1.0.0
+Resources:
+{}'''
+
+FUNCTION = '''  Function{}:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: s3://bench-bucket/code-{}.zip
+      Handler: index.handler
+      Runtime: python3.7
+      Role: !GetAtt Role{}.Arn
+      Environment:
+        Variables:
+          TABLE: !Ref Table{}
+'''
+
+
+def generate_template(function_count):
+    """Generate a packaged YAML template with application metadata and some functions."""
+    return TEMPLATE.format(''.join(FUNCTION.format(*[i] * 4) for i in range(function_count)))
+
+
+def generate_artifact(size_mib, member_count, function_count=50):
+    """Generate a zipped artifact with a packaged template and incompressible members.
+
+    Arguments:
+        size_mib {int} -- The total size of the other members in MiB
+        member_count {int} -- The number of other members
+
+    Keyword Arguments:
+        function_count {int} -- The number of functions in the template (default: {50})
+
+    Returns:
+        bytes -- The zipped artifact, with the template in the middle
+
+    """
+    template = generate_template(function_count)
+    member_bytes = size_mib * MIB // member_count
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for i in range(member_count):
+            if i == member_count // 2:
+                z.writestr(TEMPLATE_NAME, template)
+            z.writestr('code/file-{}.bin'.format(i), os.urandom(member_bytes))
+    return buffer.getvalue()
+
+
+def generate_event(artifact_key):
+    """Generate a CodePipeline job event with a single input artifact.
+
+    Arguments:
+        artifact_key {str} -- The key of the artifact in ARTIFACT_BUCKET
+
+    Returns:
+        dict -- The event
+
+    """
+    return {
+        'CodePipeline.job': {
+            'id': 'bench-job-id',
+            'accountId': '123456789012',
+            'data': {
+                'actionConfiguration': {
+                    'configuration': {
+                        'FunctionName': 'bench',
+                        'UserParameters': json.dumps({'TemplatePath': TEMPLATE_NAME})
+                    }
+                },
+                'inputArtifacts': [{
+                    'name': 'BuildArtifact',
+                    'revision': None,
+                    'location': {'type': 'S3', 's3Location': {'bucketName': ARTIFACT_BUCKET, 'objectKey': artifact_key}}
+                }],
+                'outputArtifacts': [],
+                'artifactCredentials': {
+                    'accessKeyId': 'fake-access-key-id',
+                    'secretAccessKey': 'fake-secret-access-key',
+                    'sessionToken': 'fake-session-token'
+                }
+            }
+        }
+    }
+
+
+def timed(function, repeat):
+    """Run a function several times and time each run.
+
+    Arguments:
+        function {callable} -- The function, called without arguments
+        repeat {int} -- The number of runs, after one warm-up run
+
+    Returns:
+        dict -- min_ms and median_ms of the runs
+
+    """
+    function()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {'min_ms': min(durations), 'median_ms': statistics.median(durations)}
+
+
+@contextlib.contextmanager
+def artifact_cache(cache_dir, enabled):
+    """Point the artifact cache at a directory, and enable it or not."""
+    cache_bytes = 64 * MIB if enabled else 0
+    with mock.patch.object(config, 'ARTIFACT_CACHE_DIR', cache_dir), \
+            mock.patch.object(config, 'ARTIFACT_CACHE_MEMORY_BYTES', cache_bytes), \
+            mock.patch.object(config, 'ARTIFACT_CACHE_DISK_BYTES', cache_bytes):
+        artifactcache.clear_cache()
+        yield
+        artifactcache.clear_cache()
+
+
+def bench_get_input_artifact(fake_s3, artifacts, repeat, cache_dir):
+    """Benchmark s3helper.get_input_artifact on each artifact, with and without ranged fetches or the cache."""
+    results = {}
+    for name, artifact in artifacts.items():
+        job = CodePipelineJob.from_event(generate_event(name))
+        for variant in ('ranged', 'full', 'cached'):
+            with mock.patch.object(config, 'RANGED_ARTIFACT_FETCH', variant != 'full'), \
+                    artifact_cache(cache_dir, variant == 'cached'):
+                prefix = 'get_input_artifact.{}.{}'.format(name, variant)
+                for metric, value in timed(lambda: s3helper.get_input_artifact(job), repeat).items():
+                    results['{}.{}'.format(prefix, metric)] = value
+                sent_before = fake_s3.bytes_sent
+                s3helper.get_input_artifact(job)
+                results[prefix + '.fetched_bytes'] = fake_s3.bytes_sent - sent_before
+    return results
+
+
+def bench_unzip(artifacts, repeat):
+    """Benchmark s3helper._unzip_as_string on each artifact held in memory."""
+    results = {}
+    for name, artifact in artifacts.items():
+        timings = timed(lambda: s3helper._unzip_as_string(io.BytesIO(artifact), TEMPLATE_NAME), repeat)
+        # only the template member is decompressed, not the whole artifact
+        with zipfile.ZipFile(io.BytesIO(artifact)) as z:
+            template_bytes = z.getinfo(TEMPLATE_NAME).file_size
+        results['unzip.{}.median_ms'.format(name)] = timings['median_ms']
+        results['unzip.{}.mib_per_second'.format(name)] = template_bytes / MIB / (timings['median_ms'] / 1000)
+    return results
+
+
+def bench_template_load(repeat):
+    """Benchmark templateloader.load on YAML and JSON templates, and serverlessrepo's parser as a baseline."""
+    results = {}
+    for function_count in TEMPLATE_FUNCTION_COUNTS:
+        yaml_template = generate_template(function_count)
+        templates = {'yaml': yaml_template, 'json': json.dumps(sarparser.parse_template(yaml_template))}
+        for template_format, template in templates.items():
+            prefix = 'template_load.{}-functions.{}'.format(function_count, template_format)
+            median_ms = timed(lambda: templateloader.load(template), repeat)['median_ms']
+            baseline_median_ms = timed(lambda: sarparser.parse_template(template), repeat)['median_ms']
+            results[prefix + '.median_ms'] = median_ms
+            results[prefix + '.baseline_median_ms'] = baseline_median_ms
+            results[prefix + '.speedup'] = baseline_median_ms / median_ms
+    return results
+
+
+def bench_publish(artifacts, repeat):
+    """Benchmark handler.publish end to end, against stubbed serverlessrepo and CodePipeline clients."""
+    sar_client = boto3.client('serverlessrepo', region_name='us-east-1')
+    codepipeline_client = boto3.client('codepipeline', region_name='us-east-1')
+    results = {}
+    with Stubber(sar_client) as sar_stubber, Stubber(codepipeline_client) as codepipeline_stubber, \
+            mock.patch.object(clientfactory, 'get_serverlessrepo_client', return_value=sar_client), \
+            mock.patch.object(clientfactory, 'get_codepipeline_client', return_value=codepipeline_client), \
+            contextlib.redirect_stdout(io.StringIO()):
+
+        def publish(event):
+            # otherwise the application is known to exist after the first run, and CreateApplication is skipped
+            applicationstate.clear_cache()
+            applicationprefetch.clear_cache()
+            sar_stubber.add_response('create_application', {'ApplicationId': APPLICATION_ID})
+            codepipeline_stubber.add_response('put_job_success_result', {})
+            handler.publish(event, None)
+            sar_stubber.assert_no_pending_responses()
+
+        for name in artifacts:
+            event = generate_event(name)
+            for metric, value in timed(lambda: publish(event), repeat).items():
+                results['publish.{}.{}'.format(name, metric)] = value
+
+            tracemalloc.start()
+            publish(event)
+            results['publish.{}.peak_traced_bytes'.format(name)] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return results
+
+
+def bench_cold_start(repeat):
+    """Benchmark importing the handler and its peak RSS in fresh interpreters."""
+    import_times_ms = []
+    for _ in range(repeat):
+        modules = importtime.measure('handler', env=COLD_START_ENV)
+        import_times_ms.append(sum(m['cumulative_us'] for m in modules if m['depth'] == 0) / 1000)
+
+    # kilobytes on Linux
+    completed = subprocess.run(
+        [sys.executable, '-c', 'import resource, handler; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'],
+        cwd=SRC_DIR,
+        env=COLD_START_ENV,
+        stdout=subprocess.PIPE,
+        check=True
+    )
+    return {
+        'cold_start.import.median_ms': statistics.median(import_times_ms),
+        'cold_start.peak_rss_bytes': int(completed.stdout) * 1024
+    }
+
+
+def check_budgets(results, budgets):
+    """Check the results against the budgets.
+
+    Arguments:
+        results {dict} -- Value of each metric
+        budgets {dict} -- {"max": value} or {"min": value} by metric name or glob pattern
+
+    Returns:
+        list -- A message for each exceeded budget
+
+    """
+    violations = []
+    for pattern, budget in budgets.items():
+        metrics = [name for name in results if fnmatch.fnmatchcase(name, pattern)]
+        if not metrics:
+            violations.append('{}: no metric matches the budget'.format(pattern))
+        for name in metrics:
+            if 'max' in budget and results[name] > budget['max']:
+                violations.append('{}: {:.1f} is above the budget of {}'.format(name, results[name], budget['max']))
+            if 'min' in budget and results[name] < budget['min']:
+                violations.append('{}: {:.1f} is below the budget of {}'.format(name, results[name], budget['min']))
+    return violations
+
+
+def main():
+    """Run the benchmarks, write the results and check the budgets."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='bench-results.json', help='results file, default: bench-results.json')
+    parser.add_argument('--budgets', default=DEFAULT_BUDGETS, help='budgets file, empty to skip the check')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of each benchmark, default: 5')
+    args = parser.parse_args()
+
+    artifacts = {'{}MiB-{}'.format(size_mib, member_count): generate_artifact(size_mib, member_count)
+                 for size_mib, member_count in ARTIFACT_LAYOUTS}
+
+    results = {}
+    # not the artifact cache of the host, whose entries would be hits of the next run
+    with FakeS3() as fake_s3, mock.patch.object(clientfactory, 'get_s3_client', return_value=fake_s3.client()), \
+            tempfile.TemporaryDirectory() as cache_dir, artifact_cache(cache_dir, False):
+        for name, artifact in artifacts.items():
+            fake_s3.put_object(ARTIFACT_BUCKET, name, artifact)
+        results.update(bench_get_input_artifact(fake_s3, artifacts, args.repeat, cache_dir))
+        results.update(bench_unzip(artifacts, args.repeat))
+        results.update(bench_template_load(args.repeat))
+        results.update(bench_publish(artifacts, args.repeat))
+    results.update(bench_cold_start(args.repeat))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'timestamp': int(time.time()),
+            'repeat': args.repeat,
+            'results': results
+        }, f, indent=2, sort_keys=True)
+
+    for name, value in sorted(results.items()):
+        print('{:<60} {:>14.1f}'.format(name, value))
+    print('Results written to {}'.format(args.output))
+
+    if args.budgets:
+        with open(args.budgets) as f:
+            violations = check_budgets(results, json.load(f))
+        for violation in violations:
+            print('Budget exceeded: ' + violation)
+        if violations:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
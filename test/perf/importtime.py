@@ -0,0 +1,89 @@
+"""Report what importing the Lambda function handler costs, module by module.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter from the src directory and prints the
+modules with the highest cumulative import time.
+
+Usage: python test/perf/importtime.py [--module handler] [--top 25] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src')
+IMPORT_TIME_PREFIX = 'import time:'
+
+
+def measure(module='handler', env=None):
+    """Import a module in a fresh interpreter and collect the import time of every module.
+
+    Arguments:
+        module {str} -- The module to import (default: {'handler'})
+        env {dict} -- Environment variables of the interpreter, os.environ if None (default: {None})
+
+    Returns:
+        list -- dict with name, depth, self_us and cumulative_us of each imported module, in import order
+
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        cwd=SRC_DIR,
+        env=env,
+        stderr=subprocess.PIPE,
+        check=True
+    )
+    return parse(completed.stderr.decode())
+
+
+def parse(importtime_output):
+    """Parse the output of -X importtime.
+
+    Arguments:
+        importtime_output {str} -- The stderr of the interpreter
+
+    Returns:
+        list -- dict with name, depth, self_us and cumulative_us of each imported module, in import order
+
+    """
+    modules = []
+    for line in importtime_output.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        self_us, cumulative_us, name = line[len(IMPORT_TIME_PREFIX):].split('|')
+        if not self_us.strip().isdigit():
+            # header line
+            continue
+        modules.append({
+            'name': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us)
+        })
+    return modules
+
+
+def main():
+    """Print the import time report."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='handler', help='module to import, default: handler')
+    parser.add_argument('--top', type=int, default=25, help='number of modules to report, default: 25')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    modules = measure(args.module)
+    total_us = sum(m['cumulative_us'] for m in modules if m['depth'] == 0)
+    top_modules = sorted(modules, key=lambda m: m['cumulative_us'], reverse=True)[:args.top]
+
+    if args.json:
+        print(json.dumps({'module': args.module, 'total_us': total_us, 'modules': top_modules}, indent=2))
+        return
+
+    print('{:>12} {:>12}  {}'.format('self [us]', 'cumul [us]', 'module'))
+    for m in top_modules:
+        print('{:>12} {:>12}  {}{}'.format(m['self_us'], m['cumulative_us'], '  ' * m['depth'], m['name']))
+    print('Importing {} took {:.1f} ms in total ({} modules).'.format(args.module, total_us / 1000, len(modules)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""Load test the function with many concurrent CodePipeline jobs, against local stand-ins for S3, SAR and CodePipeline.
+
+Each worker process plays a Lambda container running one invocation at a time, with the real clientfactory
+pointed at the fakes in test/fakes. The driver plays CodePipeline: it invokes the function for every job, and
+invokes it again with the continuation token when the job is continued. Latency, throttling and errors are
+injected by each fake, configured with a comma separated list of key=value faults:
+
+    latency=<seconds>,jitter=<seconds>,throttle=<rate>,error=<rate>,rps=<max requests per second>
+
+For example, 200 jobs on 20 containers with a SAR rate limit of 10 requests per second:
+
+    python test/perf/loadtest.py --jobs 200 --concurrency 20 --sar latency=0.05,jitter=0.05,rps=10
+
+The report has the throughput, job and invocation tail latencies, the throttles and errors injected by each fake,
+and the success rate of the jobs.
+"""
+import argparse
+import collections
+import concurrent.futures
+import heapq
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+PERF_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PERF_DIR, '..', '..', 'src'))
+sys.path.insert(0, os.path.join(PERF_DIR, '..', 'fakes'))
+
+# there is no X-Ray segment to add subsegments to outside of Lambda
+os.environ.setdefault('XRAY_PATCH_MODULES', '')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'fake-access-key-id')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'fake-secret-access-key')
+
+from fake_codepipeline import FakeCodePipeline  # noqa: E402
+from fake_s3 import FakeS3  # noqa: E402
+from fake_server import Faults  # noqa: E402
+from fake_serverlessrepo import FakeServerlessRepo  # noqa: E402
+
+ARTIFACT_BUCKET = 'loadtest-artifact-bucket'
+TEMPLATE_NAME = 'packaged.yml'
+# keys of the fault specifications, and the Faults arguments they set
+FAULT_KEYS = {
+    'latency': ('latency_seconds', float),
+    'jitter': ('jitter_seconds', float),
+    'throttle': ('throttle_rate', float),
+    'error': ('error_rate', float),
+    'rps': ('max_requests_per_second', int)
+}
+
+TEMPLATE = '''AWSTemplateFormatVersion: '2010-09-09'
+Transform: AWS::Serverless-2016-10-31
+Metadata:
+  AWS::ServerlessRepo::Application:
+    Name: {name}
+    Description: Application published by the load test
+    Author: loadtest
+    SemanticVersion: {version}
+Resources:
+  Function:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: s3://loadtest-bucket/code.zip
+      Handler: index.handler
+      Runtime: python3.7
+'''
+
+
+class FakeContext(object):
+    """Lambda context of an invocation, with the time left before it times out."""
+
+    def __init__(self, timeout_seconds):
+        """Initialize the context of an invocation starting now.
+
+        Arguments:
+            timeout_seconds {float} -- The timeout of the function
+
+        """
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        """Return the time left in the invocation."""
+        return max(int((self._deadline - time.monotonic()) * 1000), 0)
+
+
+class FakeEndpoints(object):
+    """Stand-in for the boto3 module of clientfactory, creating clients pointed at the fakes."""
+
+    def __init__(self, endpoint_urls):
+        """Initialize the stand-in.
+
+        Arguments:
+            endpoint_urls {dict} -- The endpoint URL of each service name
+
+        """
+        self._endpoint_urls = endpoint_urls
+
+    def client(self, service_name, **kwargs):
+        """Create a client pointed at the fake of the service, see boto3.client()."""
+        import boto3
+        from botocore.config import Config
+
+        kwargs['endpoint_url'] = self._endpoint_urls[service_name]
+        if service_name == 's3':
+            kwargs['config'] = (kwargs.get('config') or Config()).merge(Config(s3={'addressing_style': 'path'}))
+        return boto3.client(service_name, **kwargs)
+
+
+def parse_faults(spec, seed=None):
+    """Parse a fault specification, see the module documentation.
+
+    Arguments:
+        spec {str} -- The specification, e.g. latency=0.05,throttle=0.01
+
+    Keyword Arguments:
+        seed {int} -- Seed of the random faults (default: {None})
+
+    Returns:
+        Faults -- The faults
+
+    """
+    kwargs = {'seed': seed}
+    for item in filter(None, (item.strip() for item in spec.split(','))):
+        key, _, value = item.partition('=')
+        if key not in FAULT_KEYS:
+            raise argparse.ArgumentTypeError('Unknown fault {}, expected one of {}'.format(key, ', '.join(FAULT_KEYS)))
+        name, convert = FAULT_KEYS[key]
+        kwargs[name] = convert(value)
+    return Faults(**kwargs)
+
+
+def generate_artifact(name, version):
+    """Generate a zipped artifact with the packaged template of an application version."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr(TEMPLATE_NAME, TEMPLATE.format(name=name, version=version))
+    return buffer.getvalue()
+
+
+def generate_event(job_id, artifact_key, continuation_token=None):
+    """Generate the CodePipeline job event of an invocation."""
+    data = {
+        'actionConfiguration': {'configuration': {'FunctionName': 'loadtest'}},
+        'inputArtifacts': [{
+            'name': 'BuildArtifact',
+            'revision': None,
+            'location': {'type': 'S3', 's3Location': {'bucketName': ARTIFACT_BUCKET, 'objectKey': artifact_key}}
+        }],
+        'outputArtifacts': [],
+        'artifactCredentials': {
+            'accessKeyId': 'fake-access-key-id',
+            'secretAccessKey': 'fake-secret-access-key',
+            'sessionToken': 'fake-session-token'
+        }
+    }
+    if continuation_token:
+        data['continuationToken'] = continuation_token
+    return {'CodePipeline.job': {'id': job_id, 'accountId': '123456789012', 'data': data}}
+
+
+def init_worker(endpoint_urls, cache_dir):
+    """Initialize a worker process like a Lambda container, with the clients pointed at the fakes."""
+    # the metrics and logs of thousands of invocations would drown the report
+    sys.stdout = open(os.devnull, 'w')
+    logging.getLogger().addHandler(logging.NullHandler())
+    # its own artifact cache, like the /tmp of a container, read by config on import
+    os.environ['ARTIFACT_CACHE_DIR'] = tempfile.mkdtemp(dir=cache_dir)
+
+    import clientfactory
+    import handler  # noqa: F401
+
+    clientfactory.boto3 = FakeEndpoints(endpoint_urls)
+
+
+def invoke(job_id, artifact_key, continuation_token, timeout_seconds):
+    """Invoke the function in a worker process.
+
+    Returns:
+        tuple -- The duration of the invocation in seconds, and the error it raised, None if it returned
+
+    """
+    import handler
+
+    start = time.monotonic()
+    try:
+        handler.publish(generate_event(job_id, artifact_key, continuation_token), FakeContext(timeout_seconds))
+        error = None
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    return time.monotonic() - start, error
+
+
+def run(args, fakes):
+    """Drive the jobs to completion like CodePipeline, see the module documentation.
+
+    Returns:
+        dict -- The outcome, latency and number of invocations of each job
+
+    """
+    s3, sar, codepipeline = fakes
+    jobs = {}
+    ready = []
+    for i in range(args.jobs):
+        job_id = 'job-{:05d}'.format(i)
+        s3.put_object(ARTIFACT_BUCKET, job_id, generate_artifact('app-{}'.format(i % args.applications),
+                                                                 '1.0.{}'.format(i)))
+        jobs[job_id] = {'invocations': [], 'continuations': 0, 'outcome': None, 'error': None, 'token': None}
+        heapq.heappush(ready, (0, job_id))
+
+    endpoint_urls = {'s3': s3.endpoint_url, 'serverlessrepo': sar.endpoint_url,
+                     'codepipeline': codepipeline.endpoint_url}
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as cache_dir, \
+            concurrent.futures.ProcessPoolExecutor(args.concurrency, mp_context=context, initializer=init_worker,
+                                                   initargs=(endpoint_urls, cache_dir)) as executor:
+        # the workers start before the clock does, like warm containers
+        list(executor.map(time.sleep, [0.1] * args.concurrency))
+        start = time.monotonic()
+        for job in jobs.values():
+            job['start'] = start
+
+        running = {}
+        while ready or running:
+            now = time.monotonic()
+            while ready and ready[0][0] <= now:
+                _, job_id = heapq.heappop(ready)
+                job = jobs[job_id]
+                job['results_before'] = len(codepipeline.results.get(job_id, []))
+                running[executor.submit(invoke, job_id, job_id, job['token'], args.timeout)] = job_id
+
+            timeout = max(ready[0][0] - now, 0) if ready else None
+            done, _ = concurrent.futures.wait(running, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                job_id = running.pop(future)
+                job = jobs[job_id]
+                duration, error = future.result()
+                job['invocations'].append(duration)
+                result = codepipeline.last_result(job_id)
+                if len(codepipeline.results.get(job_id, [])) == job['results_before']:
+                    # CodePipeline would time the job out
+                    job['outcome'], job['error'] = 'unreported', error
+                elif result[0] == 'PutJobFailureResult':
+                    job['outcome'], job['error'] = 'failed', result[1]['failureDetails']['message']
+                elif result[1].get('continuationToken') and len(job['invocations']) < args.max_invocations:
+                    job['continuations'] += 1
+                    job['token'] = result[1]['continuationToken']
+                    heapq.heappush(ready, (time.monotonic() + args.continuation_delay, job_id))
+                    continue
+                elif result[1].get('continuationToken'):
+                    job['outcome'], job['error'] = 'failed', 'still continuing after {} invocations'.format(
+                        args.max_invocations)
+                else:
+                    job['outcome'] = 'succeeded'
+                job['end'] = time.monotonic()
+
+    return jobs, start
+
+
+def report(args, jobs, start, fakes):
+    """Summarize a run.
+
+    Returns:
+        dict -- The report
+
+    """
+    end = max(job['end'] for job in jobs.values())
+    outcomes = collections.Counter(job['outcome'] for job in jobs.values())
+    errors = collections.Counter(job['error'] for job in jobs.values() if job['error'])
+    job_latencies = sorted(job['end'] - job['start'] for job in jobs.values())
+    invocation_latencies = sorted(d for job in jobs.values() for d in job['invocations'])
+    return {
+        'jobs': len(jobs),
+        'concurrency': args.concurrency,
+        'wall_seconds': end - start,
+        'jobs_per_second': len(jobs) / (end - start),
+        'success_rate': outcomes['succeeded'] / len(jobs),
+        'outcomes': dict(outcomes),
+        'invocations': len(invocation_latencies),
+        'continuations': sum(job['continuations'] for job in jobs.values()),
+        'job_latency_seconds': _percentiles(job_latencies),
+        'invocation_latency_seconds': _percentiles(invocation_latencies),
+        'services': {
+            name: {'requests': len(fake.requests), 'throttles': fake.faults.throttles, 'errors': fake.faults.errors}
+            for name, fake in zip(('s3', 'serverlessrepo', 'codepipeline'), fakes)
+        },
+        'top_errors': errors.most_common(5)
+    }
+
+
+def main():
+    """Run the load test and print the report."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=200, help='number of jobs, default: 200')
+    parser.add_argument('--concurrency', type=int, default=20, help='concurrent invocations, default: 20')
+    parser.add_argument('--applications', type=int, default=50,
+                        help='number of applications the jobs publish versions of, default: 50')
+    parser.add_argument('--timeout', type=float, default=30, help='invocation timeout in seconds, default: 30')
+    parser.add_argument('--continuation-delay', type=float, default=1,
+                        help='seconds before a continued job is invoked again, default: 1')
+    parser.add_argument('--max-invocations', type=int, default=10,
+                        help='invocations of a job before it is failed, default: 10')
+    parser.add_argument('--seed', type=int, help='seed of the random faults')
+    parser.add_argument('--s3', default='', help='faults of S3, see above')
+    parser.add_argument('--sar', default='', help='faults of AWS Serverless Application Repository, see above')
+    parser.add_argument('--codepipeline', default='', help='faults of CodePipeline, see above')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    with FakeS3(faults=parse_faults(args.s3, args.seed)) as s3, \
+            FakeServerlessRepo(faults=parse_faults(args.sar, args.seed)) as sar, \
+            FakeCodePipeline(faults=parse_faults(args.codepipeline, args.seed)) as codepipeline:
+        fakes = (s3, sar, codepipeline)
+        jobs, start = run(args, fakes)
+        summary = report(args, jobs, start, fakes)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print('{jobs} jobs on {concurrency} containers in {wall_seconds:.1f} s, {jobs_per_second:.1f} jobs/s'.format(
+        **summary))
+    print('Success rate {:.1%}, outcomes {}'.format(summary['success_rate'], summary['outcomes']))
+    print('{} invocations, {} continuations'.format(summary['invocations'], summary['continuations']))
+    for name in ('job_latency_seconds', 'invocation_latency_seconds'):
+        print('{:<28} {}'.format(name, ' '.join('{}={:.3f}'.format(k, v) for k, v in summary[name].items())))
+    for name, counts in summary['services'].items():
+        print('{:<28} {requests} requests, {throttles} throttled, {errors} errors'.format(name, **counts))
+    for error, count in summary['top_errors']:
+        print('{:>6} x {}'.format(count, error))
+
+
+def _percentiles(sorted_values):
+    if not sorted_values:
+        return {}
+    # nearest rank
+    return {
+        name: sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+        for name, p in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -5,3 +5,4 @@ import os
 """Setup unit test environment."""
 my_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, my_path + '/../../src/')
+sys.path.insert(0, my_path + '/../fakes/')
@@ -0,0 +1,123 @@
+"""Unit test for applicationprefetch.py."""
+import pytest
+from botocore.exceptions import ClientError
+from mock import MagicMock
+
+import applicationprefetch
+import applicationstate
+import callpolicy
+import metrics
+from codepipelinejob import CodePipelineJob, InputArtifact
+from test_constants import mock_application_id
+
+FUNCTION_ARN = 'arn:aws:lambda:us-east-1:123456789012:function:sample-function'
+ARTIFACT = InputArtifact('BuildArtifact', 'sample-bucket', 'sample-pipeline/BuildArtif/abc123')
+NEXT_ARTIFACT = InputArtifact('BuildArtifact', 'sample-bucket', 'sample-pipeline/BuildArtif/def456')
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    applicationprefetch.clear_cache()
+    applicationstate.clear_cache()
+    callpolicy.clear_cache()
+    yield
+    applicationprefetch.clear_cache()
+    applicationstate.clear_cache()
+    callpolicy.clear_cache()
+
+
+@pytest.fixture
+def sar_client(mocker):
+    mocker.patch.object(applicationprefetch, 'clientfactory')
+    sar_client = applicationprefetch.clientfactory.get_serverlessrepo_client.return_value
+    sar_client.meta.region_name = 'us-east-1'
+    sar_client.get_application.return_value = {
+        'ApplicationId': mock_application_id,
+        'Author': 'sample-author',
+        'Version': {'SemanticVersion': '1.0.0'}
+    }
+    return sar_client
+
+
+def _job(user_parameters=None, input_artifact=NEXT_ARTIFACT):
+    return CodePipelineJob('sample-job-id', {}, (input_artifact,), user_parameters)
+
+
+def _deadline():
+    deadline = MagicMock()
+    deadline.remaining_seconds.return_value = None
+    deadline.call_timeout.return_value = None
+    deadline.allows_call.return_value = True
+    return deadline
+
+
+def test_predict_application_names():
+    job = _job({'ApplicationNames': ['sample-app-name', 'other-app-name']})
+
+    assert applicationprefetch.predict(job, [None, 'eu-west-1'], FUNCTION_ARN) == [
+        (None, 'arn:aws:serverlessrepo:us-east-1:123456789012:applications/sample-app-name'),
+        (None, 'arn:aws:serverlessrepo:us-east-1:123456789012:applications/other-app-name'),
+        ('eu-west-1', 'arn:aws:serverlessrepo:eu-west-1:123456789012:applications/sample-app-name'),
+        ('eu-west-1', 'arn:aws:serverlessrepo:eu-west-1:123456789012:applications/other-app-name')
+    ]
+    # the account is unknown without the function ARN
+    assert applicationprefetch.predict(job, [None]) == []
+
+
+@pytest.mark.parametrize('application_names', ['sample-app-name', [''], [1]])
+def test_predict_invalid_application_names(application_names):
+    with pytest.raises(RuntimeError, match='ApplicationNames must be a list of application names.'):
+        applicationprefetch.predict(_job({'ApplicationNames': application_names}), [None])
+
+
+def test_predict_remembered_applications():
+    applicationprefetch.remember(ARTIFACT, None, [mock_application_id])
+    applicationprefetch.remember(ARTIFACT, 'eu-west-1', ['sample-eu-application-id'])
+
+    # the artifact of the next run of the pipeline publishes the same application
+    assert applicationprefetch.predict(_job({'ApplicationNames': ['sample-app-name']}), [None], FUNCTION_ARN) == [
+        (None, mock_application_id)]
+    assert applicationprefetch.predict(_job(input_artifact=InputArtifact(
+        'BuildArtifact', 'sample-bucket', 'other-pipeline/BuildArtif/def456')), [None]) == []
+
+    applicationprefetch.remember(ARTIFACT, None, [])
+    assert applicationprefetch.predict(_job(), [None, 'eu-west-1']) == [('eu-west-1', 'sample-eu-application-id')]
+
+
+def test_remember_least_recently_published(mocker):
+    mocker.patch.object(applicationprefetch, 'MAX_REMEMBERED_ARTIFACTS', 2)
+    artifacts = [InputArtifact('BuildArtifact', 'sample-bucket', 'pipeline-{}/BuildArtif/abc'.format(i))
+                 for i in range(3)]
+    for i, artifact in enumerate(artifacts):
+        applicationprefetch.remember(artifact, None, ['application-{}'.format(i)])
+
+    assert [applicationprefetch.predict(_job(input_artifact=artifact), [None]) for artifact in artifacts] == [
+        [], [(None, 'application-1')], [(None, 'application-2')]]
+
+
+def test_prefetch(sar_client):
+    applicationprefetch.prefetch([(None, mock_application_id)], _deadline())
+    # the state is cached already
+    applicationprefetch.prefetch([(None, mock_application_id)], _deadline())
+
+    sar_client.get_application.assert_called_once_with(ApplicationId=mock_application_id)
+    assert applicationstate.find('us-east-1', mock_application_id)['Author'] == 'sample-author'
+    assert applicationstate.find_application_id('us-east-1', 'sample-app-name') == mock_application_id
+    assert metrics.get_total('PrefetchedApplications') == 1
+    metrics.reset()
+
+
+def test_prefetch_errors(sar_client, mocker):
+    mocker.patch.object(callpolicy.config, 'CALL_MAX_ATTEMPTS', 1)
+    mock_log = mocker.patch.object(applicationprefetch, 'LOG')
+    sar_client.get_application.side_effect = [
+        ClientError({'Error': {'Code': 'NotFoundException', 'Message': 'Not found'}}, 'GetApplication'),
+        {'ApplicationId': 'other-application-id', 'Version': {}}
+    ]
+
+    applicationprefetch.prefetch([(None, mock_application_id), (None, 'other-application-id')], _deadline())
+
+    assert applicationstate.find('us-east-1', mock_application_id) is None
+    assert applicationstate.find('us-east-1', 'other-application-id') is not None
+    assert 'Not found' in str(mock_log.info.call_args)
+    metrics.reset()
@@ -0,0 +1,83 @@
+"""Unit test for applicationstate.py."""
+import pytest
+
+import applicationstate
+
+REGION = 'us-east-1'
+APPLICATION_ID = 'arn:aws:serverlessrepo:us-east-1:123456789012:applications/sample-app-name'
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    applicationstate.clear_cache()
+    yield
+    applicationstate.clear_cache()
+
+
+def test_from_get_application_response():
+    assert applicationstate.from_get_application_response({
+        'ApplicationId': APPLICATION_ID,
+        'Author': 'sample-author',
+        'Labels': ['b', 'a'],
+        'ReadmeUrl': 'https://serverlessrepo/readme.md',
+        'Version': {'SemanticVersion': '1.0.0'}
+    }) == {
+        'Author': 'sample-author',
+        'Description': None,
+        'HomePageUrl': None,
+        'Labels': ['b', 'a'],
+        'SemanticVersion': '1.0.0'
+    }
+
+
+def test_get_changed_fields():
+    state = {'Author': 'sample-author', 'Description': 'old-description', 'Labels': ['b', 'a'], 'ReadmeUrl': None}
+    request = {
+        'ApplicationId': APPLICATION_ID,
+        'Author': 'sample-author',
+        'Description': 'new-description',
+        'Labels': ['a', 'b'],
+        'ReadmeUrl': 's3://bucket/readme.md'
+    }
+
+    assert applicationstate.get_changed_fields(request, state) == ['Description', 'ReadmeUrl']
+    assert applicationstate.get_changed_fields(request, None) == ['Author', 'Description', 'Labels', 'ReadmeUrl']
+
+
+def test_put_keeps_sent_readme():
+    applicationstate.put(REGION, APPLICATION_ID, {'Author': 'sample-author', 'ReadmeUrl': 's3://bucket/readme.md'})
+
+    state = applicationstate.put(REGION, APPLICATION_ID, {'Author': 'other-author'})
+
+    assert state == {'Author': 'other-author', 'ReadmeUrl': 's3://bucket/readme.md', 'ReadmeBody': None}
+    assert applicationstate.find(REGION, APPLICATION_ID) == state
+    assert applicationstate.find('eu-west-1', APPLICATION_ID) is None
+
+
+def test_update():
+    applicationstate.update(REGION, APPLICATION_ID, {'Author': 'sample-author'})
+    assert applicationstate.find(REGION, APPLICATION_ID) is None
+
+    applicationstate.put(REGION, APPLICATION_ID, {'Author': 'sample-author', 'SemanticVersion': '1.0.0'})
+    applicationstate.update(REGION, APPLICATION_ID, {'SemanticVersion': '1.0.1'})
+
+    assert applicationstate.find(REGION, APPLICATION_ID)['SemanticVersion'] == '1.0.1'
+
+
+def test_find_expired(mocker):
+    mocker.patch.object(applicationstate.config, 'APPLICATION_STATE_TTL_SECONDS', 0)
+    applicationstate.put(REGION, APPLICATION_ID, {'Author': 'sample-author'})
+
+    assert applicationstate.find(REGION, APPLICATION_ID) is None
+
+
+def test_find_application_id(mocker):
+    mocker.patch.object(applicationstate.time, 'monotonic', return_value=1000.0)
+    applicationstate.put(REGION, APPLICATION_ID, {'Author': 'sample-author'})
+
+    assert applicationstate.find_application_id(REGION, 'sample-app-name') == APPLICATION_ID
+    assert applicationstate.find_application_id(REGION, 'app-name') is None
+    assert applicationstate.find_application_id('eu-west-1', 'sample-app-name') is None
+
+    applicationstate.time.monotonic.return_value = 1000.0 + applicationstate.config.APPLICATION_STATE_TTL_SECONDS
+    assert applicationstate.find_application_id(REGION, 'sample-app-name') is None
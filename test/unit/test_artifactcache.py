@@ -0,0 +1,122 @@
+"""Unit test for artifactcache.py."""
+import os
+
+import pytest
+
+import artifactcache
+import metrics
+
+BUCKET = 'sample-bucket'
+SELECTION = ('template', '')
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(mocker, tmp_path):
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_DIR', str(tmp_path / 'artifact-cache'))
+    artifactcache.clear_cache()
+    metrics.reset()
+    yield tmp_path / 'artifact-cache'
+    artifactcache.clear_cache()
+    metrics.reset()
+
+
+def test_put_and_find(cache_dir):
+    artifactcache.put(BUCKET, 'sample-key', SELECTION, '"sample-etag"', 'sample-template')
+
+    entry = artifactcache.find(BUCKET, 'sample-key', SELECTION)
+
+    assert (entry.etag, entry.value) == ('"sample-etag"', 'sample-template')
+    assert artifactcache.find(BUCKET, 'sample-key', ('template', 'other.yml')) is None
+    assert artifactcache.find(BUCKET, 'other-key', SELECTION) is None
+    assert len(os.listdir(str(cache_dir))) == 1
+
+
+def test_put_replaces_previous_version():
+    artifactcache.put(BUCKET, 'sample-key', SELECTION, '"old-etag"', 'old-template')
+    artifactcache.put(BUCKET, 'sample-key', SELECTION, '"new-etag"', 'new-template')
+    artifactcache._ENTRIES.clear()
+
+    assert artifactcache.find(BUCKET, 'sample-key', SELECTION).value == 'new-template'
+
+
+def test_put_without_etag():
+    artifactcache.put(BUCKET, 'sample-key', SELECTION, None, 'sample-template')
+
+    assert artifactcache.find(BUCKET, 'sample-key', SELECTION) is None
+
+
+def test_memory_eviction(mocker, cache_dir):
+    # each value is 12 bytes once serialized
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_MEMORY_BYTES', 30)
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_DIR', '')
+    for key in ('key-1', 'key-2', 'key-3'):
+        artifactcache.put(BUCKET, key, SELECTION, '"etag"', 'template-' + key[-1])
+        if key == 'key-2':
+            # used recently, key-1 is evicted instead
+            artifactcache.find(BUCKET, 'key-1', SELECTION)
+
+    assert [artifactcache.find(BUCKET, key, SELECTION) is not None for key in ('key-1', 'key-2', 'key-3')] == \
+        [True, False, True]
+    # larger than the memory cache
+    artifactcache.put(BUCKET, 'key-4', SELECTION, '"etag"', 'x' * 40)
+    assert artifactcache.find(BUCKET, 'key-4', SELECTION) is None
+
+
+def test_disk_eviction(mocker, cache_dir):
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_MEMORY_BYTES', 0)
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_DISK_BYTES', 200)
+    for i, key in enumerate(('key-1', 'key-2', 'key-3')):
+        artifactcache.put(BUCKET, key, SELECTION, '"etag"', 'x' * 50)
+        # the modification times order the files
+        os.utime(artifactcache._get_path((BUCKET, key, SELECTION)), (1000 + i, 1000 + i))
+    (cache_dir / 'other-file.json').write_text('{}')
+
+    assert sum(size for _, size, _ in artifactcache._list_files()) <= 200
+    assert artifactcache.find(BUCKET, 'key-1', SELECTION) is None
+    assert artifactcache.find(BUCKET, 'key-3', SELECTION).value == 'x' * 50
+    # files that are not entries are left alone
+    assert (cache_dir / 'other-file.json').exists()
+
+
+def test_unreadable_file(mocker, cache_dir):
+    mock_log = mocker.patch.object(artifactcache, 'LOG')
+    artifactcache.put(BUCKET, 'sample-key', SELECTION, '"etag"', 'sample-template')
+    artifactcache._ENTRIES.clear()
+    path = artifactcache._get_path((BUCKET, 'sample-key', SELECTION))
+    with open(path, 'w') as f:
+        f.write('{')
+
+    assert artifactcache.find(BUCKET, 'sample-key', SELECTION) is None
+    assert not os.path.exists(path)
+    assert 'Unable to read' in mock_log.warning.call_args[0][0]
+
+
+def test_write_error(mocker):
+    mocker.patch.object(artifactcache, '_write_file', side_effect=OSError('No space left on device'))
+    mock_log = mocker.patch.object(artifactcache, 'LOG')
+
+    artifactcache.put(BUCKET, 'sample-key', SELECTION, '"etag"', 'sample-template')
+
+    assert artifactcache.find(BUCKET, 'sample-key', SELECTION).value == 'sample-template'
+    assert 'No space left on device' in str(mock_log.warning.call_args)
+
+
+def test_record_lookup(mocker):
+    mock_log = mocker.patch.object(artifactcache, 'LOG')
+
+    artifactcache.record_lookup(hit=False)
+    artifactcache.record_lookup(hit=True)
+    artifactcache.record_lookup(hit=True)
+
+    assert mock_log.info.call_args[0][1:] == ('hit', 100.0 * 2 / 3, 2, 3)
+    assert (metrics.get_total('ArtifactCacheHits'), metrics.get_total('ArtifactCacheMisses')) == (2, 1)
+
+
+def test_is_enabled(mocker):
+    assert artifactcache.is_enabled()
+
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_MEMORY_BYTES', 0)
+    assert artifactcache.is_enabled()
+
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_DISK_BYTES', 0)
+    assert not artifactcache.is_enabled()
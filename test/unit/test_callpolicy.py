@@ -0,0 +1,227 @@
+"""Unit test for callpolicy.py."""
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+from mock import MagicMock
+
+import callpolicy
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    metrics.reset()
+    callpolicy.clear_cache()
+    yield
+    metrics.reset()
+    callpolicy.clear_cache()
+
+
+@pytest.fixture
+def mock_sleep(mocker):
+    return mocker.patch.object(callpolicy.time, 'sleep')
+
+
+def _client_error(code, status=400):
+    return ClientError({'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}},
+                       'SampleOperation')
+
+
+def _deadline(remaining_seconds):
+    deadline = MagicMock()
+    deadline.remaining_seconds.return_value = remaining_seconds
+    return deadline
+
+
+@pytest.mark.parametrize('error,expected_class', [
+    (_client_error('TooManyRequestsException', 429), callpolicy.ERROR_THROTTLING),
+    (_client_error('ThrottlingException'), callpolicy.ERROR_THROTTLING),
+    (_client_error('SlowDown', 429), callpolicy.ERROR_THROTTLING),
+    (_client_error('InternalFailure', 500), callpolicy.ERROR_RETRYABLE),
+    (_client_error('BadGateway', 502), callpolicy.ERROR_RETRYABLE),
+    (ReadTimeoutError(endpoint_url='https://serverlessrepo'), callpolicy.ERROR_RETRYABLE),
+    (_client_error('ConflictException', 409), callpolicy.ERROR_FATAL),
+    (ValueError('sample error'), callpolicy.ERROR_FATAL)
+])
+def test_classify(error, expected_class):
+    assert callpolicy.classify(error) == expected_class
+
+
+def test_call(mock_sleep):
+    function = MagicMock(return_value={'sample': 'response'})
+
+    assert callpolicy.get_policy('serverlessrepo').call('sample_operation', function, a=1) == {'sample': 'response'}
+
+    function.assert_called_once_with(a=1)
+    mock_sleep.assert_not_called()
+
+
+def test_call_throttled_and_retried(mock_sleep):
+    function = MagicMock(side_effect=[_client_error('TooManyRequestsException', 429), {}])
+    policy = callpolicy.get_policy('serverlessrepo', 'eu-west-1')
+
+    assert policy.call('sample_operation', function, _deadline(100)) == {}
+
+    assert function.call_count == 2
+    assert mock_sleep.call_args[0][0] <= callpolicy.config.CALL_BACKOFF_BASE_SECONDS
+    assert metrics.get_total('SarThrottles') == 1
+    assert metrics.get_total('SarRetries') == 1
+    assert policy.token_bucket.rate < callpolicy.config.CALL_MAX_RATE_PER_SECOND
+
+
+def test_call_fatal_error_not_retried(mock_sleep):
+    function = MagicMock(side_effect=_client_error('BadRequestException'))
+
+    with pytest.raises(ClientError):
+        callpolicy.get_policy('serverlessrepo').call('sample_operation', function)
+
+    function.assert_called_once()
+    assert metrics.get_total('SarRetries') == 0
+
+
+def test_call_attempts_exhausted(mock_sleep):
+    function = MagicMock(side_effect=_client_error('InternalFailure', 500))
+
+    with pytest.raises(ClientError):
+        callpolicy.get_policy('codepipeline').call('sample_operation', function)
+
+    assert function.call_count == callpolicy.config.CALL_MAX_ATTEMPTS
+    assert metrics.get_total('CodePipelineRetries') == callpolicy.config.CALL_MAX_ATTEMPTS - 1
+
+
+def test_call_not_retried_past_deadline(mock_sleep):
+    function = MagicMock(side_effect=_client_error('InternalFailure', 500))
+
+    with pytest.raises(ClientError):
+        callpolicy.get_policy('codepipeline').call(
+            'sample_operation', function, _deadline(callpolicy.config.MIN_CALL_TIMEOUT_SECONDS - 1))
+
+    function.assert_called_once()
+
+
+def test_call_circuit_open(mock_sleep, mocker):
+    mocker.patch.object(callpolicy.config, 'CALL_MAX_ATTEMPTS', 1)
+    mocker.patch.object(callpolicy.config, 'CIRCUIT_BREAKER_FAILURES', 2)
+    function = MagicMock(side_effect=ReadTimeoutError(endpoint_url='https://serverlessrepo'))
+    policy = callpolicy.get_policy('serverlessrepo')
+
+    for _ in range(2):
+        with pytest.raises(ReadTimeoutError):
+            policy.call('sample_operation', function)
+    with pytest.raises(callpolicy.CallSuspendedError, match='suspended after repeated failures'):
+        policy.call('sample_operation', function)
+
+    assert function.call_count == 2
+    assert metrics.get_total('SarCallsSuspended') == 1
+
+
+def test_call_circuit_open_keeps_tokens(mock_sleep, mocker):
+    mocker.patch.object(callpolicy.config, 'CALL_MAX_ATTEMPTS', 1)
+    mocker.patch.object(callpolicy.config, 'CIRCUIT_BREAKER_FAILURES', 1)
+    mock_time = mocker.patch.object(callpolicy, 'time')
+    mock_time.monotonic.return_value = 1000.0
+    function = MagicMock(side_effect=ReadTimeoutError(endpoint_url='https://serverlessrepo'))
+    policy = callpolicy.get_policy('serverlessrepo')
+    with pytest.raises(ReadTimeoutError):
+        policy.call('sample_operation', function)
+    tokens = policy.token_bucket._tokens
+
+    for _ in range(5):
+        with pytest.raises(callpolicy.CallSuspendedError, match='suspended after repeated failures'):
+            policy.call('sample_operation', function)
+
+    assert policy.token_bucket._tokens == tokens
+    assert function.call_count == 1
+
+
+def test_call_rate_limited_releases_probe(mock_sleep, mocker):
+    mock_time = mocker.patch.object(callpolicy, 'time')
+    mock_time.monotonic.return_value = 1000.0
+    policy = callpolicy.get_policy('serverlessrepo')
+    policy.circuit_breaker.state = callpolicy.CIRCUIT_HALF_OPEN
+    mocker.patch.object(policy.token_bucket, 'acquire', return_value=False)
+
+    with pytest.raises(callpolicy.CallSuspendedError, match='rate limit'):
+        policy.call('sample_operation', MagicMock(), _deadline(callpolicy.config.MIN_CALL_TIMEOUT_SECONDS))
+
+    # the probe was not made, another call may still make it
+    assert policy.circuit_breaker.allow()
+
+
+def test_circuit_breaker_half_open(mocker):
+    mock_time = mocker.patch.object(callpolicy, 'time')
+    mock_time.monotonic.return_value = 1000.0
+    circuit_breaker = callpolicy.CircuitBreaker(failure_threshold=1, reset_seconds=30)
+
+    circuit_breaker.record_failure()
+    assert not circuit_breaker.allow()
+    assert circuit_breaker.retry_after_seconds() == 30
+
+    mock_time.monotonic.return_value = 1030.0
+    assert circuit_breaker.allow()
+    # a single probe at a time
+    assert not circuit_breaker.allow()
+
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == callpolicy.CIRCUIT_CLOSED
+    assert circuit_breaker.allow()
+
+
+def test_circuit_breaker_probe_failed(mocker):
+    mock_time = mocker.patch.object(callpolicy, 'time')
+    mock_time.monotonic.return_value = 1000.0
+    circuit_breaker = callpolicy.CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    for _ in range(3):
+        circuit_breaker.record_failure()
+
+    mock_time.monotonic.return_value = 1030.0
+    assert circuit_breaker.allow()
+    circuit_breaker.record_failure()
+
+    assert circuit_breaker.state == callpolicy.CIRCUIT_OPEN
+    assert not circuit_breaker.allow()
+
+
+def test_token_bucket(mocker):
+    mock_time = mocker.patch.object(callpolicy, 'time')
+    mock_time.monotonic.return_value = 1000.0
+    token_bucket = callpolicy.TokenBucket(max_rate=2, min_rate=0.5)
+
+    assert token_bucket.acquire()
+    assert token_bucket.acquire()
+    assert not token_bucket.acquire(timeout=0.1)
+
+    mock_time.monotonic.return_value = 1000.5
+    assert token_bucket.acquire(timeout=0)
+
+
+def test_token_bucket_adaptive_rate():
+    token_bucket = callpolicy.TokenBucket(max_rate=10, min_rate=1)
+
+    for _ in range(5):
+        token_bucket.on_throttle()
+    assert token_bucket.rate == 1
+
+    token_bucket.on_success()
+    assert token_bucket.rate == 1.5
+    for _ in range(100):
+        token_bucket.on_success()
+    assert token_bucket.rate == 10
+
+
+def test_call_rate_limited_past_deadline(mock_sleep, mocker):
+    mocker.patch.object(callpolicy.config, 'CALL_MAX_RATE_PER_SECOND', 1)
+    mocker.patch.object(callpolicy.config, 'CALL_MIN_RATE_PER_SECOND', 0.1)
+    policy = callpolicy.get_policy('serverlessrepo')
+    policy.token_bucket.on_throttle()
+    policy.call('sample_operation', MagicMock())
+
+    with pytest.raises(callpolicy.CallSuspendedError, match='rate limit'):
+        policy.call('sample_operation', MagicMock(), _deadline(callpolicy.config.MIN_CALL_TIMEOUT_SECONDS + 0.5))
+
+
+def test_get_policy():
+    policy = callpolicy.get_policy('serverlessrepo')
+
+    assert callpolicy.get_policy('serverlessrepo') is policy
+    assert callpolicy.get_policy('serverlessrepo', 'eu-west-1') is not policy
+    assert callpolicy.get_policy('serverlessrepo', 'eu-west-1').endpoint == 'serverlessrepo in eu-west-1'
@@ -0,0 +1,177 @@
+"""Unit test for clientfactory.py."""
+import pytest
+
+import clientfactory
+
+ARTIFACT_CREDENTIALS = {
+    'accessKeyId': 'sample-access-key-id',
+    'secretAccessKey': 'sample-secret-access-key',
+    'sessionToken': 'sample-session-token'
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    clientfactory.clear_cache()
+    yield
+    clientfactory.clear_cache()
+
+
+@pytest.fixture
+def mock_boto3(mocker):
+    mocker.patch.object(clientfactory, 'boto3')
+    clientfactory.boto3.client.side_effect = lambda *args, **kwargs: mocker.MagicMock()
+    return clientfactory.boto3
+
+
+@pytest.fixture
+def mock_xray_patch(mocker):
+    mocker.patch.object(clientfactory, '_xray_patched', False)
+    return mocker.patch('aws_xray_sdk.core.patch')
+
+
+@pytest.fixture
+def mock_time(mocker):
+    mocker.patch.object(clientfactory, 'time')
+    clientfactory.time.monotonic.return_value = 1000.0
+    return clientfactory.time
+
+
+def _credentials(access_key_id):
+    return dict(ARTIFACT_CREDENTIALS, accessKeyId=access_key_id)
+
+
+def test_get_botocore_config():
+    assert clientfactory.get_botocore_config() is clientfactory.get_botocore_config()
+    assert clientfactory.get_botocore_config().max_pool_connections == clientfactory.config.CLIENT_MAX_POOL_CONNECTIONS
+    assert clientfactory.get_botocore_config().connect_timeout == clientfactory.config.CLIENT_CONNECT_TIMEOUT_SECONDS
+    assert clientfactory.get_botocore_config().read_timeout == clientfactory.config.CLIENT_READ_TIMEOUT_SECONDS
+
+
+def test_get_s3_client(mock_boto3, mock_time):
+    client = clientfactory.get_s3_client(ARTIFACT_CREDENTIALS)
+
+    assert clientfactory.get_s3_client(dict(ARTIFACT_CREDENTIALS)) is client
+    mock_boto3.client.assert_called_once_with(
+        's3',
+        aws_access_key_id='sample-access-key-id',
+        aws_secret_access_key='sample-secret-access-key',
+        aws_session_token='sample-session-token',
+        config=clientfactory.get_botocore_config()
+    )
+
+
+def test_get_s3_client_different_credentials(mock_boto3, mock_time):
+    client = clientfactory.get_s3_client(ARTIFACT_CREDENTIALS)
+
+    assert clientfactory.get_s3_client(_credentials('another-access-key-id')) is not client
+    assert mock_boto3.client.call_count == 2
+
+
+def test_get_s3_client_expired(mock_boto3, mock_time, mocker):
+    mocker.patch.object(clientfactory.config, 'S3_CLIENT_CACHE_TTL_SECONDS', 60)
+    client = clientfactory.get_s3_client(ARTIFACT_CREDENTIALS)
+
+    mock_time.monotonic.return_value = 1059.0
+    assert clientfactory.get_s3_client(ARTIFACT_CREDENTIALS) is client
+
+    mock_time.monotonic.return_value = 1060.0
+    assert clientfactory.get_s3_client(ARTIFACT_CREDENTIALS) is not client
+
+
+def test_get_s3_client_least_recently_used_evicted(mock_boto3, mock_time, mocker):
+    mocker.patch.object(clientfactory.config, 'S3_CLIENT_CACHE_SIZE', 2)
+    first_client = clientfactory.get_s3_client(_credentials('first'))
+    second_client = clientfactory.get_s3_client(_credentials('second'))
+    clientfactory.get_s3_client(_credentials('first'))
+
+    clientfactory.get_s3_client(_credentials('third'))
+
+    assert clientfactory.get_s3_client(_credentials('first')) is first_client
+    assert clientfactory.get_s3_client(_credentials('second')) is not second_client
+
+
+def test_get_codepipeline_client(mock_boto3):
+    client = clientfactory.get_codepipeline_client()
+
+    assert clientfactory.get_codepipeline_client() is client
+    mock_boto3.client.assert_called_once()
+    assert mock_boto3.client.call_args[0] == ('codepipeline',)
+    assert mock_boto3.client.call_args[1]['region_name'] is None
+    client_config = mock_boto3.client.call_args[1]['config']
+    assert client_config.retries == {'max_attempts': 0}
+    assert client_config.max_pool_connections == clientfactory.config.CLIENT_MAX_POOL_CONNECTIONS
+
+
+def test_get_function_dynamodb_client(mock_boto3, mocker):
+    clientfactory.get_function_dynamodb_client()
+    assert mock_boto3.client.call_args[1]['endpoint_url'] is None
+
+    mocker.patch.object(clientfactory.config, 'DYNAMODB_ENDPOINT_URL', 'http://localhost:8000')
+    clientfactory.get_function_dynamodb_client()
+    assert mock_boto3.client.call_args[0] == ('dynamodb',)
+    assert mock_boto3.client.call_args[1]['endpoint_url'] == 'http://localhost:8000'
+
+
+def test_get_serverlessrepo_client_by_region(mock_boto3):
+    client = clientfactory.get_serverlessrepo_client()
+    us_west_2_client = clientfactory.get_serverlessrepo_client('us-west-2')
+
+    assert us_west_2_client is not client
+    assert clientfactory.get_serverlessrepo_client('us-west-2') is us_west_2_client
+    assert mock_boto3.client.call_args[0] == ('serverlessrepo',)
+    assert mock_boto3.client.call_args[1]['region_name'] == 'us-west-2'
+    assert mock_boto3.client.call_args[1]['config'].retries == {'max_attempts': 0}
+
+
+def test_get_serverlessrepo_client_with_timeout(mock_boto3):
+    client = clientfactory.get_serverlessrepo_client(timeout=12.5)
+
+    assert clientfactory.get_serverlessrepo_client(timeout=10) is client
+    assert clientfactory.get_serverlessrepo_client() is not client
+    client_config = mock_boto3.client.call_args_list[0][1]['config']
+    assert client_config.read_timeout == 10
+    assert client_config.connect_timeout == clientfactory.config.CLIENT_CONNECT_TIMEOUT_SECONDS
+    assert client_config.retries == {'max_attempts': 0}
+    assert client_config.max_pool_connections == clientfactory.config.CLIENT_MAX_POOL_CONNECTIONS
+
+
+def test_get_serverlessrepo_client_with_short_timeout(mock_boto3):
+    clientfactory.get_serverlessrepo_client(timeout=0.5)
+
+    client_config = mock_boto3.client.call_args[1]['config']
+    assert client_config.read_timeout == 1
+    assert client_config.connect_timeout == 1
+
+
+def test_xray_patched_before_first_client(mock_boto3, mock_xray_patch, mocker, monkeypatch):
+    monkeypatch.setenv('LAMBDA_TASK_ROOT', '/var/task')
+    mocker.patch.object(clientfactory.config, 'XRAY_PATCH_MODULES', ('botocore',))
+    mock_boto3.client.side_effect = lambda *args, **kwargs: mock_xray_patch.assert_called_once_with(('botocore',))
+
+    clientfactory.get_codepipeline_client()
+    clientfactory.get_s3_client(ARTIFACT_CREDENTIALS)
+    clientfactory.patch_xray()
+
+    mock_xray_patch.assert_called_once_with(('botocore',))
+
+
+def test_xray_not_patched(mock_boto3, mock_xray_patch, mocker, monkeypatch):
+    monkeypatch.setenv('LAMBDA_TASK_ROOT', '/var/task')
+    mocker.patch.object(clientfactory.config, 'XRAY_PATCH_MODULES', ())
+
+    clientfactory.get_codepipeline_client()
+    clientfactory.patch_xray()
+
+    mock_xray_patch.assert_not_called()
+
+
+def test_xray_not_patched_outside_lambda(mock_boto3, mock_xray_patch, mocker, monkeypatch):
+    # e.g. the worker or republish
+    monkeypatch.delenv('LAMBDA_TASK_ROOT', raising=False)
+    mocker.patch.object(clientfactory.config, 'XRAY_PATCH_MODULES', ('botocore',))
+
+    clientfactory.get_codepipeline_client()
+    clientfactory.patch_xray()
+
+    mock_xray_patch.assert_not_called()
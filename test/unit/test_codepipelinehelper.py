@@ -0,0 +1,139 @@
+"""Unit test for codepipelinehelper.py."""
+import pytest
+from botocore.exceptions import ClientError
+
+import callpolicy
+import codepipelinehelper
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    metrics.reset()
+    callpolicy.clear_cache()
+    yield
+    metrics.reset()
+    callpolicy.clear_cache()
+
+
+@pytest.fixture
+def mock_codepipeline(mocker):
+    mocker.patch.object(codepipelinehelper, 'clientfactory')
+    return codepipelinehelper.clientfactory.get_codepipeline_client.return_value
+
+
+def test_put_job_successes(mock_codepipeline):
+    codepipelinehelper.put_job_successes('sample-codepipeline-job-id', {
+        'BuildArtifact': {'application_id': 'sample-application-id', 'actions': ['CREATE_APPLICATION']},
+        'OtherArtifact': {'application_id': 'other-application-id', 'actions': []}
+    })
+
+    mock_codepipeline.put_job_success_result.assert_called_once_with(
+        jobId='sample-codepipeline-job-id',
+        executionDetails={
+            'summary': "Published 2 applications: BuildArtifact: sample-application-id ['CREATE_APPLICATION']; "
+                       "OtherArtifact: other-application-id no-op",
+            'percentComplete': 100
+        }
+    )
+
+
+def test_put_job_successes_with_changed_fields(mock_codepipeline):
+    codepipelinehelper.put_job_successes('sample-codepipeline-job-id', {
+        'BuildArtifact': {'application_id': 'sample-application-id', 'actions': ['UPDATE_APPLICATION'],
+                          'changed_fields': ['Description', 'Labels']}
+    })
+
+    summary = mock_codepipeline.put_job_success_result.call_args[1]['executionDetails']['summary']
+    assert summary == "Published 1 applications: BuildArtifact: sample-application-id ['UPDATE_APPLICATION'] changed " \
+                      "Description, Labels"
+
+
+def test_put_job_successes_with_failures_and_latencies(mock_codepipeline):
+    codepipelinehelper.put_job_successes('sample-codepipeline-job-id', {
+        'BuildArtifact@us-east-1': {'application_id': 'sample-application-id', 'actions': ['CREATE_APPLICATION']},
+        'BuildArtifact@eu-west-1': RuntimeError('sample error')
+    }, {'BuildArtifact@us-east-1': 1.234, 'BuildArtifact@eu-west-1': 0.5})
+
+    summary = mock_codepipeline.put_job_success_result.call_args[1]['executionDetails']['summary']
+    assert summary == (
+        "Published 1 of 2 applications: BuildArtifact@us-east-1: sample-application-id ['CREATE_APPLICATION'] in 1.2s; "
+        "BuildArtifact@eu-west-1: failed, sample error in 0.5s"
+    )
+
+
+def test_put_job_failures(mock_codepipeline):
+    codepipelinehelper.put_job_failures('sample-codepipeline-job-id', {
+        'BuildArtifact@eu-west-1': RuntimeError('sample error')
+    }, 3)
+
+    mock_codepipeline.put_job_failure_result.assert_called_once_with(
+        jobId='sample-codepipeline-job-id',
+        failureDetails={
+            'type': 'JobFailed',
+            'message': '1 of 3 applications failed to publish. BuildArtifact@eu-west-1: sample error'
+        }
+    )
+
+
+def test_put_job_success_truncated(mock_codepipeline):
+    codepipelinehelper.put_job_success('sample-codepipeline-job-id', {'details': 'x' * 3000})
+
+    summary = mock_codepipeline.put_job_success_result.call_args[1]['executionDetails']['summary']
+    assert len(summary) == codepipelinehelper.MAX_SUMMARY_LENGTH
+    assert summary.endswith('...')
+
+
+def test_put_job_success_with_throttled_calls(mock_codepipeline):
+    metrics.count('SarThrottles', 2)
+    metrics.count('SarRetries', 3)
+
+    codepipelinehelper.put_job_success('sample-codepipeline-job-id', 'x' * 3000)
+
+    summary = mock_codepipeline.put_job_success_result.call_args[1]['executionDetails']['summary']
+    assert len(summary) == codepipelinehelper.MAX_SUMMARY_LENGTH
+    assert summary.endswith('... (2 throttled, 3 retried AWS calls)')
+
+
+def test_put_job_failure_throttled_and_retried(mock_codepipeline, mocker):
+    mocker.patch.object(callpolicy.time, 'sleep')
+    throttling_error = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                                   'PutJobFailureResult')
+    mock_codepipeline.put_job_failure_result.side_effect = [throttling_error, {}]
+
+    codepipelinehelper.put_job_failure('sample-codepipeline-job-id', RuntimeError('sample error'))
+
+    assert mock_codepipeline.put_job_failure_result.call_count == 2
+    assert metrics.get_total('CodePipelineThrottles') == 1
+    assert metrics.get_total('CodePipelineRetries') == 1
+
+
+def test_put_job_failure_not_reported(mock_codepipeline, mocker):
+    mocker.patch.object(callpolicy.time, 'sleep')
+    mock_log = mocker.patch.object(codepipelinehelper, 'LOG')
+    mock_codepipeline.put_job_failure_result.side_effect = ClientError(
+        {'Error': {'Code': 'InternalFailure', 'Message': 'Internal failure'}}, 'PutJobFailureResult')
+
+    with pytest.raises(ClientError):
+        codepipelinehelper.put_job_failure('sample-codepipeline-job-id', RuntimeError('sample error'))
+
+    assert mock_codepipeline.put_job_failure_result.call_count == callpolicy.config.CALL_MAX_ATTEMPTS
+    assert 'sample error' in str(mock_log.error.call_args)
+
+
+def test_poll_for_jobs(mock_codepipeline):
+    action_type_id = {'category': 'Deploy', 'owner': 'Custom', 'provider': 'PublishToSAR', 'version': '1'}
+    mock_codepipeline.poll_for_jobs.return_value = {'jobs': [{'id': 'sample-codepipeline-job-id'}]}
+
+    assert codepipelinehelper.poll_for_jobs(action_type_id, 500) == [{'id': 'sample-codepipeline-job-id'}]
+
+    mock_codepipeline.poll_for_jobs.assert_called_once_with(actionTypeId=action_type_id, maxBatchSize=100)
+
+
+@pytest.mark.parametrize('status,expected', [('InProgress', True), ('Succeeded', False)])
+def test_acknowledge_job(mock_codepipeline, status, expected):
+    mock_codepipeline.acknowledge_job.return_value = {'status': status}
+
+    assert codepipelinehelper.acknowledge_job('sample-codepipeline-job-id', 'sample-nonce') is expected
+
+    mock_codepipeline.acknowledge_job.assert_called_once_with(jobId='sample-codepipeline-job-id', nonce='sample-nonce')
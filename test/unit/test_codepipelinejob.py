@@ -0,0 +1,84 @@
+"""Unit test for codepipelinejob.py."""
+import copy
+import logging
+
+import pytest
+
+import codepipelinejob
+from test_constants import generate_pipeline_event, mock_codepipeline_event
+
+
+def test_from_event():
+    event = generate_pipeline_event(mock_codepipeline_event['CodePipeline.job']['data']['inputArtifacts'],
+                                    {'TemplatePath': 'packaged.yml'})
+
+    job = codepipelinejob.CodePipelineJob.from_event(event)
+
+    assert job.job_id == 'sample-codepipeline-job-id'
+    assert job.artifact_credentials == event['CodePipeline.job']['data']['artifactCredentials']
+    assert job.input_artifacts == (codepipelinejob.InputArtifact(
+        'BuildArtifact', 'sample-pipeline-artifact-store-bucket', 'sample-artifact-key'),)
+    assert job.user_parameters == {'TemplatePath': 'packaged.yml'}
+    assert job.continuation_token == 'sample-continuation-token'
+
+
+def test_from_event_without_user_parameters_and_continuation_token():
+    event = copy.deepcopy(mock_codepipeline_event)
+    del event['CodePipeline.job']['data']['actionConfiguration']['configuration']['UserParameters']
+    del event['CodePipeline.job']['data']['continuationToken']
+
+    job = codepipelinejob.CodePipelineJob.from_event(event)
+
+    assert job.user_parameters == {}
+    assert job.continuation_token is None
+
+
+@pytest.mark.parametrize('path, message', [
+    (('id',), 'CodePipeline.job.id is missing.'),
+    (('data', 'artifactCredentials', 'sessionToken'), 'CodePipeline.job.data.artifactCredentials.sessionToken is'),
+    (('data', 'inputArtifacts', 0, 'location'), 'CodePipeline.job.data.inputArtifacts[0].location is missing.'),
+    (('data', 'actionConfiguration'), 'CodePipeline.job.data.actionConfiguration is missing.')
+])
+def test_from_event_malformed(path, message):
+    event = copy.deepcopy(mock_codepipeline_event)
+    parent = event['CodePipeline.job']
+    for key in path[:-1]:
+        parent = parent[key]
+    del parent[path[-1]]
+
+    with pytest.raises(RuntimeError, match='Malformed CodePipeline event, ' + message.replace('[', r'\[')):
+        codepipelinejob.CodePipelineJob.from_event(event)
+
+
+def test_from_event_no_input_artifacts():
+    with pytest.raises(RuntimeError, match='You should have at least one input artifact.'):
+        codepipelinejob.CodePipelineJob.from_event(generate_pipeline_event([]))
+
+
+def test_repr_hides_credentials():
+    job = codepipelinejob.CodePipelineJob.from_event(mock_codepipeline_event)
+
+    assert repr(job) == (
+        "CodePipelineJob(job_id='sample-codepipeline-job-id', input_artifacts=[InputArtifact(BuildArtifact at "
+        "s3://sample-pipeline-artifact-store-bucket/sample-artifact-key)], user_parameters={}, "
+        "continuation_token='sample-continuation-token', artifact_credentials={'secretAccessKey': '__HIDDEN__', "
+        "'sessionToken': '__HIDDEN__', 'accessKeyId': '__HIDDEN__'})"
+    )
+
+
+def test_repr_only_rendered_when_logged(mocker):
+    job = codepipelinejob.CodePipelineJob.from_event(mock_codepipeline_event)
+    mocker.patch.object(codepipelinejob.CodePipelineJob, '__repr__', return_value='CodePipelineJob()')
+    logger = logging.getLogger('test_codepipelinejob')
+    logger.setLevel(logging.WARNING)
+
+    logger.info('job=%s', job)
+
+    codepipelinejob.CodePipelineJob.__repr__.assert_not_called()
+
+
+def test_slots():
+    job = codepipelinejob.CodePipelineJob.from_event(mock_codepipeline_event)
+
+    with pytest.raises(AttributeError):
+        job.other = 'value'
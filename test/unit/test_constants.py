@@ -1,14 +1,19 @@
 """Constants used for unit tests."""
+import io
 import json
 import os
+import zipfile
 
 
-def generate_pipeline_event(input_artifacts):
+def generate_pipeline_event(input_artifacts, user_parameters=None):
     """Generate mock pipeline event based on the input artifacts.
 
     Arguments:
         input_artifacts {dict list} -- list of input artifacts
 
+    Keyword Arguments:
+        user_parameters {dict} -- UserParameters of the action, serialized as JSON (default: {None})
+
     Returns:
         dict -- mock pipeline event based on the input artifacts
 
@@ -19,9 +24,29 @@ def generate_pipeline_event(input_artifacts):
         event = json.load(f)
 
     event['CodePipeline.job']['data']['inputArtifacts'] = input_artifacts
+    if user_parameters is not None:
+        configuration = event['CodePipeline.job']['data']['actionConfiguration']['configuration']
+        configuration['UserParameters'] = json.dumps(user_parameters)
     return event
 
 
+def generate_zipped_artifact(members):
+    """Generate zipped artifact content with the given members.
+
+    Arguments:
+        members {list} -- list of (name, content) tuples, in the order they are written to the zip
+
+    Returns:
+        bytes -- the zipped artifact
+
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for name, content in members:
+            z.writestr(name, content)
+    return buffer.getvalue()
+
+
 mock_codepipeline_event = generate_pipeline_event(
     [
         {
@@ -64,3 +89,21 @@ mock_codepipeline_event_more_than_one_input_artifacts = generate_pipeline_event(
     ]
 )
 mock_codepipeline_event_no_input_artifacts = generate_pipeline_event([])
+mock_packaged_template = '''AWSTemplateFormatVersion: '2010-09-09'
+Transform: AWS::Serverless-2016-10-31
+Metadata:
+  AWS::ServerlessRepo::Application:
+    Name: sample-app-name
+    Description: sample-description
+    Author: sample-author
+    SemanticVersion: 1.0.0
+    SourceCodeUrl: https://github.com/
+Resources:
+  MyFunction:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: s3://sample-bucket/sample-code-key
+      Handler: index.handler
+      Runtime: python3.7
+'''
+mock_application_id = 'arn:aws:serverlessrepo:us-east-1:123456789012:applications/sample-app-name'
@@ -0,0 +1,30 @@
+"""Unit test for deadline.py."""
+from mock import MagicMock
+
+import deadline
+
+
+def _context(remaining_millis):
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = remaining_millis
+    return context
+
+
+def test_no_deadline():
+    no_deadline = deadline.Deadline(None)
+
+    assert no_deadline.remaining_seconds() is None
+    assert no_deadline.call_timeout() is None
+    assert no_deadline.allows_call()
+
+
+def test_deadline(mocker):
+    mocker.patch.object(deadline.config, 'DEADLINE_RESERVE_SECONDS', 5)
+    mocker.patch.object(deadline.config, 'CLIENT_READ_TIMEOUT_SECONDS', 60)
+    mocker.patch.object(deadline.config, 'MIN_CALL_TIMEOUT_SECONDS', 3)
+
+    assert deadline.Deadline(_context(300000)).call_timeout() == 60
+    assert deadline.Deadline(_context(20000)).remaining_seconds() == 15
+    assert deadline.Deadline(_context(20000)).call_timeout() == 15
+    assert deadline.Deadline(_context(8000)).allows_call()
+    assert not deadline.Deadline(_context(7999)).allows_call()
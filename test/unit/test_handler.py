@@ -1,11 +1,30 @@
 """Unit test for handler.py."""
+import threading
 import pytest
+from types import SimpleNamespace
 
 from botocore.exceptions import ClientError
 from serverlessrepo.exceptions import S3PermissionsRequired
 
 import handler
-from test_constants import mock_codepipeline_event, mock_codepipeline_event_more_than_one_input_artifacts
+from codepipelinejob import CodePipelineJob
+from test_constants import (
+    generate_pipeline_event,
+    mock_codepipeline_event,
+    mock_codepipeline_event_more_than_one_input_artifacts,
+    mock_codepipeline_event_no_input_artifacts,
+    mock_packaged_template
+)
+
+BUILD_ARTIFACT = mock_codepipeline_event['CodePipeline.job']['data']['inputArtifacts'][0]
+JOB = CodePipelineJob.from_event(mock_codepipeline_event)
+
+
+@pytest.fixture(autouse=True)
+def clear_prefetch_cache():
+    handler.applicationprefetch.clear_cache()
+    yield
+    handler.applicationprefetch.clear_cache()
 
 
 @pytest.fixture
@@ -21,42 +40,527 @@ def mock_codepipelinehelper(mocker):
 
 
 @pytest.fixture
-def mock_serverlessrepo(mocker):
-    mocker.patch.object(handler, 'serverlessrepo')
-    return handler.serverlessrepo
+def mock_publisher(mocker):
+    mocker.patch.object(handler.publisher, 'clientfactory')
+    mocker.patch.object(handler.publisher, 'run')
+    mocker.patch.object(handler.publisher, 'prepare')
+    mocker.patch.object(handler.publisher, 'get_result')
+    return handler.publisher
 
 
-def test_publish(mock_s3helper, mock_codepipelinehelper, mock_serverlessrepo):
+def test_publish(mock_s3helper, mock_codepipelinehelper, mock_publisher):
     mock_s3helper.get_input_artifact.return_value = 'packaged_template_content'
-    mock_serverlessrepo.publish_application.return_value = _mock_publish_application_response()
+    mock_publisher.run.return_value = True
+    mock_publisher.get_result.return_value = _mock_publish_application_response()
     mock_codepipelinehelper.put_job_success.return_value = None
 
     handler.publish(mock_codepipeline_event, None)
 
-    mock_s3helper.get_input_artifact.assert_called_once_with(mock_codepipeline_event)
-    mock_serverlessrepo.publish_application.assert_called_once_with('packaged_template_content')
+    mock_s3helper.get_input_artifact.assert_called_once_with(JOB, JOB.input_artifacts[0])
+    mock_publisher.prepare.assert_called_once_with('packaged_template_content')
+    template, publication, deadline, region = mock_publisher.run.call_args[0]
+    assert template == mock_publisher.prepare.return_value
+    assert region is None
+    # the continuation token of the sample event was not created by the function
+    assert publication == handler.publisher.Publication()
+    assert deadline.remaining_seconds() is None
     mock_codepipelinehelper.put_job_success.assert_called_once_with(
         'sample-codepipeline-job-id',
         _mock_publish_application_response()
     )
+    mock_codepipelinehelper.put_job_continuation.assert_not_called()
 
 
-def test_publish_more_than_one_input_artifacts(mock_s3helper, mock_codepipelinehelper, mock_serverlessrepo):
-    exception_thrown = RuntimeError('You should only have one input artifact. Please check the setting for the action.')
-    mock_s3helper.get_input_artifact.side_effect = exception_thrown
+def test_publish_warmup_event(mock_s3helper, mock_codepipelinehelper, mocker):
+    mocker.patch.object(handler.metrics, 'emit')
+    mocker.patch.object(handler.warmup, 'warm_up', return_value={'steps': {}, 'durationMs': 1.0})
 
-    handler.publish(mock_codepipeline_event_more_than_one_input_artifacts, None)
+    assert handler.publish({'warmup': {'connect': True}}, None) == {'steps': {}, 'durationMs': 1.0}
 
-    mock_s3helper.get_input_artifact.assert_called_once_with(mock_codepipeline_event_more_than_one_input_artifacts)
-    mock_serverlessrepo.assert_not_called()
-    mock_codepipelinehelper.put_job_failure.assert_called_once_with(
+    handler.warmup.warm_up.assert_called_once_with(connect=True)
+    assert mock_codepipelinehelper.mock_calls == []
+    handler.metrics.emit.assert_not_called()
+
+
+def test_publish_invalid_metadata(mock_s3helper, mock_codepipelinehelper, mocker):
+    mocker.patch.object(handler.publisher, 'run')
+    mock_s3helper.get_input_artifact.return_value = mock_packaged_template.replace(
+        'Name: sample-app-name', 'Name: sample app name').replace('Description: sample-description', 'Labels: []')
+
+    handler.publish(mock_codepipeline_event, None)
+
+    handler.publisher.run.assert_not_called()
+    e = mock_codepipelinehelper.put_job_failure.call_args[0][1]
+    assert str(e) == "Invalid application metadata in the packaged template: Name must be letters, digits and " \
+        "hyphens, 'sample app name' is not; Description is required."
+
+
+def test_publish_emits_metrics(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    mocker.patch.object(handler.metrics, 'emit')
+    mock_s3helper.get_input_artifact.return_value = 'template-a'
+    mock_publisher.prepare.side_effect = _prepared_template
+    mock_publisher.run.return_value = False
+
+    handler.publish(mock_codepipeline_event, None)
+
+    handler.metrics.emit.assert_called_once_with('Continuation')
+    assert handler.metrics._invocation.applications == {'template-a'}
+    assert len(handler.metrics._invocation.values['InvocationDuration']) == 1
+
+
+def test_publish_emits_metrics_on_failure(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    mocker.patch.object(handler.metrics, 'emit')
+    mock_s3helper.get_input_artifact.side_effect = RuntimeError('sample error')
+
+    handler.publish(mock_codepipeline_event, None)
+
+    handler.metrics.emit.assert_called_once_with('Failure')
+
+
+def test_publish_already_published(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    mocker.patch.object(handler, 'publishcache')
+    handler.publishcache.find_published.return_value = {'application_id': 'sample-application-id', 'actions': []}
+
+    handler.publish(mock_codepipeline_event, None)
+
+    handler.publishcache.find_published.assert_called_once_with(mock_publisher.prepare.return_value, None)
+    mock_publisher.run.assert_not_called()
+    handler.publishcache.record_published.assert_not_called()
+    mock_codepipelinehelper.put_job_success.assert_called_once_with(
         'sample-codepipeline-job-id',
-        exception_thrown
+        {'application_id': 'sample-application-id', 'actions': []}
+    )
+
+
+def test_publish_records_published(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    mocker.patch.object(handler, 'publishcache')
+    handler.publishcache.find_published.return_value = None
+    mock_publisher.run.return_value = True
+    mock_publisher.get_result.return_value = _mock_publish_application_response()
+
+    handler.publish(mock_codepipeline_event, None)
+
+    handler.publishcache.record_published.assert_called_once_with(
+        mock_publisher.prepare.return_value,
+        'sample-application-id',
+        None
+    )
+
+
+@pytest.fixture
+def idempotency_store(mocker):
+    store = handler.idempotency.kvstore.MemoryStore()
+    mocker.patch.object(handler.idempotency, 'get_store', return_value=store)
+    return store
+
+
+def test_publish_completes_leases(mock_s3helper, mock_codepipelinehelper, mock_publisher, idempotency_store):
+    mock_s3helper.get_input_artifact.return_value = 'template-a'
+    mock_publisher.prepare.side_effect = _prepared_template
+    mock_publisher.run.return_value = True
+    mock_publisher.get_result.return_value = _mock_publish_application_response()
+
+    handler.publish(mock_codepipeline_event, None)
+
+    job_record = idempotency_store.get(handler.idempotency.get_job_key(JOB))
+    assert job_record['status'] == 'Completed'
+    assert job_record['result'] == {'outcome': 'Success'}
+    publish_record = idempotency_store.get('publish/default/template-a/template-a')
+    assert publish_record['result'] == _mock_publish_application_response()
+
+
+@pytest.mark.parametrize('status', ['InProgress', 'Completed'])
+def test_publish_duplicate_job(mock_s3helper, mock_codepipelinehelper, mock_publisher, idempotency_store, mocker,
+                               status):
+    mocker.patch.object(handler.metrics, 'emit')
+    idempotency_store.put(handler.idempotency.get_job_key(JOB), {
+        'status': status, 'expiresAt': handler.idempotency.time.time() + 60})
+
+    handler.publish(mock_codepipeline_event, None)
+
+    mock_s3helper.get_input_artifact.assert_not_called()
+    mock_codepipelinehelper.put_job_success.assert_not_called()
+    mock_codepipelinehelper.put_job_failure.assert_not_called()
+    handler.metrics.emit.assert_called_once_with('Duplicate')
+
+
+def test_publish_duplicate_of_published_template(mock_s3helper, mock_codepipelinehelper, mock_publisher,
+                                                 idempotency_store):
+    mock_s3helper.get_input_artifact.return_value = 'template-a'
+    mock_publisher.prepare.side_effect = _prepared_template
+    idempotency_store.put('publish/default/template-a/template-a', {
+        'status': 'Completed',
+        'result': _mock_publish_application_response(),
+        'expiresAt': handler.idempotency.time.time() + 60
+    })
+
+    handler.publish(mock_codepipeline_event, None)
+
+    mock_publisher.run.assert_not_called()
+    mock_codepipelinehelper.put_job_success.assert_called_once_with(
+        'sample-codepipeline-job-id', _mock_publish_application_response())
+
+
+def test_publish_duplicate_of_template_in_progress(mock_s3helper, mock_codepipelinehelper, mock_publisher,
+                                                   idempotency_store):
+    mock_s3helper.get_input_artifact.return_value = 'template-a'
+    mock_publisher.prepare.side_effect = _prepared_template
+    in_progress = {'status': 'InProgress', 'owner': 'other-job', 'expiresAt': handler.idempotency.time.time() + 60}
+    idempotency_store.put('publish/default/template-a/template-a', in_progress)
+
+    handler.publish(mock_codepipeline_event, None)
+
+    mock_publisher.run.assert_not_called()
+    mock_codepipelinehelper.put_job_continuation.assert_called_once()
+    assert idempotency_store.get('publish/default/template-a/template-a') == in_progress
+
+
+def test_publish_releases_leases_on_failure(mock_s3helper, mock_codepipelinehelper, mock_publisher,
+                                            idempotency_store):
+    mock_s3helper.get_input_artifact.return_value = 'template-a'
+    mock_publisher.prepare.side_effect = _prepared_template
+    mock_publisher.run.side_effect = RuntimeError('sample error')
+
+    handler.publish(mock_codepipeline_event, None)
+
+    assert idempotency_store.get('publish/default/template-a/template-a') == {'status': 'Released'}
+    assert idempotency_store.get(handler.idempotency.get_job_key(JOB))['result'] == {'outcome': 'Failure'}
+
+
+def test_publish_releases_job_lease_without_result(mock_s3helper, mock_codepipelinehelper, mock_publisher,
+                                                   idempotency_store):
+    mock_s3helper.get_input_artifact.side_effect = RuntimeError('sample error')
+    mock_codepipelinehelper.put_job_failure.side_effect = RuntimeError('sample put error')
+
+    with pytest.raises(RuntimeError, match='sample put error'):
+        handler.publish(mock_codepipeline_event, None)
+
+    assert idempotency_store.get(handler.idempotency.get_job_key(JOB)) == {'status': 'Released'}
+
+
+def test_publish_lease_until_timeout(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    mocker.patch.object(handler.idempotency, 'acquire', return_value=(None, None))
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 30000)
+
+    handler.publish(mock_codepipeline_event, context)
+
+    handler.idempotency.acquire.assert_any_call(handler.idempotency.get_job_key(JOB), 30)
+
+
+def test_publish_continuation(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    def run(template, publication, deadline, region):
+        publication.phase = handler.publisher.PHASE_CREATE_APPLICATION_VERSION
+        publication.application_id = 'sample-application-id'
+        publication.actions = ['UPDATE_APPLICATION']
+        return False
+
+    mock_s3helper.get_input_artifact.return_value = 'packaged_template_content'
+    mock_publisher.run.side_effect = run
+
+    handler.publish(mock_codepipeline_event, None)
+
+    mock_codepipelinehelper.put_job_continuation.assert_called_once_with(
+        'sample-codepipeline-job-id',
+        handler.publisher.to_continuation_token({'BuildArtifact': handler.publisher.Publication(
+            phase=handler.publisher.PHASE_CREATE_APPLICATION_VERSION,
+            application_id='sample-application-id',
+            actions=['UPDATE_APPLICATION']
+        )}),
+        'Publishing continues with phase CREATE_APPLICATION_VERSION',
+        50
+    )
+    mock_codepipelinehelper.put_job_success.assert_not_called()
+
+
+def test_publish_continued(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    previous_publication = handler.publisher.Publication(
+        phase=handler.publisher.PHASE_CREATE_APPLICATION_VERSION,
+        application_id='sample-application-id',
+        actions=['UPDATE_APPLICATION']
+    )
+    event = _event_with_continuation_token(
+        mock_codepipeline_event,
+        handler.publisher.to_continuation_token({'BuildArtifact': previous_publication})
     )
+    mock_publisher.run.return_value = True
+    mocker.patch.object(handler, 'publishcache')
+
+    handler.publish(event, None)
+
+    # only the first invocation of a job looks up published digests
+    handler.publishcache.find_published.assert_not_called()
+    assert mock_publisher.run.call_args[0][1] == previous_publication
+    mock_codepipelinehelper.put_job_success.assert_called_once_with(
+        'sample-codepipeline-job-id',
+        mock_publisher.get_result.return_value
+    )
+
+
+def test_publish_more_than_one_input_artifacts(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    mocker.patch.object(handler, 'publishcache')
+    handler.publishcache.find_published.return_value = None
+    mock_s3helper.get_input_artifact.side_effect = lambda job, input_artifact: input_artifact.name
+    mock_publisher.prepare.side_effect = _prepared_template
+    mock_publisher.run.return_value = True
+    mock_publisher.get_result.side_effect = lambda template, publication: {'application_id': template.digest}
+
+    handler.publish(mock_codepipeline_event_more_than_one_input_artifacts, None)
+
+    assert mock_s3helper.get_input_artifact.call_count == 2
+    job_id, results, latencies = mock_codepipelinehelper.put_job_successes.call_args[0]
+    assert job_id == 'sample-codepipeline-job-id'
+    assert results == {
+        'NotPackagedTemplate': {'application_id': 'NotPackagedTemplate'},
+        'BuildArtifact': {'application_id': 'BuildArtifact'}
+    }
+    assert set(latencies) == {'NotPackagedTemplate', 'BuildArtifact'}
     mock_codepipelinehelper.put_job_success.assert_not_called()
+    mock_codepipelinehelper.put_job_failure.assert_not_called()
+
+
+def test_publish_more_than_one_input_artifacts_some_failed(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    exception_thrown = RuntimeError('No file matching packaged.yml in the input artifact.')
+
+    def get_input_artifact(job, input_artifact):
+        if input_artifact.name == 'NotPackagedTemplate':
+            raise exception_thrown
+        return 'packaged_template_content'
+
+    mock_s3helper.get_input_artifact.side_effect = get_input_artifact
+    mock_publisher.run.return_value = True
+
+    handler.publish(mock_codepipeline_event_more_than_one_input_artifacts, None)
+
+    mock_publisher.run.assert_called_once()
+    mock_codepipelinehelper.put_job_failures.assert_called_once_with(
+        'sample-codepipeline-job-id',
+        {'NotPackagedTemplate': exception_thrown},
+        2
+    )
+    mock_codepipelinehelper.put_job_successes.assert_not_called()
+
+
+def test_publish_more_than_one_input_artifacts_continuation(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    def run(template, publication, deadline, region):
+        if template.digest == 'BuildArtifact':
+            publication.phase = handler.publisher.PHASE_DONE
+            return True
+        return False
+
+    mock_s3helper.get_input_artifact.side_effect = lambda job, input_artifact: input_artifact.name
+    mock_publisher.prepare.side_effect = _prepared_template
+    mock_publisher.run.side_effect = run
+
+    handler.publish(mock_codepipeline_event_more_than_one_input_artifacts, None)
+
+    continuation_token = mock_codepipelinehelper.put_job_continuation.call_args[0][1]
+    assert handler.publisher.from_continuation_token(continuation_token) == {
+        'BuildArtifact': handler.publisher.Publication(phase=handler.publisher.PHASE_DONE)
+    }
+    mock_codepipelinehelper.put_job_continuation.assert_called_once_with(
+        'sample-codepipeline-job-id',
+        continuation_token,
+        'Publishing continues for NotPackagedTemplate with phase CREATE_OR_UPDATE_APPLICATION',
+        50
+    )
+
+
+def test_publish_monorepo(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    event = generate_pipeline_event([BUILD_ARTIFACT], user_parameters={'Monorepo': True})
+    mock_s3helper.get_input_artifact_templates.return_value = [
+        ('apps/a/packaged.yml', 'template-a'),
+        ('apps/b/packaged.yml', 'template-b'),
+        ('apps/b-copy/packaged.yml', 'template-b')
+    ]
+    mock_publisher.prepare.side_effect = _prepared_template
+    mock_publisher.run.return_value = True
+    mock_publisher.get_result.side_effect = lambda template, publication: {'application_id': template.digest}
+
+    handler.publish(event, None)
+
+    mock_s3helper.get_input_artifact_templates.assert_called_once_with(
+        CodePipelineJob.from_event(event), JOB.input_artifacts[0])
+    mock_s3helper.get_input_artifact.assert_not_called()
+    # identical templates are parsed and published once
+    assert mock_publisher.prepare.call_count == 2
+    assert mock_publisher.run.call_count == 2
+    assert mock_codepipelinehelper.put_job_successes.call_args[0][1] == {
+        'BuildArtifact/apps/a/packaged.yml': {'application_id': 'template-a'},
+        'BuildArtifact/apps/b/packaged.yml': {'application_id': 'template-b'},
+        'BuildArtifact/apps/b-copy/packaged.yml': {'application_id': 'template-b'}
+    }
+
+
+def test_publish_monorepo_same_application(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    event = generate_pipeline_event([BUILD_ARTIFACT], user_parameters={'Monorepo': True})
+    mock_s3helper.get_input_artifact_templates.return_value = [
+        ('apps/a/packaged.yml', 'template-a'),
+        ('apps/b/packaged.yml', 'template-b'),
+        ('apps/c/packaged.yml', 'template-c')
+    ]
+    mock_publisher.prepare.side_effect = lambda template: _prepared_template(
+        template, 'sample-app-name' if template != 'template-a' else 'other-app-name')
+    mock_publisher.run.return_value = True
+
+    handler.publish(event, None)
+
+    mock_publisher.run.assert_called_once()
+    errors = mock_codepipelinehelper.put_job_failures.call_args[0][1]
+    assert list(errors) == ['BuildArtifact/apps/b/packaged.yml', 'BuildArtifact/apps/c/packaged.yml']
+    assert str(errors['BuildArtifact/apps/b/packaged.yml']) == (
+        'More than one template publishes application sample-app-name: '
+        'BuildArtifact/apps/b/packaged.yml, BuildArtifact/apps/c/packaged.yml')
+    assert mock_codepipelinehelper.put_job_failures.call_args[0][2] == 3
+
+
+def test_publish_regions(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    event = generate_pipeline_event([BUILD_ARTIFACT], user_parameters={'Regions': ['us-east-1', 'eu-west-1']})
+    mock_s3helper.get_input_artifact.return_value = 'template-a'
+    mock_publisher.prepare.side_effect = _prepared_template
+    mock_publisher.run.return_value = True
+    mock_publisher.get_result.return_value = {'application_id': 'sample-application-id'}
+
+    handler.publish(event, None)
+
+    # the artifact is fetched and parsed once for all the regions
+    mock_s3helper.get_input_artifact.assert_called_once()
+    mock_publisher.prepare.assert_called_once()
+    assert sorted(call[0][3] for call in mock_publisher.run.call_args_list) == ['eu-west-1', 'us-east-1']
+    job_id, results, latencies = mock_codepipelinehelper.put_job_successes.call_args[0]
+    assert list(results) == ['BuildArtifact@us-east-1', 'BuildArtifact@eu-west-1']
+    assert set(latencies) == {'BuildArtifact@us-east-1', 'BuildArtifact@eu-west-1'}
+
 
+@pytest.mark.parametrize('region_failure_policy, job_succeeds', [
+    ('all-or-nothing', False),
+    ('best-effort', True)
+])
+def test_publish_region_failed(mock_s3helper, mock_codepipelinehelper, mock_publisher, region_failure_policy,
+                               job_succeeds):
+    exception_thrown = RuntimeError('sample error')
 
-def test_publish_unable_to_get_input_artifact(mock_s3helper, mock_codepipelinehelper, mock_serverlessrepo):
+    def run(template, publication, deadline, region):
+        if region == 'eu-west-1':
+            raise exception_thrown
+        return True
+
+    event = generate_pipeline_event([BUILD_ARTIFACT], user_parameters={
+        'Regions': ['us-east-1', 'eu-west-1'],
+        'RegionFailurePolicy': region_failure_policy
+    })
+    mock_s3helper.get_input_artifact.return_value = 'template-a'
+    mock_publisher.prepare.side_effect = _prepared_template
+    mock_publisher.run.side_effect = run
+
+    handler.publish(event, None)
+
+    assert mock_codepipelinehelper.put_job_successes.called == job_succeeds
+    if job_succeeds:
+        assert mock_codepipelinehelper.put_job_successes.call_args[0][1]['BuildArtifact@eu-west-1'] is exception_thrown
+    else:
+        mock_codepipelinehelper.put_job_failures.assert_called_once_with(
+            'sample-codepipeline-job-id',
+            {'BuildArtifact@eu-west-1': exception_thrown},
+            2
+        )
+
+
+def test_publish_all_regions_failed_best_effort(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    event = generate_pipeline_event([BUILD_ARTIFACT], user_parameters={
+        'Regions': ['us-east-1', 'eu-west-1'],
+        'RegionFailurePolicy': 'best-effort'
+    })
+    mock_s3helper.get_input_artifact.side_effect = RuntimeError('sample error')
+
+    handler.publish(event, None)
+
+    mock_codepipelinehelper.put_job_failures.assert_called_once()
+    mock_codepipelinehelper.put_job_successes.assert_not_called()
+
+
+@pytest.mark.parametrize('user_parameters, message', [
+    ({'Regions': 'us-east-1'}, 'Regions must be a list of region names.'),
+    ({'Regions': ['us-east-1', 'us-east-1']}, 'Regions must not contain the same region twice.'),
+    ({'RegionFailurePolicy': 'sometimes'}, 'RegionFailurePolicy must be one of all-or-nothing, best-effort.'),
+    ({'ApplicationNames': 'sample-app-name'}, 'ApplicationNames must be a list of application names.')
+])
+def test_publish_invalid_user_parameters(mock_s3helper, mock_codepipelinehelper, mock_publisher, user_parameters,
+                                         message):
+    handler.publish(generate_pipeline_event([BUILD_ARTIFACT], user_parameters=user_parameters), None)
+
+    mock_s3helper.get_input_artifact.assert_not_called()
+    assert str(mock_codepipelinehelper.put_job_failure.call_args[0][1]) == message
+
+
+def test_publish_prefetches_application_state(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    fetching = threading.Event()
+
+    def get_input_artifact(job, input_artifact):
+        fetching.set()
+        return 'packaged_template_content'
+
+    def prefetch(targets, deadline):
+        # the state is fetched while the artifact is
+        assert fetching.wait(5)
+    mock_s3helper.get_input_artifact.side_effect = get_input_artifact
+    mocker.patch.object(handler.applicationprefetch, 'prefetch', side_effect=prefetch)
+    mock_publisher.run.return_value = True
+    mock_publisher.get_result.return_value = _mock_publish_application_response()
+    event = generate_pipeline_event([BUILD_ARTIFACT], user_parameters={'ApplicationNames': ['sample-app-name']})
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 30000,
+                              invoked_function_arn='arn:aws:lambda:us-east-1:123456789012:function:sample-function')
+
+    handler.publish(event, context)
+
+    assert handler.applicationprefetch.prefetch.call_args[0][0] == [
+        (None, 'arn:aws:serverlessrepo:us-east-1:123456789012:applications/sample-app-name')]
+    mock_codepipelinehelper.put_job_success.assert_called_once()
+
+    # the next job of the pipeline predicts the application published from the artifact
+    handler.publish(mock_codepipeline_event, None)
+
+    assert handler.applicationprefetch.prefetch.call_args[0][0] == [(None, 'sample-application-id')]
+
+
+def test_publish_prefetch_disabled(mock_s3helper, mock_codepipelinehelper, mock_publisher, mocker):
+    mocker.patch.object(handler.config, 'PREFETCH_APPLICATION_STATE', False)
+    mocker.patch.object(handler.applicationprefetch, 'predict')
+    mock_publisher.run.return_value = True
+    mock_publisher.get_result.return_value = _mock_publish_application_response()
+
+    handler.publish(mock_codepipeline_event, None)
+
+    handler.applicationprefetch.predict.assert_not_called()
+    mock_codepipelinehelper.put_job_success.assert_called_once()
+
+
+def test_publish_no_input_artifacts(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    handler.publish(mock_codepipeline_event_no_input_artifacts, None)
+
+    mock_s3helper.get_input_artifact.assert_not_called()
+    job_id, e = mock_codepipelinehelper.put_job_failure.call_args[0]
+    assert job_id == 'sample-codepipeline-job-id'
+    assert str(e).startswith('You should have at least one input artifact.')
+
+
+def test_publish_malformed_event(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    event = generate_pipeline_event([{'name': 'BuildArtifact', 'location': {}}])
+
+    handler.publish(event, None)
+
+    mock_s3helper.get_input_artifact.assert_not_called()
+    assert str(mock_codepipelinehelper.put_job_failure.call_args[0][1]) == \
+        'Malformed CodePipeline event, CodePipeline.job.data.inputArtifacts[0].location.s3Location is missing.'
+
+
+def test_publish_without_job_id(mock_s3helper, mock_codepipelinehelper, mock_publisher):
+    with pytest.raises(RuntimeError, match='Malformed CodePipeline event, CodePipeline.job.id is missing.'):
+        handler.publish({'CodePipeline.job': {}}, None)
+
+    mock_codepipelinehelper.put_job_failure.assert_not_called()
+
+
+def test_publish_unable_to_get_input_artifact(mock_s3helper, mock_codepipelinehelper, mock_publisher):
     exception_thrown = ClientError(
         {
             "Error": {
@@ -70,28 +574,28 @@ def test_publish_unable_to_get_input_artifact(mock_s3helper, mock_codepipelinehe
 
     handler.publish(mock_codepipeline_event, None)
 
-    mock_s3helper.get_input_artifact.assert_called_once_with(mock_codepipeline_event)
-    mock_serverlessrepo.assert_not_called()
+    mock_s3helper.get_input_artifact.assert_called_once_with(JOB, JOB.input_artifacts[0])
+    mock_publisher.run.assert_not_called()
     mock_codepipelinehelper.put_job_failure.assert_called_once_with(
         'sample-codepipeline-job-id',
         exception_thrown
     )
-    mock_codepipelinehelper.put_job_success_result.assert_not_called()
+    mock_codepipelinehelper.put_job_success.assert_not_called()
 
 
-def test_publish_unsuccessful(mock_s3helper, mock_codepipelinehelper, mock_serverlessrepo):
+def test_publish_unsuccessful(mock_s3helper, mock_codepipelinehelper, mock_publisher):
     exception_thrown = S3PermissionsRequired(
         bucket='some-s3-bucket',
         key='some-s3-key'
     )
     mock_s3helper.get_input_artifact.return_value = 'packaged_template_content'
-    mock_serverlessrepo.publish_application.side_effect = exception_thrown
+    mock_publisher.run.side_effect = exception_thrown
     mock_codepipelinehelper.put_job_failure.return_value = None
 
     handler.publish(mock_codepipeline_event, None)
 
-    mock_s3helper.get_input_artifact.assert_called_once_with(mock_codepipeline_event)
-    mock_serverlessrepo.publish_application.assert_called_once_with('packaged_template_content')
+    mock_s3helper.get_input_artifact.assert_called_once_with(JOB, JOB.input_artifacts[0])
+    mock_publisher.prepare.assert_called_once_with('packaged_template_content')
     mock_codepipelinehelper.put_job_failure.assert_called_once_with(
         'sample-codepipeline-job-id',
         exception_thrown
@@ -99,6 +603,16 @@ def test_publish_unsuccessful(mock_s3helper, mock_codepipelinehelper, mock_serve
     mock_codepipelinehelper.put_job_success.assert_not_called()
 
 
+def _event_with_continuation_token(event, continuation_token):
+    event = dict(event)
+    event['CodePipeline.job'] = dict(event['CodePipeline.job'])
+    event['CodePipeline.job']['data'] = dict(
+        event['CodePipeline.job']['data'],
+        continuationToken=continuation_token
+    )
+    return event
+
+
 def _mock_publish_application_response():
     return {
         'application_id': 'sample-application-id',
@@ -111,3 +625,12 @@ def _mock_publish_application_response():
             'SourceCodeUrl': 'https://github.com/'
         }
     }
+
+
+def _prepared_template(template, name=None):
+    return handler.publisher.PreparedTemplate(
+        app_metadata=SimpleNamespace(name=name or template),
+        stripped_template=template,
+        digest=template,
+        template_dict={}
+    )
@@ -0,0 +1,145 @@
+"""Unit test for idempotency.py."""
+from types import SimpleNamespace
+
+import pytest
+
+import idempotency
+import kvstore
+import metrics
+from codepipelinejob import CodePipelineJob
+from test_constants import mock_codepipeline_event
+
+
+@pytest.fixture
+def store(mocker):
+    store = kvstore.MemoryStore()
+    mocker.patch.object(idempotency, 'get_store', return_value=store)
+    return store
+
+
+@pytest.fixture
+def now(mocker):
+    return mocker.patch.object(idempotency.time, 'time', return_value=1000.0)
+
+
+def test_get_store(mocker):
+    mocker.patch.object(idempotency.config, 'IDEMPOTENCY_STORE', 'memory://')
+    idempotency.get_store.cache_clear()
+
+    assert isinstance(idempotency.get_store(), kvstore.MemoryStore)
+    assert idempotency.get_store() is idempotency.get_store()
+
+    idempotency.get_store.cache_clear()
+
+
+def test_acquire_not_configured(mocker):
+    mocker.patch.object(idempotency, 'get_store', return_value=None)
+
+    assert idempotency.acquire('sample-key') == (None, None)
+
+
+def test_get_job_key():
+    job = CodePipelineJob.from_event(mock_codepipeline_event)
+    job.continuation_token = None
+    assert idempotency.get_job_key(job) == 'job/sample-codepipeline-job-id/start'
+
+    job.continuation_token = 'sample-token'
+    assert idempotency.get_job_key(job) == \
+        'job/sample-codepipeline-job-id/0f35d0ae14518b96bd6d3fec3ca15801fd58c9e048b1ccdea11a71378f2acdc9'
+
+
+def test_get_publish_key():
+    template = SimpleNamespace(app_metadata=SimpleNamespace(name='sample-app-name'), digest='sample-digest')
+
+    assert idempotency.get_publish_key(template) == 'publish/default/sample-app-name/sample-digest'
+    assert idempotency.get_publish_key(template, 'eu-west-1') == 'publish/eu-west-1/sample-app-name/sample-digest'
+
+
+def test_acquire_and_complete(store, now):
+    lease, duplicate = idempotency.acquire('sample-key', lease_seconds=60)
+
+    assert duplicate is None
+    assert lease.record == {'status': 'InProgress', 'owner': lease.record['owner'], 'expiresAt': 1060.0}
+    assert idempotency.acquire('sample-key') == (None, lease.record)
+
+    idempotency.complete(lease, {'application_id': 'sample-application-id'})
+
+    assert idempotency.acquire('sample-key') == (None, {
+        'status': 'Completed',
+        'result': {'application_id': 'sample-application-id'},
+        'expiresAt': 1000.0 + idempotency.config.IDEMPOTENCY_RESULT_TTL_SECONDS
+    })
+
+
+def test_acquire_released(store, now):
+    lease, _ = idempotency.acquire('sample-key')
+    idempotency.release(lease)
+
+    other_lease, duplicate = idempotency.acquire('sample-key')
+
+    assert duplicate is None
+    assert other_lease.record['owner'] != lease.record['owner']
+
+
+def test_acquire_expired(store, now):
+    lease, _ = idempotency.acquire('sample-key', lease_seconds=60)
+    now.return_value = 1061.0
+
+    other_lease, duplicate = idempotency.acquire('sample-key')
+
+    assert duplicate is None
+    assert other_lease is not None
+
+
+def test_complete_lease_taken_over(store, now, mocker):
+    mock_log = mocker.patch.object(idempotency, 'LOG')
+    lease, _ = idempotency.acquire('sample-key', lease_seconds=60)
+    now.return_value = 1061.0
+    other_lease, _ = idempotency.acquire('sample-key')
+
+    idempotency.complete(lease, 'sample-result')
+
+    assert store.get('sample-key') == other_lease.record
+    assert 'taken over' in mock_log.warning.call_args[0][0]
+
+
+def test_acquire_lost_race(store, mocker):
+    other_record = {'status': 'InProgress', 'owner': 'other-owner', 'expiresAt': 2000.0}
+    mocker.patch.object(idempotency.time, 'time', return_value=1000.0)
+
+    def add(key, value):
+        # another execution adds the key between the read and the conditional write
+        store.put(key, other_record)
+        return False
+    mocker.patch.object(store, 'add', side_effect=add)
+
+    assert idempotency.acquire('sample-key') == (None, other_record)
+
+
+def test_acquire_store_error(store, mocker):
+    mock_log = mocker.patch.object(idempotency, 'LOG')
+    mocker.patch.object(store, 'get', side_effect=RuntimeError('sample error'))
+
+    metrics.reset()
+
+    assert idempotency.acquire('sample-key') == (None, None)
+    assert 'sample error' in str(mock_log.error.call_args)
+    assert metrics.get_total('IdempotencyStoreErrors') == 1
+    metrics.reset()
+
+
+def test_complete_store_error(store, mocker):
+    mock_log = mocker.patch.object(idempotency, 'LOG')
+    lease, _ = idempotency.acquire('sample-key')
+    mocker.patch.object(store, 'replace', side_effect=RuntimeError('sample error'))
+
+    idempotency.complete(lease, 'sample-result')
+
+    assert 'sample error' in str(mock_log.warning.call_args)
+
+
+def test_complete_without_lease(store):
+    idempotency.complete(None, 'sample-result')
+    idempotency.release(None)
+
+    assert store.get('sample-key') is None
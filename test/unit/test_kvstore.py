@@ -0,0 +1,196 @@
+"""Unit test for kvstore.py."""
+import io
+import json
+import threading
+
+import pytest
+
+import kvstore
+from fake_dynamodb import FakeDynamoDB
+from fake_s3 import FakeS3
+
+
+@pytest.fixture
+def fake_s3():
+    with FakeS3() as fake:
+        yield fake
+
+
+@pytest.fixture
+def fake_dynamodb():
+    with FakeDynamoDB() as fake:
+        yield fake
+
+
+def test_memory_store():
+    store = kvstore.MemoryStore()
+
+    assert store.get('sample-key') is None
+    store.put('sample-key', {'a': 1})
+    assert store.get('sample-key') == {'a': 1}
+
+
+def test_file_store(tmpdir):
+    path = str(tmpdir.join('store.json'))
+    store = kvstore.FileStore(path)
+
+    assert store.get('sample-key') is None
+    store.put('sample-key', {'a': 1})
+    store.put('another-key', 'another-value')
+
+    assert kvstore.FileStore(path).get('sample-key') == {'a': 1}
+    with open(path) as f:
+        assert json.load(f) == {'sample-key': {'a': 1}, 'another-key': 'another-value'}
+    assert sorted(tmpdir.listdir()) == [tmpdir.join('store.json'), tmpdir.join('store.json.lock')]
+
+
+def test_s3_store(fake_s3):
+    store = kvstore.S3Store('sample-bucket', 'sample-prefix/', fake_s3.client())
+
+    assert store.get('sample-key') is None
+    store.put('sample-key', {'a': 1})
+
+    assert store.get('sample-key') == {'a': 1}
+    assert json.loads(fake_s3.objects[('sample-bucket', 'sample-prefix/sample-key')].decode()) == {'a': 1}
+
+
+def test_s3_store_error(fake_s3):
+    store = kvstore.S3Store('sample-bucket', s3_client=fake_s3.client())
+    fake_s3.put_object('sample-bucket', 'sample-key', b'not json')
+    with pytest.raises(ValueError):
+        store.get('sample-key')
+
+
+def test_s3_store_function_client(mocker):
+    mocker.patch.object(kvstore, 'clientfactory')
+    s3_client = kvstore.clientfactory.get_function_s3_client.return_value
+
+    kvstore.S3Store('sample-bucket').put('sample-key', 'sample-value')
+
+    s3_client.put_object.assert_called_once_with(
+        Bucket='sample-bucket',
+        Key='sample-key',
+        Body=b'"sample-value"',
+        ContentType='application/json'
+    )
+
+
+def test_dynamodb_store(fake_dynamodb):
+    store = kvstore.DynamoDBStore('sample-table', fake_dynamodb.client())
+
+    assert store.get('sample-key') is None
+    store.put('sample-key', {'b': 2, 'a': 1})
+
+    assert store.get('sample-key') == {'a': 1, 'b': 2}
+    assert fake_dynamodb.items[('sample-table', 'sample-key')] == {
+        'key': {'S': 'sample-key'}, 'value': {'S': '{"a":1,"b":2}'}}
+
+
+def test_dynamodb_store_function_client(mocker):
+    mocker.patch.object(kvstore, 'clientfactory')
+    dynamodb_client = kvstore.clientfactory.get_function_dynamodb_client.return_value
+    dynamodb_client.get_item.return_value = {}
+
+    assert kvstore.DynamoDBStore('sample-table').get('sample-key') is None
+
+    dynamodb_client.get_item.assert_called_once_with(
+        TableName='sample-table', Key={'key': {'S': 'sample-key'}}, ConsistentRead=True)
+
+
+@pytest.fixture(params=['memory', 'file', 's3', 'dynamodb'])
+def store(request, tmpdir):
+    if request.param == 'memory':
+        yield kvstore.MemoryStore()
+    elif request.param == 'file':
+        yield kvstore.FileStore(str(tmpdir.join('store.json')))
+    elif request.param == 's3':
+        with FakeS3() as fake:
+            yield kvstore.S3Store('sample-bucket', 'sample-prefix/', fake.client())
+    else:
+        with FakeDynamoDB() as fake:
+            yield kvstore.DynamoDBStore('sample-table', fake.client())
+
+
+def test_add(store):
+    assert store.add('sample-key', {'a': 1})
+    assert not store.add('sample-key', {'a': 2})
+
+    assert store.get('sample-key') == {'a': 1}
+
+
+def test_replace(store):
+    assert not store.replace('sample-key', {'a': 2}, {'a': 1})
+    store.put('sample-key', {'a': 1, 'b': [1, 2]})
+
+    assert not store.replace('sample-key', {'a': 2}, {'a': 0})
+    assert store.replace('sample-key', {'a': 2}, {'b': [1, 2], 'a': 1})
+    assert store.get('sample-key') == {'a': 2}
+
+
+def test_file_store_add_concurrently(tmpdir):
+    path = str(tmpdir.join('store.json'))
+    added = []
+
+    def add(value):
+        # one store per thread, as in different processes
+        if kvstore.FileStore(path).add('sample-key', value):
+            added.append(value)
+    threads = [threading.Thread(target=add, args=(value,)) for value in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(added) == 1
+    assert kvstore.FileStore(path).get('sample-key') == added[0]
+
+
+def test_s3_store_replace_conflict(fake_s3, mocker):
+    store = kvstore.S3Store('sample-bucket', s3_client=fake_s3.client())
+    store.put('sample-key', {'a': 1})
+    # another execution writes the key between the read and the conditional write
+    get = store._get
+
+    def get_then_put(key):
+        result = get(key)
+        store.put(key, {'a': 3})
+        return result
+    mocker.patch.object(store, '_get', side_effect=get_then_put)
+
+    assert not store.replace('sample-key', {'a': 2}, {'a': 1})
+    assert get('sample-key')[0] == {'a': 3}
+
+
+def test_from_url(tmpdir):
+    assert isinstance(kvstore.from_url('memory://'), kvstore.MemoryStore)
+    assert isinstance(kvstore.from_url('file://' + str(tmpdir.join('store.json'))), kvstore.FileStore)
+
+    s3_store = kvstore.from_url('s3://sample-bucket/sample-prefix/')
+    assert isinstance(s3_store, kvstore.S3Store)
+    assert s3_store._bucket == 'sample-bucket'
+    assert s3_store._prefix == 'sample-prefix/'
+
+    dynamodb_store = kvstore.from_url('dynamodb://sample-table')
+    assert isinstance(dynamodb_store, kvstore.DynamoDBStore)
+    assert dynamodb_store._table_name == 'sample-table'
+
+
+@pytest.mark.parametrize('url', ['', 'file://', 's3://', 'dynamodb://', 'redis://sample-host'])
+def test_from_url_unsupported(url):
+    with pytest.raises(ValueError, match='Unsupported store URL'):
+        kvstore.from_url(url)
+
+
+def test_s3_store_conditional_writes_unsupported(mocker):
+    s3_client = mocker.MagicMock()
+    # the PutObject parameters of botocore releases before conditional writes
+    s3_client.meta.service_model.operation_model.return_value.input_shape.members = {
+        'Bucket': None, 'Key': None, 'Body': None, 'ContentType': None}
+    s3_client.get_object.return_value = {'Body': io.BytesIO(b'{"a": 1}'), 'ETag': '"sample-etag"'}
+    store = kvstore.S3Store('sample-bucket', s3_client=s3_client)
+
+    with pytest.raises(RuntimeError, match=r'does not support conditional writes to S3 \(IfNoneMatch\)'):
+        store.add('sample-key', {'a': 2})
+    with pytest.raises(RuntimeError, match=r'\(IfMatch\)'):
+        store.replace('sample-key', {'a': 2}, {'a': 1})
+    s3_client.put_object.assert_not_called()
@@ -0,0 +1,32 @@
+"""Unit test for lazyimport.py."""
+import os
+import subprocess
+import sys
+
+import lazyimport
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src')
+
+
+def test_lazy_module():
+    lazy_module = lazyimport.LazyModule('json')
+
+    assert not lazy_module.is_loaded()
+    assert lazy_module.dumps({'a': 1}) == '{"a": 1}'
+    assert lazy_module.is_loaded()
+    assert lazy_module.load() is sys.modules['json']
+    assert repr(lazy_module) == '<LazyModule json (loaded)>'
+
+
+def test_handler_import_is_lazy():
+    # run in a fresh interpreter, the test session has imported everything already. With the default configuration,
+    # X-Ray patching included, which dominates the import time when done on import
+    env = dict(os.environ)
+    for name in ('XRAY_PATCH_MODULES', 'AWS_DEFAULT_REGION'):
+        env.pop(name, None)
+
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import handler'], cwd=SRC_DIR, env=env,
+                               stderr=subprocess.PIPE, check=True)
+
+    imported = {line.split('|')[-1].strip() for line in completed.stderr.decode().splitlines()}
+    assert imported & {'aws_xray_sdk', 'serverlessrepo', 'boto3', 'botocore', 'yaml'} == set()
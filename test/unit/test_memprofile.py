@@ -0,0 +1,98 @@
+"""Unit test for memprofile.py."""
+import tracemalloc
+from collections import namedtuple
+
+import pytest
+
+import memprofile
+import metrics
+
+Frame = namedtuple('Frame', ['filename', 'lineno'])
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_profile(mocker):
+    mocker.patch.object(memprofile, 'get_peak_rss_bytes', return_value=100 * memprofile.MIB)
+    mock_log = mocker.patch.object(memprofile, 'LOG')
+
+    def handler(event, context):
+        with metrics.span('Unzip'):
+            data = [bytearray(1024) for _ in range(100)]
+        return len(data)
+
+    assert memprofile.profile(handler)({}, None) == 100
+
+    report = mock_log.info.call_args[0][1]
+    assert '"recommendedMemoryMB": 192' in report
+    assert '"Unzip": {"calls": 1' in report
+    assert not tracemalloc.is_tracing()
+    assert metrics.SPAN_LISTENERS == []
+
+
+def test_profile_raises(mocker):
+    mock_log = mocker.patch.object(memprofile, 'LOG')
+
+    def handler(event, context):
+        raise RuntimeError('error')
+
+    with pytest.raises(RuntimeError):
+        memprofile.profile(handler)({}, None)
+
+    mock_log.info.assert_called_once()
+    assert metrics.SPAN_LISTENERS == []
+
+
+def test_profiler_phases():
+    profiler = memprofile.Profiler()
+    profiler.start()
+    with metrics.span('Outer'):
+        with metrics.span('Inner'):
+            data = bytearray(1024 * 1024)
+        del data
+    report = profiler.stop()
+
+    assert report['phases']['Inner']['calls'] == 1
+    assert report['phases']['Inner']['peakBytes'] >= 1024 * 1024
+    assert report['phases']['Outer']['peakBytes'] >= report['phases']['Inner']['peakBytes']
+    assert report['phases']['Outer']['steadyBytes'] < 1024 * 1024
+    assert report['peakTracedBytes'] >= 1024 * 1024
+
+
+def test_profiler_keeps_tracing_started_elsewhere():
+    tracemalloc.start()
+    try:
+        profiler = memprofile.Profiler()
+        profiler.start()
+        profiler.stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('peak_rss_mb,memory_mb', [
+    (0, 128),
+    (50, 128),
+    (100, 192),
+    (128, 192),
+    (200, 320),
+    (10000, 10240)
+])
+def test_recommend_memory_mb(peak_rss_mb, memory_mb):
+    assert memprofile.recommend_memory_mb(peak_rss_mb * memprofile.MIB) == memory_mb
+
+
+def test_find_site():
+    traceback = [
+        Frame('/var/task/handler.py', 10),
+        Frame('/var/task/s3helper.py', 20),
+        Frame('/var/task/serverlessrepo/parser.py', 30),
+        Frame('/var/lang/lib/python3.7/json/decoder.py', 40)
+    ]
+    assert memprofile._find_site(traceback) == 'serverlessrepo/parser.py:30'
+    assert memprofile._find_site(traceback[:1]) is None
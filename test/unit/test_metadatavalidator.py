@@ -0,0 +1,70 @@
+"""Unit test for metadatavalidator.py."""
+import pytest
+
+import metadatavalidator
+
+VALID_METADATA = {
+    'Name': 'sample-app-name',
+    'Description': 'sample-description',
+    'Author': 'sample-author',
+    'SpdxLicenseId': 'Apache-2.0',
+    'LicenseUrl': 's3://sample-bucket/license-key',
+    'ReadmeUrl': 'https://sample-bucket.s3.us-east-1.amazonaws.com/readme-key',
+    'Labels': ['serverless', 'codepipeline'],
+    'HomePageUrl': 'https://github.com/sample/sample-app',
+    'SemanticVersion': '1.0.0-beta.1+build.5',
+    'SourceCodeUrl': 'https://github.com/sample/sample-app/tree/1.0.0'
+}
+
+
+def test_get_errors_valid():
+    assert metadatavalidator.get_errors(VALID_METADATA) == []
+    assert metadatavalidator.get_errors({'Name': 'a', 'Description': 'b', 'Author': 'c'}) == []
+
+
+def test_get_errors_collects_all_errors():
+    metadata = {
+        'Description': 'd' * 257,
+        'Author': 'sample--author',
+        'SpdxLicenseId': 'MIT License',
+        'LicenseBody': 'sample license',
+        'LicenseUrl': 's3://sample-bucket/license-key',
+        'ReadmeUrl': 'README.md',
+        'Labels': ['label-{}'.format(i) for i in range(11)] + ['not a label'],
+        'HomePageUrl': 'github.com/sample',
+        'SemanticVersion': 1.0
+    }
+
+    assert metadatavalidator.get_errors(metadata) == [
+        'Name is required',
+        'Description must be at most 256 characters long',
+        'Author must be lowercase letters, digits and single hyphens, not at the start or the end, '
+        "'sample--author' is not",
+        "SpdxLicenseId must be an SPDX license identifier, e.g. MIT or Apache-2.0, 'MIT License' is not",
+        "ReadmeUrl must be an S3 URL set by sam package, e.g. s3://bucket/key, 'README.md' is not",
+        "HomePageUrl must be an http or https URL, 'github.com/sample' is not",
+        'SemanticVersion must be a string, 1.0 is not',
+        'Labels has 12 labels, at most 10 are allowed',
+        "Labels[11] must be letters, digits and +-_:/@, 'not a label' is not",
+        'Only one of LicenseBody and LicenseUrl can be set'
+    ]
+
+
+@pytest.mark.parametrize('semantic_version', ['1', '1.0', '01.0.0', '1.0.0-', 'v1.0.0'])
+def test_get_errors_semantic_version(semantic_version):
+    metadata = dict(VALID_METADATA, SemanticVersion=semantic_version)
+
+    assert metadatavalidator.get_errors(metadata) == [
+        'SemanticVersion must be a semantic version, e.g. 1.0.0, {!r} is not'.format(semantic_version)]
+
+
+def test_get_errors_labels_not_list():
+    assert metadatavalidator.get_errors(dict(VALID_METADATA, Labels='serverless')) == ['Labels must be a list']
+
+
+def test_validate():
+    metadatavalidator.validate(VALID_METADATA)
+
+    with pytest.raises(RuntimeError, match='^Invalid application metadata in the packaged template: '
+                                           'Name is required; Author is required.$'):
+        metadatavalidator.validate({'Description': 'sample-description'})
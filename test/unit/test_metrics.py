@@ -0,0 +1,146 @@
+"""Unit test for metrics.py."""
+import contextvars
+import json
+from concurrent import futures
+
+import pytest
+from mock import MagicMock
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_span(mocker):
+    mocker.patch.object(metrics.time, 'monotonic', side_effect=[10.0, 10.25, 20.0, 20.5])
+
+    with metrics.span('S3Fetch'):
+        pass
+    with metrics.span('S3Fetch'):
+        pass
+
+    assert metrics._invocation.values['S3FetchDuration'] == [250.0, 500.0]
+    assert metrics._invocation.units['S3FetchDuration'] == 'Milliseconds'
+
+
+def test_span_raises(mocker):
+    mocker.patch.object(metrics.time, 'monotonic', side_effect=[10.0, 10.1])
+
+    with pytest.raises(RuntimeError):
+        with metrics.span('SarCreateApplication'):
+            raise RuntimeError('sample error')
+
+    assert len(metrics._invocation.values['SarCreateApplicationDuration']) == 1
+
+
+def test_count():
+    metrics.count('ArtifactBytes', 100, metrics.UNIT_BYTES)
+    metrics.count('ArtifactBytes', 50, metrics.UNIT_BYTES)
+    metrics.count('SarRetries', 0)
+
+    assert metrics._invocation.values == {'ArtifactBytes': [150]}
+
+
+def test_emit(capsys, mocker):
+    mocker.patch.object(metrics.time, 'time', return_value=1500000000.0)
+    mocker.patch.object(metrics.time, 'monotonic', side_effect=[1.0, 1.5])
+    with metrics.span('Unzip'):
+        metrics.count('ArtifactBytes', 1024, metrics.UNIT_BYTES)
+    metrics.add_application('sample-app-name')
+
+    entry = metrics.emit(metrics.OUTCOME_SUCCESS)
+
+    assert json.loads(capsys.readouterr().out) == entry
+    assert entry == {
+        '_aws': {
+            'Timestamp': 1500000000000,
+            'CloudWatchMetrics': [{
+                'Namespace': 'ServerlessRepoPublish',
+                'Dimensions': [['ApplicationName', 'Outcome'], ['Outcome']],
+                'Metrics': [
+                    {'Name': 'ArtifactBytes', 'Unit': 'Bytes'},
+                    {'Name': 'UnzipDuration', 'Unit': 'Milliseconds'}
+                ]
+            }]
+        },
+        'ApplicationName': 'sample-app-name',
+        'Outcome': 'Success',
+        'ApplicationNames': ['sample-app-name'],
+        'ArtifactBytes': 1024,
+        'UnzipDuration': 500.0
+    }
+
+
+@pytest.mark.parametrize('applications, application_name', [
+    ([], 'unknown'),
+    (['a', 'b'], 'multiple')
+])
+def test_emit_application_name(capsys, applications, application_name):
+    for application in applications:
+        metrics.add_application(application)
+
+    assert metrics.emit(metrics.OUTCOME_FAILURE)['ApplicationName'] == application_name
+
+
+def test_emit_disabled(capsys, mocker):
+    mocker.patch.object(metrics.config, 'METRICS_NAMESPACE', '')
+
+    assert metrics.emit(metrics.OUTCOME_SUCCESS) is None
+    assert capsys.readouterr().out == ''
+
+
+def test_emit_not_serializable(capsys):
+    metrics.add_application(MagicMock())
+
+    metrics.emit(metrics.OUTCOME_SUCCESS)
+
+    assert capsys.readouterr().out == ''
+
+
+def test_span_xray(mocker):
+    mocker.patch.object(metrics.clientfactory, '_xray_patched', True)
+    mocker.patch.object(metrics, 'xray_core')
+    recorder = metrics.xray_core.xray_recorder
+
+    with metrics.span('SarCreateApplication', application='sample-app-name', region=None):
+        pass
+
+    recorder.begin_subsegment.assert_called_once_with('SarCreateApplication')
+    recorder.begin_subsegment.return_value.put_annotation.assert_called_once_with('application', 'sample-app-name')
+    recorder.end_subsegment.assert_called_once_with()
+
+
+@pytest.mark.parametrize('in_lambda, xray_patch_modules', [(False, ('botocore',)), (True, ())])
+def test_span_xray_not_patched(mocker, monkeypatch, in_lambda, xray_patch_modules):
+    if in_lambda:
+        monkeypatch.setenv('LAMBDA_TASK_ROOT', '/var/task')
+    else:
+        monkeypatch.delenv('LAMBDA_TASK_ROOT', raising=False)
+    mocker.patch.object(metrics.clientfactory.config, 'XRAY_PATCH_MODULES', xray_patch_modules)
+    mocker.patch.object(metrics.clientfactory, '_xray_patched', False)
+    mocker.patch.object(metrics, 'xray_core')
+    metrics.clientfactory.patch_xray()
+
+    with metrics.span('S3Fetch'):
+        pass
+
+    metrics.xray_core.xray_recorder.begin_subsegment.assert_not_called()
+
+
+def test_run_isolated():
+    metrics.count('SarRetries')
+
+    def publish(count):
+        metrics.count('SarRetries', count)
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(contextvars.copy_context().run, metrics.count, 'SarThrottles').result()
+        return metrics.get_total('SarRetries'), metrics.get_total('SarThrottles')
+
+    assert metrics.run_isolated(publish, 5) == (5, 1)
+    assert metrics.get_total('SarRetries') == 1
+    assert metrics.get_total('SarThrottles') == 0
@@ -0,0 +1,87 @@
+"""Unit test for publishcache.py."""
+import pytest
+from mock import MagicMock
+
+import kvstore
+import publishcache
+import publisher
+from test_constants import mock_application_id, mock_packaged_template
+
+
+@pytest.fixture
+def store(mocker):
+    store = kvstore.MemoryStore()
+    mocker.patch.object(publishcache, 'get_store', return_value=store)
+    return store
+
+
+def test_get_store_not_configured(mocker):
+    mocker.patch.object(publishcache.config, 'PUBLISH_DIGEST_STORE', '')
+    publishcache.get_store.cache_clear()
+
+    assert publishcache.get_store() is None
+
+    publishcache.get_store.cache_clear()
+
+
+def test_get_store(mocker):
+    mocker.patch.object(publishcache.config, 'PUBLISH_DIGEST_STORE', 'memory://')
+    publishcache.get_store.cache_clear()
+
+    assert isinstance(publishcache.get_store(), kvstore.MemoryStore)
+    assert publishcache.get_store() is publishcache.get_store()
+
+    publishcache.get_store.cache_clear()
+
+
+def test_find_published(store):
+    template = publisher.prepare(mock_packaged_template)
+    assert publishcache.find_published(template) is None
+
+    publishcache.record_published(template, mock_application_id)
+
+    assert publishcache.find_published(publisher.prepare(mock_packaged_template)) == {
+        'application_id': mock_application_id,
+        'actions': [],
+        'details': {
+            'Status': 'no-op, already published',
+            'TemplateDigest': template.digest
+        }
+    }
+
+
+def test_find_published_by_region(store):
+    template = publisher.prepare(mock_packaged_template)
+    publishcache.record_published(template, mock_application_id, region_name='eu-west-1')
+
+    assert publishcache.find_published(template) is None
+    assert publishcache.find_published(template, region_name='us-west-2') is None
+    assert publishcache.find_published(template, region_name='eu-west-1')['application_id'] == mock_application_id
+    assert store.get('eu-west-1/sample-app-name')['digest'] == template.digest
+
+
+def test_find_published_changed(store):
+    publishcache.record_published(publisher.prepare(mock_packaged_template), mock_application_id)
+
+    changed_template = publisher.prepare(mock_packaged_template.replace('1.0.0', '1.0.1'))
+
+    assert publishcache.find_published(changed_template) is None
+
+
+def test_find_published_reformatted(store):
+    publishcache.record_published(publisher.prepare(mock_packaged_template), mock_application_id)
+
+    reformatted_template = publisher.prepare('# comment\n' + mock_packaged_template.replace('  ', '    '))
+
+    assert publishcache.find_published(reformatted_template) is not None
+
+
+def test_store_failures_ignored(mocker):
+    store = MagicMock()
+    store.get.side_effect = IOError('unable to read')
+    store.put.side_effect = IOError('unable to write')
+    mocker.patch.object(publishcache, 'get_store', return_value=store)
+    template = publisher.prepare(mock_packaged_template)
+
+    assert publishcache.find_published(template) is None
+    publishcache.record_published(template, mock_application_id)
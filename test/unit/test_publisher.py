@@ -0,0 +1,477 @@
+"""Unit test for publisher.py."""
+import boto3
+import pytest
+from botocore.exceptions import ReadTimeoutError
+from botocore.stub import Stubber
+from mock import MagicMock
+from serverlessrepo.exceptions import ServerlessRepoClientError
+
+import applicationstate
+import callpolicy
+import metrics
+import publisher
+from test_constants import mock_application_id, mock_packaged_template
+
+STRIPPED_TEMPLATE = publisher.prepare(mock_packaged_template).stripped_template
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    callpolicy.clear_cache()
+    applicationstate.clear_cache()
+    yield
+    callpolicy.clear_cache()
+    applicationstate.clear_cache()
+
+
+@pytest.fixture
+def single_attempt(mocker):
+    mocker.patch.object(callpolicy.config, 'CALL_MAX_ATTEMPTS', 1)
+
+
+@pytest.fixture
+def sar_client():
+    return boto3.client(
+        'serverlessrepo',
+        region_name='us-east-1',
+        aws_access_key_id='sample-access-key-id',
+        aws_secret_access_key='sample-secret-access-key'
+    )
+
+
+@pytest.fixture
+def sar_stubber(sar_client, mocker):
+    mocker.patch.object(publisher, 'clientfactory')
+    publisher.clientfactory.get_serverlessrepo_client.return_value = sar_client
+    with Stubber(sar_client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def _deadline(remaining_seconds=None, allows_call=True):
+    deadline = MagicMock()
+    deadline.remaining_seconds.return_value = remaining_seconds
+    deadline.call_timeout.return_value = remaining_seconds
+    deadline.allows_call.return_value = allows_call
+    return deadline
+
+
+def _add_conflict(stubber):
+    stubber.add_client_error(
+        'create_application',
+        service_error_code='ConflictException',
+        service_message='Application with id {} already exists.'.format(mock_application_id),
+        http_status_code=409
+    )
+
+
+def _add_get_application(stubber, author='previous-author', description='previous-description',
+                         semantic_version='0.9.0'):
+    stubber.add_response('get_application', {
+        'ApplicationId': mock_application_id,
+        'Author': author,
+        'Description': description,
+        'Version': {
+            'ApplicationId': mock_application_id,
+            'CreationTime': '2020-01-01T00:00:00Z',
+            'ParameterDefinitions': [],
+            'RequiredCapabilities': [],
+            'ResourcesSupported': True,
+            'SemanticVersion': semantic_version,
+            'TemplateUrl': 'https://serverlessrepo/template.yml'
+        }
+    }, {'ApplicationId': mock_application_id})
+
+
+def _add_update(stubber):
+    stubber.add_response('update_application', {}, {
+        'ApplicationId': mock_application_id,
+        'Author': 'sample-author',
+        'Description': 'sample-description'
+    })
+
+
+def _add_create_version(stubber):
+    stubber.add_response('create_application_version', {}, {
+        'ApplicationId': mock_application_id,
+        'SemanticVersion': '1.0.0',
+        'SourceCodeUrl': 'https://github.com/',
+        'TemplateBody': STRIPPED_TEMPLATE
+    })
+
+
+def test_prepare():
+    template = publisher.prepare(mock_packaged_template)
+
+    assert template.app_metadata.name == 'sample-app-name'
+    assert 'AWS::ServerlessRepo::Application' not in template.stripped_template
+    assert 'MyFunction' in template.stripped_template
+
+
+def test_prepare_empty_template():
+    with pytest.raises(ValueError, match='Require SAM template to publish the application'):
+        publisher.prepare('')
+
+
+def test_prepare_invalid_metadata():
+    template = mock_packaged_template.replace('SemanticVersion: 1.0.0', 'SemanticVersion: 1.0') \
+        .replace('Author: sample-author', 'Author: Sample Author')
+
+    with pytest.raises(RuntimeError) as excinfo:
+        publisher.prepare(template)
+
+    assert str(excinfo.value) == "Invalid application metadata in the packaged template: Author must be lowercase " \
+        "letters, digits and single hyphens, not at the start or the end, 'Sample Author' is not; SemanticVersion " \
+        "must be a string, 1.0 is not."
+
+
+def test_run_create_application(sar_stubber):
+    sar_stubber.add_response('create_application', {'ApplicationId': mock_application_id}, {
+        'Author': 'sample-author',
+        'Description': 'sample-description',
+        'Name': 'sample-app-name',
+        'SemanticVersion': '1.0.0',
+        'SourceCodeUrl': 'https://github.com/',
+        'TemplateBody': STRIPPED_TEMPLATE
+    })
+    template = publisher.prepare(mock_packaged_template)
+    publication = publisher.Publication()
+
+    assert publisher.run(template, publication, _deadline())
+
+    assert publisher.get_result(template, publication) == {
+        'application_id': mock_application_id,
+        'actions': ['CREATE_APPLICATION'],
+        'details': {
+            'Name': 'sample-app-name',
+            'Description': 'sample-description',
+            'Author': 'sample-author',
+            'SemanticVersion': '1.0.0',
+            'SourceCodeUrl': 'https://github.com/'
+        }
+    }
+
+
+def test_run_update_application(sar_stubber):
+    _add_conflict(sar_stubber)
+    _add_get_application(sar_stubber)
+    _add_update(sar_stubber)
+    _add_create_version(sar_stubber)
+    template = publisher.prepare(mock_packaged_template)
+    publication = publisher.Publication()
+
+    assert publisher.run(template, publication, _deadline())
+
+    assert publisher.get_result(template, publication) == {
+        'application_id': mock_application_id,
+        'actions': ['UPDATE_APPLICATION', 'CREATE_APPLICATION_VERSION'],
+        'details': {
+            'Description': 'sample-description',
+            'Author': 'sample-author',
+            'SemanticVersion': '1.0.0',
+            'SourceCodeUrl': 'https://github.com/'
+        },
+        'changed_fields': ['Author', 'Description']
+    }
+
+
+def test_run_update_changed_fields(sar_stubber):
+    _add_conflict(sar_stubber)
+    _add_get_application(sar_stubber, author='sample-author')
+    sar_stubber.add_response('update_application', {}, {
+        'ApplicationId': mock_application_id,
+        'Description': 'sample-description'
+    })
+    _add_create_version(sar_stubber)
+    template = publisher.prepare(mock_packaged_template)
+    publication = publisher.Publication()
+
+    assert publisher.run(template, publication, _deadline())
+
+    result = publisher.get_result(template, publication)
+    assert result['changed_fields'] == ['Description']
+    assert result['details'] == {
+        'Description': 'sample-description',
+        'SemanticVersion': '1.0.0',
+        'SourceCodeUrl': 'https://github.com/'
+    }
+
+
+def test_run_unchanged(sar_stubber):
+    metrics.reset()
+    _add_conflict(sar_stubber)
+    _add_get_application(sar_stubber, author='sample-author', description='sample-description',
+                         semantic_version='1.0.0')
+    template = publisher.prepare(mock_packaged_template)
+    publication = publisher.Publication()
+
+    assert publisher.run(template, publication, _deadline())
+
+    assert publisher.get_result(template, publication) == {
+        'application_id': mock_application_id,
+        'actions': [],
+        'details': {},
+        'changed_fields': []
+    }
+    assert metrics.get_total('SkippedUpdates') == 1
+    metrics.reset()
+
+
+def test_run_reuses_application_state(sar_stubber):
+    _add_conflict(sar_stubber)
+    _add_get_application(sar_stubber)
+    _add_update(sar_stubber)
+    _add_create_version(sar_stubber)
+    template = publisher.prepare(mock_packaged_template)
+
+    assert publisher.run(template, publisher.Publication(), _deadline())
+    publication = publisher.Publication()
+    assert publisher.run(template, publication, _deadline())
+
+    # the second run skips CreateApplication and compares the template with the state cached by the first one
+    assert publication.actions == []
+    assert metrics.get_total('SkippedCreates') == 1
+    sar_stubber.assert_no_pending_responses()
+    metrics.reset()
+
+
+def test_run_skips_create_of_prefetched_application(sar_stubber):
+    template = publisher.prepare(mock_packaged_template)
+    applicationstate.put('us-east-1', mock_application_id, {})
+    _add_update(sar_stubber)
+    _add_create_version(sar_stubber)
+    publication = publisher.Publication()
+
+    assert publisher.run(template, publication, _deadline())
+
+    assert publication.application_id == mock_application_id
+    assert publication.actions == ['UPDATE_APPLICATION', 'CREATE_APPLICATION_VERSION']
+    sar_stubber.assert_no_pending_responses()
+
+
+def test_run_application_state_unknown(sar_stubber):
+    _add_conflict(sar_stubber)
+    sar_stubber.add_client_error('get_application', service_error_code='AccessDeniedException',
+                                 http_status_code=403)
+    _add_update(sar_stubber)
+    _add_create_version(sar_stubber)
+    template = publisher.prepare(mock_packaged_template)
+    publication = publisher.Publication()
+
+    assert publisher.run(template, publication, _deadline())
+
+    assert publication.actions == ['UPDATE_APPLICATION', 'CREATE_APPLICATION_VERSION']
+    assert 'changed_fields' not in publisher.get_result(template, publication)
+
+
+def test_run_version_exists(sar_stubber):
+    _add_conflict(sar_stubber)
+    _add_get_application(sar_stubber)
+    _add_update(sar_stubber)
+    sar_stubber.add_client_error('create_application_version', service_error_code='ConflictException',
+                                 http_status_code=409)
+    template = publisher.prepare(mock_packaged_template)
+    publication = publisher.Publication()
+
+    assert publisher.run(template, publication, _deadline())
+
+    assert publication.actions == ['UPDATE_APPLICATION']
+    assert 'SemanticVersion' not in publisher.get_result(template, publication)['details']
+
+
+def test_run_latest_version(sar_stubber):
+    _add_conflict(sar_stubber)
+    _add_get_application(sar_stubber, semantic_version='1.0.0')
+    _add_update(sar_stubber)
+    template = publisher.prepare(mock_packaged_template)
+    publication = publisher.Publication()
+
+    assert publisher.run(template, publication, _deadline())
+
+    # no version was created, the details only list the updated fields
+    assert publisher.get_result(template, publication) == {
+        'application_id': mock_application_id,
+        'actions': ['UPDATE_APPLICATION'],
+        'details': {'Description': 'sample-description', 'Author': 'sample-author'},
+        'changed_fields': ['Author', 'Description']
+    }
+    sar_stubber.assert_no_pending_responses()
+
+
+def test_run_client_error(sar_stubber):
+    sar_stubber.add_client_error('create_application', service_error_code='BadRequestException',
+                                 service_message='Invalid request', http_status_code=400)
+
+    with pytest.raises(ServerlessRepoClientError, match='Invalid request'):
+        publisher.run(publisher.prepare(mock_packaged_template), publisher.Publication(), _deadline())
+
+
+def test_run_out_of_time(sar_stubber):
+    _add_conflict(sar_stubber)
+    _add_get_application(sar_stubber)
+    _add_update(sar_stubber)
+    deadline = _deadline(remaining_seconds=10)
+    deadline.allows_call.side_effect = [True, False]
+    publication = publisher.Publication()
+
+    assert not publisher.run(publisher.prepare(mock_packaged_template), publication, deadline)
+
+    assert publication == publisher.Publication(
+        phase=publisher.PHASE_CREATE_APPLICATION_VERSION,
+        application_id=mock_application_id,
+        actions=['UPDATE_APPLICATION'],
+        changed_fields=['Author', 'Description']
+    )
+    publisher.clientfactory.get_serverlessrepo_client.assert_called_once_with(region_name=None, timeout=10)
+
+
+def test_run_continued(sar_stubber):
+    _add_create_version(sar_stubber)
+    publication = publisher.Publication(
+        phase=publisher.PHASE_CREATE_APPLICATION_VERSION,
+        application_id=mock_application_id,
+        actions=['UPDATE_APPLICATION']
+    )
+
+    assert publisher.run(publisher.prepare(mock_packaged_template), publication, _deadline(remaining_seconds=100))
+
+    assert publication.actions == ['UPDATE_APPLICATION', 'CREATE_APPLICATION_VERSION']
+
+
+def test_run_records_metrics(sar_stubber):
+    metrics.reset()
+    _add_conflict(sar_stubber)
+    _add_get_application(sar_stubber)
+    _add_update(sar_stubber)
+    _add_create_version(sar_stubber)
+
+    assert publisher.run(publisher.prepare(mock_packaged_template), publisher.Publication(), _deadline())
+
+    recorded = metrics._invocation.values
+    assert len(recorded['TemplateParseDuration']) == 1
+    assert len(recorded['SarCreateApplicationDuration']) == 1
+    assert len(recorded['SarGetApplicationDuration']) == 1
+    assert len(recorded['SarUpdateApplicationDuration']) == 1
+    assert len(recorded['SarCreateApplicationVersionDuration']) == 1
+    metrics.reset()
+
+
+def test_run_in_region(sar_stubber):
+    _add_create_version(sar_stubber)
+    publication = publisher.Publication(
+        phase=publisher.PHASE_CREATE_APPLICATION_VERSION,
+        application_id=mock_application_id
+    )
+
+    assert publisher.run(publisher.prepare(mock_packaged_template), publication, _deadline(), region_name='eu-west-1')
+
+    publisher.clientfactory.get_serverlessrepo_client.assert_called_once_with(region_name='eu-west-1', timeout=None)
+
+
+def test_run_throttled(sar_stubber, single_attempt):
+    sar_stubber.add_client_error('create_application', service_error_code='TooManyRequestsException',
+                                 http_status_code=429)
+    publication = publisher.Publication()
+
+    assert not publisher.run(publisher.prepare(mock_packaged_template), publication, _deadline(remaining_seconds=100))
+
+    assert publication == publisher.Publication(attempts=1)
+
+
+def test_run_throttled_and_retried(sar_stubber, mocker):
+    mocker.patch.object(callpolicy.time, 'sleep')
+    metrics.reset()
+    sar_stubber.add_client_error('create_application', service_error_code='TooManyRequestsException',
+                                 http_status_code=429)
+    sar_stubber.add_response('create_application', {'ApplicationId': mock_application_id})
+    publication = publisher.Publication()
+
+    assert publisher.run(publisher.prepare(mock_packaged_template), publication, _deadline(remaining_seconds=100))
+
+    assert publication.actions == ['CREATE_APPLICATION']
+    assert metrics.get_total('SarThrottles') == 1
+    assert metrics.get_total('SarRetries') == 1
+    metrics.reset()
+
+
+def test_run_server_error(sar_stubber, single_attempt):
+    sar_stubber.add_client_error('create_application', service_error_code='InternalServerErrorException',
+                                 http_status_code=500)
+    publication = publisher.Publication()
+
+    assert not publisher.run(publisher.prepare(mock_packaged_template), publication, _deadline(remaining_seconds=100))
+
+    assert publication == publisher.Publication(attempts=1)
+
+
+def test_run_timed_out_too_often(mocker, single_attempt):
+    mocker.patch.object(publisher, 'clientfactory')
+    sar_client = publisher.clientfactory.get_serverlessrepo_client.return_value
+    sar_client.create_application.side_effect = ReadTimeoutError(endpoint_url='https://serverlessrepo')
+    publication = publisher.Publication(attempts=publisher.config.MAX_PHASE_ATTEMPTS - 1)
+
+    with pytest.raises(ReadTimeoutError):
+        publisher.run(publisher.prepare(mock_packaged_template), publication, _deadline(remaining_seconds=100))
+
+
+def test_run_throttled_without_deadline(sar_stubber, single_attempt):
+    sar_stubber.add_client_error('create_application', service_error_code='TooManyRequestsException',
+                                 http_status_code=429)
+
+    with pytest.raises(publisher.botocore_exceptions.ClientError, match='TooManyRequestsException'):
+        publisher.run(publisher.prepare(mock_packaged_template), publisher.Publication(), _deadline())
+
+
+def test_continuation_token():
+    publication = publisher.Publication(
+        phase=publisher.PHASE_CREATE_APPLICATION_VERSION,
+        application_id=mock_application_id,
+        actions=['UPDATE_APPLICATION'],
+        attempts=2
+    )
+
+    publications = {'BuildArtifact': publication, 'OtherArtifact': publisher.Publication()}
+
+    # publications that have not started are left out
+    assert publisher.from_continuation_token(publisher.to_continuation_token(publications)) == {
+        'BuildArtifact': publication
+    }
+    assert len(publisher.to_continuation_token(publications)) <= 2048
+
+
+def test_continuation_token_many_templates():
+    publications = {'apps/sample-app-{}/packaged.yml'.format(i): publisher.Publication(
+        phase=publisher.PHASE_DONE,
+        application_id='{}-{}'.format(mock_application_id, i)
+    ) for i in range(12)}
+
+    assert publisher.from_continuation_token(publisher.to_continuation_token(publications)) == publications
+
+
+def test_continuation_token_too_long():
+    publications = {'BuildArtifact{}'.format(i): publisher.Publication(
+        phase=publisher.PHASE_DONE,
+        application_id=mock_application_id,
+        actions=['UPDATE_APPLICATION', 'CREATE_APPLICATION_VERSION']
+    ) for i in range(20)}
+
+    with pytest.raises(RuntimeError, match='The progress of publishing 20 templates does not fit'):
+        publisher.to_continuation_token(publications)
+
+
+@pytest.mark.parametrize('continuation_token', [
+    None,
+    'sample-continuation-token',
+    '{"version": 1, "publication": {"phase": "DONE"}}',
+    '{"version": 2, "publications": {"BuildArtifact": {"phase": "UNKNOWN"}}}',
+    '{"version": 2, "publications": []}',
+    '{"version": 2}'
+])
+def test_continuation_token_not_created_by_function(continuation_token):
+    assert publisher.from_continuation_token(continuation_token) == {}
+
+
+def test_percent_complete():
+    assert publisher.Publication().percent_complete() == 0
+    assert publisher.Publication(phase=publisher.PHASE_CREATE_APPLICATION_VERSION).percent_complete() == 50
+    assert publisher.Publication(phase=publisher.PHASE_DONE).percent_complete() == 100
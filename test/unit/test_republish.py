@@ -0,0 +1,224 @@
+"""Unit test for republish.py."""
+import json
+import threading
+
+import pytest
+
+from fake_s3 import FakeS3
+from fake_serverlessrepo import FakeServerlessRepo
+
+import applicationstate
+import artifactcache
+import callpolicy
+import clientfactory
+import kvstore
+import metrics
+import republish
+from test_constants import generate_zipped_artifact, mock_packaged_template
+
+
+@pytest.fixture(autouse=True)
+def reset(mocker, tmp_path):
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_DIR', str(tmp_path / 'artifact-cache'))
+    metrics.reset()
+    callpolicy.clear_cache()
+    applicationstate.clear_cache()
+    artifactcache.clear_cache()
+    yield
+    metrics.reset()
+    callpolicy.clear_cache()
+    applicationstate.clear_cache()
+    artifactcache.clear_cache()
+
+
+@pytest.fixture
+def fake_sar(mocker):
+    with FakeServerlessRepo() as fake:
+        mocker.patch.object(republish.publisher.clientfactory, 'get_serverlessrepo_client',
+                            side_effect=lambda region_name=None, timeout=None: fake.client(region_name or 'us-east-1'))
+        yield fake
+
+
+@pytest.fixture
+def fake_s3(mocker):
+    with FakeS3() as fake:
+        mocker.patch.object(republish.clientfactory, 'get_function_s3_client', return_value=fake.client())
+        yield fake
+
+
+def _template(name, semantic_version='1.0.0'):
+    return mock_packaged_template.replace('sample-app-name', name).replace('1.0.0', semantic_version)
+
+
+def _operations(fake_sar):
+    return sorted((request['operation'], request['application'].rpartition('/')[2]) for request in fake_sar.requests)
+
+
+def test_get_templates_directory(tmp_path):
+    (tmp_path / 'app-a').mkdir()
+    (tmp_path / 'app-a' / 'packaged.yml').write_text(_template('app-a'))
+    (tmp_path / 'app-b').mkdir()
+    (tmp_path / 'app-b' / 'template.yaml').write_text('Resources: {}')
+    (tmp_path / 'README.md').write_text(_template('not-a-template'))
+
+    assert republish.get_templates(str(tmp_path)) == [('app-a/packaged.yml', _template('app-a'))]
+    assert republish.get_templates(str(tmp_path), 'app-b/*') == []
+
+
+def test_get_templates_directory_too_large(tmp_path, mocker):
+    mocker.patch.object(republish.config, 'MAX_TEMPLATE_BYTES', 10)
+    (tmp_path / 'packaged.yml').write_text(_template('app-a'))
+
+    [(name, e)] = republish.get_templates(str(tmp_path))
+
+    assert name == 'packaged.yml'
+    assert 'larger than 10 bytes' in str(e)
+
+
+def test_get_templates_zip(tmp_path):
+    zip_path = tmp_path / 'templates.zip'
+    zip_path.write_bytes(generate_zipped_artifact([
+        ('app-a/packaged.yml', _template('app-a')),
+        ('app-b/packaged.yml', _template('app-b'))
+    ]))
+
+    assert republish.get_templates(str(zip_path)) == [
+        ('app-a/packaged.yml', _template('app-a')),
+        ('app-b/packaged.yml', _template('app-b'))
+    ]
+
+
+def test_get_templates_s3(fake_s3):
+    fake_s3.put_object('sample-bucket', 'templates/artifact.zip', generate_zipped_artifact([
+        ('packaged.yml', _template('app-a'))
+    ]))
+    fake_s3.put_object('sample-bucket', 'templates/app-b/packaged.yml', _template('app-b').encode())
+    fake_s3.put_object('sample-bucket', 'templates/app-b/README.md', b'# app-b')
+    fake_s3.put_object('sample-bucket', 'templates/empty.zip', generate_zipped_artifact([('README.md', '# empty')]))
+    fake_s3.put_object('sample-bucket', 'other/packaged.yml', _template('app-c').encode())
+
+    templates = republish.get_templates('s3://sample-bucket/templates/')
+
+    assert templates[:2] == [
+        ('templates/app-b/packaged.yml', _template('app-b')),
+        ('templates/artifact.zip/packaged.yml', _template('app-a'))
+    ]
+    name, e = templates[2]
+    assert name == 'templates/empty.zip'
+    assert str(e).startswith('No template with AWS::ServerlessRepo::Application metadata')
+
+
+def test_get_templates_unsupported_source(tmp_path):
+    (tmp_path / 'packaged.yml').write_text(_template('app-a'))
+
+    with pytest.raises(RuntimeError, match='is not a directory, a zip file or an s3'):
+        republish.get_templates(str(tmp_path / 'packaged.yml'))
+
+
+def test_republish_resumes_from_checkpoint(fake_sar):
+    checkpoint = kvstore.MemoryStore()
+    templates = [('app-{}/packaged.yml'.format(i), _template('app-{}'.format(i))) for i in range(5)]
+
+    report = republish.republish(templates, concurrency=3, checkpoint=checkpoint)
+
+    assert {k: report[k] for k in ('templates', 'targets', 'published', 'skipped', 'failed')} == {
+        'templates': 5, 'targets': 5, 'published': 5, 'skipped': 0, 'failed': 0}
+    assert _operations(fake_sar) == sorted(
+        [('CreateApplication', 'app-{}'.format(i)) for i in range(5)])
+    assert checkpoint.get('republish/default/app-0/packaged.yml')['application_id'] == \
+        'arn:aws:serverlessrepo:us-east-1:123456789012:applications/app-0'
+
+    # a rerun only publishes the template that changed since
+    del fake_sar.requests[:]
+    templates[1] = ('app-1/packaged.yml', _template('app-1', semantic_version='1.1.0'))
+    report = republish.republish(templates, checkpoint=checkpoint)
+
+    assert (report['published'], report['skipped']) == (1, 4)
+    # the state of the application was cached by the first run, only the new version is created
+    assert _operations(fake_sar) == [('CreateApplicationVersion', 'app-1')]
+    assert report['SkippedCreates'] == 1
+
+
+def test_republish_failures(fake_sar):
+    checkpoint = kvstore.MemoryStore()
+    templates = [
+        ('app-a/packaged.yml', _template('app-a')),
+        ('app-b/packaged.yml', RuntimeError('sample error')),
+        ('app-c/packaged.yml', _template('app-c').replace('Author: sample-author', 'Author: Sample Author'))
+    ]
+
+    report = republish.republish(templates, regions=['us-east-1', 'eu-west-1'], checkpoint=checkpoint)
+
+    assert (report['targets'], report['published'], report['failed']) == (6, 2, 4)
+    assert report['failures']['app-b/packaged.yml@eu-west-1'] == 'sample error'
+    assert 'Author must be lowercase' in report['failures']['app-c/packaged.yml@us-east-1']
+    assert checkpoint.get('republish/eu-west-1/app-a/packaged.yml') is not None
+    assert checkpoint.get('republish/eu-west-1/app-c/packaged.yml') is None
+
+
+def test_republish_same_application(fake_sar):
+    templates = [
+        ('app-a/packaged.yml', _template('app-a')),
+        ('copy-of-app-a/packaged.yml', _template('app-a')),
+        ('app-a-v2/packaged.yml', _template('app-a', semantic_version='2.0.0')),
+        ('app-b/packaged.yml', _template('app-b'))
+    ]
+
+    report = republish.republish(templates, regions=['us-east-1', 'eu-west-1'], concurrency=4)
+
+    assert (report['targets'], report['published'], report['failed']) == (8, 2, 6)
+    assert report['failures']['copy-of-app-a/packaged.yml@eu-west-1'] == \
+        'More than one template publishes application app-a: app-a/packaged.yml, app-a-v2/packaged.yml'
+    assert {application for _, application in _operations(fake_sar)} == {'app-b'}
+
+
+def test_republish_stopping(fake_sar):
+    stopping = threading.Event()
+    stopping.set()
+
+    report = republish.republish([('packaged.yml', _template('app-a'))], stopping=stopping)
+
+    assert (report['targets'], report['notStarted']) == (1, 1)
+    assert fake_sar.requests == []
+
+
+def test_main(fake_sar, tmp_path, capsys, mocker):
+    mocker.patch.object(republish.config, 'CALL_MAX_RATE_PER_SECOND', 10)
+    mocker.patch.object(republish.signal, 'signal')
+    (tmp_path / 'templates').mkdir()
+    (tmp_path / 'templates' / 'packaged.yml').write_text(_template('app-a'))
+    argv = [str(tmp_path / 'templates'), '--max-rate', '5', '--concurrency', '2',
+            '--checkpoint', 'file://{}'.format(tmp_path / 'checkpoint.json')]
+
+    assert republish.main(argv) == 0
+    assert json.loads(capsys.readouterr().out)['published'] == 1
+    assert republish.config.CALL_MAX_RATE_PER_SECOND == 5
+
+    assert republish.main(argv) == 0
+    assert json.loads(capsys.readouterr().out)['skipped'] == 1
+
+    # invalid metadata
+    (tmp_path / 'templates' / 'packaged.yml').write_text(_template('app-a').replace('sample-author', 'Sample'))
+    assert republish.main(argv) == 1
+
+
+def test_main_outside_lambda(tmp_path, capsys, mocker, monkeypatch):
+    # the clients come from clientfactory as in a real run, without a Lambda environment nor X-Ray segment
+    monkeypatch.delenv('LAMBDA_TASK_ROOT', raising=False)
+    mocker.patch.object(republish.signal, 'signal')
+    mocker.patch.object(clientfactory.config, 'XRAY_PATCH_MODULES', ('botocore',))
+    mocker.patch.object(clientfactory, '_xray_patched', False)
+    mock_xray_patch = mocker.patch('aws_xray_sdk.core.patch')
+    (tmp_path / 'packaged.yml').write_text(_template('app-a'))
+    clientfactory.clear_cache()
+    with FakeServerlessRepo() as fake:
+        mocker.patch.object(clientfactory, 'boto3')
+        clientfactory.boto3.client.side_effect = lambda service_name, region_name=None, **kwargs: \
+            fake.client(region_name or 'us-east-1')
+
+        assert republish.main([str(tmp_path), '--regions', 'us-east-1,eu-west-1']) == 0
+
+    assert json.loads(capsys.readouterr().out)['published'] == 2
+    assert _operations(fake).count(('CreateApplication', 'app-a')) == 2
+    mock_xray_patch.assert_not_called()
+    clientfactory.clear_cache()
@@ -1,21 +1,37 @@
-"""Unit test for handler.py."""
+"""Unit test for s3helper.py."""
+import io
+import os
 import pytest
+import zipfile
 from mock import MagicMock
 
 from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
 
+import artifactcache
 import s3helper
+from codepipelinejob import CodePipelineJob
+from fake_s3 import FakeS3
 from test_constants import (
+    generate_pipeline_event,
+    generate_zipped_artifact,
     mock_codepipeline_event,
-    mock_codepipeline_event_more_than_one_input_artifacts,
-    mock_codepipeline_event_no_input_artifacts
+    mock_codepipeline_event_more_than_one_input_artifacts
 )
 
 
+@pytest.fixture(autouse=True)
+def artifact_cache_dir(mocker, tmp_path):
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_DIR', str(tmp_path / 'artifact-cache'))
+    artifactcache.clear_cache()
+    yield tmp_path / 'artifact-cache'
+    artifactcache.clear_cache()
+
+
 @pytest.fixture
-def mock_boto3(mocker):
-    mocker.patch.object(s3helper, 'boto3')
-    return s3helper.boto3
+def mock_clientfactory(mocker):
+    mocker.patch.object(s3helper, 'clientfactory')
+    return s3helper.clientfactory
 
 
 @pytest.fixture
@@ -24,54 +40,148 @@ def mock_zipfile(mocker):
     return s3helper.zipfile
 
 
-def test_get_input_artifact(mock_boto3, mock_zipfile):
-    zipped_content_as_bytes = b'zipped_packaged_template_content'
+TAIL_RANGE = 'bytes=-{}'.format(s3helper.config.RANGED_FETCH_TAIL_BYTES)
+ARTIFACT_BUCKET = 'sample-pipeline-artifact-store-bucket'
+ARTIFACT_KEY = 'sample-artifact-key'
+JOB = CodePipelineJob.from_event(mock_codepipeline_event)
+SEVERAL_ARTIFACTS_JOB = CodePipelineJob.from_event(mock_codepipeline_event_more_than_one_input_artifacts)
+BUILD_ARTIFACT = JOB.input_artifacts[0]
+
+
+@pytest.fixture
+def fake_s3(mock_clientfactory):
+    with FakeS3() as fake:
+        mock_clientfactory.get_s3_client.return_value = fake.client()
+        yield fake
+
+
+def _get_object_response(data):
+    return {
+        'ContentLength': len(data),
+        'Body': StreamingBody(io.BytesIO(data), len(data))
+    }
+
+
+def test_get_input_artifact(mock_clientfactory):
     expected_result = 'packaged_template_content'
 
     mock_s3 = MagicMock()
-    mock_boto3.client.return_value = mock_s3
-    mock_s3.get_object.return_value.get.return_value.read.return_value = zipped_content_as_bytes
-    mock_zipfile_object = MagicMock()
-    mock_zipfile.ZipFile.return_value = mock_zipfile_object
-    mock_zipfile_object.read.return_value = bytes(expected_result, encoding='utf-8')
+    mock_clientfactory.get_s3_client.return_value = mock_s3
+    mock_s3.get_object.return_value = _get_object_response(
+        generate_zipped_artifact([('packaged.yml', expected_result)])
+    )
 
-    assert s3helper.get_input_artifact(mock_codepipeline_event) == expected_result
+    assert s3helper.get_input_artifact(JOB) == expected_result
 
+    mock_clientfactory.get_s3_client.assert_called_once_with(
+        mock_codepipeline_event['CodePipeline.job']['data']['artifactCredentials']
+    )
     mock_s3.get_object.assert_called_once_with(
         Bucket='sample-pipeline-artifact-store-bucket',
-        Key='sample-artifact-key'
+        Key='sample-artifact-key',
+        Range=TAIL_RANGE
+    )
+
+
+def test_get_input_artifact_spooled_to_disk(mock_clientfactory, mocker, tmpdir):
+    mocker.patch.object(s3helper.config, 'ARTIFACT_SPOOL_MEMORY_BYTES', 16)
+    mocker.patch.object(s3helper.config, 'ARTIFACT_SPOOL_DIR', str(tmpdir))
+    expected_result = 'packaged_template_content' * 1000
+
+    mock_s3 = MagicMock()
+    mock_clientfactory.get_s3_client.return_value = mock_s3
+    mock_s3.get_object.return_value = _get_object_response(
+        generate_zipped_artifact([('packaged.yml', expected_result)])
     )
 
+    assert s3helper.get_input_artifact(JOB) == expected_result
+    # the spooled file is removed once the template is unzipped
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_get_input_artifact_too_large(mock_clientfactory, mock_zipfile, mocker):
+    mocker.patch.object(s3helper.config, 'MAX_ARTIFACT_BYTES', 10)
 
-def test_get_input_artifact_more_than_one_input_artifacts(mock_boto3, mock_zipfile):
     mock_s3 = MagicMock()
-    mock_boto3.client.return_value = mock_s3
+    mock_clientfactory.get_s3_client.return_value = mock_s3
+    mock_s3.get_object.return_value = {'ContentLength': 11, 'Body': MagicMock()}
+
+    with pytest.raises(RuntimeError, match='The input artifact is larger than 10 bytes'):
+        s3helper.get_input_artifact(JOB)
+
+    mock_s3.get_object.return_value['Body'].iter_chunks.return_value.__iter__.assert_not_called()
+    mock_zipfile.assert_not_called()
+
+
+def test_get_input_artifact_body_longer_than_content_length(mock_clientfactory, mock_zipfile, mocker):
+    mocker.patch.object(s3helper.config, 'MAX_ARTIFACT_BYTES', 10)
+
+    mock_s3 = MagicMock()
+    mock_clientfactory.get_s3_client.return_value = mock_s3
+    mock_s3.get_object.return_value = {'ContentLength': 5, 'Body': MagicMock()}
+    mock_s3.get_object.return_value['Body'].iter_chunks.return_value = [b'123456', b'789012']
+
+    with pytest.raises(RuntimeError, match='The input artifact is larger than 10 bytes'):
+        s3helper.get_input_artifact(JOB)
+
+    mock_zipfile.assert_not_called()
+
+
+def test_get_input_artifact_template_too_large(mock_clientfactory, mocker):
+    mocker.patch.object(s3helper.config, 'MAX_TEMPLATE_BYTES', 10)
+
+    mock_s3 = MagicMock()
+    mock_clientfactory.get_s3_client.return_value = mock_s3
+    mock_s3.get_object.return_value = _get_object_response(
+        generate_zipped_artifact([('packaged.yml', 'packaged_template_content')])
+    )
+
+    with pytest.raises(RuntimeError, match='The packaged template packaged.yml is larger than 10 bytes'):
+        s3helper.get_input_artifact(JOB)
+
+
+def test_get_input_artifact_more_than_one_input_artifacts(mock_clientfactory, mock_zipfile):
+    mock_s3 = MagicMock()
+    mock_clientfactory.get_s3_client.return_value = mock_s3
 
     with pytest.raises(
         RuntimeError,
         match='You should only have one input artifact. Please check the setting for the action.'
     ):
-        s3helper.get_input_artifact(mock_codepipeline_event_more_than_one_input_artifacts)
+        s3helper.get_input_artifact(SEVERAL_ARTIFACTS_JOB)
 
     mock_s3.get_object.assert_not_called()
     mock_zipfile.assert_not_called()
 
 
-def test_get_input_artifact_no_input_artifacts(mock_boto3, mock_zipfile):
+def test_get_input_artifact_of_several(mock_clientfactory, mocker):
     mock_s3 = MagicMock()
-    mock_boto3.client.return_value = mock_s3
+    mock_clientfactory.get_s3_client.return_value = mock_s3
+    mocker.patch.object(s3helper, '_open_artifact', return_value=(MagicMock(), None))
+    mocker.patch.object(s3helper, '_unzip_as_string', return_value='packaged_template_content')
+    input_artifact = SEVERAL_ARTIFACTS_JOB.input_artifacts[0]
+
+    assert s3helper.get_input_artifact(SEVERAL_ARTIFACTS_JOB, input_artifact) == \
+        'packaged_template_content'
+    s3helper._open_artifact.assert_called_once_with(
+        mock_s3, 'sample-pipeline-artifact-store-bucket', 'sample-artifact-key1', None)
+
+
+def test_get_input_artifact_no_input_artifacts(mock_clientfactory, mock_zipfile):
+    mock_s3 = MagicMock()
+    mock_clientfactory.get_s3_client.return_value = mock_s3
 
     with pytest.raises(
         RuntimeError,
         match='You should only have one input artifact. Please check the setting for the action.'
     ):
-        s3helper.get_input_artifact(mock_codepipeline_event_no_input_artifacts)
+        s3helper.get_input_artifact(CodePipelineJob('sample-codepipeline-job-id', JOB.artifact_credentials, ()))
 
     mock_s3.get_object.assert_not_called()
     mock_zipfile.assert_not_called()
 
 
-def test_get_input_artifact_unable_to_get_artifact(mock_boto3, mock_zipfile):
+def test_get_input_artifact_unable_to_get_artifact(mock_clientfactory, mock_zipfile):
     exception_thrown = ClientError(
         {
             "Error": {
@@ -82,15 +192,305 @@ def test_get_input_artifact_unable_to_get_artifact(mock_boto3, mock_zipfile):
         "GetObject"
     )
     mock_s3 = MagicMock()
-    mock_boto3.client.return_value = mock_s3
+    mock_clientfactory.get_s3_client.return_value = mock_s3
     mock_s3.get_object.side_effect = exception_thrown
 
     with pytest.raises(ClientError) as excinfo:
-        s3helper.get_input_artifact(mock_codepipeline_event)
+        s3helper.get_input_artifact(JOB)
     assert 'Access Denied' in str(excinfo.value)
 
     mock_s3.get_object.assert_called_once_with(
         Bucket='sample-pipeline-artifact-store-bucket',
-        Key='sample-artifact-key'
+        Key='sample-artifact-key',
+        Range=TAIL_RANGE
     )
     mock_zipfile.assert_not_called()
+
+
+def test_get_input_artifact_ranged(fake_s3):
+    expected_result = 'packaged_template_content'
+    # incompressible content the publisher never reads
+    bundled_code = os.urandom(4 * 1024 * 1024)
+    artifact = generate_zipped_artifact([('packaged.yml', expected_result), ('bundle.bin', bundled_code)])
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, artifact)
+
+    assert s3helper.get_input_artifact(JOB) == expected_result
+
+    # the central directory at the end, then the template member
+    assert [request['range'] for request in fake_s3.requests] == [
+        TAIL_RANGE,
+        'bytes=0-{}'.format(30 + len('packaged.yml') + 1024 + _compressed_size(artifact, 'packaged.yml') - 1)
+    ]
+    assert fake_s3.bytes_sent < 200 * 1024
+
+
+def test_get_input_artifact_ranged_small_object(fake_s3, mocker):
+    mocker.patch.object(s3helper.config, 'RANGED_FETCH_TAIL_BYTES', 1024)
+    expected_result = 'packaged_template_content'
+    artifact = generate_zipped_artifact([('packaged.yml', expected_result), ('bundle.bin', os.urandom(4096))])
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, artifact)
+
+    assert s3helper.get_input_artifact(JOB) == expected_result
+
+    # the rest of the object is fetched instead of going through ranged reads
+    assert [request['range'] for request in fake_s3.requests] == [
+        'bytes=-1024',
+        'bytes=0-{}'.format(len(artifact) - 1024 - 1)
+    ]
+    assert fake_s3.bytes_sent == len(artifact)
+
+
+def test_get_input_artifact_ranged_object_smaller_than_tail(fake_s3):
+    expected_result = 'packaged_template_content'
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([('packaged.yml', expected_result)]))
+
+    assert s3helper.get_input_artifact(JOB) == expected_result
+
+    assert [request['range'] for request in fake_s3.requests] == [TAIL_RANGE]
+
+
+def test_get_input_artifact_ranges_not_supported(fake_s3):
+    fake_s3.honor_ranges = False
+    expected_result = 'packaged_template_content'
+    artifact = generate_zipped_artifact(
+        [('packaged.yml', expected_result), ('bundle.bin', os.urandom(2 * 1024 * 1024))]
+    )
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, artifact)
+
+    assert s3helper.get_input_artifact(JOB) == expected_result
+
+    assert len(fake_s3.requests) == 1
+    assert fake_s3.bytes_sent == len(artifact)
+
+
+def test_get_input_artifact_ranged_fetch_disabled(fake_s3, mocker):
+    mocker.patch.object(s3helper.config, 'RANGED_ARTIFACT_FETCH', False)
+    expected_result = 'packaged_template_content'
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([('packaged.yml', expected_result)]))
+
+    assert s3helper.get_input_artifact(JOB) == expected_result
+
+    assert [request['range'] for request in fake_s3.requests] == [None]
+
+
+def _compressed_size(artifact, name):
+    return zipfile.ZipFile(io.BytesIO(artifact)).getinfo(name).compress_size
+
+
+def _job_with_user_parameters(user_parameters):
+    return CodePipelineJob.from_event(generate_pipeline_event(
+        mock_codepipeline_event['CodePipeline.job']['data']['inputArtifacts'],
+        user_parameters
+    ))
+
+
+def test_get_input_artifact_template_path(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([
+        ('src/handler.py', 'handler_content'),
+        ('app/packaged.yml', 'packaged_template_content'),
+        ('app/packaged.yml.bak', 'previous_packaged_template_content')
+    ]))
+
+    job = _job_with_user_parameters({'TemplatePath': 'app/packaged.yml'})
+    assert s3helper.get_input_artifact(job) == 'packaged_template_content'
+
+
+def test_get_input_artifact_template_path_glob(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([
+        ('src/handler.py', 'handler_content'),
+        ('app/packaged-template.yml', 'packaged_template_content')
+    ]))
+
+    job = _job_with_user_parameters({'TemplatePath': '*/packaged-*.yml'})
+    assert s3helper.get_input_artifact(job) == 'packaged_template_content'
+
+
+def test_get_input_artifact_template_path_from_config(fake_s3, mocker):
+    mocker.patch.object(s3helper.config, 'TEMPLATE_PATH', '*.yaml')
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([
+        ('README.md', 'readme_content'),
+        ('packaged.yaml', 'packaged_template_content')
+    ]))
+
+    assert s3helper.get_input_artifact(JOB) == 'packaged_template_content'
+
+
+def test_get_input_artifact_template_path_user_parameters_precedence(fake_s3, mocker):
+    mocker.patch.object(s3helper.config, 'TEMPLATE_PATH', 'packaged.yaml')
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([
+        ('packaged.yaml', 'packaged_template_content'),
+        ('other/packaged.yaml', 'other_packaged_template_content')
+    ]))
+
+    job = _job_with_user_parameters({'TemplatePath': 'other/packaged.yaml'})
+    assert s3helper.get_input_artifact(job) == 'other_packaged_template_content'
+
+
+def test_get_input_artifact_template_path_no_match(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([('src/handler.py', 'handler_content')]))
+
+    job = _job_with_user_parameters({'TemplatePath': '*.yml'})
+    with pytest.raises(RuntimeError, match=r'No file matching \*.yml in the input artifact.'):
+        s3helper.get_input_artifact(job)
+
+
+def test_get_input_artifact_template_path_more_than_one_match(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([
+        ('b/packaged.yml', 'packaged_template_content'),
+        ('a/packaged.yml', 'packaged_template_content')
+    ]))
+
+    job = _job_with_user_parameters({'TemplatePath': '*.yml'})
+    with pytest.raises(
+        RuntimeError,
+        match=r'More than one file matching \*.yml in the input artifact: a/packaged.yml, b/packaged.yml'
+    ):
+        s3helper.get_input_artifact(job)
+
+
+def test_get_input_artifact_first_file_by_default(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([
+        ('app/', ''),
+        ('app/packaged.yml', 'packaged_template_content'),
+        ('app/handler.py', 'handler_content')
+    ]))
+
+    assert s3helper.get_input_artifact(JOB) == 'packaged_template_content'
+
+
+def test_get_input_artifact_empty_artifact(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([]))
+
+    with pytest.raises(RuntimeError, match='The input artifact does not contain any file.'):
+        s3helper.get_input_artifact(JOB)
+
+
+def test_get_input_artifact_ranged_template_path(fake_s3):
+    expected_result = 'packaged_template_content'
+    artifact = generate_zipped_artifact([
+        ('bundle.bin', os.urandom(2 * 1024 * 1024)),
+        ('packaged.yml', expected_result),
+        ('other.bin', os.urandom(2 * 1024 * 1024))
+    ])
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, artifact)
+
+    job = _job_with_user_parameters({'TemplatePath': 'packaged.yml'})
+    assert s3helper.get_input_artifact(job) == expected_result
+
+    # only the central directory and the selected member are fetched
+    assert len(fake_s3.requests) == 2
+    assert fake_s3.bytes_sent < 200 * 1024
+
+
+def test_get_input_artifact_templates(fake_s3):
+    app_template = 'Metadata:\n  AWS::ServerlessRepo::Application:\n    Name: {}\n'
+    artifact = generate_zipped_artifact([
+        ('apps/a/packaged.yml', app_template.format('a')),
+        ('apps/a/bundle.bin', os.urandom(4 * 1024 * 1024)),
+        ('apps/b/packaged.yaml', app_template.format('b')),
+        ('apps/b/buildspec.yml', 'version: 0.2\n'),
+        ('README.md', 'AWS::ServerlessRepo::Application')
+    ])
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, artifact)
+
+    assert s3helper.get_input_artifact_templates(JOB, BUILD_ARTIFACT) == [
+        ('apps/a/packaged.yml', app_template.format('a')),
+        ('apps/b/packaged.yaml', app_template.format('b'))
+    ]
+    # the candidates are apart: apps/a is fetched on its own, apps/b is in the fetched end of the object
+    assert len(fake_s3.requests) == 3
+    assert fake_s3.bytes_sent < 200 * 1024
+
+
+def test_get_input_artifact_templates_single_range(fake_s3):
+    app_template = 'Metadata:\n  AWS::ServerlessRepo::Application:\n    Name: {}\n'
+    members = [('apps/{}/packaged.yml'.format(i), app_template.format(i)) for i in range(20)]
+    members.append(('bundle.bin', os.urandom(4 * 1024 * 1024)))
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact(members))
+
+    templates = s3helper.get_input_artifact_templates(JOB, BUILD_ARTIFACT)
+
+    assert [file_name for file_name, _ in templates] == ['apps/{}/packaged.yml'.format(i) for i in range(20)]
+    # the central directory, then all the candidates at once
+    assert len(fake_s3.requests) == 2
+
+
+def test_get_input_artifact_templates_template_path(fake_s3):
+    app_template = 'Metadata:\n  AWS::ServerlessRepo::Application:\n    Name: {}\n'
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([
+        ('apps/a/packaged.yml', app_template.format('a')),
+        ('apps/a/template.yml', app_template.format('a'))
+    ]))
+
+    job = _job_with_user_parameters({'TemplatePath': 'apps/*/packaged.yml'})
+    assert s3helper.get_input_artifact_templates(job, BUILD_ARTIFACT) == [
+        ('apps/a/packaged.yml', app_template.format('a'))
+    ]
+
+
+def test_get_input_artifact_templates_none_found(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([('buildspec.yml', 'version: 0.2\n')]))
+
+    with pytest.raises(RuntimeError, match='No template with AWS::ServerlessRepo::Application metadata'):
+        s3helper.get_input_artifact_templates(JOB, BUILD_ARTIFACT)
+
+
+def test_get_input_artifact_cached(fake_s3, artifact_cache_dir):
+    expected_result = 'packaged_template_content'
+    artifact = generate_zipped_artifact([
+        ('packaged.yml', expected_result),
+        ('bundle.bin', os.urandom(4 * 1024 * 1024))
+    ])
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, artifact)
+    assert s3helper.get_input_artifact(JOB) == expected_result
+    del fake_s3.requests[:]
+
+    # e.g. a retried stage, the object is not fetched nor unzipped again
+    assert s3helper.get_input_artifact(JOB) == expected_result
+    assert [request['range'] for request in fake_s3.requests] == [TAIL_RANGE]
+    assert fake_s3.bytes_sent == 0
+
+    # from the disk cache of a container that evicted it from memory
+    artifactcache._ENTRIES.clear()
+    assert s3helper.get_input_artifact(JOB) == expected_result
+    assert len(os.listdir(str(artifact_cache_dir))) == 1
+    assert fake_s3.bytes_sent == 0
+
+
+def test_get_input_artifact_cached_object_changed(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([('packaged.yml', 'old_content')]))
+    assert s3helper.get_input_artifact(JOB) == 'old_content'
+
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([('packaged.yml', 'new_content')]))
+
+    assert s3helper.get_input_artifact(JOB) == 'new_content'
+    assert s3helper.get_input_artifact(JOB) == 'new_content'
+    assert len(fake_s3.requests) == 3
+
+
+def test_get_input_artifact_cached_by_template_path(fake_s3):
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([
+        ('a/packaged.yml', 'Metadata:\n  AWS::ServerlessRepo::Application:\n    Name: a\n'),
+        ('b/packaged.yml', 'b_content')
+    ]))
+    assert s3helper.get_input_artifact_templates(JOB, BUILD_ARTIFACT) == [
+        ('a/packaged.yml', 'Metadata:\n  AWS::ServerlessRepo::Application:\n    Name: a\n')]
+
+    assert s3helper.get_input_artifact(_job_with_user_parameters({'TemplatePath': 'b/*'})) == 'b_content'
+    artifactcache._ENTRIES.clear()
+    assert s3helper.get_input_artifact_templates(JOB, BUILD_ARTIFACT) == [
+        ('a/packaged.yml', 'Metadata:\n  AWS::ServerlessRepo::Application:\n    Name: a\n')]
+
+    # the two selections are cached apart, the last lookup is served from disk
+    assert fake_s3.bytes_sent == 2 * len(fake_s3.objects[(ARTIFACT_BUCKET, ARTIFACT_KEY)])
+
+
+def test_get_input_artifact_cache_disabled(fake_s3, mocker):
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_MEMORY_BYTES', 0)
+    mocker.patch.object(artifactcache.config, 'ARTIFACT_CACHE_DIR', '')
+    fake_s3.put_object(ARTIFACT_BUCKET, ARTIFACT_KEY, generate_zipped_artifact([('packaged.yml', 'content')]))
+
+    assert s3helper.get_input_artifact(JOB) == 'content'
+    assert s3helper.get_input_artifact(JOB) == 'content'
+
+    assert fake_s3.bytes_sent == 2 * len(fake_s3.objects[(ARTIFACT_BUCKET, ARTIFACT_KEY)])
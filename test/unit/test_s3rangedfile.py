@@ -0,0 +1,94 @@
+"""Unit test for s3rangedfile.py."""
+import io
+import pytest
+
+from botocore.exceptions import ClientError
+
+import s3rangedfile
+from fake_s3 import FakeS3
+
+BUCKET = 'sample-bucket'
+KEY = 'sample-key'
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def fake_s3():
+    with FakeS3() as fake:
+        fake.put_object(BUCKET, KEY, DATA)
+        yield fake
+
+
+def _ranged_file(fake_s3, **kwargs):
+    return s3rangedfile.S3RangedFile(fake_s3.client(), BUCKET, KEY, len(DATA), **kwargs)
+
+
+def test_parse_content_range():
+    assert s3rangedfile.parse_content_range('bytes 10-19/100') == (10, 19, 100)
+
+
+def test_parse_content_range_invalid():
+    with pytest.raises(IOError, match='Unexpected Content-Range in S3 response: bytes \\*/100'):
+        s3rangedfile.parse_content_range('bytes */100')
+
+
+def test_read_fetches_blocks(fake_s3):
+    f = _ranged_file(fake_s3, block_bytes=1024)
+
+    f.seek(100)
+    assert f.read(10) == DATA[100:110]
+    assert f.read(10) == DATA[110:120]
+    assert [request['range'] for request in fake_s3.requests] == ['bytes=100-1123']
+
+    f.seek(-10, io.SEEK_END)
+    assert f.read() == DATA[-10:]
+    assert f.read(1) == b''
+    assert [request['range'] for request in fake_s3.requests] == [
+        'bytes=100-1123',
+        'bytes={}-{}'.format(len(DATA) - 10, len(DATA) - 1)
+    ]
+    assert f.range_requests == 2
+    assert f.bytes_fetched == 1034
+
+
+def test_read_from_buffered_content(fake_s3):
+    f = _ranged_file(fake_s3, buffered=(len(DATA) - 100, DATA[-100:]))
+
+    f.seek(-50, io.SEEK_END)
+    assert f.read(20) == DATA[-50:-30]
+    assert fake_s3.requests == []
+
+
+def test_prefetch(fake_s3):
+    f = _ranged_file(fake_s3, block_bytes=1024)
+
+    f.prefetch(2000, 100)
+    f.seek(2000)
+    assert f.read(100) == DATA[2000:2100]
+    assert [request['range'] for request in fake_s3.requests] == ['bytes=2000-2099']
+
+
+def test_read_ranges_ignored(fake_s3):
+    fake_s3.honor_ranges = False
+    f = _ranged_file(fake_s3, block_bytes=16)
+
+    f.seek(300)
+    assert f.read(16) == DATA[300:316]
+
+
+def test_read_object_changed(fake_s3):
+    f = _ranged_file(fake_s3, etag='"another-etag"')
+
+    with pytest.raises(ClientError, match='PreconditionFailed'):
+        f.read(10)
+
+
+def test_seek_invalid(fake_s3):
+    f = _ranged_file(fake_s3)
+
+    assert f.seek(10) == 10
+    assert f.seek(5, io.SEEK_CUR) == 15
+    with pytest.raises(ValueError, match='Negative seek position: -1'):
+        f.seek(-16, io.SEEK_CUR)
+    with pytest.raises(ValueError, match='Invalid whence: 3'):
+        f.seek(0, 3)
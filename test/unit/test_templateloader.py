@@ -0,0 +1,74 @@
+"""Unit test for templateloader.py."""
+import json
+
+import pytest
+import yaml
+from serverlessrepo import parser
+
+import templateloader
+from test_constants import mock_packaged_template
+
+INTRINSICS_TEMPLATE = """
+Resources:
+  MyFunction:
+    Type: AWS::Serverless::Function
+    Properties:
+      Role: !GetAtt MyRole.Arn
+      Environment:
+        Variables:
+          TABLE: !Ref MyTable
+          URL: !Sub 'https://${MyApi}.execute-api.${AWS::Region}.amazonaws.com'
+          LIST: !Join [',', [a, b]]
+          NAME: !If
+            - IsProd
+            - prod
+            - !Ref AWS::NoValue
+"""
+
+
+@pytest.fixture
+def pure_python_yaml(monkeypatch):
+    # as when PyYAML is built without libyaml
+    monkeypatch.setattr(templateloader, '_yaml_classes', None)
+    monkeypatch.delattr(yaml, 'CSafeLoader')
+    monkeypatch.delattr(yaml, 'CSafeDumper')
+
+
+@pytest.mark.parametrize('template', [mock_packaged_template, INTRINSICS_TEMPLATE])
+def test_load_yaml(template):
+    assert templateloader.get_format(template) == templateloader.FORMAT_YAML
+    assert templateloader.load(template) == parser.parse_template(template)
+
+
+@pytest.mark.parametrize('template', [mock_packaged_template, INTRINSICS_TEMPLATE])
+def test_load_yaml_pure_python(pure_python_yaml, template):
+    assert templateloader.load(template) == parser.parse_template(template)
+    assert templateloader._yaml_classes[0].__bases__ == (yaml.SafeLoader,)
+    assert templateloader.dump(parser.parse_template(template)) == parser.yaml_dump(parser.parse_template(template))
+
+
+def test_load_json():
+    template = '  ' + json.dumps(parser.parse_template(mock_packaged_template))
+
+    assert templateloader.get_format(template) == templateloader.FORMAT_JSON
+    assert list(templateloader.load(template)) == list(parser.parse_template(template))
+
+
+def test_load_yaml_flow_mapping():
+    assert templateloader.load('{Resources: {}}') == {'Resources': {}}
+
+
+def test_load_keeps_order():
+    assert list(templateloader.load('B: 1\nA: 2\nC: 3')) == ['B', 'A', 'C']
+
+
+def test_load_invalid():
+    with pytest.raises(yaml.YAMLError):
+        templateloader.load('Resources: [')
+
+
+@pytest.mark.parametrize('template', [mock_packaged_template, INTRINSICS_TEMPLATE])
+def test_dump(template):
+    template_dict = parser.parse_template(template)
+
+    assert templateloader.dump(template_dict) == parser.yaml_dump(template_dict)
@@ -0,0 +1,27 @@
+"""Unit test for userparameters.py."""
+import pytest
+
+import userparameters
+
+
+def test_parse_user_parameters():
+    assert userparameters.parse_user_parameters(' {"TemplatePath": "packaged.yml"} ') == {
+        'TemplatePath': 'packaged.yml'
+    }
+
+
+def test_parse_user_parameters_not_set():
+    assert userparameters.parse_user_parameters('') == {}
+
+
+def test_parse_user_parameters_not_json():
+    assert userparameters.parse_user_parameters('sample-user-parameter') == {}
+
+
+def test_parse_user_parameters_not_an_object():
+    assert userparameters.parse_user_parameters('["packaged.yml"]') == {}
+
+
+def test_parse_user_parameters_invalid_json_object():
+    with pytest.raises(RuntimeError, match='UserParameters is not a valid JSON object'):
+        userparameters.parse_user_parameters('{"TemplatePath": }')
@@ -0,0 +1,93 @@
+"""Unit test for warmup.py."""
+import pytest
+from botocore.exceptions import ClientError
+
+import warmup
+
+
+@pytest.fixture
+def mock_clientfactory(mocker):
+    for client_getter in ('get_codepipeline_client', 'get_function_s3_client', 'get_function_dynamodb_client',
+                          'get_serverlessrepo_client'):
+        mock_getter = mocker.patch.object(warmup.clientfactory, client_getter)
+        mock_getter.return_value.meta.endpoint_url = 'https://sample.amazonaws.com'
+    mocker.patch.object(warmup.clientfactory, 'patch_xray')
+    mocker.patch.object(warmup.socket, 'getaddrinfo')
+    return warmup.clientfactory
+
+
+@pytest.mark.parametrize('event, expected', [
+    ({'warmup': True}, True),
+    ({'warmup': {'connect': True}}, True),
+    ({'CodePipeline.job': {}}, False),
+    ({'CodePipeline.job': {}, 'warmup': True}, False),
+    ('warmup', False)
+])
+def test_is_warmup_event(event, expected):
+    assert warmup.is_warmup_event(event) is expected
+
+
+def test_warm_up(mock_clientfactory, mocker):
+    mocker.patch.object(warmup.config, 'REGIONS', ('us-east-1', 'eu-west-1'))
+    mocker.patch.object(warmup.config, 'IDEMPOTENCY_STORE', '')
+    loads = [mocker.patch.object(module, 'load') for module in warmup.LAZY_MODULES]
+    mocker.patch.object(warmup.templateloader, 'dump')
+
+    report = warmup.warm_up()
+
+    assert list(report['steps']) == ['ImportDependencies', 'CreateClients', 'ResolveEndpoints']
+    assert all(duration >= 0 for duration in report['steps'].values())
+    assert report['durationMs'] >= sum(report['steps'].values())
+    for load in loads:
+        load.assert_called_once_with()
+    warmup.templateloader.dump.assert_called_once_with({})
+    mock_clientfactory.patch_xray.assert_called_once_with()
+    mock_clientfactory.get_codepipeline_client.assert_called_once_with()
+    mock_clientfactory.get_function_dynamodb_client.assert_not_called()
+    mock_clientfactory.get_serverlessrepo_client.assert_any_call('eu-west-1')
+    mock_clientfactory.get_serverlessrepo_client.assert_any_call(
+        'eu-west-1', timeout=warmup.config.CLIENT_READ_TIMEOUT_SECONDS)
+    # codepipeline, s3 and the two serverlessrepo clients
+    assert warmup.socket.getaddrinfo.call_count == 4
+    mock_clientfactory.get_serverlessrepo_client.return_value.list_applications.assert_not_called()
+
+
+def test_warm_up_connect(mock_clientfactory, mocker):
+    mocker.patch.object(warmup.config, 'REGIONS', ())
+    mocker.patch.object(warmup.config, 'IDEMPOTENCY_STORE', 'dynamodb://sample-table')
+    sar_client = mock_clientfactory.get_serverlessrepo_client.return_value
+    sar_client.list_applications.side_effect = ClientError(
+        {'Error': {'Code': 'AccessDeniedException', 'Message': 'Access denied'}}, 'ListApplications')
+    mocker.patch.object(warmup.socket, 'getaddrinfo', side_effect=OSError('sample error'))
+    mock_log = mocker.patch.object(warmup, 'LOG')
+
+    report = warmup.handle_event({'warmup': {'connect': True}})
+
+    assert 'OpenConnections' in report['steps']
+    sar_client.list_applications.assert_called_once_with(MaxItems=1)
+    mock_clientfactory.get_function_dynamodb_client.assert_called_once_with()
+    assert all('Unable to resolve' in call[0][0] for call in mock_log.warning.call_args_list)
+    assert mock_clientfactory.get_codepipeline_client.return_value.method_calls == []
+
+
+@pytest.mark.parametrize('initialization_type, warmup_on_init, expected', [
+    ('provisioned-concurrency', True, True),
+    ('on-demand', True, False),
+    ('provisioned-concurrency', False, False)
+])
+def test_on_init(mocker, monkeypatch, initialization_type, warmup_on_init, expected):
+    monkeypatch.setenv('AWS_LAMBDA_INITIALIZATION_TYPE', initialization_type)
+    mocker.patch.object(warmup.config, 'WARMUP_ON_INIT', warmup_on_init)
+    mocker.patch.object(warmup, 'warm_up', return_value={'steps': {}})
+
+    assert warmup.on_init() == ({'steps': {}} if expected else None)
+    assert warmup.warm_up.called is expected
+
+
+def test_on_init_error(mocker, monkeypatch):
+    monkeypatch.setenv('AWS_LAMBDA_INITIALIZATION_TYPE', 'provisioned-concurrency')
+    mocker.patch.object(warmup, 'warm_up', side_effect=RuntimeError('sample error'))
+    mock_log = mocker.patch.object(warmup, 'LOG')
+
+    assert warmup.on_init() is None
+    assert 'sample error' in str(mock_log.warning.call_args)
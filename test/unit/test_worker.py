@@ -0,0 +1,166 @@
+"""Unit test for worker.py."""
+import threading
+
+import pytest
+
+from fake_codepipeline import FakeCodePipeline
+
+import callpolicy
+import codepipelinehelper
+import metrics
+import worker
+
+ACTION_TYPE_ID = {'category': 'Deploy', 'owner': 'Custom', 'provider': 'PublishToSAR', 'version': '1'}
+JOB_DATA = {'actionConfiguration': {'configuration': {}}, 'inputArtifacts': [], 'artifactCredentials': {}}
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    metrics.reset()
+    callpolicy.clear_cache()
+    yield
+    metrics.reset()
+    callpolicy.clear_cache()
+
+
+@pytest.fixture
+def fake_codepipeline(mocker):
+    with FakeCodePipeline() as fake:
+        mocker.patch.object(codepipelinehelper.clientfactory, 'get_codepipeline_client', return_value=fake.client())
+        yield fake
+
+
+def _run_until(sample_worker, condition):
+    thread = threading.Thread(target=sample_worker.run)
+    thread.start()
+    try:
+        assert _wait_for(condition)
+    finally:
+        sample_worker.stop()
+        thread.join(5)
+    assert not thread.is_alive()
+
+
+def _wait_for(condition, timeout=5):
+    stopped = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        stopped.wait(0.01)
+    return False
+
+
+def test_run_processes_jobs_and_continuations(fake_codepipeline, mocker):
+    def publish(event, context):
+        job = event['CodePipeline.job']
+        metrics.count('JobsPublished')
+        if 'continuationToken' in job['data']:
+            codepipelinehelper.put_job_success(job['id'], {'job': job['id']})
+        else:
+            codepipelinehelper.put_job_continuation(job['id'], 'sample-token', 'Published 1 of 2', 50)
+    mocker.patch.object(worker.handler, 'publish', side_effect=publish)
+    fake_codepipeline.queue_job(ACTION_TYPE_ID, JOB_DATA)
+    fake_codepipeline.queue_job(dict(ACTION_TYPE_ID, provider='OtherProvider'), JOB_DATA)
+
+    _run_until(worker.Worker(ACTION_TYPE_ID, concurrency=2, poll_interval_seconds=0.01),
+               lambda: fake_codepipeline.last_result('job-3') is not None)
+
+    assert fake_codepipeline.acknowledged_job_ids == ['job-1', 'job-3']
+    assert fake_codepipeline.last_result('job-3')[0] == 'PutJobSuccessResult'
+    assert len(fake_codepipeline.queued_jobs) == 1
+    # each job records its metrics on its own
+    assert metrics.get_total('JobsPublished') == 0
+
+
+def test_run_bounds_concurrency(fake_codepipeline, mocker):
+    lock = threading.Lock()
+    running = []
+    max_running = []
+    release = threading.Event()
+
+    def publish(event, context):
+        with lock:
+            running.append(event['CodePipeline.job']['id'])
+            max_running.append(len(running))
+        release.wait(5)
+        with lock:
+            running.remove(event['CodePipeline.job']['id'])
+    mocker.patch.object(worker.handler, 'publish', side_effect=publish)
+    for _ in range(5):
+        fake_codepipeline.queue_job(ACTION_TYPE_ID, JOB_DATA)
+    sample_worker = worker.Worker(ACTION_TYPE_ID, concurrency=2, poll_interval_seconds=0.01)
+
+    thread = threading.Thread(target=sample_worker.run)
+    thread.start()
+    assert _wait_for(lambda: len(running) == 2)
+    assert len(fake_codepipeline.queued_jobs) == 3
+    release.set()
+    assert _wait_for(lambda: len(fake_codepipeline.acknowledged_job_ids) == 5)
+    sample_worker.stop()
+    thread.join(5)
+
+    assert max(max_running) == 2
+    assert not running
+
+
+def test_stop_waits_for_jobs_in_progress(fake_codepipeline, mocker):
+    started = threading.Event()
+    release = threading.Event()
+    finished = []
+
+    def publish(event, context):
+        started.set()
+        release.wait(5)
+        finished.append(event['CodePipeline.job']['id'])
+    mocker.patch.object(worker.handler, 'publish', side_effect=publish)
+    fake_codepipeline.queue_job(ACTION_TYPE_ID, JOB_DATA)
+    sample_worker = worker.Worker(ACTION_TYPE_ID, concurrency=1, poll_interval_seconds=0.01)
+
+    thread = threading.Thread(target=sample_worker.run)
+    thread.start()
+    assert started.wait(5)
+    sample_worker.stop()
+    thread.join(0.1)
+    assert thread.is_alive()
+    release.set()
+    thread.join(5)
+
+    assert finished == ['job-1']
+
+
+def test_run_continues_after_failures(fake_codepipeline, mocker):
+    mocker.patch.object(worker.handler, 'publish', side_effect=RuntimeError('sample error'))
+    mocker.patch.object(codepipelinehelper, 'acknowledge_job', side_effect=[RuntimeError('sample error'), True])
+    mock_log = mocker.patch.object(worker, 'LOG')
+    fake_codepipeline.queue_job(ACTION_TYPE_ID, JOB_DATA)
+    fake_codepipeline.queue_job(ACTION_TYPE_ID, JOB_DATA)
+
+    _run_until(worker.Worker(ACTION_TYPE_ID, concurrency=1, poll_interval_seconds=0.01),
+               lambda: worker.handler.publish.call_count == 1)
+
+    assert worker.handler.publish.call_args[0][0]['CodePipeline.job']['id'] == 'job-2'
+    assert 'Unable to acknowledge job' in str(mock_log.error.call_args_list[0])
+    assert _wait_for(lambda: 'Unable to process job' in str(mock_log.error.call_args_list))
+
+
+def test_run_continues_after_poll_errors(mocker):
+    mocker.patch.object(codepipelinehelper, 'poll_for_jobs', side_effect=[RuntimeError('sample error'), [], []])
+    mock_log = mocker.patch.object(worker, 'LOG')
+
+    _run_until(worker.Worker(ACTION_TYPE_ID, concurrency=1, poll_interval_seconds=0.01),
+               lambda: codepipelinehelper.poll_for_jobs.call_count >= 3)
+
+    mock_log.error.assert_called_once_with('Unable to poll for jobs: %s', mocker.ANY)
+
+
+def test_get_action_type_id(mocker):
+    mocker.patch.object(worker.config, 'WORKER_ACTION_PROVIDER', 'PublishToSAR')
+
+    assert worker.get_action_type_id() == ACTION_TYPE_ID
+
+
+def test_get_action_type_id_without_provider(mocker):
+    mocker.patch.object(worker.config, 'WORKER_ACTION_PROVIDER', '')
+
+    with pytest.raises(RuntimeError, match='WORKER_ACTION_PROVIDER'):
+        worker.get_action_type_id()